@@ -1,20 +1,41 @@
 # Import the backend
 from src.stacking_setup.components.stacking_backend.stacking_setup import StackingSetupBackend
 
-# Import the connection method
+# Import the connection methods
 from multiprocessing import Pipe  # Only needed for the pipe connection
-from src.stacking_setup.components.stacking_middleware.pipeline_connection import PipelineConnection as Connection
+from src.stacking_setup.components.stacking_middleware.pipeline_connection import PipelineConnection
+from src.stacking_setup.components.stacking_middleware.shared_memory_connection import SharedMemoryConnection, SharedMemoryChannel
+from src.stacking_setup.components.stacking_middleware.socket_connection import SocketConnection
+from src.stacking_setup.components.stacking_middleware.telemetry import TelemetryBlock  # Only for the same machine connections
 
 # Import the ui
 from src.stacking_setup.components.stacking_frondend.gui.main import main as ui_main
 # from src.stacking_setup.components.stacking_frondend.tui.main import main as ui_main
 
 
+# The connection between the frond and backend, "PIPELINE", "SHARED_MEMORY" or "SOCKET"
+CONNECTION_METHOD = "PIPELINE"
+# The address of the backend for the socket connection, a Unix socket path or <host>:<port>
+SOCKET_ADDRESS = "/tmp/stacking_setup.sock"
+
+
 if __name__ == '__main__':
     # Create the chosen middleware method and start the backend
-    par_con, ch_con = Pipe()
-    #backend = StackingSetupBackend(Connection(par_con, "BACKEND"))
+    telemetry = TelemetryBlock.create()  # Positions and temperatures are shared outside of the connection
+    if CONNECTION_METHOD == "SOCKET":
+        # Other clients can connect to the same address, the reports are sent to all of them
+        backend_con = SocketConnection(SOCKET_ADDRESS, "BACKEND")
+        frontend_con = SocketConnection(SOCKET_ADDRESS, "FRONTEND")
+    elif CONNECTION_METHOD == "SHARED_MEMORY":
+        channel = SharedMemoryChannel()
+        backend_con = SharedMemoryConnection(channel, "BACKEND", telemetry=telemetry)
+        frontend_con = SharedMemoryConnection(channel, "FRONTEND", telemetry=telemetry)
+    else:
+        par_con, ch_con = Pipe()
+        backend_con = PipelineConnection(par_con, "BACKEND", telemetry=telemetry)
+        frontend_con = PipelineConnection(ch_con, "FRONTEND", telemetry=telemetry)
+    #backend = StackingSetupBackend(backend_con)
     #backend.start_backend()
 
     # Run the ui main function
-    ui_main(Connection(ch_con, "FRONTEND"), init_backend=False) 
\ No newline at end of file
+    ui_main(frontend_con, init_backend=False)
@@ -0,0 +1,536 @@
+"""
+End-to-end throughput and latency benchmark of the stacking setup.
+
+Drives the complete frontend -> middleware -> backend -> hardware path
+with the simulated hardware (see ``configs/simulation_config.ini``) and
+writes a machine readable (json) report, so the effect of changes to the
+transport, the backend or the controllers can be compared between runs.
+
+Usage (from the repository root)::
+
+    python -m src.stacking_setup.benchmarks.end_to_end --output report.json
+
+Workloads
+---------
+* jog_burst : Rapid start/stop jog commands (M811).
+* g0_sequence : A long sequence of small linear moves (G0).
+* auto_report : Position and temperature auto reports at 20 Hz (M154, M155).
+* mcode_storm : A random mix of machine commands (M105, M114, M140, M812, G90, G91).
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import contextlib
+import threading as tr
+import multiprocessing as mp
+from collections import deque, defaultdict
+from typing import Union
+
+from ..components.stacking_backend.stacking_setup import StackingSetupBackend
+from ..components.stacking_backend.configs.settings import Settings
+from ..components.stacking_middleware.pipeline_connection import PipelineConnection
+from ..components.stacking_middleware.message import Message
+
+
+REPORT_SCHEMA = 1
+WORKLOADS = ("jog_burst", "g0_sequence", "auto_report", "mcode_storm")
+
+
+def _percentile(values: list, percentile: float) -> Union[float, None]:
+    """
+    Calculate a percentile with linear interpolation.
+
+    Parameters
+    ----------
+    values : list
+        The (unsorted) values.
+    percentile : float
+        The percentile to calculate (0-100).
+
+    Returns
+    -------
+    value : float, None
+        The percentile or None if no values are given.
+    """
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * percentile / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def _summarize(latencies: list) -> dict:
+    """
+    Summarize the latencies (seconds) in milliseconds.
+
+    Parameters
+    ----------
+    latencies : list
+        The measured latencies in seconds.
+
+    Returns
+    -------
+    summary : dict
+        The p50, p90, p99, max and mean latency in ms.
+    """
+    summary = {}
+    for name, perc in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100)):
+        value = _percentile(latencies, perc)
+        summary[name] = None if value is None else round(value * 1000, 3)
+    summary["mean"] = (
+        None if len(latencies) == 0 else round(sum(latencies) / len(latencies) * 1000, 3)
+    )
+    return summary
+
+
+class ProcessStats:
+    """
+    Read the cpu time and thread count of a process.
+
+    Uses ``/proc`` so the numbers are only available on linux, on other
+    platforms all values are reported as None.
+    """
+
+    def __init__(self, pid: int) -> ...:
+        """
+        Initialize the reader.
+
+        Parameters
+        ----------
+        pid : int
+            The process id to read the stats of.
+        """
+        self._pid = pid
+        try:
+            self._ticks = os.sysconf("SC_CLK_TCK")
+        except (AttributeError, ValueError, OSError):
+            self._ticks = None
+
+    def cpu_time(self) -> Union[float, None]:
+        """Get the used cpu time (user + system) in seconds."""
+        if self._ticks is None:
+            return None
+        try:
+            with open("/proc/{}/stat".format(self._pid)) as f:
+                # The process name can contain spaces, so split after it
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            return None
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def threads(self) -> Union[int, None]:
+        """Get the amount of threads of the process."""
+        try:
+            with open("/proc/{}/status".format(self._pid)) as f:
+                for line in f:
+                    if line.startswith("Threads:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return None
+
+
+class BenchmarkClient:
+    """
+    Frontend side of the benchmark.
+
+    Sends the commands to the backend and timestamps every received message
+    on a separate reader thread, so the latency of a command is the time
+    between sending the command and receiving the response with the same
+    command id (responses with the same id are matched first in first out).
+    """
+
+    def __init__(self, connection: PipelineConnection) -> ...:
+        """
+        Initialize the client.
+
+        Parameters
+        ----------
+        connection : PipelineConnection
+            The frontend side of the connection to the backend.
+        """
+        self._con = connection
+        self._lock = tr.Lock()
+        self._pending = defaultdict(deque)
+        self._stop = tr.Event()
+        self._reader = tr.Thread(target=self._read_loop, daemon=True)
+        self.reset()
+
+    def start(self) -> ...:
+        """Start the reader thread."""
+        self._reader.start()
+
+    def stop(self) -> ...:
+        """Stop the reader thread."""
+        self._stop.set()
+        self._reader.join(timeout=1)
+
+    def reset(self) -> ...:
+        """Reset the counters of the current workload."""
+        self._lock.acquire()
+        self._pending.clear()
+        self.sent = 0
+        self.latencies = []
+        self.errors = 0
+        self.telemetry = defaultdict(list)
+        self._lock.release()
+
+    @property
+    def outstanding(self) -> int:
+        """Get the amount of commands that did not get a response (yet)."""
+        self._lock.acquire()
+        amount = sum(len(q) for q in self._pending.values())
+        self._lock.release()
+        return amount
+
+    def send(self, line: str) -> ...:
+        """
+        Send a gcode line and register the expected responses.
+
+        Parameters
+        ----------
+        line : str
+            The gcode line, every command in the line gets its own response.
+        """
+        now = time.perf_counter()
+        self._lock.acquire()
+        for command_id in line.split():
+            if command_id[0] in ("G", "M"):
+                self._pending[command_id].append(now)
+                self.sent += 1
+        self._lock.release()
+        self._con.send(line)
+
+    def wait_for_responses(self, timeout: float) -> bool:
+        """
+        Wait until all sent commands got a response.
+
+        Parameters
+        ----------
+        timeout : float
+            The maximum time to wait in seconds.
+
+        Returns
+        -------
+        done : bool
+            True if all responses were received, False on a timeout.
+        """
+        etime = time.perf_counter() + timeout
+        while self.outstanding != 0:
+            if time.perf_counter() > etime:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def _read_loop(self) -> ...:
+        """Receive and timestamp the messages from the backend."""
+        while not self._stop.is_set():
+            messages = self._con.receive() if self._con.message_waiting() else None
+            if not messages:
+                time.sleep(0.0005)
+                continue
+            now = time.perf_counter()
+            for message in messages:
+                if isinstance(message, Message):
+                    self._handle(message, now)
+
+    def _handle(self, message: Message, now: float) -> ...:
+        """Match a received message to a command or count it as telemetry."""
+        self._lock.acquire()
+        if isinstance(message.command, str) and message.command in ("M105", "M114"):
+            # Auto report messages carry the reported command
+            self.telemetry[message.command].append(now)
+        elif len(self._pending[message.command_id]) != 0:
+            self.latencies.append(now - self._pending[message.command_id].popleft())
+            if message.exit_code != 0:
+                self.errors += 1
+        self._lock.release()
+
+
+def _jog_burst(client: BenchmarkClient, scale: int, rng: random.Random) -> ...:
+    """Rapidly start and stop jogging the base stage."""
+    for _ in range(25 * scale):
+        client.send("M811 X1")
+        client.send("M811 X0")
+
+
+def _g0_sequence(client: BenchmarkClient, scale: int, rng: random.Random) -> ...:
+    """Send a long sequence of small relative moves."""
+    client.send("G91")
+    for i in range(25 * scale):
+        client.send("G0 X0.2" if i % 2 == 0 else "G0 X-0.2")
+
+
+def _auto_report(client: BenchmarkClient, scale: int, rng: random.Random) -> ...:
+    """Enable 20 Hz position and temperature reports for a while."""
+    client.send("M154 S0.05")
+    client.send("M155 S0.05")
+    time.sleep(2 * scale)
+    client.send("M154 S0")
+    client.send("M155 S0")
+
+
+def _mcode_storm(client: BenchmarkClient, scale: int, rng: random.Random) -> ...:
+    """Send a random mix of machine commands as fast as possible."""
+    lines = (
+        lambda: "M105",
+        lambda: "M114",
+        lambda: "M812 X{0} Y{0}".format(rng.choice((10, 50, 100))),
+        lambda: "M140 S{}".format(rng.choice((25, 30, 40))),
+        lambda: rng.choice(("G90", "G91")),
+    )
+    for _ in range(50 * scale):
+        client.send(rng.choice(lines)())
+
+
+_WORKLOAD_FUNCS = {
+    "jog_burst": _jog_burst,
+    "g0_sequence": _g0_sequence,
+    "auto_report": _auto_report,
+    "mcode_storm": _mcode_storm,
+}
+
+
+def run_workload(
+    name: str,
+    client: BenchmarkClient,
+    backend_stats: ProcessStats,
+    scale: int = 1,
+    seed: int = 0,
+    timeout: float = 60,
+) -> dict:
+    """
+    Run one workload and collect the results.
+
+    Parameters
+    ----------
+    name : str
+        The name of the workload, see :data:`WORKLOADS`.
+    client : BenchmarkClient
+        The connected benchmark client.
+    backend_stats : ProcessStats
+        The stats reader of the backend process.
+    scale : int
+        Multiplier for the size of the workload.
+    seed : int
+        The seed for the random workloads.
+    timeout : float
+        Time in seconds to wait for the outstanding responses.
+
+    Returns
+    -------
+    result : dict
+        The results of the workload.
+    """
+    client.reset()
+    rng = random.Random(seed)
+    max_threads = backend_stats.threads()
+    cpu_start, front_start = backend_stats.cpu_time(), os.times()
+    start = time.perf_counter()
+
+    _WORKLOAD_FUNCS[name](client, scale, rng)
+    complete = client.wait_for_responses(timeout)
+
+    duration = time.perf_counter() - start
+    cpu_end, front_end = backend_stats.cpu_time(), os.times()
+    threads = backend_stats.threads()
+    if threads is not None:
+        max_threads = threads if max_threads is None else max(max_threads, threads)
+
+    result = {
+        "commands": client.sent,
+        "responses": len(client.latencies),
+        "lost": client.outstanding,
+        "errors": client.errors,
+        "complete": complete,
+        "duration_s": round(duration, 4),
+        "commands_per_s": round(len(client.latencies) / duration, 2),
+        "latency_ms": _summarize(client.latencies),
+        "backend_cpu_percent": None
+        if cpu_start is None or cpu_end is None
+        else round((cpu_end - cpu_start) / duration * 100, 2),
+        "frontend_cpu_percent": round(
+            (front_end.user + front_end.system - front_start.user - front_start.system)
+            / duration * 100,
+            2,
+        ),
+        "backend_threads": max_threads,
+    }
+    if client.telemetry:
+        result["telemetry"] = {}
+        for command, stamps in client.telemetry.items():
+            intervals = [b - a for a, b in zip(stamps, stamps[1:])]
+            result["telemetry"][command] = {
+                "messages": len(stamps),
+                "rate_hz": round(len(stamps) / duration, 2),
+                "interval_ms": _summarize(intervals),
+            }
+    return result
+
+
+def run_benchmark(
+    workloads: tuple = WORKLOADS,
+    scale: int = 1,
+    seed: int = 0,
+    idle_time: float = 2,
+    settings_file: str = "simulation_config.ini",
+) -> dict:
+    """
+    Start a simulated backend and run the given workloads against it.
+
+    Parameters
+    ----------
+    workloads : tuple
+        The names of the workloads to run.
+    scale : int
+        Multiplier for the size of the workloads.
+    seed : int
+        The seed for the random workloads.
+    idle_time : float
+        The time in seconds to measure the idle cpu usage.
+    settings_file : str
+        The hardware settings file (in the configs folder) to use.
+
+    Returns
+    -------
+    report : dict
+        The benchmark report.
+    """
+    par_con, ch_con = mp.Pipe()
+    connection = PipelineConnection(ch_con, "FRONTEND")
+    backend = StackingSetupBackend(
+        PipelineConnection(par_con, "BACKEND"), settings=Settings(settings_file)
+    )
+
+    start = time.perf_counter()
+    backend.start_backend()
+    connection.handshake()
+    client = BenchmarkClient(connection)
+    client.start()
+
+    # The backend is ready when the hardware answers, keep asking until it does
+    while time.perf_counter() - start < 60:
+        client.reset()
+        client.send("M114")
+        if client.wait_for_responses(0.5):
+            break
+    startup = time.perf_counter() - start
+
+    stats = ProcessStats(backend._controller_process.pid)
+    report = {
+        "schema": REPORT_SCHEMA,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": {
+            "python": platform.python_version(),
+            "system": platform.system(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "parameters": {
+            "scale": scale,
+            "seed": seed,
+            "settings": settings_file,
+            "transport": type(connection).__name__,
+        },
+        "startup_s": round(startup, 4),
+        "workloads": {},
+    }
+
+    try:
+        cpu_start = stats.cpu_time()
+        time.sleep(idle_time)
+        cpu_end = stats.cpu_time()
+        report["idle"] = {
+            "backend_cpu_percent": None
+            if cpu_start is None or cpu_end is None
+            else round((cpu_end - cpu_start) / idle_time * 100, 2),
+            "backend_threads": stats.threads(),
+        }
+
+        for name in workloads:
+            report["workloads"][name] = run_workload(
+                name, client, stats, scale=scale, seed=seed
+            )
+    finally:
+        client.stop()
+        connection.send_sentinel()
+        backend._controller_process.join(timeout=5)
+        if backend._controller_process.is_alive():
+            backend._controller_process.terminate()
+            backend._controller_process.join()
+    return report
+
+
+@contextlib.contextmanager
+def _stdout_to_stderr():
+    """
+    Send everything written to stdout to stderr, including the child processes.
+
+    The backend prints its progress (bring up table, zeroing) to stdout, the
+    redirect is done on file descriptor level so the backend process started
+    inside the block inherits it and stdout only contains the report.
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def main(argv: Union[list, None] = None) -> int:
+    """
+    Run the benchmark from the command line.
+
+    Parameters
+    ----------
+    argv : list, None
+        The command line arguments, by default :data:`sys.argv`.
+
+    Returns
+    -------
+    exit_code : int
+        0 if all workloads completed, 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--output", "-o", default=None,
+                        help="File to write the json report to (default stdout)")
+    parser.add_argument("--workloads", "-w", nargs="+", default=list(WORKLOADS),
+                        choices=WORKLOADS, help="The workloads to run")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="Multiplier for the size of the workloads")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed for the random workloads")
+    parser.add_argument("--settings", default="simulation_config.ini",
+                        help="Hardware settings file in the configs folder")
+    args = parser.parse_args(argv)
+
+    with _stdout_to_stderr():
+        report = run_benchmark(
+            workloads=tuple(args.workloads),
+            scale=args.scale,
+            seed=args.seed,
+            settings_file=args.settings,
+        )
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    complete = all(res["complete"] for res in report["workloads"].values())
+    return 0 if complete else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+"""
+Throughput benchmark of the pipe transport between the frontend and backend.
+
+Sends batches of status messages (like the position auto report) over a
+multiprocessing pipe and measures the messages per second of the framed
+transport (:class:`~stacking_middleware.pipeline_connection.PipeCom`)
+and of the previous transport (one ``send`` per item followed by an end
+of message marker) as the baseline. The size and the encode and decode
+time of a telemetry message are compared between pickle and the
+:class:`~stacking_middleware.message_codec.MessageCodec`. The same
+batches are also sent through the whole connectors, the
+:class:`~stacking_middleware.pipeline_connection.PipelineConnection`
+and the :class:`~stacking_middleware.shared_memory_connection.SharedMemoryConnection`.
+
+Usage (from the repository root)::
+
+    python -m src.stacking_setup.benchmarks.pipe_transport --output report.json
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import platform
+import threading as tr
+import multiprocessing as mp
+from typing import Union
+
+from ..components.stacking_middleware.pipeline_connection import PipeCom, PipelineConnection
+from ..components.stacking_middleware.shared_memory_connection import SharedMemoryConnection, SharedMemoryChannel
+from ..components.stacking_middleware.message import Message
+from ..components.stacking_middleware.message_codec import MessageCodec
+
+
+REPORT_SCHEMA = 1
+BATCH_SIZES = (1, 10, 100)
+_EOM = "EOM"  # End of message marker of the previous transport
+
+
+def _legacy_write(conn, data: list) -> ...:
+    """Write the items one by one followed by the end of message marker (baseline)."""
+    for item in data:
+        conn.send(item)
+    conn.send(_EOM)
+
+
+def _legacy_read(conn) -> list:
+    """Read the items until the end of message marker (baseline)."""
+    result = []
+    if conn.poll():
+        for msg in iter(conn.recv, _EOM):
+            result.append(msg)
+    return result
+
+
+TRANSPORTS = {
+    "legacy": (_legacy_write, _legacy_read),
+    "framed": (PipeCom.write_pipe, PipeCom.read_pipe),
+}
+
+
+def _status_message(n_axes: int) -> Message:
+    """Create a position report like the one of the position auto report."""
+    positions = {"AXIS{}".format(i): float(i) * 1.5 for i in range(n_axes)}
+    return Message(exit_code=0, msg=positions, command_id="M154", command="M114")
+
+
+def measure(transport: str, batch_size: int, messages: int, n_axes: int = 8) -> dict:
+    """
+    Measure the throughput of one transport.
+
+    A reader thread drains the pipe while the batches are written, like
+    the backend and frontend loops do.
+
+    Parameters
+    ----------
+    transport : str
+        The transport to measure, 'legacy' or 'framed'.
+    batch_size : int
+        The amount of messages per write.
+    messages : int
+        The total amount of messages to send.
+    n_axes : int
+        The amount of axes in every status message.
+
+    Returns
+    -------
+    result : dict
+        The messages per second and the elapsed time.
+    """
+    write, read = TRANSPORTS[transport]
+    reader_end, writer_end = mp.Pipe(duplex=False)
+    batch = [_status_message(n_axes) for _ in range(batch_size)]
+    batches = max(1, messages // batch_size)
+    received = []
+
+    def reader():
+        count = 0
+        while count < batches * batch_size:
+            if reader_end.poll(0.001):
+                count += len(read(reader_end))
+        received.append(count)
+
+    thread = tr.Thread(target=reader, daemon=True)
+    start = time.perf_counter()
+    thread.start()
+    for _ in range(batches):
+        write(writer_end, batch)
+    thread.join()
+    elapsed = time.perf_counter() - start
+    reader_end.close()
+    writer_end.close()
+    return {
+        "messages": received[0],
+        "elapsed_s": round(elapsed, 4),
+        "messages_per_s": round(received[0] / elapsed, 1),
+    }
+
+
+def _pipeline_pair() -> tuple:
+    """Create the frontend and backend ends of a pipeline connection."""
+    par_con, ch_con = mp.Pipe()
+    return PipelineConnection(ch_con, "FRONTEND"), PipelineConnection(par_con, "BACKEND")
+
+
+def _shared_memory_pair() -> tuple:
+    """Create the frontend and backend ends of a shared memory connection."""
+    channel = SharedMemoryChannel()
+    return SharedMemoryConnection(channel, "FRONTEND"), SharedMemoryConnection(channel, "BACKEND")
+
+
+CONNECTORS = {
+    "pipeline": _pipeline_pair,
+    "shared_memory": _shared_memory_pair,
+}
+
+
+def measure_connector(connector: str, batch_size: int, messages: int, n_axes: int = 8) -> dict:
+    """
+    Measure the throughput of one connector from the backend to the frontend.
+
+    Parameters
+    ----------
+    connector : str
+        The connector to measure, 'pipeline' or 'shared_memory'.
+    batch_size : int
+        The amount of messages per send.
+    messages : int
+        The total amount of messages to send.
+    n_axes : int
+        The amount of axes in every status message.
+
+    Returns
+    -------
+    result : dict
+        The messages per second and the elapsed time.
+    """
+    frontend, backend = CONNECTORS[connector]()
+    backend.__init_lock__()
+    batch = [_status_message(n_axes) for _ in range(batch_size)]
+    batches = max(1, messages // batch_size)
+    received = []
+
+    def reader():
+        count = 0
+        while count < batches * batch_size:
+            if frontend.wait_for_message(0.001):
+                count += len(frontend.receive())
+        received.append(count)
+
+    thread = tr.Thread(target=reader, daemon=True)
+    start = time.perf_counter()
+    thread.start()
+    for _ in range(batches):
+        backend.send(batch)
+    thread.join()
+    elapsed = time.perf_counter() - start
+    backend.disconnect()
+    frontend.disconnect()
+    return {
+        "messages": received[0],
+        "elapsed_s": round(elapsed, 4),
+        "messages_per_s": round(received[0] / elapsed, 1),
+    }
+
+
+def measure_codec(n_axes: int = 20, repeat: int = 5000) -> dict:
+    """
+    Compare the size and speed of pickle and the message codec for a telemetry message.
+
+    Parameters
+    ----------
+    n_axes : int
+        The amount of axes in the position report.
+    repeat : int
+        The amount of encodes and decodes to time.
+
+    Returns
+    -------
+    result : dict
+        Per format the size in bytes and the encode and decode time in us.
+    """
+    message = _status_message(n_axes)
+    codec = MessageCodec()
+    formats = {
+        "pickle": (lambda: pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads),
+        "codec": (lambda: codec.encode(message), MessageCodec.decode),
+    }
+    result = {}
+    for name, (encode, decode) in formats.items():
+        data = encode()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            encode()
+        encode_time = (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        for _ in range(repeat):
+            decode(data)
+        decode_time = (time.perf_counter() - start) / repeat
+        result[name] = {
+            "bytes": len(data),
+            "encode_us": round(encode_time * 1e6, 2),
+            "decode_us": round(decode_time * 1e6, 2),
+        }
+    return result
+
+
+def run_benchmark(messages: int = 20000, batch_sizes: tuple = BATCH_SIZES) -> dict:
+    """
+    Measure all the transports for all the batch sizes.
+
+    Parameters
+    ----------
+    messages : int
+        The amount of messages per measurement.
+    batch_sizes : tuple
+        The batch sizes to measure.
+
+    Returns
+    -------
+    report : dict
+        The benchmark report.
+    """
+    report = {
+        "schema": REPORT_SCHEMA,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": {
+            "python": platform.python_version(),
+            "system": platform.system(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "parameters": {"messages": messages, "batch_sizes": list(batch_sizes)},
+        "transports": {},
+        "speedup": {},
+        "codec": measure_codec(),
+        "connectors": {},
+        "connector_speedup": {},
+    }
+    for transport in TRANSPORTS:
+        report["transports"][transport] = {
+            str(size): measure(transport, size, messages) for size in batch_sizes
+        }
+    for size in batch_sizes:
+        legacy = report["transports"]["legacy"][str(size)]["messages_per_s"]
+        framed = report["transports"]["framed"][str(size)]["messages_per_s"]
+        report["speedup"][str(size)] = round(framed / legacy, 2)
+
+    for connector in CONNECTORS:
+        report["connectors"][connector] = {
+            str(size): measure_connector(connector, size, messages) for size in batch_sizes
+        }
+    for size in batch_sizes:
+        pipeline = report["connectors"]["pipeline"][str(size)]["messages_per_s"]
+        shared = report["connectors"]["shared_memory"][str(size)]["messages_per_s"]
+        report["connector_speedup"][str(size)] = round(shared / pipeline, 2)
+    return report
+
+
+def main(argv: Union[list, None] = None) -> int:
+    """
+    Run the benchmark from the command line.
+
+    Parameters
+    ----------
+    argv : list, None
+        The command line arguments, by default :data:`sys.argv`.
+
+    Returns
+    -------
+    exit_code : int
+        Always 0.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--output", "-o", default=None,
+                        help="File to write the json report to (default stdout)")
+    parser.add_argument("--messages", "-n", type=int, default=20000,
+                        help="Amount of messages per measurement")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=list(BATCH_SIZES),
+                        help="The amount of messages per write")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(messages=args.messages, batch_sizes=tuple(args.batch_sizes))
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+"""
+Scripting client of the stacking setup, see :mod:`client.client`.
+"""
+from .client import StackingClient, CommandError, DEFAULT_TIMEOUT
+from .aio import AsyncStackingClient
@@ -0,0 +1,143 @@
+"""
+Asyncio interface of the scripting client.
+
+The :class:`AsyncStackingClient` wraps a :class:`~client.client.StackingClient`,
+the commands are sent straight away and awaiting them waits for the
+response without blocking the event loop. Run several commands at the
+same time with :func:`asyncio.gather`::
+
+    async with AsyncStackingClient(connector) as client:
+        await client.home()
+        await asyncio.gather(client.move({'X': 10}), client.set_temperature(60))
+        async for topic, values in client.telemetry():
+            print(topic, values)
+"""
+import asyncio
+from typing import Union
+
+from .client import StackingClient, DEFAULT_TIMEOUT, INTERVAL
+
+
+class AsyncStackingClient:
+    """Asyncio version of the :class:`~client.client.StackingClient`."""
+
+    def __init__(self, connector, timeout: float = DEFAULT_TIMEOUT, heartbeat: float = INTERVAL) -> ...:
+        """
+        Initialize the client.
+
+        Parameters
+        ----------
+        connector : BaseConnector
+            The frontend side of the connection to the backend.
+        timeout : float
+            The default time in seconds to wait for a response.
+        heartbeat : float
+            The time in seconds between two heartbeats, 0 to not send them.
+        """
+        self.client = StackingClient(connector, timeout, heartbeat)
+        self._timeout = timeout
+
+    async def __aenter__(self) -> "AsyncStackingClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc) -> ...:
+        await self.close()
+
+    async def connect(self) -> ...:
+        """Do the handshake with the backend and start the reader."""
+        await asyncio.get_running_loop().run_in_executor(None, self.client.connect)
+
+    async def close(self, stop_backend: bool = False) -> ...:
+        """
+        Stop the reader and disconnect, see :meth:`~client.client.StackingClient.close`.
+
+        Parameters
+        ----------
+        stop_backend : bool
+            Send the sentinel so the backend stops.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self.client.close, stop_backend)
+
+    async def _wait(self, future, timeout: Union[float, None]):
+        """Await the response of a command."""
+        timeout = self._timeout if timeout is None else timeout
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    async def submit(self, command: str, timeout: Union[float, None] = None):
+        """
+        Send a gcode line and wait for the response.
+
+        Parameters
+        ----------
+        command : str
+            The gcode line.
+        timeout : float, None
+            The time to wait in seconds, by default the timeout of the client.
+
+        Returns
+        -------
+        response : Message
+            The response of the backend.
+        """
+        return await self._wait(self.client.submit(command), timeout)
+
+    async def move(self, axes: dict, timeout: Union[float, None] = None):
+        """Move the linear axes, see :meth:`~client.client.StackingClient.move`."""
+        return await self._wait(self.client.move(axes, wait=False), timeout)
+
+    async def rotate(self, angle: Union[float, int], timeout: Union[float, None] = None):
+        """Rotate the sample bed, see :meth:`~client.client.StackingClient.rotate`."""
+        return await self._wait(self.client.rotate(angle, wait=False), timeout)
+
+    async def set_positioning(self, absolute: bool, timeout: Union[float, None] = None):
+        """Set the positioning mode, see :meth:`~client.client.StackingClient.set_positioning`."""
+        return await self._wait(self.client.set_positioning(absolute, wait=False), timeout)
+
+    async def home(self, timeout: Union[float, None] = None):
+        """Home all the axes, see :meth:`~client.client.StackingClient.home`."""
+        return await self._wait(self.client.home(wait=False), timeout)
+
+    async def positions(self, timeout: Union[float, None] = None) -> dict:
+        """Get the positions, see :meth:`~client.client.StackingClient.positions`."""
+        return (await self.submit("M114", timeout)).msg
+
+    async def temperatures(self, timeout: Union[float, None] = None) -> dict:
+        """Get the temperatures, see :meth:`~client.client.StackingClient.temperatures`."""
+        return (await self.submit("M105", timeout)).msg
+
+    async def set_temperature(
+        self,
+        temperature: Union[float, int],
+        wait: bool = True,
+        tolerance: float = 1.0,
+        poll_interval: float = 1.0,
+        timeout: Union[float, None] = None,
+    ):
+        """Set the temperature, see :meth:`~client.client.StackingClient.set_temperature`."""
+        loop = asyncio.get_running_loop()
+        if not wait:
+            return await self._wait(self.client.set_temperature(temperature, wait=False), timeout)
+        return await loop.run_in_executor(
+            None, lambda: self.client.set_temperature(temperature, True, tolerance, poll_interval, timeout)
+        )
+
+    async def telemetry(self, timeout: Union[float, None] = None) -> ...:
+        """
+        Iterate over the reported positions and temperatures, see
+        :meth:`~client.client.StackingClient.telemetry`.
+        """
+        loop = asyncio.get_running_loop()
+        iterator = self.client.telemetry(timeout)
+        done = object()
+        try:
+            while True:
+                item = await loop.run_in_executor(None, next, iterator, done)
+                if item is done:
+                    return
+                yield item
+        finally:
+            try:
+                iterator.close()
+            except ValueError:
+                pass  # Still waiting in the executor, it stops when the client closes
@@ -0,0 +1,501 @@
+"""
+Scripting client of the stacking setup.
+
+Every command is sent as a numbered gcode line (``N<nr> <command>``) and
+returns a :class:`concurrent.futures.Future` that is resolved with the
+response of the backend to that line. The responses are matched on the
+request id (the line number) and not on the command id, so any amount
+of commands can be in flight at the same time. Use :meth:`StackingClient.batch`
+to send many commands in one frame.
+
+Example::
+
+    client = StackingClient(connector)
+    client.connect()
+    client.home()
+    with client.batch():
+        moves = [client.move({'X': 10}, wait=False) for _ in range(10)]
+    for future in moves:
+        future.result()
+    for topic, values in client.telemetry():
+        print(topic, values)
+"""
+import re
+import time
+import queue
+import contextlib
+import threading as tr
+from concurrent.futures import Future
+from typing import Union
+
+try:
+    from ..components.stacking_middleware.message import Message
+    from ..components.stacking_middleware.topics import TOPIC_POSITIONS, TOPIC_TEMPERATURES
+    from ..components.stacking_middleware.heartbeat import INTERVAL
+except ImportError:
+    from components.stacking_middleware.message import Message
+    from components.stacking_middleware.topics import TOPIC_POSITIONS, TOPIC_TEMPERATURES
+    from components.stacking_middleware.heartbeat import INTERVAL
+
+
+DEFAULT_TIMEOUT = 60  # Seconds to wait for a response
+MAX_REQUEST_ID = 0xFFFFFFFF  # The request ids are sent as unsigned 32 bit numbers
+
+_TELEMETRY_TOPICS = {"M154": TOPIC_POSITIONS, "M155": TOPIC_TEMPERATURES}
+_CLOSED = object()  # Put in the telemetry queues when the client closes
+_COMMAND_ID = re.compile(r"[GM]\d+")
+
+
+class CommandError(Exception):
+    """Raised when the backend answered a command with an error."""
+
+    def __init__(self, message: Message):
+        self.message = message
+
+    def __str__(self):
+        return "{} failed with exit code {}: {}".format(
+            self.message.command_id, self.message.exit_code, self.message.msg
+        )
+
+
+class StackingClient:
+    """
+    Client of the backend for experiment scripts.
+
+    The client uses any frontend connector (see :mod:`stacking_middleware`).
+    A reader thread receives the messages of the backend, resolves the
+    futures of the commands and passes the auto reports to the
+    :meth:`telemetry` iterators. The waiting commands fail as soon as the
+    backend stops sending heartbeats.
+    """
+
+    def __init__(self, connector, timeout: float = DEFAULT_TIMEOUT, heartbeat: float = INTERVAL) -> ...:
+        """
+        Initialize the client.
+
+        Parameters
+        ----------
+        connector : BaseConnector
+            The frontend side of the connection to the backend.
+        timeout : float
+            The default time in seconds to wait for a response.
+        heartbeat : float
+            The time in seconds between two heartbeats, 0 to not send them.
+        """
+        self._con = connector
+        self._timeout = timeout
+        self._heartbeat = heartbeat
+        self._lock = tr.Lock()
+        self._pending = {}  # Future per request id
+        self._request_id = 0
+        self._listeners = []  # Queues of the telemetry iterators
+        self._batch = tr.local()  # The lines collected by a batch of this thread
+        self._stop = tr.Event()
+        self._reader = None
+
+    def __enter__(self) -> "StackingClient":
+        self.connect()
+        return self
+
+    def __exit__(self, *exc) -> ...:
+        self.close()
+
+    @property
+    def connector(self):
+        """The connector to the backend."""
+        return self._con
+
+    @property
+    def outstanding(self) -> int:
+        """The amount of commands that did not get a response yet."""
+        return len(self._pending)
+
+    # CONNECTION
+    def connect(self) -> ...:
+        """Do the handshake with the backend (if not done yet) and start the reader."""
+        if not self._con.handshake_complete:
+            self._con.handshake()
+        if self._heartbeat and self._con.heartbeat is None:
+            self._con.start_heartbeat(self._heartbeat, on_lost=self._backend_lost)
+        if self._reader is None:
+            self._stop.clear()
+            self._reader = tr.Thread(target=self._read_loop, daemon=True)
+            self._reader.start()
+
+    def close(self, stop_backend: bool = False) -> ...:
+        """
+        Stop the reader and disconnect, the waiting commands fail.
+
+        Parameters
+        ----------
+        stop_backend : bool
+            Send the sentinel so the backend stops (the socket backend only
+            stops when the last client sends it).
+        """
+        if stop_backend and self._con.is_connected:
+            self._con.send_sentinel()
+        self._stop.set()
+        if self._reader is not None:
+            self._reader.join()
+            self._reader = None
+        self._con.disconnect()
+
+        self._fail_pending(ConnectionError("The client was closed before the backend answered."))
+        self._lock.acquire()
+        listeners = list(self._listeners)
+        self._lock.release()
+        for listener in listeners:
+            listener.put(_CLOSED)
+
+    def _backend_lost(self) -> ...:
+        """Fail the waiting commands, the backend stopped sending heartbeats."""
+        self._fail_pending(ConnectionError("The backend stopped sending heartbeats."))
+
+    def _fail_pending(self, error: Exception) -> ...:
+        """Fail the futures of all the waiting commands."""
+        self._lock.acquire()
+        pending, self._pending = self._pending, {}
+        self._lock.release()
+        for future in pending.values():
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+    # COMMANDS
+    def submit(self, command: str) -> Future:
+        """
+        Send a gcode line.
+
+        Parameters
+        ----------
+        command : str
+            The gcode line, for example 'G0 X10'.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Resolved with the response :class:`Message`, or failed with a
+            :class:`CommandError` if the backend answered with an error.
+
+        Raises
+        ------
+        ValueError
+            If the backend announced in the handshake that it does not
+            support one of the commands in the line.
+        """
+        unsupported = [w for w in command.split() if _COMMAND_ID.fullmatch(w) and not self._con.supports(w)]
+        if unsupported:
+            raise ValueError("The backend does not support {}.".format(", ".join(unsupported)))
+
+        future = Future()
+        self._lock.acquire()
+        self._request_id = self._request_id % MAX_REQUEST_ID + 1
+        request_id = self._request_id
+        self._pending[request_id] = future
+        self._lock.release()
+
+        line = "N{} {}".format(request_id, command)
+        lines = getattr(self._batch, "lines", None)
+        if lines is not None:
+            lines.append(line)
+        else:
+            self._con.send(line)
+        return future
+
+    @contextlib.contextmanager
+    def batch(self) -> ...:
+        """
+        Collect the commands of this thread and send them as one frame.
+
+        The commands in the block return futures, they are only sent when
+        the block ends so they can not be waited for inside the block.
+        """
+        if getattr(self._batch, "lines", None) is not None:
+            yield  # Already in a batch
+            return
+        self._batch.lines = []
+        try:
+            yield
+        finally:
+            lines, self._batch.lines = self._batch.lines, None
+            if lines:
+                self._con.send(lines)
+
+    def _result(self, future: Future, wait: bool, timeout: Union[float, None]):
+        """Wait for the response of the future or return the future."""
+        if not wait:
+            return future
+        if getattr(self._batch, "lines", None) is not None:
+            raise RuntimeError("A command in a batch can not be waited for, use wait=False.")
+        return future.result(self._timeout if timeout is None else timeout)
+
+    def move(self, axes: dict, wait: bool = True, timeout: Union[float, None] = None):
+        """
+        Move the linear axes (G0), relative or absolute depending on the positioning mode.
+
+        Parameters
+        ----------
+        axes : dict
+            The movement per axis, {<axis_id> : <um>, ...}.
+        wait : bool
+            Wait until the move is done, otherwise return the future.
+        timeout : float, None
+            The time to wait in seconds, by default the timeout of the client.
+
+        Returns
+        -------
+        response : Message, Future
+            The response of the backend, or the future of the response.
+
+        Raises
+        ------
+        ValueError
+            If one of the axes is not enabled on the backend.
+        """
+        capabilities = self._con.capabilities
+        if capabilities is not None:
+            disabled = [axis for axis in axes if axis not in capabilities.axes]
+            if disabled:
+                raise ValueError("The axes {} are not enabled on the backend.".format(disabled))
+        return self._result(self.submit(_line("G0", axes)), wait, timeout)
+
+    def rotate(self, angle: Union[float, int], wait: bool = True, timeout: Union[float, None] = None):
+        """
+        Rotate the sample bed (G1).
+
+        Parameters
+        ----------
+        angle : float, int
+            The rotation in degrees.
+        wait : bool
+            Wait until the rotation is done, otherwise return the future.
+        timeout : float, None
+            The time to wait in seconds, by default the timeout of the client.
+
+        Returns
+        -------
+        response : Message, Future
+            The response of the backend, or the future of the response.
+        """
+        return self._result(self.submit(_line("G1", {"L": angle})), wait, timeout)
+
+    def set_positioning(self, absolute: bool, wait: bool = True, timeout: Union[float, None] = None):
+        """
+        Set the positioning mode of the moves, absolute (G90) or relative (G91).
+
+        Parameters
+        ----------
+        absolute : bool
+            True for absolute positioning, False for relative positioning.
+        wait : bool
+            Wait for the response, otherwise return the future.
+        timeout : float, None
+            The time to wait in seconds, by default the timeout of the client.
+
+        Returns
+        -------
+        response : Message, Future
+            The response of the backend, or the future of the response.
+        """
+        return self._result(self.submit("G90" if absolute else "G91"), wait, timeout)
+
+    def home(self, wait: bool = True, timeout: Union[float, None] = None):
+        """
+        Home all the axes (G28).
+
+        Parameters
+        ----------
+        wait : bool
+            Wait until homing is done, otherwise return the future.
+        timeout : float, None
+            The time to wait in seconds, by default the timeout of the client.
+
+        Returns
+        -------
+        response : Message, Future
+            The response of the backend, or the future of the response.
+        """
+        return self._result(self.submit("G28"), wait, timeout)
+
+    def positions(self, timeout: Union[float, None] = None) -> dict:
+        """
+        Get the positions (M114).
+
+        Parameters
+        ----------
+        timeout : float, None
+            The time to wait in seconds, by default the timeout of the client.
+
+        Returns
+        -------
+        positions : dict
+            {<axis_id> : <position>, ...}
+        """
+        return self._result(self.submit("M114"), True, timeout).msg
+
+    def temperatures(self, timeout: Union[float, None] = None) -> dict:
+        """
+        Get the temperatures (M105).
+
+        Parameters
+        ----------
+        timeout : float, None
+            The time to wait in seconds, by default the timeout of the client.
+
+        Returns
+        -------
+        temperatures : dict
+            {<axis_id> : {'current' : <temperature>, 'target' : <setpoint>}, ...}
+        """
+        return self._result(self.submit("M105"), True, timeout).msg
+
+    def set_temperature(
+        self,
+        temperature: Union[float, int],
+        wait: bool = True,
+        tolerance: float = 1.0,
+        poll_interval: float = 1.0,
+        timeout: Union[float, None] = None,
+    ):
+        """
+        Set the temperature of the sample bed (M140).
+
+        Parameters
+        ----------
+        temperature : float, int
+            The temperature to set in degrees celsius.
+        wait : bool
+            Wait until every heater is within the tolerance of the
+            temperature, otherwise return the future of the command.
+        tolerance : float
+            The allowed difference with the temperature in degrees celsius.
+        poll_interval : float
+            The time in seconds between two temperature reads while waiting.
+        timeout : float, None
+            The time to wait in seconds, by default the timeout of the client.
+
+        Raises
+        ------
+        TimeoutError
+            If the temperature was not reached within the timeout.
+
+        Returns
+        -------
+        temperatures : dict, Future
+            The temperatures (see :meth:`temperatures`) once the temperature
+            is reached, or the future of the command.
+        """
+        future = self.submit(_line("M140", {"S": temperature}))
+        if not wait:
+            return future
+        timeout = self._timeout if timeout is None else timeout
+        etime = time.monotonic() + timeout
+        self._result(future, True, timeout)
+        while True:
+            temperatures = self.temperatures(max(etime - time.monotonic(), 0))
+            heaters = [t["current"] for t in temperatures.values() if t["target"] is not None]
+            if all(current is not None and abs(current - temperature) <= tolerance for current in heaters):
+                return temperatures
+            if time.monotonic() + poll_interval > etime:
+                raise TimeoutError("The temperature {} was not reached, got {}".format(temperature, temperatures))
+            time.sleep(poll_interval)
+
+    # TELEMETRY
+    def telemetry(self, timeout: Union[float, None] = None) -> ...:
+        """
+        Iterate over the positions and temperatures while they are reported.
+
+        Start the auto reports with 'M154 S<interval>' and 'M155 S<interval>'.
+        When the connector has a shared telemetry block the block is read
+        instead, every new snapshot gives its positions and temperatures.
+
+        Parameters
+        ----------
+        timeout : float, None
+            Stop when nothing was reported for this time in seconds, None
+            to continue until the client closes.
+
+        Yields
+        ------
+        topic : str
+            'positions' or 'temperatures'.
+        values : dict
+            The positions or temperatures in the format of M114 or M105.
+        """
+        block = self._con.telemetry
+        if block is not None:
+            yield from self._block_telemetry(block, timeout)
+            return
+
+        listener = queue.Queue()
+        self._lock.acquire()
+        self._listeners.append(listener)
+        self._lock.release()
+        try:
+            while True:
+                try:
+                    item = listener.get(timeout=timeout)
+                except queue.Empty:
+                    return
+                if item is _CLOSED:
+                    return
+                yield item
+        finally:
+            self._lock.acquire()
+            self._listeners.remove(listener)
+            self._lock.release()
+
+    def _block_telemetry(self, block, timeout: Union[float, None]) -> ...:
+        """Iterate over the new snapshots of the shared telemetry block."""
+        sequence = block.sequence
+        last = time.monotonic()
+        while not self._stop.is_set():
+            if block.sequence != sequence:
+                snapshot = block.read()
+                if snapshot is not None:
+                    sequence, last = snapshot["sequence"], time.monotonic()
+                    if snapshot["positions"]:
+                        yield TOPIC_POSITIONS, snapshot["positions"]
+                    if snapshot["temperatures"]:
+                        yield TOPIC_TEMPERATURES, snapshot["temperatures"]
+            elif timeout is not None and time.monotonic() - last > timeout:
+                return
+            time.sleep(0.01)
+
+    # READER
+    def _read_loop(self) -> ...:
+        """Receive the messages of the backend (runs in the reader thread)."""
+        while not self._stop.is_set():
+            if not self._con.wait_for_message(0.1):
+                if not self._con.is_connected:
+                    break
+                continue
+            for item in self._con.receive() or []:
+                if isinstance(item, Message):
+                    self._handle(item)
+
+    def _handle(self, message: Message) -> ...:
+        """Resolve the future of a response or pass an auto report on."""
+        if message.request_id is not None:
+            self._lock.acquire()
+            future = self._pending.pop(message.request_id, None)
+            self._lock.release()
+            if future is None or not future.set_running_or_notify_cancel():
+                return  # Another response to the same line, or the caller stopped waiting
+            if message.exit_code == 0:
+                future.set_result(message)
+            else:
+                future.set_exception(CommandError(message))
+            return
+
+        topic = _TELEMETRY_TOPICS.get(message.command_id)
+        if topic is not None and message.exit_code == 0:
+            self._lock.acquire()
+            listeners = list(self._listeners)
+            self._lock.release()
+            for listener in listeners:
+                listener.put((topic, message.msg))
+
+
+def _line(command_id: str, params: dict) -> str:
+    """Create a gcode line, {'X': 10} gives 'G0 X10'."""
+    return " ".join([command_id] + ["{}{}".format(key, value) for key, value in params.items()])
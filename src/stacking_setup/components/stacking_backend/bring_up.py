@@ -0,0 +1,204 @@
+import threading as tr
+import traceback
+from typing import Union, Tuple
+from . import clock
+
+
+class BringUpGraph:
+    """
+    Connect hardware as a dependency graph.
+
+    Every device is a step with a connect function, the steps it depends on
+    and a timeout. Steps start as soon as all their dependencies are
+    connected, so independent controllers connect in parallel and a
+    component connects directly after its controller(s). If a dependency
+    fails (or times out) the steps depending on it are skipped.
+
+    .. note::
+        A step that times out cannot be killed, its thread keeps running in
+        the background (as a daemon) but the result is ignored.
+    """
+
+    # The possible states of a step in the report
+    OK = "ok"
+    FAILED = "failed"
+    TIMEOUT = "timeout"
+    SKIPPED = "skipped"
+
+    def __init__(self, em_event=None) -> ...:
+        """
+        Initialize the graph.
+
+        Parameters
+        ----------
+        em_event : multiprocessing.Event, None
+            The emergency stop event, no new steps are started once it is set.
+        """
+        self._em_event = em_event
+        self._steps = {}
+        self._cond = tr.Condition()
+
+    def add(
+        self,
+        name: str,
+        func: callable,
+        depends: Tuple[str, ...] = (),
+        timeout: Union[float, int] = 30,
+    ) -> ...:
+        """
+        Add a step to the graph.
+
+        Parameters
+        ----------
+        name : str
+            The unique name of the step.
+        func : callable
+            The function that connects the device.
+        depends : tuple
+            The names of the steps that have to be connected first.
+        timeout : float, int
+            The maximum time in seconds the step is allowed to take.
+
+        Raises
+        ------
+        ValueError
+            If a step with the same name was already added.
+        """
+        if name in self._steps:
+            raise ValueError("Bring up step {} was already added.".format(name))
+        self._steps[name] = {"func": func, "depends": tuple(depends), "timeout": timeout}
+
+    def _run_step(self, name: str, results: dict) -> ...:
+        """Run a step and store the result (executed in a separate thread)."""
+        try:
+            self._steps[name]["func"]()
+            status, error = self.OK, None
+        except Exception as e:
+            status = self.FAILED
+            error = "{}: {}".format(type(e).__name__, e)
+            traceback.print_exc()
+
+        self._cond.acquire()
+        if results[name]["status"] is None:  # Not timed out in the meantime
+            results[name]["status"] = status
+            results[name]["error"] = error
+            results[name]["end"] = clock.monotonic()
+        self._cond.notify_all()
+        self._cond.release()
+
+    def _dependency_state(self, name: str, results: dict) -> Union[str, None]:
+        """Get OK if all dependencies are connected, the failing state or None if not done."""
+        for dep in self._steps[name]["depends"]:
+            state = results[dep]["status"] if dep in results else None
+            if state is None:
+                return None
+            elif state != self.OK:
+                return state
+        return self.OK
+
+    def run(self) -> dict:
+        """
+        Run all the steps.
+
+        Raises
+        ------
+        ValueError
+            If a step depends on a step that is not in the graph.
+
+        Returns
+        -------
+        report : dict
+            The startup timing report, with the total time in seconds under
+            'total' and per step under 'steps' the status, error, dependencies
+            and the start, end and duration in seconds.
+        """
+        for name, step in self._steps.items():
+            for dep in step["depends"]:
+                if dep not in self._steps:
+                    raise ValueError("Bring up step {} depends on unknown step {}.".format(name, dep))
+
+        start = clock.monotonic()
+        results = {}
+        waiting = list(self._steps)
+        running = {}
+
+        self._cond.acquire()
+        while len(waiting) != 0 or len(running) != 0:
+            now = clock.monotonic()
+
+            # Start the steps that are ready or skip them if a dependency failed
+            for name in list(waiting):
+                state = self._dependency_state(name, results)
+                em_stop = self._em_event is not None and self._em_event.is_set()
+                if state is None and not em_stop:
+                    continue
+                waiting.remove(name)
+                results[name] = {"status": None, "error": None, "start": now, "end": None}
+                if em_stop or state != self.OK:
+                    results[name]["status"] = self.SKIPPED
+                    results[name]["error"] = "Emergency stop" if em_stop else "Dependency not connected"
+                    results[name]["end"] = now
+                    continue
+                thread = tr.Thread(target=self._run_step, args=(name, results), daemon=True)
+                running[name] = now + self._steps[name]["timeout"]
+                thread.start()
+
+            # Collect the finished and timed out steps
+            for name, deadline in list(running.items()):
+                if results[name]["status"] is not None:
+                    del running[name]
+                elif now >= deadline:
+                    results[name]["status"] = self.TIMEOUT
+                    results[name]["error"] = "No connection within {} s".format(self._steps[name]["timeout"])
+                    results[name]["end"] = now
+                    del running[name]
+
+            if len(running) == 0 and len(waiting) != 0 and all(
+                self._dependency_state(name, results) is None for name in waiting
+            ):
+                # Nothing can start anymore, the remaining steps depend on each other
+                for name in waiting:
+                    results[name] = {"status": self.SKIPPED, "error": "Circular dependency",
+                                     "start": now, "end": now}
+                waiting = []
+            elif len(running) != 0:
+                self._cond.wait(0.01)
+        self._cond.release()
+
+        report = {"total": clock.monotonic() - start, "steps": {}}
+        for name, result in results.items():
+            report["steps"][name] = {
+                "status": result["status"],
+                "error": result["error"],
+                "depends": self._steps[name]["depends"],
+                "start": result["start"] - start,
+                "end": result["end"] - start,
+                "duration": result["end"] - result["start"],
+            }
+        return report
+
+    @staticmethod
+    def format_report(report: dict) -> str:
+        """
+        Format the startup report as a table.
+
+        Parameters
+        ----------
+        report : dict
+            The report returned by :meth:`run`.
+
+        Returns
+        -------
+        table : str
+            The report as text.
+        """
+        lines = ["Hardware bring up took {:.2f} s".format(report["total"])]
+        steps = sorted(report["steps"].items(), key=lambda i: (i[1]["start"], i[0]))
+        for name, step in steps:
+            line = "  {:<18} {:<8} start {:7.2f} s  took {:7.2f} s".format(
+                name, step["status"], step["start"], step["duration"]
+            )
+            if step["error"] is not None:
+                line += "  ({})".format(step["error"])
+            lines.append(line)
+        return "\n".join(lines)
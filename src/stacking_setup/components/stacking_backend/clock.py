@@ -0,0 +1,210 @@
+"""
+Clock used by the backend, the controllers and the simulators.
+
+All waiting in the backend goes through :func:`sleep` (or :func:`wait` for an
+event) and all deadlines are calculated with :func:`monotonic`, so the time
+source can be swapped.
+By default the :class:`RealClock` is used. The :class:`VirtualClock` is
+meant for simulated runs, it only moves forward when every thread that
+uses the clock is sleeping and then jumps straight to the earliest wake up
+time. A homing run of minutes on the rig finishes in a fraction of a
+second and always sees the same sequence of timestamps.
+
+Example
+-------
+>>> from components.stacking_backend import clock
+>>> clock.set_clock(clock.VirtualClock())
+>>> clock.sleep(180)  # Returns immediately
+>>> clock.monotonic()
+180.0
+"""
+import time
+import heapq
+import itertools
+import threading as tr
+from typing import Union
+
+
+class RealClock:
+    """Clock that follows the wall time (the default)."""
+
+    mode = "real"
+
+    def monotonic(self) -> float:
+        """Get the current time in seconds."""
+        return time.monotonic()
+
+    def sleep(self, seconds: Union[float, int]) -> ...:
+        """Block the calling thread for the given amount of seconds."""
+        time.sleep(max(seconds, 0))
+
+    def wait(self, event: tr.Event, timeout: Union[float, int, None] = None) -> bool:
+        """Wait until the event is set or the timeout passes, return True if it is set."""
+        return event.wait(None if timeout is None else max(timeout, 0))
+
+
+class VirtualClock:
+    """
+    Clock that advances instantly when all threads using it are blocked.
+
+    Every thread that sleeps on the clock is registered as a participant.
+    When all living participants are sleeping the time jumps to the
+    earliest wake up time and the threads that are due are released in
+    order. A participant that is blocked on something else (a queue, a
+    serial port, a join) would stop the clock forever, so if no progress
+    is made for ``stall_timeout`` seconds of wall time the clock advances
+    anyway.
+    """
+
+    mode = "virtual"
+
+    def __init__(
+        self, start: Union[float, int] = 0.0, stall_timeout: Union[float, int] = 0.01
+    ) -> ...:
+        """
+        Initialize the clock.
+
+        Parameters
+        ----------
+        start : float, int
+            The start time in seconds.
+        stall_timeout : float, int
+            The wall time in seconds to wait for a participant that is not
+            sleeping on the clock before advancing anyway.
+        """
+        self._now = float(start)
+        self._stall_timeout = stall_timeout
+        self._cond = tr.Condition()
+        self._sleepers = []  # Heap of (wake up time, sequence nr)
+        self._pending = set()  # Sequence nrs of the sleepers not yet released
+        self._counter = itertools.count()
+        self._participants = set()
+
+    def monotonic(self) -> float:
+        """Get the current virtual time in seconds."""
+        self._cond.acquire()
+        now = self._now
+        self._cond.release()
+        return now
+
+    def register(self, thread: Union[tr.Thread, None] = None) -> ...:
+        """
+        Register a thread as participant (done automatically on sleep).
+
+        Parameters
+        ----------
+        thread : threading.Thread, None
+            The thread to register, by default the calling thread.
+        """
+        self._cond.acquire()
+        self._participants.add(tr.current_thread() if thread is None else thread)
+        self._cond.release()
+
+    def unregister(self, thread: Union[tr.Thread, None] = None) -> ...:
+        """
+        Stop waiting for a thread before advancing the time.
+
+        Parameters
+        ----------
+        thread : threading.Thread, None
+            The thread to unregister, by default the calling thread.
+        """
+        self._cond.acquire()
+        self._participants.discard(tr.current_thread() if thread is None else thread)
+        self._cond.notify_all()
+        self._cond.release()
+
+    def _all_blocked(self) -> bool:
+        """Check if all participants are sleeping (lock should be held)."""
+        # Forget the finished threads, registered threads that did not start yet still count
+        self._participants = {
+            t for t in self._participants if t.is_alive() or t.ident is None
+        }
+        return len(self._pending) >= len(self._participants)
+
+    def _advance(self) -> ...:
+        """Jump to the earliest wake up time and release the due sleepers (lock should be held)."""
+        if len(self._sleepers) == 0:
+            return
+        self._now = max(self._now, self._sleepers[0][0])
+        while len(self._sleepers) != 0 and self._sleepers[0][0] <= self._now:
+            _, seq = heapq.heappop(self._sleepers)
+            self._pending.discard(seq)
+        self._cond.notify_all()
+
+    def sleep(self, seconds: Union[float, int]) -> ...:
+        """Block the calling thread for the given amount of virtual seconds."""
+        if seconds <= 0:
+            time.sleep(0)  # Only give other threads a chance to run
+            return
+
+        self._cond.acquire()
+        try:
+            self._participants.add(tr.current_thread())
+            seq = next(self._counter)
+            heapq.heappush(self._sleepers, (self._now + seconds, seq))
+            self._pending.add(seq)
+
+            while seq in self._pending:
+                if self._all_blocked():
+                    self._advance()
+                elif not self._cond.wait(self._stall_timeout) and seq in self._pending:
+                    # Another participant is blocked outside of the clock
+                    self._advance()
+        finally:
+            self._cond.release()
+
+    def wait(self, event: tr.Event, timeout: Union[float, int, None] = None) -> bool:
+        """
+        Wait until the event is set or the virtual timeout passes.
+
+        The event is checked every virtual millisecond, so the waiting
+        thread takes part in the clock like a sleeping thread.
+
+        Returns
+        -------
+        bool
+            True if the event is set.
+        """
+        etime = None if timeout is None else self.monotonic() + timeout
+        while not event.is_set():
+            if etime is not None and self.monotonic() >= etime:
+                return False
+            self.sleep(0.001)
+        return True
+
+
+_clock = RealClock()
+
+
+def get_clock() -> Union[RealClock, VirtualClock]:
+    """Get the clock used by the backend."""
+    return _clock
+
+
+def set_clock(clock: Union[RealClock, VirtualClock, None] = None) -> ...:
+    """
+    Set the clock used by the backend.
+
+    Parameters
+    ----------
+    clock : RealClock, VirtualClock, None
+        The clock to use, None restores the real clock.
+    """
+    global _clock
+    _clock = RealClock() if clock is None else clock
+
+
+def monotonic() -> float:
+    """Get the current time in seconds from the active clock."""
+    return _clock.monotonic()
+
+
+def sleep(seconds: Union[float, int]) -> ...:
+    """Sleep the given amount of seconds on the active clock."""
+    _clock.sleep(seconds)
+
+
+def wait(event: tr.Event, timeout: Union[float, int, None] = None) -> bool:
+    """Wait for an event with a timeout on the active clock, return True if it is set."""
+    return _clock.wait(event, timeout)
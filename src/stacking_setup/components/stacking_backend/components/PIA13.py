@@ -9,6 +9,8 @@ from ..controllers.KIM101 import KIM101
 class PIA13(Base):
     """Class to control a PIA13 Thorlabs piezo actuator."""
 
+    _live_settings = {"min_vel": "_min_speed", "max_vel": "_max_speed", "max_acc": "_max_acceleration"}
+
     def __init__(
         self,
         id: str,
@@ -39,15 +41,11 @@ class PIA13(Base):
         self._hardware_controller = hardware_controller
         self._settings = settings
         self._em_event = em_event
-        self._min_speed = self._settings.get(self._type + "." + self._id, "min_vel")
-        self._max_speed = self._settings.get(self._type + "." + self._id, "max_vel")
-        self._min_speed = self._settings.get(self._type + "." + self._id, "min_vel")
-        self._max_acceleration = self._settings.get(
-            self._type + "." + self._id, "max_acc"
-        )
-        self._steps_per_um = self._settings.get(
-            self._type + "." + self._id, "steps_per_um"
-        )
+        config = self._settings.section(self._type + "." + self._id)
+        self._min_speed = config["min_vel"]
+        self._max_speed = config["max_vel"]
+        self._max_acceleration = config["max_acc"]
+        self._steps_per_um = config["steps_per_um"]
         self._lock = tr.Lock()  # Lock for the hardware
 
     # ATTRIBUTES
@@ -82,9 +80,9 @@ class PIA13(Base):
     def speed(self) -> Union[float, int]:
         """Get the speed of the hardware."""
         self._lock.acquire()
-        drive = self._hardware_controller.get_drive_parameters()
+        vel = self.parameter_cache.get("vel", self._hardware_controller.get_drive_parameters)
         self._lock.release()
-        return drive['vel']
+        return vel
 
     @speed.setter
     def speed(self, speed: Union[float, int]) -> ...:
@@ -107,6 +105,9 @@ class PIA13(Base):
         self._lock.acquire()
         self._hardware_controller.setup_drive(channel=self._channel, velocity=speed)
         self._hardware_controller.setup_jog(channel=self._channel, velocity=speed)
+        # The drive velocity is rounded to whole steps, the acceleration is set as well
+        self.parameter_cache.set("vel", int(round(speed, 0)))
+        self.parameter_cache.invalidate("acc")
         self._lock.release()
 
     @property
@@ -120,14 +121,15 @@ class PIA13(Base):
             The acceleration of the hardware.
         """
         self._lock.acquire()
-        drive = self._hardware_controller.get_drive_parameters()
+        acc = self.parameter_cache.get("acc", self._hardware_controller.get_drive_parameters)
         self._lock.release()
-        return drive['acc']
+        return acc
 
     # CONNECTION FUNCTIONS
     def connect(self) -> ...:
         """Connect the hardware."""
         self._lock.acquire()
+        self.parameter_cache.invalidate()
         if not self._hardware_controller._connected:
             self._hardware_controller.connect()
         else:
@@ -251,6 +253,7 @@ class PIA13(Base):
     def emergency_stop(self) -> ...:
         """Stop the hardware."""
         self._hardware_controller.emergency_stop()
+        self.parameter_cache.invalidate()
 
 
 if __name__ == "__main__":
@@ -2,11 +2,13 @@ import serial
 from typing import Union
 from typeguard import typechecked
 from ..configs.settings import Settings
-import time
+from .. import clock
 import threading as tr
 import multiprocessing as mp
 from ..exceptions import NotSupportedError, HardwareNotConnectedError
 from .base import Base
+from ..simulation import SimulatedTangoSerial
+from ..serial_trace import SerialRecorder, SerialReplay
 
 
 class TangoDesktop(Base):
@@ -44,8 +46,10 @@ class TangoDesktop(Base):
 
     _id = None
     _type = "TANGODESKTOP"
+    _live_settings = {"max_vel": "_max_speed", "check_interval": "_check_interval"}
     _controller = None
     _ser = None
+    _checked_port = None  # The port opened to check the serial nr, reused on connect
 
     def __init__(self, id: str, settings: Settings, em_event: mp.Event) -> ...:
         """
@@ -66,19 +70,24 @@ class TangoDesktop(Base):
         self._em_event = em_event
 
         # Get the settings
-        self._port = settings.get(self._type + ".DEFAULT", "port")
-        self._baud_rate = settings.get(self._type + ".DEFAULT", "baud_rate")
-        self._timeout = settings.get(self._type + ".DEFAULT", "timeout")
-        self._serial_nr = settings.get(self._type + ".DEFAULT", "serial_nr")
-        self._max_speed = settings.get(self._type + "." + self._id, "max_vel")
-        self._check_interval = settings.get(self._type + ".DEFAULT", "check_interval")
+        config = settings.section(self._type + "." + self._id)
+        self._port = config["port"]
+        self._baud_rate = config["baud_rate"]
+        self._timeout = config["timeout"]
+        self._serial_nr = config["serial_nr"]
+        self._max_speed = config["max_vel"]
+        self._check_interval = config["check_interval"]
+        self._simulate = config["simulate"]
+        self._capture_file = config["capture_file"]
+        self._replay_file = config["replay_file"]
+        self._replay_speed = config["replay_speed"]
         self._current_speed = None  # Only used for jogging
         self._stop_event = tr.Event()
 
         if self._controller is None:
             # Controller is not initiated, check if the port can be captured
             try:
-                ser = serial.Serial(self._port, self._baud_rate, timeout=self._timeout)
+                ser = self._open_port()
                 ser.write("?readsn \r".encode())
                 resp = ser.readline().decode().strip()
 
@@ -91,7 +100,8 @@ class TangoDesktop(Base):
                         )
                     )
                 else:
-                    ser.close()
+                    # Keep the port open so connect does not have to reopen it
+                    self._checked_port = ser
 
             except [serial.SerialException, ConnectionRefusedError] as e:
                 raise HardwareNotConnectedError(
@@ -197,6 +207,23 @@ class TangoDesktop(Base):
         state = True if self._ser.in_waiting > 0 else False
         return state
 
+    def _open_port(self) -> serial.Serial:
+        """
+        Open the serial port.
+
+        Opens the simulated port if simulation is enabled or replays a trace
+        if a replay file is set, the traffic is recorded if a capture file is set.
+        """
+        if self._replay_file:
+            ser = SerialReplay(self._replay_file, timeout=self._timeout, speed=self._replay_speed)
+        elif self._simulate:
+            ser = SimulatedTangoSerial(self._port, self._baud_rate, timeout=self._timeout)
+        else:
+            ser = serial.Serial(self._port, self._baud_rate, timeout=self._timeout)
+        if self._capture_file:
+            ser = SerialRecorder(ser, self._capture_file)
+        return ser
+
     def _send_and_receive(
         self,
         command: str,
@@ -246,10 +273,10 @@ class TangoDesktop(Base):
 
         if expect_confirmation or expect_response:
             got_response = False
-            etime = time.time() + self._timeout
-            while time.time() < etime and not got_response:
+            etime = clock.monotonic() + self._timeout
+            while clock.monotonic() < etime and not got_response:
                 # Check if a confirmation is expected
-                time.sleep(0.01)
+                clock.sleep(0.01)
 
                 if expect_confirmation and not expect_response:
                     if self._message_waiting():
@@ -292,9 +319,11 @@ class TangoDesktop(Base):
             return None
         if self._ser is None:
             # Connect the tango desktop
-            self._ser = serial.Serial(
-                self._port, self._baud_rate, timeout=self._timeout
-            )
+            if self._checked_port is not None:
+                self._ser = self._checked_port
+                self._checked_port = None
+            else:
+                self._ser = self._open_port()
 
             # Check if the right dim and ext modes are set
             resp = self._send_and_receive(
@@ -342,12 +371,15 @@ class TangoDesktop(Base):
             return None  # Do nothing to give other classes a chance to stop the emergency stop
 
         self._lock.acquire()
+        if self._checked_port is not None:
+            self._checked_port.close()
+            self._checked_port = None
         if self._ser is None:
             pass
         else:
             # Make sure nothing is moving
             while self.is_moving():
-                pass
+                clock.sleep(0.01)
 
             self._ser.close()  # Disconnect the tango desktop
         self._lock.release()
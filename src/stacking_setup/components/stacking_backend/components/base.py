@@ -1,5 +1,6 @@
 from typing import Union
 from ..exceptions import NotSupportedError
+from ..parameter_cache import ParameterCache
 
 
 class Base:
@@ -21,6 +22,8 @@ class Base:
 
     _id = None
     _type = "HARDWARE BASE CLASS"
+    # Settings that can be changed while running (M501), by key the attribute to set
+    _live_settings = {}
 
     def __init__(self, id: str) -> ...:
         """
@@ -61,6 +64,21 @@ class Base:
         """
         raise NotImplementedError()
 
+    @property
+    def parameter_cache(self) -> ParameterCache:
+        """
+        Get the cache of the parameters that only change when they are set.
+
+        Created on first use, so derived classes do not have to call the
+        initializer of this class. Setters should write the accepted value
+        through to the cache, connecting and the emergency stop should
+        invalidate it.
+        """
+        cache = self.__dict__.get("_parameter_cache")
+        if cache is None:
+            cache = self.__dict__.setdefault("_parameter_cache", ParameterCache())
+        return cache
+
     # STEP ATTRIBUTES
     # The component can either support steps/um or steps/deg, not both.
     @property
@@ -10,6 +10,7 @@ class BaseStepper(Base):
     """Class for the steppers in the XY base controller."""
 
     _type = "BASESTEPPER"
+    _live_settings = {"min_vel": "_min_speed", "max_vel": "_max_speed"}
 
     def __init__(self, settings: Settings, controller: MainXYController, id: str, em_event : mp.Event):
         """Initialize the stepper."""
@@ -17,9 +18,10 @@ class BaseStepper(Base):
         self._id = id
         self._em_event = em_event
 
-        self._min_speed = settings.get(self._type + "." + self._id, "min_vel")
-        self._max_speed = settings.get(self._type + "." + self._id, "max_vel")
-        self._steps_per_um = settings.get(self._type + "." + self._id, "steps_per_um")
+        config = settings.section(self._type + "." + self._id)
+        self._min_speed = config["min_vel"]
+        self._max_speed = config["max_vel"]
+        self._steps_per_um = config["steps_per_um"]
         self._lock = tr.Lock()
 
     # Attributes
@@ -80,6 +82,10 @@ class BaseStepper(Base):
         self._lock.release()
 
     # METHODS
+    def is_moving(self) -> bool:
+        """Check if the stepper is moving (from the motion tracking, without asking the controller)."""
+        return not self._controller.motion_event(self._id).is_set()
+
     def home(self):
         """Home the stepper."""
         self._lock.acquire()
@@ -88,23 +94,29 @@ class BaseStepper(Base):
 
         print("Homing done")
 
-    def move_by(self, distance: float, convert=True) -> ...:
-        """Move the stepper by a certain distance."""
+    def move_by(self, distance: float, convert=True) -> tr.Event:
+        """Move the stepper by a certain distance, the returned event is set when it stopped."""
         if convert:
             distance = self._convert_to_steps(distance)
 
         self._lock.acquire()
-        self._controller.move_by(self._id, distance)
-        self._lock.release()
-
-    def move_to(self, position: float, convert=True) -> ...:
-        """Move the stepper to a certain position."""
+        try:
+            done = self._controller.move_by(self._id, distance)
+        finally:
+            self._lock.release()
+        return done
+
+    def move_to(self, position: float, convert=True) -> tr.Event:
+        """Move the stepper to a certain position, the returned event is set when it stopped."""
         if convert:
             position = self._convert_to_steps(position)
 
         self._lock.acquire()
-        self._controller.move_to(self._id, position)
-        self._lock.release()
+        try:
+            done = self._controller.move_to(self._id, position)
+        finally:
+            self._lock.release()
+        return done
 
     def start_jog(self, direction: str, convert=True) -> ...:
         """Start jogging the stepper."""
@@ -12,6 +12,7 @@ class SampleBed(Base):
 
     _connected = False
     _type = "SAMPLEHOLDER"
+    _live_settings = {"max_temperature": "_max_temperature", "min_vel": "_min_speed", "max_vel": "_max_speed"}
 
     def __init__(
         self,
@@ -45,11 +46,10 @@ class SampleBed(Base):
         self._em_event = em_event
 
         # Load some settings
-        self._max_temperature = self._settings.get(
-            self._type + "." + self._id, "max_temperature"
-        )
-        self._min_speed = self._settings.get(self._type + "." + self._id, "min_vel")
-        self._max_speed = self._settings.get(self._type + "." + self._id, "max_vel")
+        config = self._settings.section(self._type + "." + self._id)
+        self._max_temperature = config["max_temperature"]
+        self._min_speed = config["min_vel"]
+        self._max_speed = config["max_vel"]
 
     # ATTRIBUTES
     @property
@@ -74,7 +74,7 @@ class SampleBed(Base):
     def speed(self) -> Union[float, int]:
         """Get the speed of the motor (mdeg/s)."""
         self._lock.acquire()
-        speed = self._motor_controller.get_drive_parameters()[-1]
+        speed = self.parameter_cache.get("vel", self._motor_controller.get_drive_parameters)
         self._lock.release()
         return speed * 10e3
 
@@ -89,13 +89,16 @@ class SampleBed(Base):
         self._lock.acquire()
         self._motor_controller.setup_drive(velocity=speed)
         self._motor_controller.setup_jog(velocity=speed)
+        # Setting the drive also sets the acceleration
+        self.parameter_cache.set("vel", speed)
+        self.parameter_cache.invalidate("acc")
         self._lock.release()
 
     @property
     def acceleration(self) -> Union[float, int]:
         """Get the acceleration of the motor (mdeg/s^2)."""
         self._lock.acquire()
-        acceleration = self._motor_controller.get_drive_parameters()[0]
+        acceleration = self.parameter_cache.get("acc", self._motor_controller.get_drive_parameters)
         self._lock.release()
         return acceleration * 10e3
 
@@ -135,6 +138,7 @@ class SampleBed(Base):
     def connect(self) -> ...:
         """Connect the sample bed."""
         self._lock.acquire()
+        self.parameter_cache.invalidate()
         if not self._base_controller.is_connected():
             self._base_controller.connect()
 
@@ -316,3 +320,4 @@ class SampleBed(Base):
         self._em_event.set()
         self._motor_controller._controller.stop(immediate=True, sync=False)
         self._base_controller.emergency_stop()
+        self.parameter_cache.invalidate()
@@ -34,6 +34,7 @@ ACCEPTED_COMMANDS = {
               'S' : [int, float]},
     'M154' : {'S': [int, float]},
     'M155' : {'S': [int, float]},
+    'M501' : {},
     'M811' : {'ACCEPTED_AXES': ACCEPTED_AXES},
     'M812' : {'ACCEPTED_AXES': ACCEPTED_AXES},
     'M813' : {'ACCEPTED_AXES': ACCEPTED_AXES},
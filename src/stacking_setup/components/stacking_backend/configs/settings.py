@@ -1,4 +1,6 @@
 import configparser
+from collections.abc import Mapping
+from types import MappingProxyType
 from typing import Union
 from typeguard import typechecked
 from ast import literal_eval
@@ -9,6 +11,115 @@ try:
 except ImportError:
     from accepted_commands import ACCEPTED_COMMANDS, ACCEPTED_AXES, ACCEPTED_LINEAR_AXES, ACCEPTED_ROTATIONAL_AXES
 
+# The accepted value types of the known keys, checked when the settings are compiled
+_NUMBER = (int, float)
+SCHEMA = {
+    "enabled": (bool,),
+    "simulate": (bool,),
+    "serial_nr": (str,),
+    "port": (str,),
+    "baud_rate": (int,),
+    "timeout": _NUMBER,
+    "zero_timeout": _NUMBER,
+    "check_interval": _NUMBER,
+    "connect_timeout": _NUMBER,
+    "capture_file": (str,),
+    "replay_file": (str,),
+    "replay_speed": _NUMBER,
+    "not_ready_policy": (str,),
+    "steps_per_um": _NUMBER,
+    "min_vel": _NUMBER,
+    "max_vel": _NUMBER,
+    "min_acc": _NUMBER,
+    "max_acc": _NUMBER,
+    "max_temperature": _NUMBER,
+    "mode": (str,),
+    "file": (str,),
+    "interval": _NUMBER,
+    "max_age": _NUMBER,
+}
+
+
+class _ConfigParser(configparser.ConfigParser):
+    """Config parser that counts the changes, so compiled sections can be dropped when outdated."""
+
+    version = 0
+
+    def read(self, *args, **kwargs) -> list:
+        """Read the files and count the change."""
+        res = super().read(*args, **kwargs)
+        self.version += 1
+        return res
+
+    def set(self, section: str, option: str, value: Union[str, None] = None) -> None:
+        """Set an option and count the change."""
+        super().set(section, option, value)
+        self.version += 1
+
+    def remove_option(self, section: str, option: str) -> bool:
+        """Remove an option and count the change."""
+        res = super().remove_option(section, option)
+        self.version += 1
+        return res
+
+    def remove_section(self, section: str) -> bool:
+        """Remove a section and count the change."""
+        res = super().remove_section(section)
+        self.version += 1
+        return res
+
+
+class SectionSettings(Mapping):
+    """
+    Immutable snapshot of the settings of one section.
+
+    The values are parsed and type checked once, the fallback values of
+    the <type>.DEFAULT section are already resolved. Components get
+    their snapshot with :meth:`Settings.section` and read the values
+    like a dictionary.
+    """
+
+    __slots__ = ("_name", "_values")
+
+    def __init__(self, name: str, values: dict) -> None:
+        """
+        Initialize the snapshot.
+
+        Parameters
+        ----------
+        name: str
+            The section name.
+        values: dict
+            The parsed values by key.
+        """
+        self._name = name
+        self._values = MappingProxyType(dict(values))
+
+    @property
+    def name(self) -> str:
+        """Get the section name."""
+        return self._name
+
+    def __getitem__(self, key: str) -> Union[str, int, float, bool]:
+        """Get a value, raises a KeyError if the key is not found."""
+        try:
+            return self._values[key.lower()]
+        except KeyError:
+            raise KeyError(f'Key {key} not found in section {self._name}') from None
+
+    def __iter__(self):
+        """Iterate over the keys."""
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        """Get the amount of keys."""
+        return len(self._values)
+
+    def __repr__(self) -> str:
+        """Get the representation of the snapshot."""
+        return f'SectionSettings({self._name!r}, {dict(self._values)!r})'
+
+
 class Settings:
     """
     Class to handle the settings.
@@ -22,6 +133,10 @@ class Settings:
     The config first looks in the <type>.<id> section and then in the
     <type>.DEFAULT section for fallback values. If the key is not found
     in either section, a KeyError is raised.
+
+    The file is parsed and validated once into an immutable
+    :class:`SectionSettings` per section. When the settings are changed
+    the snapshots are compiled again on the next use.
     """
 
     @typechecked
@@ -34,18 +149,22 @@ class Settings:
         filename: str
             The filename of the settings file.
         """
-        self._config = configparser.ConfigParser()
+        self._config = _ConfigParser()
+        self._sections = {}  # Compiled sections by name
+        self._compiled_version = None
 
         # Create the path to file
         self._filename = filename
-        path = os.path.dirname(os.path.abspath(__file__)) + '\\' + self._filename
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), self._filename)
+        self._path = path
 
         # Check if the file exists
         if not self._file_exists(path):
             raise FileNotFoundError(f'File {path} not found.')
         
-        # Load the settings
+        # Load the settings and validate them
         self._config.read(path)
+        self._compile()
         self._accepted_commands = ACCEPTED_COMMANDS
         self._accepted_axes = ACCEPTED_AXES
         self._accepted_linear_axes = ACCEPTED_LINEAR_AXES
@@ -123,7 +242,147 @@ class Settings:
         except FileNotFoundError:
             return False
 
-    @typechecked
+    @staticmethod
+    def _parse(section : str, key : str, raw : str) -> Union[str, int, float, bool]:
+        """
+        Parse and type check a raw value.
+
+        Parameters
+        ----------
+        section: str
+            The section of the value (for the error message).
+        key: str
+            The key of the value.
+        raw: str
+            The value as written in the file.
+
+        Raises
+        ------
+        TypeError
+            If the value does not have the type given in the schema.
+
+        Returns
+        -------
+        value: str, int, float, bool
+            The parsed value, a string if it is not a python literal.
+        """
+        try:
+            value = literal_eval(raw)
+        except (ValueError, SyntaxError):
+            value = raw
+
+        accepted = SCHEMA.get(key)
+        if accepted is None:
+            return value
+        if isinstance(value, bool) and bool not in accepted or not isinstance(value, accepted):
+            raise TypeError(
+                f'Key {key} in section {section} should be '
+                f'{" or ".join(i.__name__ for i in accepted)}, not {type(value).__name__}'
+            )
+        return value
+
+    def _compile_section(self, section : str, config : Union[configparser.ConfigParser, None]=None) -> SectionSettings:
+        """
+        Compile the snapshot of a section with the default values resolved.
+
+        Parameters
+        ----------
+        section: str
+            The section name, the section does not have to exist.
+        config: ConfigParser, None
+            The parsed file to compile from, by default the loaded settings.
+
+        Returns
+        -------
+        snapshot: SectionSettings
+            The compiled section.
+        """
+        config = self._config if config is None else config
+        default = section.split('.')[0] + '.DEFAULT'
+        values = {}
+        for name in (default, section):
+            if config.has_section(name):
+                for key, raw in config.items(name, raw=True):
+                    values[key] = self._parse(name, key, raw)
+        return SectionSettings(section, values)
+
+    def _compile(self) -> None:
+        """Compile all the sections in the file."""
+        version = self._config.version
+        self._sections = {
+            name: self._compile_section(name) for name in self._config.sections()
+        }
+        self._compiled_version = version
+
+    def section(self, section : str) -> SectionSettings:
+        """
+        Get the compiled settings of a section.
+
+        Parameters
+        ----------
+        section: str
+            The section name, values missing in the section are taken from
+            the type.DEFAULT section.
+
+        Returns
+        -------
+        snapshot: SectionSettings
+            The immutable settings of the section.
+        """
+        if self._compiled_version != self._config.version:
+            self._compile()  # The settings changed
+        snapshot = self._sections.get(section)
+        if snapshot is None:
+            # Not in the file, only the default values
+            snapshot = self._compile_section(section)
+            self._sections = {**self._sections, section: snapshot}
+        return snapshot
+
+    def reload(self) -> dict:
+        """
+        Read the settings file again and get the changed settings.
+
+        The new file is validated before it replaces the running settings,
+        if it can not be loaded the running settings are kept.
+
+        Raises
+        ------
+        FileNotFoundError
+            If the settings file does not exist anymore.
+        TypeError
+            If a value in the file has the wrong type.
+
+        Returns
+        -------
+        changes: dict
+            The changed (added, changed or removed) keys by section name, as
+            written in the file (a changed default is not repeated for every section).
+        """
+        if not self._file_exists(self._path):
+            raise FileNotFoundError(f'File {self._path} not found.')
+        config = _ConfigParser()
+        config.read(self._path)
+
+        # Compile (and validate) before anything is replaced
+        new = {name: self._compile_section(name, config) for name in config.sections()}
+
+        # Compare the sections as written, a changed default is reported once
+        changes = {}
+        for name in sorted(set(self._config.sections()) | set(config.sections())):
+            old_values = dict(self._config.items(name, raw=True)) if self._config.has_section(name) else {}
+            new_values = dict(config.items(name, raw=True)) if config.has_section(name) else {}
+            changed = sorted(
+                key for key in set(old_values) | set(new_values)
+                if old_values.get(key) != new_values.get(key)
+            )
+            if changed:
+                changes[name] = changed
+
+        self._config = config
+        self._sections = new
+        self._compiled_version = config.version
+        return changes
+
     def get(self, section : str, key : str) -> Union[str, int, float, bool]:
         """
         Get the value of a key in a specific section.
@@ -148,19 +407,7 @@ class Settings:
         value: str, int, float, bool
             The value of the key.
         """
-        val = self._config.get(section, key, fallback=None)
-        if val is None:  # Look in the default section
-            val = self._config.get(section.split('.')[0]+'.DEFAULT', key, fallback=None)
-
-        if val is None:  # Key not found
-            raise KeyError(f'Key {key} not found in section {section}')
-
-        try:
-            val = literal_eval(val)
-        except ValueError:
-            pass
-
-        return val
+        return self.section(section)[key]
 
     @typechecked
     def set(self, section : str, key : str, value : Union[str, int, float, bool]) -> None:
@@ -201,7 +448,7 @@ class Settings:
         """Save the settings to the file."""
         if filename is None:
             filename = self._filename
-        path = os.path.dirname(os.path.abspath(__file__)) + '\\' + filename
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
         with open(path, 'w') as configfile:
             self._config.write(configfile)
 
@@ -1,7 +1,4 @@
-from pylablib.devices.Thorlabs.kinesis import (
-    KinesisMotor,
-    list_kinesis_devices,
-)
+from pylablib.devices.Thorlabs.kinesis import KinesisMotor
 from typing import Union
 from typeguard import typechecked
 from configparser import ConfigParser
@@ -9,12 +6,17 @@ from ..configs.settings import Settings
 import threading as tr
 import multiprocessing as mp
 from ..exceptions import HardwareNotConnectedError
+from ..simulation import simulated_kinesis
+from .kinesis_devices import list_connected_devices
+from .. import clock
 
 
 class KDC101:
     """Class to control communication with the KCD101 motorcontroller."""
 
     _type = "KDC101"
+    # Settings that can be changed while running (M501), by key the attribute to set
+    _live_settings = {"check_interval": "_check_interval"}
     _connected = False
     _controller = None
 
@@ -37,17 +39,19 @@ class KDC101:
         """
         self._lock = tr.Lock()  # To ensure threadsafe serial communication
         self._settings = settings
-        self._serial_nr = self._settings.get(self._type + ".DEFAULT", "serial_nr")
+        config = self._settings.section(self._type + ".DEFAULT")
+        self._serial_nr = config["serial_nr"]
         self._em_event = em_event
         self._stop_event = tr.Event()
-        self._check_interval = self._settings.get(self._type + ".DEFAULT", "check_interval")
+        self._check_interval = config["check_interval"]
+        self._simulate = config["simulate"]
         if self._serial_nr == "None":
             raise HardwareNotConnectedError(
                 "It could not be determined if the device is connected because of missing serial nr in config."
             )
 
         # Check if the controller is connected.
-        connected_devices = list_kinesis_devices()
+        connected_devices = list_connected_devices(self._simulate)
         device_found = False
         for connection in connected_devices:
             if connection[0] == self._serial_nr:
@@ -55,7 +59,7 @@ class KDC101:
                 break
 
         if not device_found:
-            print("The connected devices: {}".format(list_kinesis_devices()))
+            print("The connected devices: {}".format(connected_devices))
             raise HardwareNotConnectedError("The external controller is not connected.")
 
     # CONNECTION FUNCTIONS
@@ -63,7 +67,10 @@ class KDC101:
         """Connect the KCD101."""
         # Device model PRM1-Z8 is used bcause the PRMTZ8/M is not officially supported by pylablib.
         self._lock.acquire()
-        self._controller = KinesisMotor(self._serial_nr, scale="PRM1-Z8")
+        if self._simulate:
+            self._controller = simulated_kinesis.SimulatedKinesisMotor(self._serial_nr, scale="PRM1-Z8")
+        else:
+            self._controller = KinesisMotor(self._serial_nr, scale="PRM1-Z8")
         self._connected = True
         self._lock.release()
 
@@ -324,7 +331,7 @@ class KDC101:
                 if not self._controller.is_moving():
                     break
                 else:
-                    continue
+                    clock.sleep(0.005)
             else:
                 self.emergency_stop()
                 break
@@ -1,14 +1,13 @@
-from pylablib.devices.Thorlabs.kinesis import (
-    KinesisPiezoMotor,
-    list_kinesis_devices,
-)
+from pylablib.devices.Thorlabs.kinesis import KinesisPiezoMotor
 from typing import Union, Tuple
 from typeguard import typechecked
 from ..configs.settings import Settings
 import threading as tr
 import multiprocessing as mp
 from ..exceptions import HardwareNotConnectedError
-import time
+from ..simulation import simulated_kinesis
+from .kinesis_devices import list_connected_devices
+from .. import clock
 
 
 class KIM101:
@@ -17,6 +16,8 @@ class KIM101:
     _controller = None
     _connected = False
     _type = "KIM101"
+    # Settings that can be changed while running (M501), by key the attribute to set
+    _live_settings = {"check_interval": "_check_interval"}
 
     @typechecked
     def __init__(self, settings: Settings, em_event: mp.Event) -> ...:
@@ -36,11 +37,10 @@ class KIM101:
             If the KIM101 is not connected.
         """
         self._settings = settings
-        self._serial_nr = self._settings.get(self._type + ".DEFAULT", "serial_nr")
-        self._serial_nr = self._settings.get(self._type + ".DEFAULT", "serial_nr")
-        self._check_interval = self._settings.get(
-            self._type + ".DEFAULT", "check_interval"
-        )
+        config = self._settings.section(self._type + ".DEFAULT")
+        self._serial_nr = config["serial_nr"]
+        self._check_interval = config["check_interval"]
+        self._simulate = config["simulate"]
         self._connected = False
         self._stop_event = tr.Event()
         self._lock = tr.Lock()
@@ -51,7 +51,7 @@ class KIM101:
             )
 
         # Check if the controller is connected.
-        connected_devices = list_kinesis_devices()
+        connected_devices = list_connected_devices(self._simulate)
         device_found = False
         for connection in connected_devices:
             if connection[0] == self._serial_nr:
@@ -59,14 +59,17 @@ class KIM101:
                 break
 
         if not device_found:
-            print("The connected deviced: {}".format(list_kinesis_devices()))
+            print("The connected deviced: {}".format(connected_devices))
             raise HardwareNotConnectedError("The external controller is not connected.")
 
     # CONNECTION FUNCTIONS
     def connect(self) -> ...:
         """Connect the KIM101."""
         self._lock.acquire()
-        self._controller = KinesisPiezoMotor(self._serial_nr)
+        if self._simulate:
+            self._controller = simulated_kinesis.SimulatedKinesisPiezoMotor(self._serial_nr)
+        else:
+            self._controller = KinesisPiezoMotor(self._serial_nr)
         self._connected = True
         self._lock.release()
 
@@ -111,7 +114,7 @@ class KIM101:
                 if not self.is_moving(channel):
                     break
                 else:
-                    continue
+                    clock.sleep(0.005)
             else:
                 # Emergency stop was triggered
                 self._controller.stop()
@@ -277,13 +280,16 @@ class KIM101:
         intervals : int
             The amount of intervals to move
         """
+        # The check interval is in ms and the drive velocity in steps/s
+        velocity = self.get_drive_parameters()["vel"]
+        step_size = self._check_interval / 1000 * velocity
+
         # If the distance is smaller than the check interval, only move once
-        if  abs(distance) < self._check_interval * self.speed:
+        if abs(distance) < step_size or step_size <= 0:
             return distance, 1
-        
+
         # Determine the step size by using the check interval time and set velocity
         # The step size is the distance that is moved in one interval
-        step_size = self._check_interval * self.speed
         # Determine the amount of intervals by dividing the distance by the step size
         intervals = abs(int(distance // step_size))
         step_size = step_size if distance > 0 else -1 * step_size
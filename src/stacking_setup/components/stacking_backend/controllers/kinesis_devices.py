@@ -0,0 +1,45 @@
+from pylablib.devices.Thorlabs.kinesis import list_kinesis_devices
+from typing import Union, List, Tuple
+import threading as tr
+from ..simulation import simulated_kinesis
+from .. import clock
+
+
+_lock = tr.Lock()
+_cache = {}  # {simulate: (time, devices)}
+
+
+def list_connected_devices(
+    simulate: bool = False, max_age: Union[float, int] = 5
+) -> List[Tuple[str, str]]:
+    """
+    List the connected kinesis devices.
+
+    Enumerating the kinesis devices is slow, so the result is shared by all
+    kinesis controllers (KIM101, KDC101). Controllers that ask at the same
+    time wait for one enumeration instead of each doing their own.
+
+    Parameters
+    ----------
+    simulate : bool
+        If the simulated devices should be listed.
+    max_age : float, int
+        The maximum age in seconds of a cached result.
+
+    Returns
+    -------
+    devices : list
+        The connected devices as (serial nr, description) tuples.
+    """
+    _lock.acquire()
+    try:
+        now = clock.monotonic()
+        if simulate not in _cache or now - _cache[simulate][0] > max_age:
+            if simulate:
+                devices = simulated_kinesis.list_kinesis_devices()
+            else:
+                devices = list_kinesis_devices()
+            _cache[simulate] = (now, list(devices))
+        return list(_cache[simulate][1])
+    finally:
+        _lock.release()
@@ -1,13 +1,57 @@
-from ..exceptions import HardwareNotConnectedError, HardwareError
+from ..exceptions import HardwareNotConnectedError, HardwareError, AxisNotReadyError
 import serial
 from typing import Union, Tuple
-import time
 import threading as tr
+from .. import clock
 from ..configs.settings import Settings
+from ..simulation import SimulatedMainXYSerial
+from ..serial_trace import SerialRecorder, SerialReplay
+from ..parameter_cache import ParameterCache
 import multiprocessing as mp
+import random
+from collections import deque
 from time import sleep
 
 
+# The amount of data lines that follow the confirmation, by command (or its first two letters)
+_DATA_LINES = {"l": 6, "gp": 1, "gt": 1, "ga": 1, "gb": 48, "gk": 1, "ge": 7}
+# The commands that can send more lines than listed above, jogging gives a different
+# confirmation than other commands. The lines after their answer are skipped until the
+# confirmation of the next command, so the answers stay matched to their commands.
+_TRAILING_LINES = ("sv",)
+
+
+# The cached parameters in the answer of the 'l' command, by key the line index
+_LIMITS = {"speed_x": 0, "acceleration": 1, "deceleration": 2, "speed_y": 3, "target_temperature": 5}
+# The commands that set a cached parameter, by command prefix the key and the conversion
+_WRITES = {
+    "ssx": ("speed_x", int),
+    "ssy": ("speed_y", int),
+    "sa": ("acceleration", int),
+    "sd": ("deceleration", int),
+    "st": ("target_temperature", lambda value: float(value) / 100),
+}
+
+
+def _data_lines(command: str) -> int:
+    """Get the amount of data lines the controller sends after confirming a command."""
+    return _DATA_LINES.get(command, _DATA_LINES.get(command[:2], 0))
+
+
+class _Request:
+    """A command that waits for its answer, see :meth:`MainXYController._route`."""
+
+    __slots__ = ("command", "data_lines", "confirmed", "error", "lines", "done")
+
+    def __init__(self, command: str, data_lines: int) -> ...:
+        self.command = command
+        self.data_lines = data_lines
+        self.confirmed = False
+        self.error = None  # The line that was received instead of the confirmation
+        self.lines = []
+        self.done = tr.Event()
+
+
 class MainXYController:
     """
     This is the main class responsible for communication with the eld controller.
@@ -16,10 +60,28 @@ class MainXYController:
         The controller uses steps as the unit of measurement. This means all values from
         the user should be converted from um to steps. This is not done in this class
         and is the responsibility of the overlaying class
+
+    .. note::
+        Zeroing runs in the background after connecting, every axis has its
+        own readiness state. Moving an axis that is not ready is queued until
+        the axis is zeroed or rejected with a :class:`AxisNotReadyError`,
+        depending on the ``not_ready_policy`` setting. Everything else
+        (temperature, vacuum, position reads) can be used while zeroing.
     """
 
     _type = "MAINXYCONTROLLER"
     _is_connected = False
+    # Settings that can be changed while running (M501), by key the attribute to set
+    _live_settings = {"check_interval": "_check_interval", "zero_timeout": "_zero_timeout"}
+    FIRST_MOTION_POLL = 0.01  # Seconds between the status polls after the expected end of a move
+    MAX_MOTION_POLL = 0.2  # Maximal seconds between two status polls
+    _MOVING_FLAGS = {"x": 15, "y": 31}  # The lines of the 'gb' answer that flag a moving axis
+
+    # The readiness states of the axes
+    NOT_ZEROED = "not zeroed"
+    ZEROING = "zeroing"
+    READY = "ready"
+    FAILED = "failed"
 
     def __init__(self, settings: Settings, em_event: mp.Event) -> ...:
         """
@@ -35,11 +97,25 @@ class MainXYController:
         # Get the settings
         self._em_event = em_event
         self._stop_event = tr.Event()
-        self._port = settings.get(self._type + ".DEFAULT", "port")
-        self._baud_rate = settings.get(self._type + ".DEFAULT", "baud_rate")
-        self._timeout = settings.get(self._type + ".DEFAULT", "timeout")
-        self._zero_timeout = settings.get(self._type + ".DEFAULT", "zero_timeout")
-        self._check_interval = settings.get(self._type + ".DEFAULT", "check_interval")
+        config = settings.section(self._type + ".DEFAULT")
+        self._port = config["port"]
+        self._baud_rate = config["baud_rate"]
+        self._timeout = config["timeout"]
+        self._zero_timeout = config["zero_timeout"]
+        self._check_interval = config["check_interval"]
+        self._simulate = config["simulate"]
+        self._capture_file = config["capture_file"]
+        self._replay_file = config["replay_file"]
+        self._replay_speed = config["replay_speed"]
+        self._not_ready_policy = config["not_ready_policy"]
+        self._pipeline_window = max(1, int(config["pipeline_window"]))
+        self._session_token = config["session_token"]  # The firmware has the sk/gk commands
+        if self._not_ready_policy not in ("queue", "reject"):
+            raise ValueError(
+                "Unknown not_ready_policy {}, use 'queue' or 'reject'.".format(
+                    self._not_ready_policy
+                )
+            )
         self._temp_control_active = False
         self._lock = tr.Lock()
         self._ser_lock = tr.Lock()
@@ -47,6 +123,29 @@ class MainXYController:
         self._zeroed = False
         self._vacuum_state = False
         self._ser = None
+        self._state_lock = tr.Lock()
+        self._axis_state = {"x": self.NOT_ZEROED, "y": self.NOT_ZEROED}
+        self._zero_error = None
+        self._zero_thread = None
+        self._rx_buffer = b""  # Incomplete received line
+        self._requests = deque()  # The requests waiting for their answer, in sending order
+        self._trailing = None  # The answered command of which extra lines are skipped, see _route
+        self._requests_lock = tr.Lock()
+        self._subscribers = []  # Callbacks for the status lines
+        self._reader = None
+        self._reader_stop = tr.Event()
+        self._expected_state = None  # State from the machine state snapshot
+        self._session = 0  # Token stored on the controller after zeroing, 0 if none
+        self._positions = {"x": None, "y": None}  # Last commanded, None if unknown
+        self._speeds = {"x": None, "y": None}  # Last set speeds
+        self._cache = ParameterCache()  # The parameters of the 'l' command
+        self._motion_done = {"x": tr.Event(), "y": tr.Event()}  # Set while idle
+        for event in self._motion_done.values():
+            event.set()
+        self._motion_seq = {"x": 0, "y": 0}  # Counts the started moves
+        self._motion_end = {"x": None, "y": None}  # Expected end time, None if unknown
+        self._motion_wake = tr.Event()
+        self._motion_thread = None
 
     # COMMUNICATION
     def _send_and_receive(
@@ -58,6 +157,10 @@ class MainXYController:
         """
         Send a command to the base controller and receive the response.
 
+        The response lines are matched to the command by the reader thread
+        (see :meth:`_read_loop`), the command only waits until they arrived.
+        Use :meth:`_send_pipelined` to send several commands at once.
+
         Parameters
         -----------
         command: str
@@ -73,70 +176,364 @@ class MainXYController:
             If the tango desktop is not connected.
         ValueError:
             If the command caused an error
+        HardwareError:
+            If the controller did not respond in time.
 
         Returns:
         --------
         response: str or None
             The response of the tango desktop.
         """
+        request = self._submit(command)
+        if not (expect_confirmation or expect_response):
+            return
+        return self._result(request, expect_confirmation, expect_response)
+
+    def _send_pipelined(
+        self, commands: list, expect_response: bool = False
+    ) -> list:
+        """
+        Send several commands without waiting for the answer of each one.
+
+        Up to ``pipeline_window`` commands are in flight, the controller
+        answers them in order. Every command is sent, also when an earlier
+        one was refused.
+
+        Parameters
+        ----------
+        commands: list
+            The commands to send.
+        expect_response: bool
+            If the commands return data lines.
+
+        Raises
+        ------
+        HardwareNotConnectedError:
+            If the controller is not connected.
+        ValueError:
+            If commands were refused, the message gives the answer of every
+            refused command.
+        HardwareError:
+            If the controller did not respond in time.
+
+        Returns
+        -------
+        responses: list
+            The data lines of every command (None if expect_response is False).
+        """
+        requests = [self._submit(command) for command in commands]
+        responses = []
+        errors = []
+        try:
+            for request in requests:
+                try:
+                    responses.append(self._result(request, True, expect_response))
+                except ValueError:
+                    responses.append(None)
+                    errors.append("{}: {}".format(request.command, request.error))
+        except HardwareError:
+            for request in requests:
+                self._drop_request(request)  # Do not match late answers to them
+            raise
+        if len(errors) != 0:
+            raise ValueError(
+                "The base controller refused {} of {} commands ({}).".format(
+                    len(errors), len(commands), ", ".join(errors)
+                )
+            )
+        return responses
+
+    def _submit(self, command: str) -> "_Request":
+        """
+        Send a command, the answer is collected by the reader thread.
+
+        Waits while ``pipeline_window`` commands are waiting for their
+        answer. The serial lock is held from queueing to writing, so the
+        commands are queued in the order they are sent.
+
+        Parameters
+        ----------
+        command: str
+            The command to send.
+
+        Raises
+        ------
+        HardwareNotConnectedError:
+            If the controller is not connected.
+
+        Returns
+        -------
+        request: _Request
+            The request to give to :meth:`_result`.
+        """
         if self._ser is None:
             raise HardwareNotConnectedError(
                 "The Base stage controller is not connected."
             )
+        self._start_reader()
 
-        self._ser_lock.acquire()
         if "\r\n" not in command:
             command = command.strip()
             command += "\r\n"
+        request = _Request(command.strip(), _data_lines(command.strip()))
 
-        self._ser.reset_input_buffer()  # Empty the serial buffer
-        self._ser.write(command.encode())  # Send the command
-
-        got_response = False
-        if expect_confirmation or expect_response:
-            etime = time.time() + self._timeout
-            while time.time() < etime and not got_response:
-                # Check if a confirmation is expected
-                time.sleep(0.01)
-
-                if self._ser.in_waiting > 0:
-                    data_resp = self._ser.readlines()
-                    for i in range(len(data_resp)):
-                        data_resp[i] = data_resp[i].strip()
-
-                    to_remove = []
-
-                    # Remove empty lines
-                    for cnt, i in enumerate(data_resp):
-                        if i == b"":
-                            to_remove.append(cnt)
-                    for i in to_remove[::-1]:
-                        data_resp.pop(i)
-
-                    if len(data_resp) == 0:
-                        continue
-                    if expect_confirmation and not data_resp[0][-2:] == b"OK":
-                        raise ValueError(
-                            "Received an unexpected confirmation {}".format(
-                                data_resp
-                            )
-                        )
-                    if not expect_response:
-                        self._ser_lock.release()
-                        return
-                    else:
-                        self._ser_lock.release()
-                        return data_resp[1:]  # Leave out the confirmation
-
-            if not got_response:
-                # Waiting for response timed out
-                print("The command {} did not receive a response.".format(command))
-                raise HardwareError(
-                    "The base controller did not respond to the command {}.".format(
-                        command
-                    )
-                )
+        self._ser_lock.acquire()
+        try:
+            self._wait_for_window()
+            # Queue before writing, the reader can get the response before write returns
+            self._requests_lock.acquire()
+            self._requests.append(request)
+            self._requests_lock.release()
+            self._ser.write(command.encode())  # Send the command
+        finally:
             self._ser_lock.release()
+        return request
+
+    def _wait_for_window(self) -> ...:
+        """Wait until less than ``pipeline_window`` commands are in flight (serial lock is held)."""
+        while True:
+            self._requests_lock.acquire()
+            oldest = None
+            if len(self._requests) >= self._pipeline_window:
+                oldest = self._requests[0]
+            self._requests_lock.release()
+            if oldest is None:
+                return
+            if not clock.wait(oldest.done, self._timeout):
+                self._drop_request(oldest)  # Its own waiter reports the time out
+
+    def _result(
+        self,
+        request: "_Request",
+        expect_confirmation: bool = True,
+        expect_response: bool = False,
+    ) -> Union[None, list]:
+        """
+        Wait for the answer of a command sent with :meth:`_submit`.
+
+        Parameters
+        ----------
+        request: _Request
+            The request of the command.
+        expect_confirmation: bool
+            If a refused command should raise an error.
+        expect_response: bool
+            If the data lines should be returned.
+
+        Raises
+        ------
+        ValueError:
+            If the command caused an error
+        HardwareError:
+            If the controller did not respond in time.
+
+        Returns
+        -------
+        response: list or None
+            The data lines of the answer.
+        """
+        if not clock.wait(request.done, self._timeout):
+            self._drop_request(request)
+            # Waiting for response timed out
+            print("The command {} did not receive a response.".format(request.command))
+            raise HardwareError(
+                "The base controller did not respond to the command {}.".format(
+                    request.command
+                )
+            )
+        if request.error is None:
+            self._write_through(request.command)
+        if expect_confirmation and request.error is not None:
+            raise ValueError(
+                "Received an unexpected confirmation {}".format([request.error])
+            )
+        if expect_response:
+            return request.lines
+
+    def _write_through(self, command: str) -> ...:
+        """
+        Update the cached parameter a confirmed command has set.
+
+        Parameters
+        ----------
+        command: str
+            The stripped command, for example 'ssx25600'.
+        """
+        for prefix, (key, convert) in _WRITES.items():
+            if command.startswith(prefix):
+                try:
+                    self._cache.set(key, convert(command[len(prefix):].split(",")[0]))
+                except ValueError:
+                    self._cache.invalidate(key)
+                return
+
+    def _read_limits(self) -> dict:
+        """Read the parameters of the 'l' command for the cache."""
+        res = self._send_and_receive("l", expect_response=True)
+        limits = {key: int(res[i]) for key, i in _LIMITS.items() if key != "target_temperature"}
+        limits["target_temperature"] = float(res[_LIMITS["target_temperature"]].decode())
+        return limits
+
+    @property
+    def parameter_cache(self) -> ParameterCache:
+        """Get the cache of the speeds, accelerations and target temperature."""
+        return self._cache
+
+    def _drop_request(self, request: "_Request") -> ...:
+        """Stop waiting for the response of a request."""
+        self._requests_lock.acquire()
+        try:
+            self._requests.remove(request)
+        except ValueError:
+            pass  # Answered in the meantime
+        self._requests_lock.release()
+
+    def _start_reader(self) -> ...:
+        """Start the thread that reads the port, if it is not running."""
+        if self._reader is not None and self._reader.is_alive():
+            return
+        self._reader_stop = tr.Event()
+        self._rx_buffer = b""
+        self._trailing = None
+        self._reader = tr.Thread(target=self._read_loop, args=(self._ser, self._reader_stop), daemon=True)
+        self._reader.start()
+
+    def _stop_reader(self) -> ...:
+        """Stop the reader thread, the requests that still wait fail."""
+        if self._reader is None:
+            return
+        self._reader_stop.set()
+        if self._reader is not tr.current_thread():
+            self._reader.join()
+        self._reader = None
+        self._requests_lock.acquire()
+        self._requests.clear()
+        self._requests_lock.release()
+
+    def _read_loop(self, ser, stop: tr.Event) -> ...:
+        """
+        Read the port and split the data into lines (executed in the reader thread).
+
+        An incomplete line is kept and put in front of the next read, so a
+        line is never split between two reads.
+
+        Parameters
+        ----------
+        ser: serial.Serial
+            The port to read.
+        stop: tr.Event
+            Set to stop reading.
+        """
+        while not stop.is_set() and getattr(ser, "is_open", True):
+            try:
+                data = ser.read(max(1, ser.in_waiting))  # Blocks until data or the timeout
+            except (serial.SerialException, OSError):
+                break  # The port was closed
+            if len(data) == 0:
+                continue
+            lines = (self._rx_buffer + data).split(b"\n")
+            self._rx_buffer = lines.pop()  # Keep the incomplete line for the next read
+            for line in lines:
+                self._route(line.strip())
+
+    def _route(self, line: bytes) -> ...:
+        """
+        Give a received line to the request it answers or to the subscribers.
+
+        The controller answers the commands in order, the first line of an
+        answer is the confirmation (``OK``) and the amount of data lines
+        that follow it depends on the command. Status lines the controller
+        sends on its own (``ENDPOS X``) can come in between. The extra lines
+        after the answer of a jog command (see ``_TRAILING_LINES``) are
+        skipped until the next confirmation.
+
+        Parameters
+        ----------
+        line: bytes
+            The stripped line.
+        """
+        if line == b"":
+            return
+        if self._handle_unsolicited(line):
+            self._requests_lock.acquire()
+            subscribers = list(self._subscribers)
+            self._requests_lock.release()
+            for callback in subscribers:
+                callback(line)
+            return
+
+        self._requests_lock.acquire()
+        try:
+            if len(self._requests) == 0:
+                return  # Nobody waits for it (the request timed out or a trailing line)
+            request = self._requests[0]
+            if request.confirmed:
+                request.lines.append(line)
+            elif line[-2:] == b"OK":
+                request.confirmed = True
+                self._trailing = None
+            elif self._trailing is not None:
+                print("Skipped the line {} after the answer to {}.".format(line, self._trailing))
+                return
+            else:
+                request.error = line  # An error instead of the confirmation
+            if request.error is not None or (
+                request.confirmed and len(request.lines) >= request.data_lines
+            ):
+                self._requests.popleft()
+                request.done.set()
+                if request.confirmed and request.command[:2] in _TRAILING_LINES:
+                    self._trailing = request.command
+        finally:
+            self._requests_lock.release()
+
+    def subscribe(self, callback: callable) -> ...:
+        """
+        Get the status lines the controller sends on its own.
+
+        Parameters
+        ----------
+        callback: callable
+            Called with the stripped line (for example b'ENDPOS X') from the
+            reader thread, it should return quickly.
+        """
+        self._requests_lock.acquire()
+        self._subscribers.append(callback)
+        self._requests_lock.release()
+
+    def unsubscribe(self, callback: callable) -> ...:
+        """Stop giving the status lines to a callback of :meth:`subscribe`."""
+        self._requests_lock.acquire()
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+        self._requests_lock.release()
+
+    def _handle_unsolicited(self, line: bytes) -> bool:
+        """
+        Handle a line the controller sent on its own.
+
+        Parameters
+        ----------
+        line: bytes
+            The stripped line.
+
+        Returns
+        -------
+        handled: bool
+            True if the line was not a response but a status message.
+        """
+        if line[:8] not in (b"ENDPOS X", b"ENDPOS Y"):
+            return False
+        axis = line[7:8].decode().lower()
+        self._state_lock.acquire()
+        if self._axis_state[axis] == self.ZEROING:
+            self._axis_state[axis] = self.READY
+            self._positions[axis] = 0
+        self._state_lock.release()
+        # The axis reached its end position, it does not move anymore
+        self._motion_finished(axis)
+        self._motion_wake.set()
+        return True
 
     def _get_axis_id(self, axis: str) -> str:
         """
@@ -208,7 +605,7 @@ class MainXYController:
                 #     self.emergency_stop()
                 #     raise HardwareError("The stepper response timed out while zero-ing.")
 
-            time.sleep(interval)
+            clock.sleep(interval)
 
         if self._em_event.is_set():
             stop_flag.set()
@@ -224,21 +621,81 @@ class MainXYController:
         """Check if the hardware has performed the zero move."""
         return self._zeroed
 
+    @property
+    def axis_states(self) -> dict:
+        """Get the readiness state of the axes ('x' and 'y')."""
+        self._state_lock.acquire()
+        states = dict(self._axis_state)
+        self._state_lock.release()
+        return states
+
+    def is_ready(self, axis: str) -> bool:
+        """
+        Check if an axis is zeroed and can be moved.
+
+        Parameters
+        ----------
+        axis: str
+            The axis, can be 'h' or 'j'.
+        """
+        return self.axis_states[self._get_axis_id(axis)] == self.READY
+
+    def _check_ready(self, axis: str) -> ...:
+        """
+        Make sure an axis is ready before moving it.
+
+        With the 'queue' policy this waits until zeroing the axis is done,
+        with the 'reject' policy an error is raised right away.
+
+        Parameters
+        ----------
+        axis: str
+            The axis, can be 'h' or 'j'.
+
+        Raises
+        ------
+        AxisNotReadyError
+            If the axis is not (or did not get) ready.
+        """
+        id = self._get_axis_id(axis)
+        if self._not_ready_policy == "queue":
+            etime = clock.monotonic() + self._zero_timeout
+            while (
+                self.axis_states[id] == self.ZEROING
+                and clock.monotonic() < etime
+                and not self._em_event.is_set()
+            ):
+                clock.sleep(0.01)
+
+        state = self.axis_states[id]
+        if state == self.READY:
+            return
+        reason = state
+        if state == self.FAILED and self._zero_error is not None:
+            reason = "{}: {}".format(state, self._zero_error)
+        raise AxisNotReadyError(
+            "Axis {} is not ready ({}).".format(axis.upper(), reason)
+        )
+
     @property
     def speed(self) -> int:
         """Get the speed of the controller."""
         self._lock.acquire()
-        res = self._send_and_receive("l", expect_response=True)
-        self._lock.release()
-        return res[0]
+        try:
+            speed = self._cache.get("speed_x", self._read_limits)
+        finally:
+            self._lock.release()
+        return speed
 
     @property
     def acceleration(self) -> int:
         """Get the acceleration of the controller."""
         self._lock.acquire()
-        res = self._send_and_receive("l", expect_response=True)
-        self._lock.release()
-        return res[1]
+        try:
+            acceleration = self._cache.get("acceleration", self._read_limits)
+        finally:
+            self._lock.release()
+        return acceleration
 
     # TEMPERATURE ATTRIBUTES
     @property
@@ -253,9 +710,11 @@ class MainXYController:
     def target_temperature(self) -> float:
         """Get the target temperature of the hardware."""
         self._lock.acquire()
-        res = self._send_and_receive("l", expect_response=True)
-        self._lock.release()
-        return float(res[5].decode())
+        try:
+            temperature = self._cache.get("target_temperature", self._read_limits)
+        finally:
+            self._lock.release()
+        return temperature
 
     @target_temperature.setter
     def target_temperature(self, temperature: Union[float, int]) -> ...:
@@ -273,15 +732,29 @@ class MainXYController:
             return
         self._lock.acquire()
         # time.sleep(0.1)
-        self._ser = serial.Serial(self._port, self._baud_rate, timeout=self._timeout)
+        self._stop_reader()  # The reader of a port that failed to connect
+        self._cache.invalidate()  # The controller might have been reset
+        if self._replay_file:
+            self._ser = SerialReplay(self._replay_file, timeout=self._timeout, speed=self._replay_speed)
+        elif self._simulate:
+            self._ser = SimulatedMainXYSerial(self._port, self._baud_rate, timeout=self._timeout)
+        else:
+            self._ser = serial.Serial(self._port, self._baud_rate, timeout=self._timeout)
+        if self._capture_file:
+            self._ser = SerialRecorder(self._ser, self._capture_file)
         m3 = b"Base Stage Controller10\r\n"
 
         # Reset the input buffer
-        time.sleep(2)
+        clock.sleep(2)
         self._ser_lock.acquire()
         self._ser.reset_input_buffer()
         self._ser.write(b"gid\r\n")
-        msg_list = self._ser.readlines()
+        msg_list = []
+        while m3 not in msg_list:
+            line = self._ser.readline()  # Returns at the id line, not after the timeout
+            if not line:
+                break
+            msg_list.append(line)
         self._ser_lock.release()
         if not m3 in msg_list:
             raise HardwareError(
@@ -290,26 +763,169 @@ class MainXYController:
                 )
             )
 
-        # Enter run mode so the controller can be used
-        self._send_and_receive("n", expect_confirmation=True)
-
-        # Set the velocity to max to make zero faster
-        self._send_and_receive("ssx25600", expect_response=True)
-        self._send_and_receive("ssy25600", expect_response=True)
-        self._send_and_receive('sa200', expect_response=True)
-        self._send_and_receive('sd200, expect_response=True')
+        # Enter run mode so the controller can be used and set the velocity
+        # to max to make zero faster
+        self._send_pipelined(["n", "ssx25600", "ssy25600", "sa200", "sd200"])
+        self._speeds = {"x": 25600, "y": 25600}
         self._is_connected = True
         
         self._lock.release()
-        self.zero()
+        if not self._resume_from_state():
+            self.start_zero()
 
         # self.start_check_error()
 
+    @property
+    def state(self) -> dict:
+        """
+        Get the state to persist in the machine state snapshot.
+
+        Only the cached values are used (the last commanded positions and
+        speeds), so taking a snapshot does not use the serial connection.
+        The positions are only given when the axes are zeroed, otherwise the
+        position is meaningless after a restart.
+        """
+        state = {"zeroed": self._zeroed, "homed": self._homed}
+        if not self._is_connected or not self._zeroed:
+            return state
+        state["session"] = self._session
+        state["positions"] = dict(self._positions)
+        state["speeds"] = dict(self._speeds)
+        return state
+
+    def read_state(self) -> dict:
+        """
+        Update the cached positions and speeds from the controller and get the state.
+
+        Used before shutting down, when the last commanded positions might
+        not be reached (stopped moves or jogs).
+
+        Returns
+        -------
+        state: dict
+            The state as returned by :attr:`state`.
+        """
+        if self._is_connected and self._zeroed:
+            self._lock.acquire()
+            try:
+                for id in ("x", "y"):
+                    res = self._send_and_receive("gp{}".format(id), expect_response=True)
+                    self._positions[id] = int(res[0])
+                res = self._send_and_receive("l", expect_response=True)
+                self._speeds = {"x": int(res[0]), "y": int(res[3])}
+            finally:
+                self._lock.release()
+        return self.state
+
+    def restore_state(self, state: dict) -> ...:
+        """
+        Set the state from the machine state snapshot to resume from.
+
+        On the next :meth:`connect` the session token and the positions are
+        compared with what the controller reports, if the controller kept
+        its reference the zero routine is skipped and the speeds are restored.
+
+        Parameters
+        ----------
+        state: dict
+            The state as returned by :attr:`state`.
+        """
+        self._expected_state = state
+
+    def _store_session(self) -> ...:
+        """
+        Store a new session token on the controller after zeroing.
+
+        The controller forgets the token on a power cycle and when it is
+        zeroed again, so a matching token shows that the zero reference
+        of this session is still valid.
+
+        The session commands are not part of the standard firmware, they
+        are only sent when the ``session_token`` setting is on. The firmware
+        should answer ``sk<token>`` with OK and keep the token in memory
+        until it is power cycled or zeroed (``z``), and answer ``gk`` with
+        OK and the token on the next line (0 if it has none).
+        """
+        if not self._session_token:
+            return  # A restart will zero again
+        session = random.randint(1, 2**31 - 1)
+        self._lock.acquire()
+        try:
+            self._send_and_receive("sk{}".format(session))
+            self._session = session
+        except (ValueError, HardwareError) as e:
+            # Firmware without session support, a restart will zero again
+            self._session = 0
+            print("The base controller did not store the session token: {}".format(e))
+        finally:
+            self._lock.release()
+
+    def _resume_from_state(self) -> bool:
+        """
+        Skip zeroing if the controller kept the reference of the snapshot.
+
+        The controller should still hold the session token of the snapshot
+        (a positive sign that it was not power cycled or zeroed since) and
+        report the positions of the snapshot. Without the ``session_token``
+        setting the axes are always zeroed.
+
+        Returns
+        -------
+        resumed: bool
+            True if the axes are ready without zeroing.
+        """
+        state = self._expected_state
+        self._expected_state = None
+        if not self._session_token:
+            return False  # The firmware can not confirm the reference, see _store_session
+        if state is None or not state.get("zeroed") or not state.get("session"):
+            return False
+        positions = state.get("positions", {})
+        if None in (positions.get("x"), positions.get("y")):
+            return False
+
+        self._lock.acquire()
+        try:
+            res = self._send_and_receive("gk", expect_response=True)
+            if int(res[0]) != state["session"]:
+                print("The base stage lost its reference, zeroing again.")
+                return False
+            for id in ("x", "y"):
+                res = self._send_and_receive("gp{}".format(id), expect_response=True)
+                if int(res[0]) != positions[id]:
+                    print("The base stage lost its position, zeroing again.")
+                    return False
+
+            # Connecting sets the zero speed, put the speeds of the snapshot back
+            for id, speed in state.get("speeds", {}).items():
+                if speed is None:
+                    continue
+                self._send_and_receive("ss{}{}".format(id, speed), expect_response=True)
+                self._speeds[id] = speed
+        except (ValueError, HardwareError) as e:
+            # Firmware without session support
+            print("Could not check the reference of the base stage: {}".format(e))
+            return False
+        finally:
+            self._lock.release()
+
+        self._state_lock.acquire()
+        self._axis_state = {"x": self.READY, "y": self.READY}
+        self._zero_error = None
+        self._state_lock.release()
+        self._session = state["session"]
+        self._positions = {"x": positions["x"], "y": positions["y"]}
+        self._zeroed = True
+        self._homed = state.get("homed", False)
+        print("The base stage kept its reference, skipped the zero routine.")
+        return True
+
     def disconnect(self) -> ...:
         """Disconnect the hardware."""
         if not self._is_connected:
             return
         self._send_and_receive("p")
+        self._stop_reader()
         self._ser.close()
         self._is_connected = False
 
@@ -370,13 +986,268 @@ class MainXYController:
                 else:
                     return False
 
+    # MOTION COMPLETION
+    def motion_event(self, axis: str) -> tr.Event:
+        """
+        Get the event that is set while an axis is idle.
+
+        Parameters
+        ----------
+        axis: str
+            The axis, can be 'h' or 'j'.
+
+        Returns
+        -------
+        event: tr.Event
+            Cleared when a move or jog is started, set when the controller
+            reports the axis stopped.
+        """
+        return self._motion_done[self._get_axis_id(axis)]
+
+    def wait_for_motion(
+        self, axis: Union[str, None] = None, timeout: Union[float, int, None] = None
+    ) -> bool:
+        """
+        Wait until the moves are finished.
+
+        Parameters
+        ----------
+        axis: str, None
+            The axis to wait for ('h' or 'j'), None waits for both.
+        timeout: float, int, None
+            The maximum time to wait in seconds, None waits until done.
+
+        Returns
+        -------
+        idle: bool
+            True if the axes are idle, False if the timeout passed.
+        """
+        ids = ("x", "y") if axis is None else (self._get_axis_id(axis),)
+        etime = None if timeout is None else clock.monotonic() + timeout
+        for id in ids:
+            remaining = None if etime is None else etime - clock.monotonic()
+            if not clock.wait(self._motion_done[id], remaining):
+                return False
+        return True
+
+    def _track_motion(self, id: str, distance: Union[int, None]) -> tr.Event:
+        """
+        Mark an axis as moving before its move is sent.
+
+        The time the move should take is estimated from the distance and
+        the cached speed of the axis, the watcher thread asks the controller
+        if the axis stopped when that time passed.
+
+        Parameters
+        ----------
+        id: str
+            The axis id, 'x' or 'y'.
+        distance: int, None
+            The distance of the move in steps, None for a jog (no end).
+
+        Returns
+        -------
+        event: tr.Event
+            Set when the axis stopped.
+        """
+        duration = None
+        if distance is not None:
+            speed = self._cache.get("speed_" + id, self._read_limits)
+            duration = abs(distance) / speed if speed > 0 else None
+
+        self._state_lock.acquire()
+        self._motion_seq[id] += 1
+        self._motion_end[id] = None if duration is None else clock.monotonic() + duration
+        event = self._motion_done[id]
+        event.clear()
+        if self._motion_thread is None:
+            self._motion_thread = tr.Thread(target=self._watch_motion, daemon=True)
+            self._motion_thread.start()
+        self._state_lock.release()
+        self._motion_wake.set()
+        return event
+
+    def _expect_stop(self) -> ...:
+        """Let the watcher ask the controller right away, the axes are stopping."""
+        self._state_lock.acquire()
+        now = clock.monotonic()
+        for id, event in self._motion_done.items():
+            if not event.is_set():
+                self._motion_end[id] = now
+        self._state_lock.release()
+        self._motion_wake.set()
+
+    def _motion_finished(self, id: str, seq: Union[int, None] = None) -> ...:
+        """
+        Mark an axis as idle.
+
+        Parameters
+        ----------
+        id: str
+            The axis id, 'x' or 'y'.
+        seq: int, None
+            The move the status belongs to, if another move was started
+            since, the axis is not marked. None always marks it.
+        """
+        self._state_lock.acquire()
+        if seq is None or seq == self._motion_seq[id]:
+            self._motion_done[id].set()
+        self._state_lock.release()
+
+    def _watch_motion(self) -> ...:
+        """
+        Find out when the moving axes stopped (executed in the watcher thread).
+
+        Sleeps until the first move should be finished and then polls the
+        status ('gb'), the poll interval doubles from FIRST_MOTION_POLL up
+        to MAX_MOTION_POLL while the axis is still moving (the acceleration
+        is not in the estimate). A new move or a status line of the
+        controller wakes the thread. It ends when all axes are idle.
+        """
+        interval = self.FIRST_MOTION_POLL
+        while True:
+            self._state_lock.acquire()
+            moving = {id: self._motion_end[id] for id, event in self._motion_done.items() if not event.is_set()}
+            seqs = dict(self._motion_seq)
+            if len(moving) == 0 or not self._is_connected or not getattr(self._ser, "is_open", True):
+                for event in self._motion_done.values():
+                    event.set()  # Nothing can be tracked when disconnected
+                self._motion_thread = None
+                self._state_lock.release()
+                return
+            self._state_lock.release()
+
+            ends = [i for i in moving.values() if i is not None]
+            wait = min(ends) - clock.monotonic() if len(ends) != 0 else 0
+            if wait > 0:
+                interval = self.FIRST_MOTION_POLL  # Not due yet
+            else:
+                wait = interval
+                interval = min(interval * 2, self.MAX_MOTION_POLL)
+            self._motion_wake.clear()
+            if clock.wait(self._motion_wake, wait):
+                continue  # New move or notification, check again
+
+            try:
+                res = self._send_and_receive("gb", expect_response=True)
+            except (ValueError, HardwareError, HardwareNotConnectedError) as e:
+                print("Could not get the motion status of the base stage: {}".format(e))
+                continue
+            for id in moving:
+                if res[self._MOVING_FLAGS[id]] != b"1":
+                    self._motion_finished(id, seqs[id])
+
     # HOMING FUNCTIONS
+    def start_zero(self) -> ...:
+        """
+        Start zeroing the stepper motors in the background.
+
+        The zero command is sent directly, waiting for the axes to reach
+        the end switches is done in a separate thread. Every axis becomes
+        ready as soon as the controller reports it is zeroed. If zeroing
+        is already running nothing is done.
+        """
+        if self._em_event.is_set():
+            return
+        if self._zero_thread is not None and self._zero_thread.is_alive():
+            return
+
+        self._state_lock.acquire()
+        self._axis_state = {"x": self.ZEROING, "y": self.ZEROING}
+        self._zero_error = None
+        self._state_lock.release()
+        self._homed = False
+        self._zeroed = False
+        self._session = 0
+        self._positions = {"x": None, "y": None}
+
+        self._lock.acquire()
+        try:
+            self._send_and_receive("z")
+        except Exception as e:
+            self._finish_zero("The zero command failed: {}".format(e))
+            raise
+        finally:
+            self._lock.release()
+
+        self._zero_thread = tr.Thread(target=self._wait_for_zero, daemon=True)
+        self._zero_thread.start()
+
+    def _wait_for_zero(self) -> ...:
+        """Wait for the axes to report they are zeroed (executed in a separate thread)."""
+        etime = clock.monotonic() + self._zero_timeout
+        while clock.monotonic() < etime and not self._em_event.is_set():
+            # The reader thread marks the axes ready when the controller reports them
+            if self.ZEROING not in self.axis_states.values():
+                break
+            clock.sleep(0.01)
+
+        if self._em_event.is_set():
+            self._finish_zero("Zeroing was interrupted by the emergency stop.")
+        else:
+            self._finish_zero("The base controller did not home within the time limit.")
+
+    def _finish_zero(self, error: str) -> ...:
+        """
+        Mark the axes that are still zeroing as failed.
+
+        Parameters
+        ----------
+        error: str
+            The reason to give for the axes that failed.
+        """
+        self._state_lock.acquire()
+        for axis, state in self._axis_state.items():
+            if state == self.ZEROING:
+                self._axis_state[axis] = self.FAILED
+                self._zero_error = error
+        ready = all(i == self.READY for i in self._axis_state.values())
+        self._state_lock.release()
+
+        if ready:
+            self._store_session()
+            self._homed = True
+            self._zeroed = True
+            print('Finished zero routine')
+        else:
+            print(error)
+
+    def wait_until_zeroed(self, timeout: Union[float, int, None] = None) -> ...:
+        """
+        Wait until the background zeroing is done.
+
+        Parameters
+        ----------
+        timeout: float, int, None
+            The maximum time to wait in seconds, by default the zero timeout.
+
+        Raises
+        ------
+        HardwareError
+            If the stepper motors do not successfully zero.
+        """
+        timeout = self._zero_timeout if timeout is None else timeout
+        etime = clock.monotonic() + timeout
+        while clock.monotonic() < etime and (
+            self.ZEROING in self.axis_states.values()
+            or (self._zero_thread is not None and self._zero_thread.is_alive())
+        ):
+            clock.sleep(0.01)
+
+        if not self._zeroed:
+            raise HardwareError(
+                self._zero_error
+                if self._zero_error is not None
+                else "The base controller did not home within the time limit."
+            )
+
     def zero(self) -> ...:
         """
-        Zero the connected stepper motors.
+        Zero the connected stepper motors and wait until done.
 
         .. note::
             The axis will be homed separately, first the x-axis and then the y-axis.
+            If zeroing is already running in the background this waits for it.
 
         Raises
         ------
@@ -385,34 +1256,8 @@ class MainXYController:
         """
         if self._em_event.is_set():
             return
-        self._lock.acquire()
-        self._send_and_receive("z")
-
-        # Wait for the homing to finish
-        x_homed = False
-        y_homed = False
-
-        self._ser_lock.acquire()
-        etime = time.time() + self._zero_timeout
-        while not (x_homed and y_homed) and time.time() < etime:
-            if self._ser.in_waiting > 0:
-                data = self._ser.readlines()
-                for i in data:
-                    if i.strip()[:8] == b"ENDPOS X":
-                        x_homed = True
-                    if i.strip()[:8] == b"ENDPOS Y":
-                        y_homed = True
-        self._ser_lock.release()
-        self._lock.release()
-
-        if not x_homed or not y_homed:
-            raise HardwareError(
-                "The base controller did not home within the time limit."
-            )
-        self._homed = True
-        self._zeroed = True
-
-        print('Finished zero routine')
+        self.start_zero()
+        self.wait_until_zeroed()
 
     def home(self) -> ...:
         """
@@ -431,6 +1276,7 @@ class MainXYController:
             self.zero()
         else:
             self._send_and_receive("h", expect_confirmation=True)
+            self._positions = {"x": 0, "y": 0}
             self._homed = True
 
         print('Finished home routine')
@@ -470,11 +1316,14 @@ class MainXYController:
         """
         if self._em_event.is_set():
             return
+        self._check_ready(axis)
         id = self._get_axis_id(axis)
         self._lock.acquire()
         # Jogging gives a different confirmation than other commands
         _ = self._send_and_receive("sv{}{}".format(id, int(velocity)), expect_response=True)
+        self._positions[id] = None  # Unknown until read after the jog
         self._lock.release()
+        self._track_motion(id, None)
 
     def stop_jog(self, axis: Union[None, str] = None) -> ...:
         """
@@ -492,8 +1341,9 @@ class MainXYController:
             id = self._get_axis_id(axis)
             self._send_and_receive("sv{}0".format(id), expect_response=True)
         self._lock.release()
+        self._expect_stop()
 
-    def move_to(self, id: str, position: Union[float, int]) -> ...:
+    def move_to(self, id: str, position: Union[float, int]) -> tr.Event:
         """
         Move the hardware to a position.
 
@@ -503,19 +1353,23 @@ class MainXYController:
             The axis to move, can be 'x' or 'y'.
         position : float or int
             The position to move to.
+
+        Raises
+        ------
+        AxisNotReadyError
+            If the axis is not zeroed (yet).
+
+        Returns
+        -------
+        done : tr.Event
+            Set when the axis stopped, see :meth:`wait_for_motion`.
         """
+        self._check_ready(id)
         pos = int(self.get_position(id))
         distance = position - pos  # Distance to move
         step_size, intervals = self._get_movement_intervals(distance=distance)
         
-        id = self._get_axis_id(id)
-        self._lock.acquire()
-        for i in range(intervals):
-            if self._em_event.is_set() or self._stop_event.is_set():
-                break
-            self._send_and_receive("sp{}{}".format(id.lower(), pos + step_size))
-            pos += step_size
-        self._lock.release()
+        return self._move_in_steps(self._get_axis_id(id), pos, step_size, intervals)
 
     def _get_movement_intervals(self, distance: int) -> Tuple[int, int]:
         """
@@ -537,18 +1391,68 @@ class MainXYController:
             The amount of intervals to move
         """
         # If the distance is smaller than the check interval, only move once
-        if  abs(distance) < self._check_interval * self.speed:
+        speed = int(self.speed)
+        if  abs(distance) < self._check_interval * speed:
             return distance, 1
         
         # Determine the step size by using the check interval time and set velocity
         # The step size is the distance that is moved in one interval
-        step_size = self._check_interval * self.speed
+        step_size = self._check_interval * speed
         # Determine the amount of intervals by dividing the distance by the step size
         intervals = abs(int(distance // step_size))
         step_size = step_size if distance > 0 else -1 * step_size
         return step_size, intervals
 
-    def move_by(self, id: str, distance: Union[float, int]) -> ...:
+    def _move_in_steps(self, id: str, pos: int, step_size: int, intervals: int) -> tr.Event:
+        """
+        Send the target positions of a move divided in intervals.
+
+        The emergency and stop events are checked before sending every
+        target, the targets are pipelined so sending them does not wait
+        for every confirmation.
+
+        Parameters
+        ----------
+        id : str
+            The axis id, 'x' or 'y'.
+        pos : int
+            The current position.
+        step_size : int
+            The distance of one interval.
+        intervals : int
+            The amount of intervals.
+
+        Returns
+        -------
+        done : tr.Event
+            Set when the axis stopped, see :meth:`_track_motion`.
+        """
+        id = id.lower()
+        done = self._motion_done[id]
+        self._lock.acquire()
+        try:
+            requests = []
+            for i in range(intervals):
+                if self._em_event.is_set() or self._stop_event.is_set():
+                    break
+                pos += step_size
+                requests.append((pos, self._submit("sp{}{}".format(id, pos))))
+                if i == 0:
+                    # After the first target, so every later status poll sees the move
+                    done = self._track_motion(id, step_size * intervals)
+            try:
+                for pos, request in requests:
+                    self._result(request)
+                    self._positions[id] = pos
+            except HardwareError:
+                for _, request in requests:
+                    self._drop_request(request)  # Do not match late answers to them
+                raise
+        finally:
+            self._lock.release()
+        return done
+
+    def move_by(self, id: str, distance: Union[float, int]) -> tr.Event:
         """
         Move the hardware by a position.
 
@@ -558,26 +1462,32 @@ class MainXYController:
             The axis to move, can be 'x' or 'y'.
         distance : float or int
             The distance to move by.
+
+        Raises
+        ------
+        AxisNotReadyError
+            If the axis is not zeroed (yet).
+
+        Returns
+        -------
+        done : tr.Event
+            Set when the axis stopped, see :meth:`wait_for_motion`.
         """
+        self._check_ready(id)
         pos = int(self.get_position(id))
         step_size, intervals = self._get_movement_intervals(distance=distance)
 
-        id = self._get_axis_id(id)
-        self._lock.acquire()
-        for i in range(intervals):
-            if self._em_event.is_set() or self._stop_event.is_set():
-                break
-            self._send_and_receive("sp{}{}".format(id.lower(), pos + step_size))
-            pos += step_size
-        self._lock.release()
+        return self._move_in_steps(self._get_axis_id(id), pos, step_size, intervals)
 
     def stop(self) -> ...:
         """Unconditionally stop the hardware."""
         self._stop_event.set()
         self._lock.acquire()
         self._send_and_receive("x")
+        self._positions = {"x": None, "y": None}  # Stopped somewhere on the way
         self._lock.release()
         self._stop_event.clear()
+        self._expect_stop()
 
     def emergency_stop(self) -> ...:
         """
@@ -592,8 +1502,11 @@ class MainXYController:
             any commands from being executed until the flag is cleared.
         """
         self._send_and_receive("x")  # Stop all motion
+        self._positions = {"x": None, "y": None}  # Stopped somewhere on the way
         self._send_and_receive('fp0')  # Stop temp control
         self._em_event.set()
+        self._cache.invalidate()
+        self._expect_stop()
 
     def toggle_vacuum(self, state: bool) -> ...:
         """
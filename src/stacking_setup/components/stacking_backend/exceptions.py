@@ -29,3 +29,14 @@ class HardwareError(Exception):
 
     def __str__(self) -> str:
         return self._msg
+
+
+class AxisNotReadyError(Exception):
+    """Exception raised when an axis cannot be used yet (for example while zeroing)."""
+
+    def __init__(self, msg=None) -> ...:
+        """Initialize the exception."""
+        self._msg = msg
+
+    def __str__(self) -> str:
+        return self._msg
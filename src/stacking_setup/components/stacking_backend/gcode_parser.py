@@ -106,6 +106,34 @@ class GcodeParser:
 
         return commands
 
+    @staticmethod
+    @typechecked
+    def split_line_number(line: str) -> tuple:
+        """
+        Split the line number from a gcode line.
+
+        A client numbers its lines (``N<nr> <command>``, like marlin) to
+        match the responses to its commands. Only the first entry of a
+        line can be a line number, an axis can not start a line.
+
+        Parameters
+        ----------
+        line : str
+            The gcode line.
+
+        Returns
+        -------
+        line_number : int, None
+            The line number, None if the line is not numbered.
+        line : str
+            The line without the line number.
+        """
+        if line[:1] == "N":
+            number, _, rest = line.partition(" ")
+            if number[1:].isdigit():
+                return int(number[1:]), rest
+        return None, line
+
     @staticmethod
     @typechecked
     def _is_valid(entry: str) -> bool:
@@ -0,0 +1,101 @@
+"""
+Persisted snapshot of the machine state for fast warm restarts.
+
+The backend periodically writes the positioning mode and the state of
+the controllers (zeroed/homed flags, session token, positions and
+speeds) to a small json file. When the backend restarts (after a crash
+or an :func:`~stacking_backend.stacking_setup.StackingSetupBackend.M999`)
+the snapshot is compared with what the controllers report, a controller
+that kept its reference does not have to be zeroed again.
+
+The file is written atomically (temporary file, fsync, rename), so a
+crash while writing leaves the previous snapshot intact.
+"""
+import os
+import json
+import time
+import tempfile
+from typing import Union
+
+
+SNAPSHOT_VERSION = 1
+
+
+def resolve_path(path: str) -> str:
+    """
+    Get the full path of a snapshot file.
+
+    Parameters
+    ----------
+    path : str
+        The snapshot file, ``~`` is expanded to the home folder and relative
+        paths are relative to the configs folder (like the settings files).
+
+    Returns
+    -------
+    path : str
+        The absolute path.
+    """
+    path = os.path.expanduser(path)
+    if os.path.isabs(path):
+        return path
+    configs = os.path.join(os.path.dirname(os.path.abspath(__file__)), "configs")
+    return os.path.join(configs, path)
+
+
+def save_snapshot(path: str, state: dict) -> ...:
+    """
+    Write the machine state atomically.
+
+    Parameters
+    ----------
+    path : str
+        The snapshot file.
+    state : dict
+        The machine state, should be json serializable.
+    """
+    snapshot = {"version": SNAPSHOT_VERSION, "time": time.time(), "state": state}
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".snapshot_", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_snapshot(path: str, max_age: Union[float, int, None] = None) -> Union[dict, None]:
+    """
+    Read the machine state.
+
+    Parameters
+    ----------
+    path : str
+        The snapshot file.
+    max_age : float, int, None
+        The maximum age of the snapshot in seconds, None for no limit.
+
+    Returns
+    -------
+    state : dict, None
+        The machine state or None if there is no usable snapshot (missing,
+        corrupt, from another version or too old).
+    """
+    try:
+        with open(path, "r") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    if max_age is not None and time.time() - snapshot.get("time", 0) > max_age:
+        return None
+    state = snapshot.get("state")
+    return state if isinstance(state, dict) else None
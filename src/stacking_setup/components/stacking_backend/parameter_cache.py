@@ -0,0 +1,112 @@
+"""
+Cache of the device parameters that only change when the backend sets them.
+
+Reading a speed or an acceleration costs a round trip to the device, while
+the value only changes when the backend writes it. The :class:`ParameterCache`
+keeps the last read or written values: setters write through to the cache
+after the device accepted the value, and the cache is invalidated when the
+device might have changed them on its own (a reconnect or an emergency stop).
+One device read often returns several parameters (the drive parameters give
+the velocity and the acceleration), so a read fills all the values it got.
+
+Example
+-------
+>>> cache = ParameterCache()
+>>> cache.get("vel", controller.get_drive_parameters)  # Reads the device
+>>> cache.get("acc", controller.get_drive_parameters)  # Cached by the read above
+>>> cache.stats
+{'hits': 1, 'misses': 1, 'size': 2}
+"""
+import threading as tr
+
+
+class ParameterCache:
+    """Thread safe cache of device parameters with hit and miss counters."""
+
+    def __init__(self) -> ...:
+        """Initialize an empty cache."""
+        self._lock = tr.Lock()
+        self._values = {}
+        self._generation = 0  # Changed by every invalidation
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, read: callable):
+        """
+        Get a parameter, read from the device if it is not cached.
+
+        Parameters
+        ----------
+        key : str
+            The name of the parameter.
+        read : callable
+            Reads the device, returns a dict with (at least) the parameter by
+            key. All the returned values are cached.
+
+        Raises
+        ------
+        KeyError
+            If the read did not return the parameter.
+
+        Returns
+        -------
+        value
+            The value of the parameter.
+        """
+        self._lock.acquire()
+        if key in self._values:
+            self.hits += 1
+            value = self._values[key]
+            self._lock.release()
+            return value
+        self.misses += 1
+        generation = self._generation
+        self._lock.release()
+
+        values = read()
+        self._lock.acquire()
+        if generation == self._generation:
+            # Not invalidated while reading, otherwise the values might be outdated
+            self._values.update(values)
+        self._lock.release()
+        return values[key]
+
+    def set(self, key: str, value) -> ...:
+        """
+        Store a value that was written to the device (write through).
+
+        Parameters
+        ----------
+        key : str
+            The name of the parameter.
+        value
+            The value the device accepted.
+        """
+        self._lock.acquire()
+        self._values[key] = value
+        self._lock.release()
+
+    def invalidate(self, key: str = None) -> ...:
+        """
+        Forget a parameter so the next get reads the device.
+
+        Parameters
+        ----------
+        key : str, None
+            The parameter to forget, None forgets all of them.
+        """
+        self._lock.acquire()
+        if key is None:
+            self._values.clear()
+        else:
+            self._values.pop(key, None)
+        self._generation += 1
+        self._lock.release()
+
+    @property
+    def stats(self) -> dict:
+        """Get the amount of hits, misses and cached parameters."""
+        self._lock.acquire()
+        stats = {"hits": self.hits, "misses": self.misses, "size": len(self._values)}
+        self._lock.release()
+        return stats
@@ -0,0 +1,311 @@
+"""
+Capture and replay of the serial traffic of the controller drivers.
+
+A :class:`SerialRecorder` wraps an open serial port and writes every write
+and read to a compact binary trace. A :class:`SerialReplay` is a drop in
+replacement for the serial port that plays the responses from a trace back
+at the recorded (or an accelerated) speed, so timing problems seen on the
+rig can be reproduced and the driver overhead can be measured without it.
+
+Trace format (little endian)
+----------------------------
+* header : magic ``b"SRTR"`` (4 bytes), version (uint8), start wall time in ns (uint64)
+* record : kind (1 byte), time since the start in ns (uint64), length (uint32), payload
+
+Record kinds are ``O`` (port opened, payload is the port name), ``W``
+(bytes written), ``R`` (bytes returned by a read) and ``C`` (port closed).
+The timestamps come from the backend clock (see :mod:`clock`).
+"""
+import time
+import struct
+import threading as tr
+from typing import Union, List, Tuple
+from . import clock
+from .simulation.simulated_serial import SimulatedSerial
+
+
+TRACE_MAGIC = b"SRTR"
+TRACE_VERSION = 1
+_HEADER = struct.Struct("<4sBQ")
+_RECORD = struct.Struct("<cQI")
+
+OPEN = b"O"
+WRITE = b"W"
+READ = b"R"
+CLOSE = b"C"
+
+
+def read_trace(path: str) -> List[Tuple[bytes, int, bytes]]:
+    """
+    Read a serial trace.
+
+    Parameters
+    ----------
+    path : str
+        The path of the trace file.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a (supported) serial trace.
+
+    Returns
+    -------
+    records : list
+        The records as (kind, time in ns, payload) tuples.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        raise ValueError("{} is not a serial trace.".format(path))
+    magic, version, _ = _HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC:
+        raise ValueError("{} is not a serial trace.".format(path))
+    if version != TRACE_VERSION:
+        raise ValueError("Unsupported serial trace version {}.".format(version))
+
+    records = []
+    offset = _HEADER.size
+    while offset + _RECORD.size <= len(data):
+        kind, t_ns, length = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        records.append((kind, t_ns, data[offset : offset + length]))
+        offset += length
+    return records
+
+
+class _TraceWriter:
+    """Append only writer of one trace file, shared by all recorders on the same path."""
+
+    _writers = {}
+    _writers_lock = tr.Lock()
+
+    def __init__(self, path: str) -> ...:
+        """Create the trace file and write the header."""
+        self._lock = tr.Lock()
+        self._start = clock.monotonic()
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, time.time_ns()))
+        self._file.flush()
+
+    @classmethod
+    def get(cls, path: str) -> "_TraceWriter":
+        """Get the writer of the given path (the file is truncated on first use)."""
+        with cls._writers_lock:
+            if path not in cls._writers:
+                cls._writers[path] = cls(path)
+            return cls._writers[path]
+
+    @classmethod
+    def close_all(cls) -> ...:
+        """Close all trace files, the next recording on a path starts a new trace."""
+        with cls._writers_lock:
+            for writer in cls._writers.values():
+                with writer._lock:
+                    writer._file.close()
+            cls._writers.clear()
+
+    def record(self, kind: bytes, payload: bytes = b"") -> ...:
+        """Append a record with the current time."""
+        t_ns = int((clock.monotonic() - self._start) * 1e9)
+        with self._lock:
+            self._file.write(_RECORD.pack(kind, max(t_ns, 0), len(payload)) + payload)
+            # Flush every record, a killed backend should still leave a usable trace
+            self._file.flush()
+
+
+def close_traces() -> ...:
+    """Close all open trace files (recording to the same path again starts a new trace)."""
+    _TraceWriter.close_all()
+
+
+class SerialRecorder:
+    """
+    Serial port wrapper that records the traffic to a trace file.
+
+    All attributes that are not recorded are passed on to the wrapped port.
+    """
+
+    def __init__(self, ser, path: str) -> ...:
+        """
+        Start recording the traffic of the port.
+
+        Parameters
+        ----------
+        ser : serial.Serial
+            The open serial port (or simulated port).
+        path : str
+            The trace file. Recorders on the same path share the file, so a
+            port that is reopened by the driver ends up in one trace.
+        """
+        self._ser = ser
+        self._writer = _TraceWriter.get(path)
+        self._writer.record(OPEN, str(getattr(ser, "port", "")).encode())
+
+    def __getattr__(self, name: str):
+        """Pass the other attributes on to the wrapped port."""
+        return getattr(self._ser, name)
+
+    def write(self, data: bytes) -> int:
+        """Write the data to the port and record it."""
+        self._writer.record(WRITE, bytes(data))
+        return self._ser.write(data)
+
+    def _record_read(self, data: bytes) -> bytes:
+        """Record the returned bytes (if any)."""
+        if len(data) != 0:
+            self._writer.record(READ, data)
+        return data
+
+    def read(self, size: int = 1) -> bytes:
+        """Read size bytes from the port."""
+        return self._record_read(self._ser.read(size))
+
+    def read_all(self) -> bytes:
+        """Read all bytes in the input buffer."""
+        return self._record_read(self._ser.read_all())
+
+    def readline(self) -> bytes:
+        """Read a line from the port."""
+        return self._record_read(self._ser.readline())
+
+    def readlines(self) -> List[bytes]:
+        """
+        Read lines until the timeout passes without new data.
+
+        Reads line by line (like pyserial does) so every line is recorded
+        with the time it arrived.
+        """
+        lines = []
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            lines.append(line)
+        return lines
+
+    def close(self) -> ...:
+        """Close the port."""
+        self._writer.record(CLOSE)
+        self._ser.close()
+
+
+class _TraceReplayDevice:
+    """
+    Plays the reads of a trace back relative to the writes of the driver.
+
+    The reads that followed a write in the trace become available the same
+    (scaled) time after the driver does the matching write.
+    """
+
+    def __init__(self, path: str, speed: Union[float, int] = 1.0) -> ...:
+        """
+        Load the trace.
+
+        Parameters
+        ----------
+        path : str
+            The trace file.
+        speed : float, int
+            The replay speed, 2 replays twice as fast as recorded.
+        """
+        if speed <= 0:
+            raise ValueError("The replay speed should be larger than 0.")
+        self._lock = tr.Lock()
+        self._records = [r for r in read_trace(path) if r[0] in (WRITE, READ)]
+        self._cursor = 0
+        self._speed = speed
+        self._anchor_trace = 0
+        self._anchor_real = clock.monotonic()
+        self.mismatches = []  # (expected, written) pairs
+
+    @property
+    def finished(self) -> bool:
+        """Check if all records were played back."""
+        return self._cursor >= len(self._records)
+
+    def handle(self, data: bytes) -> List[bytes]:
+        """Match a write of the driver to the next write in the trace."""
+        lines = []
+        with self._lock:
+            # Reads the driver skipped are delivered right away
+            while not self.finished and self._records[self._cursor][0] == READ:
+                lines.append(self._records[self._cursor][2])
+                self._cursor += 1
+            if self.finished:
+                self.mismatches.append((b"", data))
+                return lines
+
+            _, t_ns, expected = self._records[self._cursor]
+            if expected != data:
+                self.mismatches.append((expected, data))
+            self._cursor += 1
+            self._anchor_trace = t_ns
+            self._anchor_real = clock.monotonic()
+        return lines
+
+    def poll(self) -> List[bytes]:
+        """Get the reads that are due since the last write."""
+        elapsed = (clock.monotonic() - self._anchor_real) * self._speed * 1e9
+        lines = []
+        with self._lock:
+            while not self.finished:
+                kind, t_ns, payload = self._records[self._cursor]
+                if kind != READ or t_ns - self._anchor_trace > elapsed:
+                    break
+                lines.append(payload)
+                self._cursor += 1
+        return lines
+
+
+class SerialReplay(SimulatedSerial):
+    """
+    Serial port that replays a recorded trace.
+
+    Ports opened on the same trace share the playback position, so a driver
+    that reopens its port continues where the previous port stopped.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        timeout: Union[float, int, None] = None,
+        speed: Union[float, int] = 1.0,
+        **kwargs
+    ) -> ...:
+        """
+        Open the replay port.
+
+        Parameters
+        ----------
+        path : str
+            The trace file to replay.
+        timeout : float, int, None
+            The read timeout in seconds.
+        speed : float, int
+            The replay speed, 2 replays twice as fast as recorded.
+        """
+        self._path = path
+        self._speed = speed
+        super().__init__(path, timeout=timeout, **kwargs)
+
+    def _create_device(self) -> _TraceReplayDevice:
+        """Load the trace to replay."""
+        return _TraceReplayDevice(self._path, self._speed)
+
+    @property
+    def mismatches(self) -> list:
+        """Get the writes that did not match the trace as (expected, written) pairs."""
+        return self._device.mismatches
+
+    @property
+    def finished(self) -> bool:
+        """Check if the whole trace was played back."""
+        return self._device.finished
+
+    def write(self, data: bytes) -> int:
+        """Write data, every write is matched to the next write in the trace."""
+        with self._lock:
+            for resp in self._device.handle(bytes(data)):
+                self._rx += resp
+        return len(data)
@@ -0,0 +1,21 @@
+from .simulated_axis import SimulatedAxis
+from .simulated_serial import (
+    SimulatedSerial,
+    SimulatedMainXYSerial,
+    SimulatedTangoSerial,
+)
+from .simulated_kinesis import (
+    SimulatedKinesisPiezoMotor,
+    SimulatedKinesisMotor,
+    list_kinesis_devices,
+)
+
+__all__ = [
+    'SimulatedAxis',
+    'SimulatedSerial',
+    'SimulatedMainXYSerial',
+    'SimulatedTangoSerial',
+    'SimulatedKinesisPiezoMotor',
+    'SimulatedKinesisMotor',
+    'list_kinesis_devices',
+]
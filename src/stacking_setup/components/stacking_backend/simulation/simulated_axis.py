@@ -0,0 +1,111 @@
+import threading as tr
+from typing import Union
+from .. import clock
+
+
+class SimulatedAxis:
+    """
+    Kinematic model of one simulated axis.
+
+    The position is not integrated in a loop but calculated from the time the
+    current move was started, this keeps the simulators cheap when nothing is
+    asked from them. Accelerations are ignored, a move runs at constant speed.
+    """
+
+    def __init__(self, position: Union[float, int] = 0, speed: Union[float, int] = 1000) -> ...:
+        """
+        Initialize the axis.
+
+        Parameters
+        ----------
+        position : float or int
+            The start position of the axis (in device units).
+        speed : float or int
+            The speed used for moves (in device units per second).
+        """
+        self._lock = tr.Lock()
+        self.speed = abs(speed)
+        self._start_pos = position
+        self._start_time = self._now()
+        self._velocity = 0
+        self._target = None
+
+    @staticmethod
+    def _now() -> float:
+        """Get the current simulation time in seconds."""
+        return clock.monotonic()
+
+    def _position(self, now: float) -> Union[float, int]:
+        """Calculate the position at the given time (lock should be held)."""
+        travelled = self._velocity * (now - self._start_time)
+        if self._target is not None:
+            remaining = self._target - self._start_pos
+            if abs(travelled) >= abs(remaining):
+                return self._target
+        return self._start_pos + travelled
+
+    def _restart(self, now: float) -> ...:
+        """Start a new segment from the current position (lock should be held)."""
+        self._start_pos = self._position(now)
+        self._start_time = now
+
+    @property
+    def position(self) -> Union[float, int]:
+        """Get the current position of the axis."""
+        with self._lock:
+            return self._position(self._now())
+
+    @position.setter
+    def position(self, position: Union[float, int]) -> ...:
+        """Set the position of the axis without moving (zeroing)."""
+        with self._lock:
+            self._start_pos = position
+            self._start_time = self._now()
+            self._velocity = 0
+            self._target = None
+
+    @property
+    def is_moving(self) -> bool:
+        """Check if the axis is moving."""
+        with self._lock:
+            if self._velocity == 0:
+                return False
+            if self._target is None:
+                return True
+            return self._position(self._now()) != self._target
+
+    def time_to_target(self) -> float:
+        """Get the time in seconds until the current move is finished."""
+        with self._lock:
+            if self._velocity == 0 or self._target is None:
+                return 0.0
+            return abs(self._target - self._position(self._now())) / abs(self._velocity)
+
+    def move_to(self, target: Union[float, int], speed: Union[float, int, None] = None) -> ...:
+        """Start a move to the given target."""
+        speed = self.speed if speed is None else abs(speed)
+        with self._lock:
+            self._restart(self._now())
+            self._target = target
+            if speed == 0 or target == self._start_pos:
+                self._velocity = 0
+            else:
+                self._velocity = speed if target > self._start_pos else -speed
+
+    def move_by(self, distance: Union[float, int], speed: Union[float, int, None] = None) -> ...:
+        """Start a move by the given distance from the current position."""
+        self.move_to(self.position + distance, speed)
+
+    def jog(self, velocity: Union[float, int]) -> ...:
+        """Move at the given (signed) velocity until stopped."""
+        with self._lock:
+            self._restart(self._now())
+            self._target = None
+            self._velocity = velocity
+
+    def stop(self) -> ...:
+        """Stop the axis at its current position."""
+        with self._lock:
+            self._restart(self._now())
+            self._target = None
+            self._velocity = 0
@@ -0,0 +1,233 @@
+from typing import Union, List, Tuple
+from .simulated_axis import SimulatedAxis
+from .. import clock
+
+
+# The kinesis devices on the rig (serial nr, description)
+SIMULATED_KINESIS_DEVICES = [
+    ("97101742", "Simulated Kinesis Inertial Motor Controller"),
+    ("27263640", "Simulated Kinesis DC Servo Motor Controller"),
+]
+
+
+def list_kinesis_devices() -> List[Tuple[str, str]]:
+    """List the simulated kinesis devices (same format as pylablib)."""
+    return list(SIMULATED_KINESIS_DEVICES)
+
+
+def _direction_sign(direction: Union[str, int, bool]) -> int:
+    """Convert a pylablib style jog direction to a sign."""
+    if direction in ("+", 1, True):
+        return 1
+    elif direction in ("-", 0, False, -1):
+        return -1
+    raise ValueError("Unknown jog direction {}".format(direction))
+
+
+class SimulatedKinesisPiezoMotor:
+    """
+    Simulation of :class:`pylablib.devices.Thorlabs.kinesis.KinesisPiezoMotor`.
+
+    Only the functions used by the :class:`KIM101` controller are implemented.
+    Positions are in steps, velocities in steps/s.
+    """
+
+    def __init__(self, conn: str, channels: int = 4) -> ...:
+        """
+        Open the simulated piezo controller.
+
+        Parameters
+        ----------
+        conn : str
+            The serial nr of the controller.
+        channels : int
+            The amount of channels on the controller.
+        """
+        self.conn = conn
+        self._axes = {i: SimulatedAxis(0, speed=500) for i in range(1, channels + 1)}
+        self._drive = {i: [110, 500, 10000] for i in self._axes}
+        self._jog = {i: ["continuous", 100, 100, 500, 10000] for i in self._axes}
+
+    def close(self) -> ...:
+        """Close the connection."""
+        self.stop()
+
+    def get_position(self, channel: int = 1) -> int:
+        """Get the position of the given channel (steps)."""
+        return int(self._axes[channel].position)
+
+    def is_moving(self, channel: int = 1) -> bool:
+        """Check if the given channel is moving."""
+        return self._axes[channel].is_moving
+
+    def setup_drive(self, max_voltage=None, velocity=None, acceleration=None, channel: int = 1) -> ...:
+        """Set the drive parameters of the given channel."""
+        for idx, value in enumerate((max_voltage, velocity, acceleration)):
+            if value is not None:
+                self._drive[channel][idx] = value
+        self._axes[channel].speed = self._drive[channel][1]
+
+    def get_drive_parameters(self, channel: int = 1) -> tuple:
+        """Get the drive parameters (max voltage, velocity, acceleration)."""
+        return tuple(self._drive[channel])
+
+    def setup_jog(self, mode=None, step_size=None, velocity=None, acceleration=None, channel: int = 1) -> ...:
+        """Set the jog parameters of the given channel."""
+        for idx, value in ((0, mode), (1, step_size), (3, velocity), (4, acceleration)):
+            if value is not None:
+                self._jog[channel][idx] = value
+
+    def get_jog_parameters(self, channel: int = 1) -> tuple:
+        """Get the jog parameters (mode, step size fwd, step size bwd, velocity, acceleration)."""
+        return tuple(self._jog[channel])
+
+    def jog(self, direction: Union[str, int, bool], kind: str = "continuous", channel: int = 1) -> ...:
+        """Start a jog on the given channel."""
+        sign = _direction_sign(direction)
+        if kind == "continuous":
+            self._axes[channel].jog(sign * self._jog[channel][3])
+        else:
+            self._axes[channel].move_by(sign * self._jog[channel][1])
+
+    def move_by(self, distance: Union[float, int] = 1, channel: int = 1) -> ...:
+        """Move the given channel by the distance (steps)."""
+        self._axes[channel].move_by(int(distance))
+
+    def move_to(self, position: Union[float, int], channel: int = 1) -> ...:
+        """Move the given channel to the position (steps)."""
+        self._axes[channel].move_to(int(position))
+
+    def wait_move(self, channel: int = 1, timeout: Union[float, None] = None) -> ...:
+        """Wait until the given channel stopped moving."""
+        etime = None if timeout is None else clock.monotonic() + timeout
+        while self.is_moving(channel=channel):
+            if etime is not None and clock.monotonic() > etime:
+                raise TimeoutError()
+            clock.sleep(0.001)
+
+    def stop(self, channel: Union[int, None] = None, immediate: bool = True, sync: bool = True) -> ...:
+        """Stop the given channel (or all channels if None)."""
+        channels = self._axes.keys() if channel is None else [channel]
+        for i in channels:
+            self._axes[i].stop()
+
+
+class SimulatedKinesisMotor:
+    """
+    Simulation of :class:`pylablib.devices.Thorlabs.kinesis.KinesisMotor`.
+
+    Only the functions used by the :class:`KDC101` controller are implemented.
+    Positions are in degrees, velocities in degrees/s.
+    """
+
+    def __init__(self, conn: str, scale: Union[str, None] = None) -> ...:
+        """
+        Open the simulated motor controller.
+
+        Parameters
+        ----------
+        conn : str
+            The serial nr of the controller.
+        scale : str
+            Not used but added for compatibility.
+        """
+        self.conn = conn
+        self._axis = SimulatedAxis(0, speed=10)
+        self._velocity = [0, 25, 10]  # min velocity, acceleration, max velocity
+        self._jog = ["continuous", 5, 0, 25, 10]
+        self._homing = [1, 1, 10, 4]  # direction, limit switch, velocity, offset
+        self._homed = False
+        self._homing_active = False
+
+    def close(self) -> ...:
+        """Close the connection."""
+        self.stop()
+
+    def get_position(self, scale: bool = True) -> float:
+        """Get the position of the motor."""
+        return self._axis.position
+
+    def is_moving(self) -> bool:
+        """Check if the motor is moving."""
+        return self._axis.is_moving
+
+    def is_homing(self) -> bool:
+        """Check if the motor is homing."""
+        if self._homing_active and not self._axis.is_moving:
+            self._homing_active = False
+            self._homed = True
+        return self._homing_active
+
+    def is_homed(self) -> bool:
+        """Check if the motor is homed."""
+        self.is_homing()
+        return self._homed
+
+    def home(self, sync: bool = False, force: bool = True) -> ...:
+        """Start homing the motor."""
+        self._homing_active = True
+        self._axis.move_to(0, speed=self._homing[2])
+        if sync:
+            self.wait_for_home()
+
+    def wait_for_home(self, timeout: Union[float, None] = None) -> ...:
+        """Wait until the homing is done."""
+        etime = None if timeout is None else clock.monotonic() + timeout
+        while self.is_homing():
+            if etime is not None and clock.monotonic() > etime:
+                raise TimeoutError()
+            clock.sleep(0.001)
+
+    def get_homing_parameters(self, scale: bool = True) -> tuple:
+        """Get the homing parameters (direction, limit switch, velocity, offset)."""
+        return tuple(self._homing)
+
+    def setup_homing(self, home_direction=None, limit_switch=None, velocity=None, offset_distance=None,
+                     acceleration=None, scale: bool = True) -> ...:
+        """Set the homing parameters."""
+        for idx, value in enumerate((home_direction, limit_switch, velocity, offset_distance)):
+            if value is not None:
+                self._homing[idx] = value
+
+    def get_velocity_params(self, scale: bool = True) -> tuple:
+        """Get the velocity parameters (min velocity, acceleration, max velocity)."""
+        return tuple(self._velocity)
+
+    def setup_velocity(self, min_velocity=None, acceleration=None, max_velocity=None, scale: bool = True) -> ...:
+        """Set the velocity parameters."""
+        for idx, value in enumerate((min_velocity, acceleration, max_velocity)):
+            if value is not None:
+                self._velocity[idx] = value
+        self._axis.speed = self._velocity[2]
+
+    def get_jog_params(self, scale: bool = True) -> tuple:
+        """Get the jog parameters (mode, step size, min velocity, acceleration, max velocity)."""
+        return tuple(self._jog)
+
+    def setup_jog(self, mode=None, step_size=None, min_velocity=None, acceleration=None,
+                  max_velocity=None, stop_mode=None, scale: bool = True) -> ...:
+        """Set the jog parameters."""
+        for idx, value in enumerate((mode, step_size, min_velocity, acceleration, max_velocity)):
+            if value is not None:
+                self._jog[idx] = value
+
+    def jog(self, direction: Union[str, int, bool], kind: str = "continuous") -> ...:
+        """Start a jog."""
+        sign = _direction_sign(direction)
+        if kind == "continuous":
+            self._axis.jog(sign * self._jog[4])
+        else:
+            self._axis.move_by(sign * self._jog[1])
+
+    def move_by(self, distance: Union[float, int] = 1, scale: bool = True) -> ...:
+        """Move the motor by the given distance."""
+        self._axis.move_by(distance)
+
+    def move_to(self, position: Union[float, int], scale: bool = True) -> ...:
+        """Move the motor to the given position."""
+        self._axis.move_to(position)
+
+    def stop(self, immediate: bool = False, sync: bool = True) -> ...:
+        """Stop the motor."""
+        self._homing_active = False
+        self._axis.stop()
@@ -0,0 +1,422 @@
+import threading as tr
+from typing import Union, List
+from .simulated_axis import SimulatedAxis
+from .. import clock
+
+
+class SimulatedSerial:
+    """
+    Drop in replacement for :class:`serial.Serial` backed by a simulated device.
+
+    Only the part of the pyserial interface used by the controllers is
+    implemented. The read functions follow the pyserial timeout behaviour,
+    so :meth:`readlines` only returns after ``timeout`` seconds without new
+    data, just like on the real port.
+    """
+
+    _device_type = None
+    _devices = {}  # Simulated devices by port, so a reopened port keeps its state
+    _ports = {}  # The open port of every device, like a real port it can only be open once
+    _devices_lock = tr.Lock()
+
+    def __init__(
+        self,
+        port: Union[str, None] = None,
+        baudrate: int = 9600,
+        timeout: Union[float, int, None] = None,
+        **kwargs
+    ) -> ...:
+        """
+        Open the simulated port.
+
+        Parameters
+        ----------
+        port : str
+            The port name, ports with the same name share one simulated device.
+        baudrate : int
+            Not used but added for compatibility.
+        timeout : float, int, None
+            The read timeout in seconds.
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.is_open = False
+        self._rx = bytearray()
+        self._tx = bytearray()
+        self._lock = tr.Lock()
+        self._key = (type(self).__name__, port)
+        with self._devices_lock:
+            if self._key not in self._devices:
+                self._devices[self._key] = self._create_device()
+            self._device = self._devices[self._key]
+        self.open()
+
+    def _create_device(self):
+        """Create the simulated device behind a newly used port."""
+        return self._device_type()
+
+    @classmethod
+    def reset_devices(cls) -> ...:
+        """Forget all simulated devices (power cycle the simulated rig)."""
+        with cls._devices_lock:
+            ports = list(cls._ports.values())
+            cls._devices.clear()
+            cls._ports.clear()
+        for ser in ports:
+            ser.close()
+
+    @property
+    def device(self):
+        """Get the simulated device behind the port."""
+        return self._device
+
+    def open(self) -> ...:
+        """Open the port, a handle that still has the port open is closed."""
+        with self._devices_lock:
+            previous = self._ports.get(self._key)
+            self._ports[self._key] = self
+        if previous is not None and previous is not self:
+            previous.close()
+        self.is_open = True
+
+    def close(self) -> ...:
+        """Close the port."""
+        self.is_open = False
+        with self._devices_lock:
+            if self._ports.get(self._key) is self:
+                del self._ports[self._key]
+
+    def _update(self) -> ...:
+        """Move the lines the device produced on its own into the input buffer."""
+        for line in self._device.poll():
+            self._rx += line
+
+    @property
+    def in_waiting(self) -> int:
+        """Get the amount of bytes in the input buffer."""
+        with self._lock:
+            self._update()
+            return len(self._rx)
+
+    def reset_input_buffer(self) -> ...:
+        """Clear the input buffer."""
+        with self._lock:
+            self._update()
+            self._rx.clear()
+
+    def reset_output_buffer(self) -> ...:
+        """Clear the output buffer."""
+        with self._lock:
+            self._tx.clear()
+
+    def write(self, data: bytes) -> int:
+        """Write data to the simulated device."""
+        with self._lock:
+            self._tx += data
+            while True:
+                idx = self._tx.find(self._device.terminator)
+                if idx < 0:
+                    break
+                line = bytes(self._tx[:idx]).strip()
+                del self._tx[: idx + len(self._device.terminator)]
+                if len(line) == 0:
+                    continue
+                for resp in self._device.handle(line):
+                    self._rx += resp
+        return len(data)
+
+    def flush(self) -> ...:
+        """Wait until all data is written (always done for the simulator)."""
+        pass
+
+    def _wait_for(self, condition: callable) -> ...:
+        """Wait until the condition on the input buffer holds or the timeout passes."""
+        etime = None if self.timeout is None else clock.monotonic() + self.timeout
+        while self.is_open:
+            with self._lock:
+                self._update()
+                if condition():
+                    return
+            if etime is not None and clock.monotonic() >= etime:
+                return
+            clock.sleep(0.001)
+
+    def read(self, size: int = 1) -> bytes:
+        """Read size bytes from the port."""
+        self._wait_for(lambda: len(self._rx) >= size)
+        with self._lock:
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+        return data
+
+    def read_all(self) -> bytes:
+        """Read all bytes in the input buffer."""
+        with self._lock:
+            self._update()
+            data = bytes(self._rx)
+            self._rx.clear()
+        return data
+
+    def readline(self) -> bytes:
+        """Read a line ending with a newline (or what arrived before the timeout)."""
+        self._wait_for(lambda: b"\n" in self._rx)
+        with self._lock:
+            idx = self._rx.find(b"\n")
+            idx = len(self._rx) if idx < 0 else idx + 1
+            data = bytes(self._rx[:idx])
+            del self._rx[:idx]
+        return data
+
+    def readlines(self) -> List[bytes]:
+        """Read lines until the timeout passes without new data."""
+        lines = []
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            lines.append(line)
+        return lines
+
+
+class SimulatedBaseStageDevice:
+    """
+    Simulation of the home made base stage controller.
+
+    Implements the command set used by
+    :class:`~stacking_backend.controllers.main_xy_controller.MainXYController`.
+    Positions are in steps, the axes start away from the zero position so
+    zeroing takes a realistic amount of time.
+    """
+
+    terminator = b"\n"
+    id_line = b"Base Stage Controller10\r\n"
+    start_positions = {"x": 51200, "y": 25600}
+    zero_backoff = 0.5  # Time in seconds to back off the home switch
+
+    def __init__(self) -> ...:
+        """Initialize the simulated controller."""
+        self._lock = tr.Lock()
+        self.axes = {
+            axis: SimulatedAxis(position, speed=25600)
+            for axis, position in self.start_positions.items()
+        }
+        self.acceleration = 200
+        self.deceleration = 200
+        self.temperature = 21.0
+        self.target_temperature = 0.0
+        self.temp_control = False
+        self.vacuum = False
+        self.run_mode = False
+        self.session = 0  # Session token, lost on a power cycle and when zeroing
+        self._temp_time = clock.monotonic()
+        self._zero_queue = []  # Axes waiting to be zeroed (in order)
+        self._pending = []  # (time, line) async lines
+
+    @staticmethod
+    def _line(value) -> bytes:
+        """Format a value as a response line."""
+        if isinstance(value, bytes):
+            return value + b"\r\n"
+        return str(value).encode() + b"\r\n"
+
+    def _update_temperature(self, now: float) -> ...:
+        """Move the temperature towards the setpoint at 1 degree per second."""
+        dt = now - self._temp_time
+        self._temp_time = now
+        goal = self.target_temperature if self.temp_control else 21.0
+        step = min(abs(goal - self.temperature), dt)
+        self.temperature += step if goal > self.temperature else -step
+
+    def _start_next_zero(self, now: float) -> ...:
+        """Start zeroing the next axis in the queue (lock should be held)."""
+        if len(self._zero_queue) == 0:
+            return
+        axis = self._zero_queue[0]
+        self.axes[axis].move_to(0)
+        # The controller always backs off the home switch, even when at zero
+        done = now + self.axes[axis].time_to_target() + self.zero_backoff
+        self._pending.append((done, axis))
+
+    def poll(self) -> List[bytes]:
+        """Get the lines the controller sent on its own since the last poll."""
+        now = clock.monotonic()
+        lines = []
+        with self._lock:
+            while len(self._pending) != 0 and self._pending[0][0] <= now:
+                _, axis = self._pending.pop(0)
+                self._zero_queue.pop(0)
+                self.axes[axis].position = 0
+                lines.append(self._line("ENDPOS {}".format(axis.upper())))
+                self._start_next_zero(now)
+        return lines
+
+    def handle(self, line: bytes) -> List[bytes]:
+        """Handle one command line and return the response lines."""
+        cmd = line.decode(errors="replace").strip()
+        now = clock.monotonic()
+        ok = [self._line(b"OK")]
+        with self._lock:
+            self._update_temperature(now)
+            if cmd == "gid":
+                return [self.id_line]
+            elif cmd == "n":
+                self.run_mode = True
+                return ok
+            elif cmd == "p":
+                self.run_mode = False
+                return ok
+            elif cmd == "z":
+                self.session = 0
+                self._zero_queue = ["x", "y"]
+                self._pending = []
+                self._start_next_zero(now)
+                return ok
+            elif cmd == "h":
+                for axis in self.axes.values():
+                    axis.move_to(0)
+                return ok
+            elif cmd == "x":
+                for axis in self.axes.values():
+                    axis.stop()
+                return ok
+            elif cmd[:2] == "ss" and cmd[2:3] in self.axes:
+                self.axes[cmd[2]].speed = abs(int(float(cmd[3:])))
+                return ok
+            elif cmd[:2] in ("sa", "sd"):
+                value = cmd[2:].split(",")[0]
+                if cmd[:2] == "sa":
+                    self.acceleration = int(float(value))
+                else:
+                    self.deceleration = int(float(value))
+                return ok
+            elif cmd[:2] == "gp" and cmd[2:3] in self.axes:
+                return ok + [self._line(int(self.axes[cmd[2]].position))]
+            elif cmd[:2] == "sp" and cmd[2:3] in self.axes:
+                self.axes[cmd[2]].move_to(int(float(cmd[3:])))
+                return ok
+            elif cmd[:2] == "sv" and cmd[2:3] in self.axes:
+                self.axes[cmd[2]].jog(int(float(cmd[3:])))
+                return ok
+            elif cmd == "l":
+                return ok + [
+                    self._line(self.axes["x"].speed),
+                    self._line(self.acceleration),
+                    self._line(self.deceleration),
+                    self._line(self.axes["y"].speed),
+                    self._line(int(self.vacuum)),
+                    self._line(self.target_temperature),
+                ]
+            elif cmd == "gt":
+                return ok + [self._line("{:.2f}".format(self.temperature))]
+            elif cmd[:2] == "st":
+                self.target_temperature = float(cmd[2:]) / 100
+                return ok
+            elif cmd in ("fp0", "fp1"):
+                self.temp_control = cmd == "fp1"
+                return ok
+            elif cmd in ("su0", "su1"):
+                self.vacuum = cmd == "su1"
+                return ok
+            elif cmd == "ga":
+                return ok + [self._line(int(self.temperature < self.target_temperature))]
+            elif cmd == "gb":
+                status = [b"0"] * 48
+                status[15] = b"1" if self.axes["x"].is_moving else b"0"
+                status[31] = b"1" if self.axes["y"].is_moving else b"0"
+                return ok + [self._line(i) for i in status]
+            elif cmd[:2] == "sk":
+                self.session = int(cmd[2:])
+                return ok
+            elif cmd == "gk":
+                return ok + [self._line(self.session)]
+            elif cmd == "ge":
+                return ok + [self._line(b"0") for _ in range(7)]
+            return [self._line("ERR unknown command {}".format(cmd))]
+
+
+class SimulatedTangoDevice:
+    """
+    Simulation of the Marzhauser Tango desktop controller (z axis only).
+
+    Implements the command set used by
+    :class:`~stacking_backend.components.TangoDesktop.TangoDesktop`.
+    Positions are in um, velocities in revolutions per second.
+    """
+
+    terminator = b"\r"
+    serial_nr = "220313104"
+    pitch = 1.0
+    motorsteps = 200
+
+    def __init__(self) -> ...:
+        """Initialize the simulated controller."""
+        self._lock = tr.Lock()
+        self.axis = SimulatedAxis(0, speed=self.pitch * 1000)
+        self.settings = {"dim": "1 1 1", "extmode": "1", "nosetlimit": "1", "autostatus": "0"}
+        self.acceleration = 0.1
+
+    def poll(self) -> List[bytes]:
+        """The simulated tango does not send anything on its own."""
+        return []
+
+    def handle(self, line: bytes) -> List[bytes]:
+        """Handle one command line and return the response lines."""
+        parts = line.decode(errors="replace").split()
+        if len(parts) == 0:
+            return []
+        cmd, args = parts[0].lower(), parts[1:]
+        if args and args[0].lower() == "z":
+            args = args[1:]
+
+        with self._lock:
+            if cmd == "?readsn":
+                return [self._line(self.serial_nr)]
+            elif cmd == "?pitch":
+                return [self._line(self.pitch)]
+            elif cmd == "?motorsteps":
+                return [self._line(self.motorsteps)]
+            elif cmd == "?pos":
+                return [self._line(round(self.axis.position, 3))]
+            elif cmd == "?vel":
+                return [self._line(self.axis.speed / 1000 / self.pitch)]
+            elif cmd == "?accel":
+                return [self._line(self.acceleration)]
+            elif cmd == "!vel":
+                self.axis.speed = abs(float(args[0])) * self.pitch * 1000
+            elif cmd == "!accel":
+                self.acceleration = float(args[0])
+            elif cmd == "sa":
+                return [self._line("M" if self.axis.is_moving else "@")]
+            elif cmd == "!moa":
+                self.axis.move_to(float(args[0]))
+            elif cmd == "!mor":
+                self.axis.move_by(float(args[0]))
+            elif cmd == "!speed":
+                self.axis.jog(float(args[0]) * self.pitch * 1000)
+            elif cmd in ("!stop", "!stopaccel"):
+                self.axis.stop()
+            elif cmd[0] == "?" and cmd[1:] in self.settings:
+                return [self._line(self.settings[cmd[1:]])]
+            elif cmd[0] == "!" and cmd[1:] in self.settings:
+                self.settings[cmd[1:]] = " ".join(args)
+            else:
+                return [self._line("E")]
+        return []
+
+    @staticmethod
+    def _line(value) -> bytes:
+        """Format a value as a response line."""
+        return str(value).encode() + b"\r\n"
+
+
+class SimulatedMainXYSerial(SimulatedSerial):
+    """Simulated serial port with the base stage controller connected."""
+
+    _device_type = SimulatedBaseStageDevice
+
+
+class SimulatedTangoSerial(SimulatedSerial):
+    """Simulated serial port with the tango desktop connected."""
+
+    _device_type = SimulatedTangoDevice
@@ -1,12 +1,17 @@
 import multiprocessing as mp
 import threading as tr
-import time
 import logging
+import configparser
 from typeguard import typechecked
 from typing import Union
 from .gcode_parser import GcodeParser, GcodeAttributeError, GcodeParsingError
-from .exceptions import NotSupportedError
+from .exceptions import NotSupportedError, HardwareNotConnectedError, AxisNotReadyError
 from ..stacking_middleware.message import Message
+from ..stacking_middleware.topics import TOPIC_POSITIONS, TOPIC_TEMPERATURES
+from ..stacking_middleware.outbox import TelemetryOutbox
+from ..stacking_middleware.command_coalescer import CommandCoalescer
+from ..stacking_middleware.handshake import Capabilities
+from ..stacking_middleware.heartbeat import INTERVAL, MISSED_BEATS
 from .controllers.KDC101 import KDC101
 from .controllers.KIM101 import KIM101
 from .components.PIA13 import PIA13
@@ -14,9 +19,13 @@ from .components.sample_bed import SampleBed
 from .components.base_stepper import BaseStepper
 from .controllers.main_xy_controller import MainXYController
 from .components.TangoDesktop import TangoDesktop
+from .components.base import Base
 from ..stacking_middleware.pipeline_connection import PipelineConnection
 from ..stacking_middleware.serial_connection import SerialConnection
 from .configs.settings import Settings
+from . import clock
+from .bring_up import BringUpGraph
+from . import machine_state
 from queue import Queue
 from .catch_remote_exceptions import catch_remote_exceptions
 
@@ -51,6 +60,7 @@ class StackingSetupBackend:
     * M154 : Position auto report
     * M155 : Temperature auto report
     * M190 : Wait for bed temperature
+    * M501 : Reload settings
     * M503 : Report settings
     * M510 : Lock machine
     * M511 : Unlock machine
@@ -61,8 +71,55 @@ class StackingSetupBackend:
 
     _emergency_breaker = None
     _hardware = None
-
-    def __init__(self, to_main: Union[PipelineConnection, SerialConnection]) -> None:
+    _startup_report = None
+    _telemetry_outbox = None  # Latest wins queue of the auto reports, see :meth:`_telemetry_out`
+    _request_id = None  # Line number of the command that is being executed, see :meth:`_execute_command`
+    _snapshot_file = ""  # Machine state snapshot, empty if disabled
+    # The settings that have to be enabled for an axis, see :meth:`_init_all_hardware`
+    _AXIS_SETTINGS = {
+        "X": ("KIM101.DEFAULT", "PIA13.X"),
+        "Y": ("KIM101.DEFAULT", "PIA13.Y"),
+        "Z": ("KIM101.DEFAULT", "PIA13.Z"),
+        "L": ("KDC101.DEFAULT", "MAINXYCONTROLLER.DEFAULT", "SAMPLEHOLDER.L"),
+        "H": ("KDC101.DEFAULT", "MAINXYCONTROLLER.DEFAULT", "BASESTEPPER.H"),
+        "J": ("KDC101.DEFAULT", "MAINXYCONTROLLER.DEFAULT", "BASESTEPPER.J"),
+        "K": ("TANGODESKTOP.K",),
+    }
+    # The commands :meth:`_execute_command` dispatches, also announced in the handshake
+    # (see :meth:`_capabilities`). The priority commands stop the rest of the line, the
+    # other commands map to True if the method takes the parameters of the command.
+    _PRIORITY_COMMANDS = ("M112", "M999", "M0")
+    _MACHINE_COMMANDS = {
+        "M105": False,  # Get the temperature
+        "M113": True,  # Keep the host alive
+        "M114": False,  # Get the position
+        "M140": True,  # Set the bed temperature
+        "M154": True,  # Position autoreport
+        "M155": True,  # Temperature autoreport
+        "M501": False,  # Reload the settings
+        "M811": True,  # Use jogging
+        "M812": True,  # Set the jog velocity
+        "M813": True,  # Unconditional stop
+        "M814": True,  # Toggle the vacuum pump
+        "M815": True,  # Toggle the temp control
+    }
+    _MOVEMENT_COMMANDS = {
+        "G0": True,  # Move to all the given axes at the same time
+        "G1": True,  # Rotate the given axis
+        "G28": False,  # Home all axes
+        "G90": False,  # Set to absolute positioning
+        "G91": False,  # Set to relative positioning
+    }
+    # Backend settings that can be changed while running, by section and key the attribute to set
+    _live_settings = {"SNAPSHOT.DEFAULT": {"interval": "_snapshot_interval", "max_age": "_snapshot_max_age"}}
+    # Settings that are read from the settings every time they are used
+    _read_on_use_settings = ("connect_timeout",)
+
+    def __init__(
+        self,
+        to_main: Union[PipelineConnection, SerialConnection],
+        settings: Union[Settings, None] = None,
+    ) -> None:
         """
         Initiate the backend class.
 
@@ -74,11 +131,15 @@ class StackingSetupBackend:
             .. note::
                 All middleware methods that inherit from the base middleware class
                 can be used as a as a middleware connection.
+        settings : Settings, None
+            The hardware settings to use, by default the ``hardware_config.ini``
+            settings. Pass ``Settings('simulation_config.ini')`` to run the
+            backend against the simulated hardware.
         """
         self._con_to_main = to_main
         self._emergency_stop_event = mp.Event()
         self._shutdown = mp.Event()
-        self._settings = Settings()
+        self._settings = Settings() if settings is None else settings
         self._positioning = "REL"  # Always initiate in relative positioning mode
 
     # INITIATION METHODS
@@ -101,70 +162,6 @@ class StackingSetupBackend:
     #     )
     #     return logging.getLogger(__name__)
 
-    @typechecked
-    def _echo(self, func : callable, command_id : str, command : Union[dict, None]=None) -> ...:
-        """
-        Echo the command response (error code and msg) to the main process.
-
-        The goal of this function is to execute actions in a separate thread and pass the status
-        messages to the main process.
-
-        .. attention::
-            Actions have to be done in a separate thread so the backend stays responsive and can 
-            respond to the emergency stop command (:func:`M112`)
-
-        Parameters
-        ----------
-        func : function
-            The function to execute.
-        command_id : str
-            The command id.
-        command : dict, None
-            The command.
-        """
-        if self._emergency_stop_event.is_set():
-            # self._logger.critical('Cannot execute command {} when the estop is set'.format(command_id))
-            return
-
-        # Send the exit code and msg over the pipe to main
-        thread = tr.Thread(target=self._threaded_excecution, args=(self._execution_q, func, command_id, command,),
-                            daemon=True)
-        thread.start()
-        return
-
-    def _threaded_excecution(self, q : Queue, func : callable, command_id : str, command : Union[dict, None]=None) -> ...:
-        """
-        Execute the command in a separate thread.
-
-        Parameters
-        ----------
-        q : Queue
-            The queue to send the message to the main thread.
-        func : function
-            The function to execute.
-        command_id : str
-            The command id.
-        command : dict, None
-            The command.
-        """
-        if command is not None:
-            exit_code, msg = func(command)
-        else:
-            exit_code, msg = func()
-
-        if msg is None:
-            msg = ''
-        elif not isinstance(msg, (str, dict),):
-            msg = str(msg)
-
-        message = Message(exit_code=exit_code, msg=msg, command_id=command_id, command=command)
-
-        # Send to the main process and execution loop
-        q.put(Message(exit_code=exit_code, msg=msg, command_id=command_id, command=command))
-        self._con_to_main.send(message)
-        return
-
-
     def _init_all_hardware(self, settings : Settings) -> list:
         """
         Initiate the hardware.
@@ -184,12 +181,17 @@ class StackingSetupBackend:
             A list of the hardware controllers.
         """
         _hardware = []
+        self._controllers = {}  # The controllers by type, connected before the components
+        self._dependencies = {}  # The controllers each component (axis id) depends on
 
         # Initiate the piezos
         if self._settings.get("KIM101.DEFAULT", "enabled"):
             self._piezo_controller = KIM101(
                 settings=settings, em_event=self._emergency_stop_event
             )
+            self._controllers["KIM101"] = self._piezo_controller
+            for axis_id in ("X", "Y", "Z"):
+                self._dependencies[axis_id] = ("KIM101",)
 
             if self._settings.get("PIA13.X", "enabled"):
                 _hardware.append(
@@ -234,6 +236,11 @@ class StackingSetupBackend:
             self._base_controller = MainXYController(
                 settings=settings, em_event=self._emergency_stop_event
             )
+            self._controllers["KDC101"] = self._motor_controller
+            self._controllers["MAINXYCONTROLLER"] = self._base_controller
+            self._dependencies["L"] = ("KDC101", "MAINXYCONTROLLER")
+            self._dependencies["H"] = ("MAINXYCONTROLLER",)
+            self._dependencies["J"] = ("MAINXYCONTROLLER",)
 
             if self._settings.get("SAMPLEHOLDER.L", "enabled"):
                 _hardware.append(
@@ -276,7 +283,45 @@ class StackingSetupBackend:
 
         return _hardware
 
+    def _capabilities(self, settings : Settings) -> Capabilities:
+        """
+        Get what the backend can handle, sent to the frontend in the handshake.
+
+        The axes follow from the settings so the handshake does not have to
+        wait for the hardware. The commands are the commands that
+        :meth:`_execute_command` dispatches.
+
+        Parameters
+        ----------
+        settings : Settings
+            The settings.
+
+        Returns
+        -------
+        capabilities : Capabilities
+            The enabled axes and the supported commands.
+        """
+        axes = [
+            axis_id
+            for axis_id, sections in self._AXIS_SETTINGS.items()
+            if all(settings.get(section, "enabled") for section in sections)
+        ]
+        opcodes = sorted(self._PRIORITY_COMMANDS + tuple(self._MACHINE_COMMANDS) + tuple(self._MOVEMENT_COMMANDS))
+        return Capabilities(axes=axes, opcodes=opcodes)
+
     # MAIN EXECUTION FUNCTIONS
+    def _respond(self, message: Message) -> ...:
+        """
+        Send a response of the command line that is being executed.
+
+        Parameters
+        ----------
+        message : Message
+            The response, it gets the request id of the command line.
+        """
+        message.request_id = self._request_id
+        self._con_to_main.send(message)
+
     @typechecked
     def _echo(
         self, func: callable, command_id: str, command: Union[dict, None] = None
@@ -310,6 +355,7 @@ class StackingSetupBackend:
                 func,
                 command_id,
                 command,
+                self._request_id,
             ),
             daemon=True,
         )
@@ -322,6 +368,7 @@ class StackingSetupBackend:
         func: callable,
         command_id: str,
         command: Union[dict, None] = None,
+        request_id: Union[int, None] = None,
     ) -> ...:
         if command is not None:
             exit_code, msg = func(command)
@@ -336,17 +383,68 @@ class StackingSetupBackend:
         ):
             msg = str(msg)
 
-        q.put(
-            Message(
-                exit_code=exit_code, msg=msg, command_id=command_id, command=command
-            )
+        message = Message(
+            exit_code=exit_code, msg=msg, command_id=command_id, command=command
         )
+        message.request_id = request_id
+
+        # Send to the main process and execution loop
+        q.put(message)
+        self._con_to_main.send(message)
         return
 
-    def _connect_all_hardware(self) -> ...:
-        """Connect all the hardware in the _hardware list."""
+    def _connect_all_hardware(self) -> dict:
+        """
+        Connect all the hardware in the _hardware list.
+
+        The controllers are connected in parallel and every component is
+        connected as soon as its controllers are, see :class:`BringUpGraph`.
+
+        Raises
+        ------
+        HardwareNotConnectedError
+            If one of the parts did not connect (in time).
+
+        Returns
+        -------
+        report : dict
+            The startup timing report.
+        """
+        controllers = getattr(self, "_controllers", {})
+        dependencies = getattr(self, "_dependencies", {})
+        graph = BringUpGraph(self._emergency_stop_event)
+        for name, controller in controllers.items():
+            graph.add(
+                name,
+                controller.connect,
+                timeout=self._settings.get(name + ".DEFAULT", "connect_timeout"),
+            )
         for axis in self._hardware:
-            axis.connect()
+            try:
+                timeout = self._settings.get(axis.type + "." + axis.id, "connect_timeout")
+            except KeyError:
+                # No timeout for this part, use the general component timeout
+                timeout = self._settings.get("COMPONENT.DEFAULT", "connect_timeout")
+            graph.add(
+                axis.id,
+                axis.connect,
+                depends=dependencies.get(axis.id, ()),
+                timeout=timeout,
+            )
+
+        self._startup_report = graph.run()
+        print(BringUpGraph.format_report(self._startup_report))
+
+        failed = [
+            name
+            for name, step in self._startup_report["steps"].items()
+            if step["status"] != BringUpGraph.OK
+        ]
+        if len(failed) != 0 and not self._emergency_stop_event.is_set():
+            raise HardwareNotConnectedError(
+                "Could not connect: {}".format(", ".join(sorted(failed)))
+            )
+        return self._startup_report
 
     def _disconnect_all_hardware(self) -> ...:
         """Disconnect the hardware."""
@@ -376,10 +474,29 @@ class StackingSetupBackend:
             new process (hardware objects contain parts that cant be pickled).
         """
         # self._logger = self._set_logger()
+        # Select the time source, virtual time is only meant for simulated hardware
+        try:
+            clock_mode = settings.get("CLOCK.DEFAULT", "mode")
+        except KeyError:
+            clock_mode = "real"
+        clock.set_clock(clock.VirtualClock() if clock_mode == "virtual" else clock.RealClock())
+
+        # The machine state snapshot used to skip zeroing after a restart
+        try:
+            snapshot_file = settings.get("SNAPSHOT.DEFAULT", "file")
+            self._snapshot_interval = settings.get("SNAPSHOT.DEFAULT", "interval")
+            self._snapshot_max_age = settings.get("SNAPSHOT.DEFAULT", "max_age")
+        except KeyError:
+            snapshot_file = ""
+        self._snapshot_file = machine_state.resolve_path(snapshot_file) if snapshot_file else ""
+
         self._execution_q = mp.Queue()
+        self._coalescer = CommandCoalescer(monotonic=clock.monotonic)
         self._hardware = self._init_all_hardware(settings)
+        self._restore_state()
         self._connect_all_hardware()
         self._start_check_emergency_state()
+        self._start_checkpointing()
         # self._logger.info('Stacking setup initiated with connected hardware: {}'.format(self._hardware))
 
     def start_backend(self) -> ...:
@@ -400,13 +517,98 @@ class StackingSetupBackend:
         self._controller_process.set_deamon = True
         self._controller_process.start()
 
+    def _restore_state(self) -> ...:
+        """
+        Load the machine state snapshot (if enabled).
+
+        The positioning mode is restored directly, the controller states are
+        handed to the controllers so they can skip zeroing on connect if
+        they kept their position.
+        """
+        if not self._snapshot_file:
+            return
+        state = machine_state.load_snapshot(self._snapshot_file, self._snapshot_max_age)
+        if state is None:
+            return
+
+        if state.get("positioning") in ("REL", "ABS"):
+            self._positioning = state["positioning"]
+        controllers = getattr(self, "_controllers", {})
+        for name, controller_state in state.get("controllers", {}).items():
+            if name not in controllers:
+                continue
+            try:
+                controllers[name].restore_state(controller_state)
+            except AttributeError:
+                # The controller does not keep its state
+                pass
+
+    def _get_state(self, read_hardware: bool = False) -> dict:
+        """
+        Collect the machine state for the snapshot.
+
+        Parameters
+        ----------
+        read_hardware : bool
+            If the controllers should read their positions and speeds from
+            the hardware, otherwise the cached (last commanded) values are used.
+
+        Returns
+        -------
+        state : dict
+            The positioning mode and the state of the controllers.
+        """
+        state = {"positioning": self._positioning, "controllers": {}}
+        for name, controller in getattr(self, "_controllers", {}).items():
+            try:
+                if read_hardware:
+                    state["controllers"][name] = controller.read_state()
+                else:
+                    state["controllers"][name] = controller.state
+            except AttributeError:
+                # The controller does not keep its state
+                pass
+        return state
+
+    def _save_state(self, read_hardware: bool = False) -> ...:
+        """
+        Write the machine state snapshot (if enabled).
+
+        Parameters
+        ----------
+        read_hardware : bool
+            If the controllers should read their state from the hardware
+            (only on shutdown, the checkpoints use the cached values).
+        """
+        if not self._snapshot_file:
+            return
+        try:
+            machine_state.save_snapshot(self._snapshot_file, self._get_state(read_hardware))
+        except Exception as e:
+            # A failed checkpoint should never stop the backend
+            print("Could not save the machine state: {}".format(e))
+
+    def _start_checkpointing(self) -> ...:
+        """Start the thread that periodically saves the machine state snapshot."""
+        if not self._snapshot_file:
+            return
+        self._checkpoint_thread = tr.Thread(target=self._checkpoint_loop, daemon=True)
+        self._checkpoint_thread.start()
+
+    def _checkpoint_loop(self) -> ...:
+        """Save the machine state every snapshot interval (executed in a separate thread)."""
+        while not self._shutdown.is_set():
+            clock.sleep(self._snapshot_interval)
+            if not self._emergency_stop_event.is_set() and not self._shutdown.is_set():
+                self._save_state()
+
     def _start_check_emergency_state(self) -> ...:
         """
         Start the emergency stop check loop.
         
         Start a new thread that checks if the emergency stop event is set.
         """
-        self._emergency_stop_thread = tr.Thread(target=self._check_emergency_state)
+        self._emergency_stop_thread = tr.Thread(target=self._check_emergency_state, daemon=True)
         self._emergency_stop_thread.start()
 
     def _check_emergency_state(self) -> bool:
@@ -424,7 +626,7 @@ class StackingSetupBackend:
                 self._con_to_main.send(msg)
                 self._emergency_stop()
                 break
-            time.sleep(0.1)
+            clock.sleep(0.1)
 
     def _check_command_output(self) -> bool:
         """
@@ -472,12 +674,23 @@ class StackingSetupBackend:
         """
         self._con_to_main = con_to_main
         self._con_to_main.__init_lock__()
-        self._con_to_main.handshake()
+        self._con_to_main.handshake(self._capabilities(settings))
+        self._frontend_lost = tr.Event()
+        self._start_heartbeat(settings)
         self._emergency_stop_event = emergency_stop_event
         self._shutdown = shutdown_event
         self.setup_backend(settings)
 
         while not emergency_stop_event.is_set() or not shutdown_event.is_set():
+            # Stop all movement when the frontend stopped sending heartbeats
+            if self._frontend_lost.is_set():
+                self._frontend_lost.clear()
+                self._stop_for_lost_frontend()
+
+            # Apply the merged settings that waited for the rate limit
+            if self._coalescer.due():
+                self._release_coalesced(force=False)
+
             # Check if a new command is available
             if self._con_to_main.message_waiting():
                 commands = self._con_to_main.receive()
@@ -494,19 +707,22 @@ class StackingSetupBackend:
                 # Parse and execute the commands
                 for command in commands:
                     if command is not None:
+                        request_id = None
                         try:
+                            if isinstance(command, str):
+                                request_id, command = GcodeParser.split_line_number(command)
                             parsed_command = GcodeParser.parse_gcode_line(command)
                         except (GcodeAttributeError, GcodeParsingError) as e:
-                            self._con_to_main.send(
-                                Message(
-                                    exit_code=1,
-                                    msg=str(e),
-                                    command=command,
-                                    command_id="",
-                                )
+                            message = Message(
+                                exit_code=1,
+                                msg=str(e),
+                                command=command,
+                                command_id="",
                             )
+                            message.request_id = request_id
+                            self._con_to_main.send(message)
                             continue
-                        self._execute_command(parsed_command)
+                        self._execute_or_coalesce(parsed_command, request_id)
                     else:
                         self._con_to_main.send(
                             Message(
@@ -517,14 +733,94 @@ class StackingSetupBackend:
                             )
                         )
             else:
-                time.sleep(0.01)
+                clock.sleep(0.01)
 
+        self._save_state(read_hardware=True)
         self._disconnect_all_hardware()
         # self._logger.critical('Stacking process stopped.')
+        if self._telemetry_outbox is not None:
+            self._telemetry_outbox.close()
         self._con_to_main.disconnect()
         
+    def _start_heartbeat(self, settings: Settings) -> ...:
+        """
+        Start the heartbeat of the connection to the frontend.
+
+        The heartbeat thread sets ``_frontend_lost`` when the frontend missed
+        its beats, the controller loop then stops all movement (see
+        :meth:`_stop_for_lost_frontend`). A frontend that does not send
+        heartbeats is never lost. With several frontends (a socket
+        connection) every frontend is watched on its own, losing any of
+        them stops the movement.
+
+        Parameters
+        ----------
+        settings : Settings
+            The settings, the interval and missed beats are in the
+            HEARTBEAT.DEFAULT section.
+        """
+        try:
+            interval = settings.get("HEARTBEAT.DEFAULT", "interval")
+            missed = settings.get("HEARTBEAT.DEFAULT", "missed")
+        except KeyError:
+            interval, missed = INTERVAL, MISSED_BEATS
+        if interval:
+            self._con_to_main.start_heartbeat(interval, missed, on_lost=self._frontend_lost.set)
+
+    def _stop_for_lost_frontend(self) -> ...:
+        """Stop all movement, nobody is watching the machine anymore."""
+        print("The frontend is lost, stopping all movement.")
+        if self._hardware:
+            self.M0()
+
+    def _execute_or_coalesce(self, parsed_command: dict, request_id: Union[int, None] = None) -> ...:
+        """
+        Execute the parsed command dict, or merge it with the waiting settings.
+
+        A command that only holds a coalesced setting (see
+        :mod:`stacking_middleware.command_coalescer`) is merged with the
+        waiting setting and applied by the controller loop at a bounded
+        rate. Any other command applies the waiting settings first. Numbered
+        commands are never merged, their client waits for the response. A
+        waiting setting that is merged into a newer one is acknowledged
+        straight away, every command gets one response.
+
+        Parameters
+        ----------
+        parsed_command : dict
+            The parsed command, see :func:`_execute_command`.
+        request_id : int, None
+            The line number of the command.
+        """
+        if len(parsed_command) == 1 and request_id is None:
+            (command_id, params), = parsed_command.items()
+            merged = self._coalescer.holds(command_id)
+            if isinstance(params, dict) and self._coalescer.add(command_id, params):
+                if merged:
+                    self._con_to_main.send(Message(
+                        exit_code=0,
+                        msg="Merged into the next {}.".format(command_id),
+                        command_id=command_id,
+                    ))
+                return
+        self._release_coalesced()
+        self._execute_command(parsed_command, request_id)
+
+    def _release_coalesced(self, force: bool = True) -> ...:
+        """
+        Execute the merged settings.
+
+        Parameters
+        ----------
+        force : bool
+            Execute all the waiting settings, otherwise only the settings
+            that do not exceed the rate limit.
+        """
+        for command_id, params in self._coalescer.release(force):
+            self._execute_command({command_id: params})
+
     @typechecked        
-    def _execute_command(self, parsed_command : dict) -> ...:
+    def _execute_command(self, parsed_command : dict, request_id : Union[int, None] = None) -> ...:
         """
         Execute the parsed command dict.
 
@@ -539,7 +835,17 @@ class StackingSetupBackend:
             :func:`M0` (stop all movement).
             if one of these commands is in the parsed_command dict it will be
             executed first and the rest of the commands will be ignored.
+
+        Parameters
+        ----------
+        parsed_command : dict
+            The parsed command line, see :class:`GcodeParser`.
+        request_id : int, None
+            The line number of the command line, all the responses to the
+            line carry it so a client can match them to its command.
         """
+        self._request_id = request_id  # Picked up by the responses (runs on the controller thread only)
+
         # Placeholder for the exit code
         exit_code = 0
 
@@ -549,7 +855,7 @@ class StackingSetupBackend:
                 exit_code,
                 msg,
             ) = self.M112()
-            self._con_to_main.send(
+            self._respond(
                 Message(exit_code=exit_code, msg="", command_id="M112", command="M112")
             )
             # self._logger.critical("Emergency stop triggered")
@@ -557,7 +863,7 @@ class StackingSetupBackend:
 
         if "M999" in parsed_command.keys():
             exit_code, msg = self.M999()
-            self._con_to_main.send(
+            self._respond(
                 Message(exit_code=exit_code, msg="", command_id="M999", command="M999")
             )
             # self._logger.critical("Reset triggered")
@@ -565,7 +871,7 @@ class StackingSetupBackend:
 
         if "M0" in parsed_command.keys():
             exit_code, msg = self.M0()
-            self._con_to_main.send(
+            self._respond(
                 Message(exit_code=exit_code, msg="", command_id="M0", command="M0")
             )
             # self._logger.critical("Stop all movement triggered")
@@ -580,66 +886,11 @@ class StackingSetupBackend:
             if command_id[0] != "M":
                 # The command is not a machine command so skip it
                 continue
-            elif command_id == "M105":
-                # Get the temperature
-                self._echo(func=self.M105, command_id="M105")
-            elif command_id == "M113":
-                # Keep the host alive
-                self._echo(
-                    func=self.M113,
-                    command_id="M113",
-                    command=parsed_command[command_id],
-                )
-            elif command_id == "M114":
-                # Get the position
-                self._echo(func=self.M114, command_id="M114")
-            elif command_id == "M140":
-                # Set the bed temperature
-                self._echo(
-                    func=self.M140,
-                    command_id="M140",
-                    command=parsed_command[command_id],
-                )
-            elif command_id == "M154":
-                # Position autoreport
-                self._echo(
-                    func=self.M154,
-                    command_id="M154",
-                    command=parsed_command[command_id],
-                )
-            elif command_id == "M155":
-                # Temperature autoreport
-                self._echo(
-                    func=self.M155,
-                    command_id="M155",
-                    command=parsed_command[command_id],
-                )
-            elif command_id == "M811":
-                # Use jogging
-                self._echo(
-                    func=self.M811,
-                    command_id="M811",
-                    command=parsed_command[command_id],
-                )
-            elif command_id == "M812":
-                # Use jogging
-                self._echo(func=self.M812, command_id='M812',
-                        command=parsed_command[command_id])
-            elif command_id == 'M813':
-                # Unconditional stop
-                self._echo(func=self.M813, command_id='M813',
-                        command=parsed_command[command_id])
-            elif command_id == 'M814':
-                # Toggle the vacuum pump
-                self._echo(func=self.M814, command_id='M814',
-                        command=parsed_command[command_id])
-            elif command_id == 'M815':
-                # Toggle the temp control
-                self._echo(func=self.M815, command_id='M815',
-                        command=parsed_command[command_id])
+            elif command_id in self._MACHINE_COMMANDS:
+                self._dispatch(command_id, parsed_command, self._MACHINE_COMMANDS[command_id])
             else:
                 exit_code = 1
-                self._con_to_main.send(
+                self._respond(
                     Message(
                         exit_code=exit_code,
                         msg="Unknown command",
@@ -662,33 +913,11 @@ class StackingSetupBackend:
                 # There was an error in one of the previous commands
                 break
 
-            if command_id == "G0":
-                # Move to all the given axes at the same time
-                self._echo(
-                    func=self.G0, command_id="G0", command=parsed_command[command_id]
-                )
-            elif command_id == "G1":
-                # Rotate the given axis
-                self._echo(
-                    func=self.G1, command_id="G1", command=parsed_command[command_id]
-                )
-            elif command_id == "G2":
-                # Jog the given axis
-                self._echo(
-                    func=self.G2, command_id="G2", command=parsed_command[command_id]
-                )
-            elif command_id == "G28":
-                # Home all axes
-                self._echo(func=self.G28, command_id="G28")
-            elif command_id == "G90":
-                # Set to absolute positioning
-                self._echo(func=self.G90, command_id="G90")
-            elif command_id == "G91":
-                # Set to relative positioning
-                self._echo(func=self.G91, command_id="G91")
+            if command_id in self._MOVEMENT_COMMANDS:
+                self._dispatch(command_id, parsed_command, self._MOVEMENT_COMMANDS[command_id])
             else:
                 exit_code = 1
-                self._con_to_main.send(
+                self._respond(
                     Message(
                         exit_code=exit_code,
                         msg="Unknown command",
@@ -714,7 +943,25 @@ class StackingSetupBackend:
                 command_id="None",
             )
             # self._logger.warning(message.msg)
-            self._con_to_main.send(message)
+            self._respond(message)
+
+    def _dispatch(self, command_id: str, parsed_command: dict, with_parameters: bool) -> ...:
+        """
+        Execute a command of the dispatch tables, see :meth:`_execute_command`.
+
+        Parameters
+        ----------
+        command_id : str
+            The command id, the name of the method that executes the command.
+        parsed_command : dict
+            The parsed command line.
+        with_parameters : bool
+            Pass the parameters of the command to the method.
+        """
+        if with_parameters:
+            self._echo(func=getattr(self, command_id), command_id=command_id, command=parsed_command[command_id])
+        else:
+            self._echo(func=getattr(self, command_id), command_id=command_id)
 
     # MOVEMENT FUNCTIONS
     def G0(self, movements: dict) -> tuple:
@@ -734,6 +981,7 @@ class StackingSetupBackend:
             The error message if any error occurred, otherwise None.
         """
         axis_to_move = list(movements.keys())
+        not_ready = []  # The reasons axes could not be moved yet
         for axis in self._hardware:
             if axis.id in movements.keys():
                 try:
@@ -749,10 +997,15 @@ class StackingSetupBackend:
                     #     "Linear movement not supported for axis {}".format(axis.id)
                     # )
                     pass
+                except AxisNotReadyError as e:
+                    not_ready.append(str(e))
 
         if len(axis_to_move) != 0:
             # There are still movements left
-            return 1, "Not all movements were executed: {}".format(axis_to_move)
+            msg = "Not all movements were executed: {}".format(axis_to_move)
+            if len(not_ready) != 0:
+                msg += " " + " ".join(not_ready)
+            return 1, msg
         else:
             return 0, None
 
@@ -963,6 +1216,11 @@ class StackingSetupBackend:
         If the interval None is given the current settings will be returned if a 
         keep alive timer has been set. Otherwise the keep alive timer will be
         set to the given amount of seconds. If 0 is given the timer is disabled.
+
+        .. note::
+            The liveness of the connection is watched by the heartbeats of the
+            connector (see :mod:`stacking_middleware.heartbeat`), the keep alive
+            messages are only sent to hosts that ask for them.
         
         Parameters
         ----------
@@ -1005,7 +1263,8 @@ class StackingSetupBackend:
                 pass
             self._keep_host_alive_flag = tr.Event()
             self._keep_host_alive_interval = interval['S']
-            self._keep_host_alive_timer = tr.Thread(target=self._keep_host_alive, args=(interval, self._keep_host_alive_flag))
+            self._keep_host_alive_timer = tr.Thread(target=self._keep_host_alive, args=(interval['S'], self._keep_host_alive_flag),
+                                                    daemon=True)
             self._keep_host_alive_timer.start()
             return 0, None
 
@@ -1027,7 +1286,7 @@ class StackingSetupBackend:
             else:
                 stop_flag.set()
                 return
-            time.sleep(interval)
+            clock.sleep(interval)
 
     def _keep_host_alive(self, interval : int, stop_flag : tr.Event) -> ...:
         """
@@ -1047,7 +1306,7 @@ class StackingSetupBackend:
             else:
                 stop_flag.set()
                 return
-            time.sleep(interval)
+            clock.sleep(interval)
 
     def M114(self) -> tuple:
         """
@@ -1095,6 +1354,76 @@ class StackingSetupBackend:
                     pass
             return 0, None
 
+    def _settings_users(self, section: str) -> list:
+        """
+        Get the running components and controllers that use a settings section.
+
+        Parameters
+        ----------
+        section : str
+            The section name, a DEFAULT section is used by all parts of that type.
+
+        Returns
+        -------
+        users : list
+            The components and controllers with the settings section they read.
+        """
+        parts = list(self._hardware or []) + list(getattr(self, "_controllers", {}).values())
+        users = []
+        for part in parts:
+            if isinstance(part, Base):
+                own = part.type + "." + part.id
+            else:
+                own = part._type + ".DEFAULT"
+            if section == own or section == own.split(".")[0] + ".DEFAULT":
+                users.append((part, own))
+        return users
+
+    def M501(self) -> tuple:
+        """
+        Reload the settings file.
+
+        The changed settings that are safe to change while running (speed
+        limits, check intervals, timeouts) are applied to the running
+        components directly. Changed settings that need the hardware to
+        reconnect (ports, serial numbers, enabled parts, conversion factors)
+        are only reported, they are used after the next :func:`M999` or restart.
+
+        Returns
+        -------
+        exit_code : int
+            0 if the settings were reloaded, 1 if not.
+        msg : dict, str
+            The changed keys by section in the format
+            {'applied': {<section>: [<key>, ...]}, 'reconnect': {<section>: [<key>, ...]}}
+            or the reason the settings could not be reloaded.
+        """
+        try:
+            changes = self._settings.reload()
+        except (OSError, TypeError, configparser.Error) as e:
+            return 1, "Could not reload the settings: {}".format(e)
+
+        applied, reconnect = {}, {}
+        for section, keys in changes.items():
+            for key in keys:
+                done = False
+                if key not in self._settings.section(section):
+                    pass  # Removed, the part keeps its value until it is created again
+                elif key in self._read_on_use_settings:
+                    done = True
+                elif key in self._live_settings.get(section, {}):
+                    setattr(self, self._live_settings[section][key], self._settings.get(section, key))
+                    done = True
+                else:
+                    users = self._settings_users(section)
+                    if len(users) != 0 and all(key in part._live_settings for part, _ in users):
+                        for part, own in users:
+                            # The section of the part itself might override a changed default
+                            setattr(part, part._live_settings[key], self._settings.get(own, key))
+                        done = True
+                (applied if done else reconnect).setdefault(section, []).append(key)
+        return 0, {"applied": applied, "reconnect": reconnect}
+
     def M999(self) -> tuple:
         """
         Reset the machine.
@@ -1110,10 +1439,17 @@ class StackingSetupBackend:
             0 if the command was successful, 1 if not.
         msg : None
         """
+        self._save_state(read_hardware=True)  # Checkpoint so the reconnect can skip zeroing.
         self._disconnect_all_hardware()  # Try to disconnect all the hardware.
         self._emergency_stop_event.clear()  # Reset the emergency stop flag.
-        self._shutdown = False  # Reset the shutdown flag.
-        self._initiate_all_hardware()  # Reconnect all the hardware.
+        self._shutdown.clear()  # Reset the shutdown flag.
+
+        # Reconnect all the hardware.
+        self._hardware = self._init_all_hardware(self._settings)
+        self._restore_state()
+        self._connect_all_hardware()
+        if not self._emergency_stop_thread.is_alive():
+            self._start_check_emergency_state()
         return 0, None
 
     def M154(self, interval : dict) -> tuple:
@@ -1122,6 +1458,8 @@ class StackingSetupBackend:
 
         The data is returned in the msg variable in the following format:
         {<axis_id> : <position>, ...}
+        If the connector has a shared telemetry block the positions are
+        published in the block instead (see :mod:`stacking_middleware.telemetry`).
 
         If the interval None is given the current settings will be returned if a 
         auto position update has been set. Otherwise the auto position timer will be
@@ -1168,10 +1506,31 @@ class StackingSetupBackend:
                 pass
             self._auto_position_report_flag = tr.Event()
             self._auto_position_report_interval = interval['S']
-            self._auto_position_report_timer = tr.Thread(target=self._auto_position_report, args=(interval['S'], self._auto_position_report_flag))
+            self._telemetry_out()  # Created here so the report threads do not race to create it
+            self._auto_position_report_timer = tr.Thread(target=self._auto_position_report, args=(interval['S'], self._auto_position_report_flag),
+                                                         daemon=True)
             self._auto_position_report_timer.start()
             return 0, None
 
+    def _telemetry_out(self) -> TelemetryOutbox:
+        """
+        Get the outbox of the auto reports for the current connection.
+
+        A slow frontend or link only gets the latest position and
+        temperature report instead of a backlog of old reports (see
+        :mod:`stacking_middleware.outbox`).
+
+        Returns
+        -------
+        outbox : TelemetryOutbox
+            The outbox of the connection to the main process.
+        """
+        if self._telemetry_outbox is None or self._telemetry_outbox.connector is not self._con_to_main:
+            if self._telemetry_outbox is not None:
+                self._telemetry_outbox.close(timeout=1)
+            self._telemetry_outbox = TelemetryOutbox(self._con_to_main)
+        return self._telemetry_outbox
+
     def _auto_position_report(self, interval : int, stop_flag : tr.Event()) -> ...:
         """
         Send a position update to the host. (support function for :class:`M154`)
@@ -1184,20 +1543,24 @@ class StackingSetupBackend:
             A threading event that can be set to stop the thread.
         """
         while not stop_flag.is_set():
-            if not self._shutdown.is_set() and not self._emergency_stop_event.is_set() and \
+            if self._con_to_main.telemetry is None and not self._con_to_main.has_subscribers(TOPIC_POSITIONS):
+                # Nobody wants the positions, do not read the hardware
+                pass
+            elif not self._shutdown.is_set() and not self._emergency_stop_event.is_set() and \
                     self._con_to_main.is_connected:
                 exit_code, positions = self.M114()
-                if exit_code == 0:
-                    self._con_to_main.send(Message(exit_code=0, msg=positions, command_id='M154', 
-                                        command='M114'))
+                if exit_code == 0 and self._con_to_main.telemetry is not None:
+                    self._con_to_main.telemetry.publish_positions(positions)
+                elif exit_code == 0:
+                    self._telemetry_out().send(Message.report(0, 'M154', positions, 'M114'))
                 else:
-                    self._con_to_main.send(Message(exit_code=1, msg='Could not get all positions, got {}'.format(positions), 
+                    self._telemetry_out().send(Message(exit_code=1, msg='Could not get all positions, got {}'.format(positions), 
                                         command_id='M154', command='M114'))                         
             else:
                 stop_flag.set()
                 return
             
-            time.sleep(interval)
+            clock.sleep(interval)
 
     def M155(self, interval : dict) -> tuple:
         """
@@ -1210,6 +1573,8 @@ class StackingSetupBackend:
         .. note::
             The data is returned in the msg variable in the following format:
             {<axis_id> : {'current' : <current_temperature>, 'target' : <target_temperature>}, ...}
+            If the connector has a shared telemetry block the temperatures are
+            published in the block instead.
         
         Parameters
         ----------
@@ -1252,7 +1617,9 @@ class StackingSetupBackend:
                 pass
             self._auto_temperature_report_flag = tr.Event()
             self._auto_temperature_report_interval = interval['S']
-            self._auto_temperature_report_timer = tr.Thread(target=self._auto_temperature_report, args=(interval['S'], self._auto_temperature_report_flag))
+            self._telemetry_out()  # Created here so the report threads do not race to create it
+            self._auto_temperature_report_timer = tr.Thread(target=self._auto_temperature_report, args=(interval['S'], self._auto_temperature_report_flag),
+                                                            daemon=True)
             self._auto_temperature_report_timer.start()
             return 0, None
 
@@ -1268,18 +1635,23 @@ class StackingSetupBackend:
             A threading event that can be set to stop the thread.
         """
         while not stop_flag.is_set():
-            if not self._shutdown.is_set() and not self._emergency_stop_event.is_set() and \
+            if self._con_to_main.telemetry is None and not self._con_to_main.has_subscribers(TOPIC_TEMPERATURES):
+                # Nobody wants the temperatures, do not read the hardware
+                pass
+            elif not self._shutdown.is_set() and not self._emergency_stop_event.is_set() and \
                     self._con_to_main.is_connected:
                 exit_code, temps = self.M105()
-                if exit_code == 0:
-                    self._con_to_main.send(Message(exit_code=0, msg=temps, command_id='M155', command='M105'))
+                if exit_code == 0 and self._con_to_main.telemetry is not None:
+                    self._con_to_main.telemetry.publish_temperatures(temps)
+                elif exit_code == 0:
+                    self._telemetry_out().send(Message.report(0, 'M155', temps, 'M105'))
                 else:
-                    self._con_to_main.send(Message(exit_code=1, msg='Could not get temperatures.', command_id='M155', command='M105'))
+                    self._telemetry_out().send(Message(exit_code=1, msg='Could not get temperatures.', command_id='M155', command='M105'))
             else:
                 stop_flag.set()
                 return
 
-            time.sleep(interval)
+            clock.sleep(interval)
 
     # JOGGING AND DRIVING FUNCTIONS
     def M811(self, command: dict) -> tuple:
@@ -1296,6 +1668,7 @@ class StackingSetupBackend:
         msg : str
             A message with the result of the command.
         """
+        not_ready = []  # The reasons axes could not be jogged yet
         for axis in self._hardware:
             if axis.id in command.keys():
                 if abs(command[axis.id]) == 1:
@@ -1307,11 +1680,15 @@ class StackingSetupBackend:
                         axis.start_jog(dir)
                     except NotSupportedError:
                         pass
+                    except AxisNotReadyError as e:
+                        not_ready.append(str(e))
                 elif command[axis.id] == 0:
                     try:
                         axis.stop_jog()
                     except NotSupportedError:
                         pass
+        if len(not_ready) != 0:
+            return 1, " ".join(not_ready)
         return 0, None
 
     def M812(self, command: dict) -> tuple:
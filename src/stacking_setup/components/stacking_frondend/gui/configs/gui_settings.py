@@ -67,6 +67,8 @@ class GuiSettings:
         self._keep_alive_interval = config.getfloat('BACKEND', 'keep_alive_interval')
         self._pos_auto_update_interval = config.getfloat('BACKEND', 'pos_autoupdate_interval')
         self._temp_auto_update_interval = config.getfloat('BACKEND', 'temp_autoupdate_interval')
+        self._heartbeat_interval = config.getfloat('BACKEND', 'heartbeat_interval')
+        self._heartbeat_missed = config.getint('BACKEND', 'heartbeat_missed')
         self._known_units = literal_eval(config.get('BACKEND', 'known_units'))
 
         # Temp settings
@@ -154,6 +156,30 @@ class GuiSettings:
         """
         return self._temp_auto_update_interval
 
+    @property
+    def heartbeat_interval(self) -> Union[float, int]:
+        """
+        Get the interval of the heartbeats to the backend.
+
+        Returns
+        -------
+        int or float
+            The interval in seconds, 0 if no heartbeats are sent.
+        """
+        return self._heartbeat_interval
+
+    @property
+    def heartbeat_missed(self) -> int:
+        """
+        Get the amount of missed heartbeats after which the backend is lost.
+
+        Returns
+        -------
+        int
+            The amount of heartbeats.
+        """
+        return self._heartbeat_missed
+
     @property
     def known_units(self) -> dict:
         """
@@ -21,6 +21,11 @@ from .widgets.focus_widget import FocusWidget
 from .widgets.temperature_widget import TemperatureWidget
 from .configs.gui_settings import GuiSettings
 import multiprocessing as mp
+from ...stacking_middleware.topics import (
+    Subscription, TOPIC_RESPONSES, TOPIC_POSITIONS, TOPIC_TEMPERATURES, TOPIC_ESTOP
+)
+from ...stacking_middleware.command_coalescer import CommandCoalescer
+from ...stacking_middleware.message import Message
 
 
 # If true some usefull information will be printed to the console
@@ -101,6 +106,9 @@ class MainWindow(QMainWindow):
         # Handshake with the frondend
         time.sleep(0.2)
         self._connector.handshake()
+        if self._settings.heartbeat_interval:
+            self._connector.start_heartbeat(self._settings.heartbeat_interval, self._settings.heartbeat_missed)
+        self._update_subscriptions()
         self._start_event_handeler()
         self._q.put("M154 S{}".format(self._settings.pos_auto_update_interval))
         self._q.put("M155 S{}".format(self._settings.temp_auto_update_interval))
@@ -116,6 +124,7 @@ class MainWindow(QMainWindow):
             The close event.
         """
         self._stop_event_handeler()
+        self._connector.stop_heartbeat()
         self._connector.send_sentinel()
         self.close()
 
@@ -289,6 +298,17 @@ class MainWindow(QMainWindow):
             widget.hide()
         else:
             widget.show()
+        if self._connector.handshake_complete:
+            self._update_subscriptions()
+
+    def _update_subscriptions(self):
+        """Only subscribe to the reports of the visible widgets, the keep alive messages are never used."""
+        topics = [TOPIC_RESPONSES, TOPIC_ESTOP]
+        if self.baseControlWidget.isVisible() or self.maskControlWidget.isVisible():
+            topics.append(TOPIC_POSITIONS)
+        if self.temperatureWidget.isVisible():
+            topics.append(TOPIC_TEMPERATURES)
+        self._q.put(Subscription(topics))
 
     # Communication with the backend
     def _start_event_handeler(self):
@@ -309,19 +329,52 @@ class MainWindow(QMainWindow):
 
     def _event_handeler(self, q, shutdown_event):
         """Thread that responds to messages from the backend."""
+        telemetry_sequence = 0
+        coalescer = CommandCoalescer()  # Merges the velocity updates of a slider drag
+        backend_lost = False
         while not shutdown_event.is_set():
+            # Tell the user when the backend stops (or starts again) sending heartbeats
+            heartbeat = self._connector.heartbeat
+            if heartbeat is not None and heartbeat.lost != backend_lost:
+                backend_lost = heartbeat.lost
+                msg = "The backend stopped answering." if backend_lost else "The backend answers again."
+                self._update_gui([Message(exit_code=int(backend_lost), msg=msg, command_id="")])
+
+            # Read the latest telemetry if the backend published new values
+            telemetry = self._connector.telemetry
+            if telemetry is not None and telemetry.sequence != telemetry_sequence:
+                snapshot = telemetry.read()
+                if snapshot is not None:
+                    telemetry_sequence = snapshot["sequence"]
+                    self._update_telemetry(snapshot)
+
             # Check if the connector has a message waiting
             if self._connector.message_waiting():
                 msg = self._connector.receive()
                 self._update_gui(msg)
             else:
-                # Check if the gui send a message and pass it too the backend
+                # Check if the gui send a message and pass it too the backend,
+                # the waiting settings are sent before the next command
                 if not q.empty():
                     msg = q.get()
-                    self._connector.send(msg)
+                    if not coalescer.add_line(msg):
+                        self._connector.send(coalescer.release_lines() + [msg])
+
+            # Send the merged settings that waited for the rate limit, also
+            # while the backend keeps sending messages
+            if coalescer.due():
+                self._connector.send(coalescer.release_lines(force=False))
 
             time.sleep(0.01)  # Yield the processor
 
+    def _update_telemetry(self, snapshot: dict):
+        """Pass the positions and temperatures of a telemetry snapshot to the widgets."""
+        if snapshot["positions"]:
+            self.maskControlWidget.update_positions(snapshot["positions"])
+            self.baseControlWidget.update_positions(snapshot["positions"])
+        if snapshot["temperatures"]:
+            self.temperatureWidget.update_temperature(temp=snapshot["temperatures"])
+
     def _update_gui(self, messages: list):
         """Get the content from the message and pass it to the correct widget."""
         for i in messages:
@@ -1,8 +1,16 @@
 from typing import Union
 import time
 
+try:
+    from .topics import Subscription, topic_of
+    from . import handshake as hs
+    from .heartbeat import Heartbeat, Beat, INTERVAL, MISSED_BEATS
+except ImportError:
+    from topics import Subscription, topic_of
+    import handshake as hs
+    from heartbeat import Heartbeat, Beat, INTERVAL, MISSED_BEATS
+
 SENTINEL = "SENTINEL"  # Sentinel command to close the pipe
-EOM_CHAR = "EOM"  # String indicating the end of a message over a pipe
 
 
 class HandshakeError(Exception):
@@ -25,6 +33,11 @@ class BaseConnector:
     _role = None
     _handshake_complete = False
     _SENTINEL = SENTINEL
+    _telemetry = None
+    _subscriptions = None  # The topics the other side subscribed to, None for all
+    _capabilities = None  # What the backend can handle, None if not known
+    _protocol_version = None  # The protocol version agreed in the handshake
+    _heartbeat = None  # The heartbeat of the connection, see :meth:`start_heartbeat`
 
     # ATTRIBUTES
     @property
@@ -42,16 +55,178 @@ class BaseConnector:
         """Return the handshake status."""
         return self._handshake_complete
 
+    @property
+    def capabilities(self) -> Union[hs.Capabilities, None]:
+        """
+        Return what the backend can handle, None if it is not known.
+
+        The frontend receives them in the handshake, see
+        :mod:`~stacking_middleware.handshake`.
+        """
+        return self._capabilities
+
+    @property
+    def protocol_version(self) -> Union[int, None]:
+        """Return the protocol version agreed in the handshake."""
+        return self._protocol_version
+
+    def supports(self, command_id: str) -> bool:
+        """
+        Check if the backend supports a command.
+
+        Parameters
+        ----------
+        command_id : str
+            The command id, for example 'G0'.
+
+        Returns
+        -------
+        bool
+            True if the command is supported or if the backend did not
+            announce its capabilities.
+        """
+        return self._capabilities is None or self._capabilities.supports(command_id)
+
     @property
     def is_connected(self) -> bool:
         """Check if the device is connected."""
         raise NotImplementedError()
 
+    @property
+    def backlog(self) -> Union[int, None]:
+        """
+        Return the bytes that were sent but not read by the other side yet.
+
+        None if the connector can not tell, see
+        :class:`~stacking_middleware.outbox.TelemetryOutbox`.
+        """
+        return None
+
+    @property
+    def telemetry(self):
+        """
+        Return the shared telemetry block, None if the telemetry is sent as messages.
+
+        See :class:`~stacking_middleware.telemetry.TelemetryBlock`.
+        """
+        return self._telemetry
+
+    @property
+    def heartbeat(self) -> Union[Heartbeat, None]:
+        """Return the heartbeat of the connection, None if it was not started."""
+        return self._heartbeat
+
     @property
     def SENTINEL(self) -> str:
         """Return the sentinel command."""
         return self._SENTINEL
 
+    # TOPICS
+    def subscribe(self, topics: Union[list, tuple, None] = None) -> ...:
+        """
+        Only receive the messages of the given topics.
+
+        Parameters
+        ----------
+        topics : list, tuple, None
+            The topics to receive (see :mod:`stacking_middleware.topics`),
+            None for all the topics.
+
+        Raises
+        ------
+        ValueError
+            If the backend does not send one of the topics.
+        """
+        subscription = Subscription(topics)
+        if self._capabilities is not None and subscription.topics is not None:
+            unknown = subscription.topics.difference(self._capabilities.topics)
+            if unknown:
+                raise ValueError("The backend does not send the topics {}.".format(sorted(unknown)))
+        self.send(subscription)
+
+    def has_subscribers(self, topic: str) -> bool:
+        """
+        Check if the other side wants the messages of a topic.
+
+        Parameters
+        ----------
+        topic : str
+            The topic to check.
+
+        Returns
+        -------
+        bool
+            True if the messages of the topic are sent.
+        """
+        return self._subscriptions is None or topic in self._subscriptions
+
+    def _select(self, data) -> list:
+        """Get the items of data to send, drops the messages of the topics without subscribers."""
+        items = data if isinstance(data, list) else [data]
+        subscriptions = self._subscriptions
+        if subscriptions is None:
+            return items
+        return [i for i in items if topic_of(i) in subscriptions or topic_of(i) is None]
+
+    def _take_subscriptions(self, items: Union[list, None]) -> Union[list, None]:
+        """
+        Apply the received subscriptions and remove them from the received items.
+
+        The greetings the frontend repeated before it got the answer and
+        the heartbeats are removed as well, they are not commands.
+        """
+        if not items:
+            return items
+        result = []
+        for item in items:
+            if isinstance(item, Subscription):
+                self._subscriptions = item.topics
+            elif self._handshake_complete and hs.is_greeting(item):
+                continue
+            elif isinstance(item, Beat):
+                if self._heartbeat is not None:
+                    self._heartbeat.receive(item)
+            else:
+                result.append(item)
+        return result
+
+    # HEARTBEAT
+    def start_heartbeat(
+        self,
+        interval: float = INTERVAL,
+        missed: int = MISSED_BEATS,
+        on_lost: Union[callable, None] = None,
+    ) -> Heartbeat:
+        """
+        Start sending heartbeats, see :mod:`~stacking_middleware.heartbeat`.
+
+        The beats of the other side are taken when the connector receives,
+        so the side that starts the heartbeat has to keep receiving.
+
+        Parameters
+        ----------
+        interval : float
+            The time in seconds between two beats.
+        missed : int
+            The amount of missed beats after which the other side is lost.
+        on_lost : callable, None
+            Called (from the heartbeat thread) when the other side is lost.
+
+        Returns
+        -------
+        heartbeat : Heartbeat
+            The started heartbeat.
+        """
+        self.stop_heartbeat()
+        self._heartbeat = Heartbeat(self, interval, missed, on_lost)
+        self._heartbeat.start()
+        return self._heartbeat
+
+    def stop_heartbeat(self) -> ...:
+        """Stop sending heartbeats, called by :meth:`disconnect`."""
+        if self._heartbeat is not None:
+            self._heartbeat.stop()
+
     # METHODS
     def connect(self) -> ...:
         """Connect to the device."""
@@ -80,12 +255,48 @@ class BaseConnector:
         """Check if a message is waiting."""
         raise NotImplementedError()
 
+    def wait_for_message(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Wait until a message is waiting.
+
+        Connectors that can be woken by the other side override this,
+        by default the connector is polled.
+
+        Parameters
+        ----------
+        timeout : float, None
+            The maximum time to wait in seconds, None to wait forever.
+
+        Returns
+        -------
+        bool
+            True if a message is waiting, False otherwise.
+        """
+        etime = None if timeout is None else time.monotonic() + timeout
+        while not self.message_waiting():
+            if etime is not None and time.monotonic() >= etime:
+                return False
+            time.sleep(0.001)
+        return True
+
     def receive(self) -> Union[bytes, str]:
         """Receive data from the device."""
         raise NotImplementedError()
 
-    def handshake(self) -> ...:
-        """Perform the handshake with the device."""
+    def handshake(self, capabilities: Union[hs.Capabilities, None] = None) -> ...:
+        """
+        Perform the handshake with the device, see :mod:`~stacking_middleware.handshake`.
+
+        Parameters
+        ----------
+        capabilities : Capabilities, None
+            What the backend can handle, only used by the backend.
+
+        Raises
+        ------
+        HandshakeError
+            If the role is unknown or the backend refused the greeting.
+        """
         # Depending on the role of the connector decide
         # what to send and what to receive
         if self._role == "FRONTEND":
@@ -97,50 +308,64 @@ class BaseConnector:
                 _ = self.receive()
 
         elif self._role == "BACKEND":
+            # The buffer is not emptied, the repeated greetings are removed
+            # on receive and the first commands may already be waiting
+            self._capabilities = capabilities
             self._backend_handshake()
             self._handshake_complete = True
 
-            # Empty the buffer
-            while self.message_waiting():
-                _ = self.receive()
-
         else:
             raise HandshakeError("Unknown role {}".format(self._role))
 
     def _frondend_handshake(self) -> bool:
-        """Frontend handshake."""
+        """
+        Frontend handshake.
+
+        Greets the backend and greets again with an exponentially growing
+        delay until the backend answers.
+        """
         if not self.is_connected:
             return False
-        # Wait for the response
+        delay = hs.FIRST_RETRY
         while True:
             # Send the hello message
-            self.send("Hello there.")
+            self.send(hs.Hello())
 
-            if self.message_waiting():
-                res = self.receive()
-            else:
+            if not self.wait_for_message(delay):
+                delay = min(2 * delay, hs.MAX_RETRY)
                 continue
 
-            if res[0] == "Hello there general Kenobi.":
-                return True
-            else:
-                raise ValueError("Unexpected message: {}".format(res[0]))
-
-        raise ValueError("frondend Handshake failed")
+            for reply in self.receive() or []:
+                if isinstance(reply, hs.Welcome):
+                    if reply.error is not None:
+                        raise HandshakeError(reply.error)
+                    if reply.capabilities is not None and reply.capabilities.codec != hs.CODEC_VERSION:
+                        raise HandshakeError(
+                            "The backend uses codec version {}, the frontend version {}.".format(
+                                reply.capabilities.codec, hs.CODEC_VERSION
+                            )
+                        )
+                    self._protocol_version = reply.version
+                    self._capabilities = reply.capabilities
+                    return True
+                elif reply == hs.LEGACY_REPLY:
+                    self._protocol_version = 1
+                    return True
+                else:
+                    raise ValueError("Unexpected message: {}".format(reply))
 
     def _backend_handshake(self) -> bool:
-        """Backend handshake."""
+        """Backend handshake, answers the first compatible greeting."""
         # Wait for the hello message
         while True:
-            time.sleep(0.1)
-
-            if self.message_waiting():
-                res = self.receive()
-            else:
+            if not self.wait_for_message(hs.MAX_RETRY):
                 continue
 
-            if res[0] == "Hello there.":
-                self.send("Hello there general Kenobi.")
-                break
-            else:
-                raise ValueError("Unexpected message: {}".format(res[0]))
+            for greeting in self.receive() or []:
+                if not hs.is_greeting(greeting):
+                    raise ValueError("Unexpected message: {}".format(greeting))
+                reply = hs.answer(greeting, self._capabilities)
+                self.send(reply)
+                if hs.accepted(reply):
+                    self._protocol_version = getattr(reply, "version", 1)
+                    return True
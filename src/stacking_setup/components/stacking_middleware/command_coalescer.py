@@ -0,0 +1,186 @@
+"""
+Coalescing of setting commands that only need their latest value.
+
+A GUI slider sends a new :func:`M812` (set the velocity) for every step
+of a drag, and every one of them is a round trip to each device. The
+:class:`CommandCoalescer` merges the waiting commands per axis, a newer
+value replaces the older one, and releases the merged command at most
+once per interval. Any other command releases the waiting commands
+first, so a setting is always applied before the commands after it.
+The frontend merges the commands in its send queue and the backend
+merges them again before executing them. The backend acknowledges every
+command that it merged into a newer one, so each command still gets its
+own response.
+"""
+import time
+from typing import Union
+
+
+COALESCED_COMMANDS = ("M812",)  # Commands of which only the latest value per axis matters
+MIN_INTERVAL = 0.1  # Seconds between two applied commands with the same command id
+
+
+def split_command(line) -> Union[tuple, None]:
+    """
+    Split a command line of a single coalesced command.
+
+    Parameters
+    ----------
+    line : str or any other item
+        The command line, for example 'M812 X10 Y10'.
+
+    Returns
+    -------
+    command : tuple, None
+        (command id, {<axis_id> : <value>, ...}), None if the line is not
+        a single coalesced command.
+    """
+    if not isinstance(line, str):
+        return None
+    words = line.split()
+    if not words or words[0] not in COALESCED_COMMANDS:
+        return None
+    command_id = words.pop(0)
+    params = {}
+    for word in words:
+        try:
+            params[word[0]] = float(word[1:])
+        except (ValueError, IndexError):
+            return None  # Not a simple setting, leave it to the parser of the backend
+    return command_id, params
+
+
+def join_command(command_id: str, params: dict) -> str:
+    """
+    Create the command line of a coalesced command.
+
+    Parameters
+    ----------
+    command_id : str
+        The command id.
+    params : dict
+        The values per axis, {<axis_id> : <value>, ...}.
+
+    Returns
+    -------
+    line : str
+        The command line.
+    """
+    return " ".join([command_id] + ["{}{}".format(axis, value) for axis, value in params.items()])
+
+
+class CommandCoalescer:
+    """Merge the waiting setting commands and release them at a bounded rate."""
+
+    def __init__(self, min_interval: float = MIN_INTERVAL, monotonic: callable = time.monotonic) -> ...:
+        """
+        Initialize the coalescer.
+
+        Parameters
+        ----------
+        min_interval : float
+            The minimal time in seconds between two released commands with the same command id.
+        monotonic : callable
+            The clock to use, the backend passes the clock of its simulation.
+        """
+        self._min_interval = min_interval
+        self._monotonic = monotonic
+        self._waiting = {}  # The merged values per command id
+        self._released = {}  # The last release time per command id
+        self.merged = 0  # Amount of values that were replaced by a newer value
+
+    @property
+    def waiting(self) -> bool:
+        """If there are commands waiting to be released."""
+        return bool(self._waiting)
+
+    def holds(self, command_id: str) -> bool:
+        """Check if a command with the command id is waiting to be released."""
+        return command_id in self._waiting
+
+    def add(self, command_id: str, params: dict) -> bool:
+        """
+        Add a command, it is merged with the waiting command of the same id.
+
+        Parameters
+        ----------
+        command_id : str
+            The command id.
+        params : dict
+            The values per axis, {<axis_id> : <value>, ...}.
+
+        Returns
+        -------
+        bool
+            True if the command is held by the coalescer, False if it is
+            not a coalesced command and should be sent (after :meth:`release`).
+        """
+        if command_id not in COALESCED_COMMANDS:
+            return False
+        waiting = self._waiting.setdefault(command_id, {})
+        self.merged += len(waiting.keys() & params.keys())
+        waiting.update(params)
+        return True
+
+    def add_line(self, line) -> bool:
+        """
+        Add a command line, see :meth:`add`.
+
+        Parameters
+        ----------
+        line : str or any other item
+            The command line.
+
+        Returns
+        -------
+        bool
+            True if the line is held by the coalescer.
+        """
+        command = split_command(line)
+        return command is not None and self.add(*command)
+
+    def due(self) -> bool:
+        """Check if a waiting command can be released without exceeding the rate."""
+        now = self._monotonic()
+        return any(now - self._released.get(command_id, -float("inf")) >= self._min_interval
+                   for command_id in self._waiting)
+
+    def release(self, force: bool = True) -> list:
+        """
+        Take the waiting commands.
+
+        Parameters
+        ----------
+        force : bool
+            Release all the waiting commands, otherwise only the commands
+            that can be released without exceeding the rate.
+
+        Returns
+        -------
+        commands : list
+            The merged commands, [(command id, {<axis_id> : <value>, ...}), ...].
+        """
+        now = self._monotonic()
+        commands = []
+        for command_id in list(self._waiting):
+            if force or now - self._released.get(command_id, -float("inf")) >= self._min_interval:
+                commands.append((command_id, self._waiting.pop(command_id)))
+                self._released[command_id] = now
+        return commands
+
+    def release_lines(self, force: bool = True) -> list:
+        """
+        Take the waiting commands as command lines, see :meth:`release`.
+
+        Parameters
+        ----------
+        force : bool
+            Release all the waiting commands, otherwise only the commands
+            that can be released without exceeding the rate.
+
+        Returns
+        -------
+        lines : list
+            The merged command lines.
+        """
+        return [join_command(command_id, params) for command_id, params in self.release(force)]
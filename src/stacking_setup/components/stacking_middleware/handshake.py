@@ -0,0 +1,179 @@
+"""
+Versioned handshake between a frontend and the backend.
+
+The frontend greets the backend with a :class:`Hello` holding its
+protocol version and greets again after an exponentially growing delay
+until the backend answers, so a starting backend is not flooded. The
+backend answers the first compatible greeting with a :class:`Welcome`
+holding its :class:`Capabilities`: the enabled axes, the supported
+commands, the codec version and the telemetry topics. The frontend
+only sends what the backend announced. The greetings of the first
+version ("Hello there.") are still answered, without capabilities.
+"""
+import struct
+from typing import Union
+
+try:
+    from .message_codec import CODEC_VERSION, ITEM_HELLO, register_item
+    from .topics import TOPICS
+except ImportError:
+    from message_codec import CODEC_VERSION, ITEM_HELLO, register_item
+    from topics import TOPICS
+
+
+PROTOCOL_VERSION = 2  # Version 1 is the greeting with plain strings
+LEGACY_HELLO = "Hello there."  # The greeting of version 1
+LEGACY_REPLY = "Hello there general Kenobi."  # The answer of version 1
+FIRST_RETRY = 0.02  # Seconds before the frontend greets again
+MAX_RETRY = 1.0  # Maximal seconds between two greetings
+
+_HELLO = struct.Struct("<H")  # Protocol version
+
+
+class Capabilities:
+    """What the backend can handle, sent to the frontend in the :class:`Welcome`."""
+
+    __slots__ = ("axes", "opcodes", "codec", "topics")
+
+    def __init__(
+        self,
+        axes: Union[list, tuple] = (),
+        opcodes: Union[list, tuple] = (),
+        codec: int = CODEC_VERSION,
+        topics: Union[list, tuple] = TOPICS,
+    ) -> ...:
+        """
+        Initialize the capabilities.
+
+        Parameters
+        ----------
+        axes : list, tuple
+            The ids of the enabled axes.
+        opcodes : list, tuple
+            The supported command ids, for example ('G0', 'M114').
+        codec : int
+            The version of the message codec.
+        topics : list, tuple
+            The topics of the messages the backend sends.
+        """
+        self.axes = tuple(axes)
+        self.opcodes = tuple(opcodes)
+        self.codec = codec
+        self.topics = tuple(topics)
+
+    def supports(self, command_id: str) -> bool:
+        """
+        Check if the backend supports a command.
+
+        Parameters
+        ----------
+        command_id : str
+            The command id, for example 'G0'.
+
+        Returns
+        -------
+        bool
+            True if the command is supported.
+        """
+        return command_id in self.opcodes
+
+    def __repr__(self) -> str:
+        return "Capabilities(axes={}, opcodes={}, codec={}, topics={})".format(
+            self.axes, self.opcodes, self.codec, self.topics
+        )
+
+
+class Hello:
+    """The greeting of the frontend."""
+
+    __slots__ = ("version",)
+
+    def __init__(self, version: int = PROTOCOL_VERSION) -> ...:
+        """
+        Initialize the greeting.
+
+        Parameters
+        ----------
+        version : int
+            The protocol version of the frontend.
+        """
+        self.version = version
+
+    def pack(self) -> bytes:
+        """Pack the greeting for the wire."""
+        return _HELLO.pack(self.version)
+
+    @classmethod
+    def unpack(cls, data: Union[bytes, memoryview]) -> "Hello":
+        """Unpack a greeting packed with :meth:`pack`."""
+        return cls(*_HELLO.unpack(data))
+
+
+class Welcome:
+    """The answer of the backend to a :class:`Hello`."""
+
+    __slots__ = ("version", "capabilities", "error")
+
+    def __init__(
+        self,
+        version: int = PROTOCOL_VERSION,
+        capabilities: Union[Capabilities, None] = None,
+        error: Union[str, None] = None,
+    ) -> ...:
+        """
+        Initialize the answer.
+
+        Parameters
+        ----------
+        version : int
+            The protocol version of the backend.
+        capabilities : Capabilities, None
+            What the backend can handle.
+        error : str, None
+            Why the greeting was refused, None if it was accepted.
+        """
+        self.version = version
+        self.capabilities = capabilities
+        self.error = error
+
+
+def is_greeting(item) -> bool:
+    """Check if an item is a greeting of a frontend (of any version)."""
+    return isinstance(item, Hello) or (isinstance(item, str) and item == LEGACY_HELLO)
+
+
+def answer(greeting, capabilities: Union[Capabilities, None]) -> Union[Welcome, str]:
+    """
+    Answer the greeting of a frontend.
+
+    Parameters
+    ----------
+    greeting : Hello, str
+        The greeting, see :func:`is_greeting`.
+    capabilities : Capabilities, None
+        What the backend can handle.
+
+    Returns
+    -------
+    reply : Welcome, str
+        The :class:`Welcome`, refused if the version does not match, or the
+        answer of version 1 for a greeting of version 1.
+    """
+    if not isinstance(greeting, Hello):
+        return LEGACY_REPLY
+    if greeting.version != PROTOCOL_VERSION:
+        return Welcome(
+            error="Protocol version {} is not supported, the backend speaks version {}.".format(
+                greeting.version, PROTOCOL_VERSION
+            )
+        )
+    return Welcome(capabilities=capabilities)
+
+
+def accepted(reply) -> bool:
+    """Check if an answer of :func:`answer` accepted the greeting."""
+    return not (isinstance(reply, Welcome) and reply.error is not None)
+
+
+# A socket client greets before it is trusted, so the greeting is never pickled
+register_item(ITEM_HELLO, Hello)
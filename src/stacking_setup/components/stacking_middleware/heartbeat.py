@@ -0,0 +1,195 @@
+"""
+Liveness of a connection with heartbeats.
+
+Both sides of a connection send a :class:`Beat` every interval. A beat
+is a small control item of the codec (it never reaches the frontend or
+the backend loop) that echoes the send time of the last beat that was
+received and how long it was held, so every received beat gives the
+round trip time without an extra reply. A side that did not receive a
+beat for the configured amount of intervals marks the other side as
+lost. The other side is only watched after its first beat, a peer that
+does not send beats is never marked lost.
+"""
+import time
+import struct
+import threading as tr
+from typing import Union
+
+
+INTERVAL = 0.5  # Seconds between two beats
+MISSED_BEATS = 3  # Missed beats after which the other side is lost
+
+_BEAT = struct.Struct("<Iqqq")  # Sequence nr, send time, echoed send time, hold time (ns)
+
+
+class Beat:
+    """A heartbeat, see :mod:`~stacking_middleware.heartbeat`."""
+
+    __slots__ = ("sequence", "sent_ns", "echo_ns", "hold_ns")
+
+    def __init__(self, sequence: int, sent_ns: int, echo_ns: int = 0, hold_ns: int = 0) -> ...:
+        """
+        Initialize the beat.
+
+        Parameters
+        ----------
+        sequence : int
+            The number of the beat.
+        sent_ns : int
+            The monotonic send time in ns.
+        echo_ns : int
+            The send time of the last received beat, 0 if none was received.
+        hold_ns : int
+            The time in ns between receiving that beat and sending this one.
+        """
+        self.sequence = sequence
+        self.sent_ns = sent_ns
+        self.echo_ns = echo_ns
+        self.hold_ns = hold_ns
+
+    def pack(self) -> bytes:
+        """Pack the beat for the wire."""
+        return _BEAT.pack(self.sequence, self.sent_ns, self.echo_ns, self.hold_ns)
+
+    @classmethod
+    def unpack(cls, data: Union[bytes, memoryview]) -> "Beat":
+        """Unpack a beat packed with :meth:`pack`."""
+        return cls(*_BEAT.unpack(data))
+
+
+class Heartbeat:
+    """Send the beats of a connector and watch the beats of the other side."""
+
+    def __init__(
+        self,
+        connector,
+        interval: float = INTERVAL,
+        missed: int = MISSED_BEATS,
+        on_lost: Union[callable, None] = None,
+    ) -> ...:
+        """
+        Initialize the heartbeat, :meth:`start` starts sending.
+
+        Parameters
+        ----------
+        connector : BaseConnector
+            The connector to send the beats with.
+        interval : float
+            The time in seconds between two beats.
+        missed : int
+            The amount of missed beats after which the other side is lost.
+        on_lost : callable, None
+            Called (from the heartbeat thread) when the other side is lost.
+        """
+        self._connector = connector
+        self._interval = interval
+        self._missed = missed
+        self._on_lost = on_lost
+        self._lock = tr.Lock()
+        self._stop = tr.Event()
+        self._thread = None
+        self._sequence = 0
+        self._last_beat = None  # The last received beat
+        self._received_ns = 0  # When the last beat was received
+        self._lost = False
+        self.rtt = None  # The last measured round trip time in seconds
+        self.received = 0  # Amount of received beats
+
+    @property
+    def interval(self) -> float:
+        """Return the time in seconds between two beats."""
+        return self._interval
+
+    @property
+    def timeout(self) -> float:
+        """Return the time in seconds without beats after which the other side is lost."""
+        return self._interval * self._missed
+
+    @property
+    def lost(self) -> bool:
+        """Check if the other side is lost."""
+        return self._lost
+
+    @property
+    def running(self) -> bool:
+        """Check if the beats are sent."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> ...:
+        """Start sending the beats."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = tr.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True) -> ...:
+        """
+        Stop sending the beats, the other side is not marked lost.
+
+        Parameters
+        ----------
+        wait : bool
+            Wait until the heartbeat thread stopped.
+        """
+        self._stop.set()
+        if wait and self._thread is not None and self._thread is not tr.current_thread():
+            self._thread.join()
+
+    def beat(self) -> Beat:
+        """Create the next beat, it echoes the last received beat."""
+        now = time.monotonic_ns()
+        self._lock.acquire()
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        if self._last_beat is None:
+            beat = Beat(self._sequence, now)
+        else:
+            beat = Beat(self._sequence, now, self._last_beat.sent_ns, now - self._received_ns)
+        self._lock.release()
+        return beat
+
+    def receive(self, beat: Beat) -> ...:
+        """
+        Take a beat of the other side.
+
+        Parameters
+        ----------
+        beat : Beat
+            The received beat.
+        """
+        now = time.monotonic_ns()
+        self._lock.acquire()
+        self._last_beat = beat
+        self._received_ns = now
+        self.received += 1
+        if beat.echo_ns:
+            self.rtt = (now - beat.echo_ns - beat.hold_ns) / 1e9
+        self._lost = False
+        self._lock.release()
+
+    def _run(self) -> ...:
+        """Send the beats and watch the other side (runs in the heartbeat thread)."""
+        while not self._stop.wait(self._interval):
+            if not self._connector.is_connected:
+                self._mark_lost()
+                return
+            try:
+                self._connector.send(self.beat())
+            except (OSError, EOFError, ValueError):
+                self._mark_lost()
+                return
+
+            self._lock.acquire()
+            silent = self._last_beat is not None and time.monotonic_ns() - self._received_ns > self.timeout * 1e9
+            self._lock.release()
+            if silent and not self._lost:
+                self._mark_lost()
+
+    def _mark_lost(self) -> ...:
+        """Mark the other side as lost and call the callback."""
+        if self._stop.is_set():
+            return  # Stopped on purpose
+        self._lost = True
+        print("Connection lost, no heartbeat for {:.2f} s.".format(self.timeout))
+        if self._on_lost is not None:
+            self._on_lost()
@@ -1,11 +1,21 @@
+import time
 import datetime
 from typing import Union
 from typeguard import typechecked
-import pickle
 
 
 class Message:
-    """Class used to send status messages between the frond and backend."""
+    """
+    Class used to send status messages between the frond and backend.
+
+    The creation time is stored as seconds since the epoch and only
+    formatted when the ``timestamp`` is read (when it is displayed).
+    """
+
+    __slots__ = ("exit_code", "command", "command_id", "msg", "created", "sequence", "sent_ns", "request_id")
+
+    # The fields returned by items, keys and values
+    FIELDS = ("exit_code", "command", "command_id", "msg", "timestamp")
 
     @typechecked
     def __init__(
@@ -17,7 +27,7 @@ class Message:
     ) -> ...:
         """
         Initialize the message object.
-        
+
         Parameters
         ----------
         exit_code : int
@@ -33,18 +43,71 @@ class Message:
         self.command = command
         self.command_id = command_id
         self.msg = msg
-        self.timestamp = str(datetime.datetime.now())
+        self.created = time.time()
+        self.sequence = None  # Set by the codec when received
+        self.sent_ns = None  # Set by the codec when received
+        self.request_id = None  # The line number of the command this message answers
+
+    @classmethod
+    def report(
+        cls,
+        exit_code: int,
+        command_id: str,
+        msg: Union[str, dict],
+        command: Union[str, dict, None] = None,
+        created: Union[float, None] = None,
+    ) -> "Message":
+        """
+        Create a message without checking the types of the fields.
+
+        Used for the messages that are created very often (the auto reports)
+        and for the decoded messages, the caller has to make sure the
+        fields have the types of :meth:`__init__`.
+
+        Parameters
+        ----------
+        exit_code : int
+            The exit code of the command.
+        command_id : str
+            The command ID.
+        msg : Union[str, dict]
+            The message to send.
+        command : Union[str, dict, None], optional
+            The command to send, by default None
+        created : float, None, optional
+            The creation time in seconds since the epoch, by default now.
+
+        Returns
+        -------
+        message : Message
+            The message.
+        """
+        message = cls.__new__(cls)
+        message.exit_code = exit_code
+        message.command = command
+        message.command_id = command_id
+        message.msg = msg
+        message.created = time.time() if created is None else created
+        message.sequence = None
+        message.sent_ns = None
+        message.request_id = None
+        return message
+
+    @property
+    def timestamp(self) -> str:
+        """The creation time as a readable local date and time."""
+        return str(datetime.datetime.fromtimestamp(self.created))
 
     def items(self) -> list:
-        return self.__dict__.items()
+        return [(key, getattr(self, key)) for key in self.FIELDS]
 
     def keys(self) -> list:
-        return self.__dict__.keys()
+        return list(self.FIELDS)
 
     def values(self) -> list:
-        return self.__dict__.values()
+        return [getattr(self, key) for key in self.FIELDS]
 
 
 if __name__ == "__main__":
     msg = Message(0, "test", "test", "test")
-    print(msg.__dict__)
+    print(dict(msg.items()))
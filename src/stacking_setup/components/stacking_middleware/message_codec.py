@@ -0,0 +1,376 @@
+"""
+Compact binary wire format of the data sent between the frontend and backend.
+
+A :class:`~stacking_middleware.message.Message` is encoded as a fixed
+header followed by a typed payload::
+
+    version (B) | exit code (h) | opcode (H) | sequence nr (I) |
+    request id (I) | sent time in monotonic ns (q) |
+    creation time in epoch s (d) | msg kind (B) | command kind (B)
+
+The opcode is the index of the command id in :data:`OPCODES`, other
+command ids are sent as a short string after the header. The command is
+sent as a string or pickled (command dicts), the msg as a string, as
+packed doubles per axis (position reports), as packed current and target
+doubles per axis (temperature reports) or pickled. The packed doubles
+take int values (the steps of the piezo axes) and None (sent as NaN), an
+int is decoded as a float.
+The request id is the line number of the command the message answers,
+0 if the message does not answer a numbered command.
+
+Every item sent over a connection is tagged (kind and length), so
+commands (strings), messages, heartbeats and any other picklable object
+can be mixed on the same pipe or serial stream. The control items (the
+heartbeat, the greeting and the subscription) have a fixed wire form, see
+:func:`register_item`. Data of a peer that is not trusted (a socket client)
+is decoded without pickle, pickled items and payloads are refused.
+"""
+import time
+import pickle
+import struct
+from typing import Union
+
+try:
+    from .message import Message
+    from .heartbeat import Beat
+except ImportError:
+    from message import Message
+    from heartbeat import Beat
+
+
+CODEC_VERSION = 6
+
+# The known command ids, only append to keep the opcodes of older versions
+OPCODES = (
+    "None", "G0", "G1", "G2", "G28", "G90", "G91",
+    "M0", "M92", "M105", "M112", "M113", "M114", "M140", "M154", "M155",
+    "M501", "M811", "M812", "M813", "M814", "M815", "M999",
+)
+_OPCODE_IDS = {command_id: i for i, command_id in enumerate(OPCODES)}
+OPCODE_CUSTOM = 0xFFFF  # The command id follows the header
+
+# Payload kinds
+KIND_NONE = 0
+KIND_STR = 1
+KIND_FLOATS = 2
+KIND_PICKLE = 3
+KIND_TEMPERATURES = 4
+
+# Item kinds
+ITEM_PICKLE = 0
+ITEM_STR = 1
+ITEM_MESSAGE = 2
+ITEM_BEAT = 3
+ITEM_HELLO = 4
+ITEM_SUBSCRIPTION = 5
+
+_HEADER = struct.Struct("<BhHIIqdBB")
+_ITEM = struct.Struct("<BI")  # Item kind, length of the item body
+_STR_LEN = struct.Struct("<I")
+_NAMES = struct.Struct("<BH")  # Amount of axes, length of the packed names
+_PICKLE = pickle.HIGHEST_PROTOCOL
+_TEMPERATURE_KEYS = ("current", "target")  # The values of an axis in a temperature report
+
+
+# The classes of the control items with a fixed wire form by item kind and the other way around
+_FIXED_ITEMS = {}
+_FIXED_KINDS = {}
+
+
+def register_item(kind: int, cls: type) -> ...:
+    """
+    Send the items of a class in their fixed wire form instead of pickled.
+
+    Parameters
+    ----------
+    kind : int
+        The item kind, one of the ITEM_* constants.
+    cls : type
+        The class, packs an item with ``pack()`` and unpacks it with the
+        class method ``unpack(data)``.
+    """
+    _FIXED_ITEMS[kind] = cls
+    _FIXED_KINDS[cls] = kind
+
+
+register_item(ITEM_BEAT, Beat)
+
+
+# The packed axis names of the float reports by the axis names (the axes hardly change)
+_names_cache = {}
+_names_lookup = {}
+
+
+def _pack_names(names: tuple) -> Union[bytes, None]:
+    """Pack the axis names of a float report, None if they can not be packed."""
+    packed = _names_cache.get(names)
+    if packed is None:
+        if not 0 < len(names) < 256 or not all(
+            isinstance(i, str) and i.isascii() and len(i) < 256 for i in names
+        ):
+            return None
+        packed = b"".join(bytes([len(i)]) + i.encode() for i in names)
+        packed = _NAMES.pack(len(names), len(packed)) + packed
+        _names_cache[names] = packed
+        _names_lookup[packed] = names
+    return packed
+
+
+def _is_number(value) -> bool:
+    """Check if a value can be sent as a packed double (None is sent as NaN)."""
+    return value is None or type(value) is float or type(value) is int
+
+
+def _is_temperature(value) -> bool:
+    """Check if a value is the temperature of an axis, {'current': <number>, 'target': <number>}."""
+    return (
+        type(value) is dict
+        and len(value) == len(_TEMPERATURE_KEYS)
+        and all(key in value and _is_number(value[key]) for key in _TEMPERATURE_KEYS)
+    )
+
+
+def _pack_doubles(values: list) -> bytes:
+    """Pack numbers as doubles, None as NaN."""
+    return struct.pack("<%dd" % len(values), *[float("nan") if i is None else i for i in values])
+
+
+def _unpack_doubles(body: memoryview, count: int, pos: int) -> list:
+    """Unpack doubles packed with :func:`_pack_doubles`, NaN as None."""
+    return [None if i != i else i for i in struct.unpack_from("<%dd" % count, body, pos)]
+
+
+def _pack_payload(value) -> tuple:
+    """Get the kind and the packed body of a command or msg."""
+    if value is None:
+        return KIND_NONE, b""
+    if isinstance(value, str):
+        return KIND_STR, value.encode()
+    if isinstance(value, dict) and value:
+        values = tuple(value.values())
+        if all(_is_number(i) for i in values):
+            names = _pack_names(tuple(value))
+            if names is not None:
+                return KIND_FLOATS, names + _pack_doubles(values)
+        elif all(_is_temperature(i) for i in values):
+            names = _pack_names(tuple(value))
+            if names is not None:
+                return KIND_TEMPERATURES, names + _pack_doubles([i[k] for i in values for k in _TEMPERATURE_KEYS])
+    return KIND_PICKLE, pickle.dumps(value, protocol=_PICKLE)
+
+
+def _unpack_names(body: memoryview) -> tuple:
+    """Unpack the axis names of a float report, returns the names and the position after them."""
+    count, size = _NAMES.unpack_from(body)
+    pos = _NAMES.size + size
+    packed = bytes(body[:pos])
+    names = _names_lookup.get(packed)
+    if names is None:
+        names, i = [], _NAMES.size
+        for _ in range(count):
+            size = body[i]
+            names.append(bytes(body[i + 1:i + 1 + size]).decode())
+            i += 1 + size
+        names = tuple(names)
+        _names_cache[names] = packed
+        _names_lookup[packed] = names
+    return names, pos
+
+
+def _unpack_payload(kind: int, body: memoryview, trusted: bool = True):
+    """Unpack the body of a command or msg, pickled bodies only if the sender is trusted."""
+    if kind == KIND_NONE:
+        return None
+    if kind == KIND_STR:
+        return bytes(body).decode()
+    if kind == KIND_FLOATS:
+        names, pos = _unpack_names(body)
+        return dict(zip(names, _unpack_doubles(body, len(names), pos)))
+    if kind == KIND_TEMPERATURES:
+        names, pos = _unpack_names(body)
+        values = iter(_unpack_doubles(body, len(names) * len(_TEMPERATURE_KEYS), pos))
+        return {name: {key: next(values) for key in _TEMPERATURE_KEYS} for name in names}
+    if kind == KIND_PICKLE:
+        if not trusted:
+            raise ValueError("Pickled payloads are not accepted from this peer.")
+        return pickle.loads(body)
+    raise ValueError("Unknown payload kind {}.".format(kind))
+
+
+class MessageCodec:
+    """
+    Encoder and decoder of the wire format.
+
+    Every connection should use its own codec, the codec numbers the
+    messages it encodes so the receiver can detect lost messages.
+    """
+
+    def __init__(self) -> ...:
+        """Initialize the codec."""
+        self._sequence = 0
+
+    def encode(self, message: Message) -> bytes:
+        """
+        Encode a message.
+
+        Parameters
+        ----------
+        message : Message
+            The message to encode.
+
+        Returns
+        -------
+        data : bytes
+            The encoded message.
+        """
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        opcode = _OPCODE_IDS.get(message.command_id, OPCODE_CUSTOM)
+        msg_kind, msg = _pack_payload(message.msg)
+        command_kind, command = _pack_payload(message.command)
+
+        parts = [
+            _HEADER.pack(
+                CODEC_VERSION,
+                message.exit_code,
+                opcode,
+                self._sequence,
+                message.request_id or 0,
+                time.monotonic_ns(),
+                message.created,
+                msg_kind,
+                command_kind,
+            )
+        ]
+        if opcode == OPCODE_CUSTOM:
+            command_id = message.command_id.encode()
+            parts.append(bytes([len(command_id)]) + command_id)
+        parts.append(_STR_LEN.pack(len(command)))
+        parts.append(command)
+        parts.append(msg)
+        return b"".join(parts)
+
+    @staticmethod
+    def decode(data: Union[bytes, memoryview], trusted: bool = True) -> Message:
+        """
+        Decode a message.
+
+        The sequence number, the sent time (monotonic clock of the sender
+        in ns) and the request id are added as the ``sequence``,
+        ``sent_ns`` and ``request_id`` attributes.
+
+        Parameters
+        ----------
+        data : bytes, memoryview
+            The encoded message.
+        trusted : bool
+            If the sender is trusted, pickled payloads are refused otherwise.
+
+        Raises
+        ------
+        ValueError
+            If the message was encoded with another version or holds a
+            pickled payload of a peer that is not trusted.
+
+        Returns
+        -------
+        message : Message
+            The decoded message.
+        """
+        data = memoryview(data)
+        (version, exit_code, opcode, sequence, request_id, sent_ns, created,
+         msg_kind, command_kind) = _HEADER.unpack_from(data)
+        if version != CODEC_VERSION:
+            raise ValueError("Unsupported message codec version {}.".format(version))
+        pos = _HEADER.size
+        if opcode == OPCODE_CUSTOM:
+            size = data[pos]
+            command_id = bytes(data[pos + 1:pos + 1 + size]).decode()
+            pos += 1 + size
+        else:
+            command_id = OPCODES[opcode]
+        (size,) = _STR_LEN.unpack_from(data, pos)
+        pos += _STR_LEN.size
+        command = _unpack_payload(command_kind, data[pos:pos + size], trusted)
+        msg = _unpack_payload(msg_kind, data[pos + size:], trusted)
+
+        # The fields were checked when the message was created
+        message = Message.report(exit_code, command_id, msg, command, created)
+        message.sequence = sequence
+        message.sent_ns = sent_ns
+        message.request_id = request_id or None
+        return message
+
+    def encode_item(self, item) -> bytes:
+        """
+        Encode a tagged item.
+
+        Parameters
+        ----------
+        item : Message, str, a control item or any picklable object
+            The item to send.
+
+        Returns
+        -------
+        data : bytes
+            The kind and length of the item followed by the item.
+        """
+        if isinstance(item, Message):
+            kind, body = ITEM_MESSAGE, self.encode(item)
+        elif isinstance(item, str):
+            kind, body = ITEM_STR, item.encode()
+        elif type(item) in _FIXED_KINDS:
+            kind, body = _FIXED_KINDS[type(item)], item.pack()
+        else:
+            kind, body = ITEM_PICKLE, pickle.dumps(item, protocol=_PICKLE)
+        return _ITEM.pack(kind, len(body)) + body
+
+    @classmethod
+    def decode_items(cls, data: Union[bytes, memoryview], offset: int = 0, trusted: bool = True) -> tuple:
+        """
+        Decode all the complete tagged items in the data.
+
+        Parameters
+        ----------
+        data : bytes, memoryview
+            The received data.
+        offset : int
+            The position of the first item in the data.
+        trusted : bool
+            If the sender is trusted, pickled items are refused otherwise.
+
+        Raises
+        ------
+        ValueError
+            If an item has an unknown kind or is pickled by a peer that is
+            not trusted.
+
+        Returns
+        -------
+        items : list
+            The decoded items.
+        used : int
+            The position after the last complete item, the data after it
+            is the start of an incomplete item.
+        """
+        data = memoryview(data)
+        items = []
+        while len(data) - offset >= _ITEM.size:
+            kind, size = _ITEM.unpack_from(data, offset)
+            start = offset + _ITEM.size
+            if len(data) - start < size:
+                break  # Incomplete item
+            body = data[start:start + size]
+            if kind == ITEM_MESSAGE:
+                items.append(cls.decode(body, trusted))
+            elif kind == ITEM_STR:
+                items.append(bytes(body).decode())
+            elif kind == ITEM_PICKLE:
+                if not trusted:
+                    raise ValueError("Pickled items are not accepted from this peer.")
+                items.append(pickle.loads(body))
+            elif kind in _FIXED_ITEMS:
+                items.append(_FIXED_ITEMS[kind].unpack(body))
+            else:
+                raise ValueError("Unknown item kind {}.".format(kind))
+            offset = start + size
+        return items, offset
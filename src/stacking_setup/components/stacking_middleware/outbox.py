@@ -0,0 +1,121 @@
+"""
+Latest wins outbox for the telemetry of the backend.
+
+The auto reports (M154 and M155) are sent at a fixed rate. When the
+frontend or the link can not keep up, sending them in order only builds
+a backlog of old positions and temperatures. The :class:`TelemetryOutbox`
+keeps only the latest message per telemetry topic and sends it when the
+connector has room for it, a newer report replaces the one that is
+still waiting. The messages of all the other topics (the responses and
+the emergency stop) are sent straight away and never dropped.
+"""
+import threading as tr
+from typing import Union
+
+try:
+    from .topics import TOPIC_POSITIONS, TOPIC_TEMPERATURES, topic_of
+except ImportError:
+    from topics import TOPIC_POSITIONS, TOPIC_TEMPERATURES, topic_of
+
+
+COALESCED_TOPICS = (TOPIC_POSITIONS, TOPIC_TEMPERATURES)
+MAX_BACKLOG = 8192  # Unread bytes on the connector before the telemetry is held back
+BACKLOG_POLL = 0.005  # Seconds between the backlog checks while the telemetry is held back
+
+
+class TelemetryOutbox:
+    """
+    Outgoing queue of one message per telemetry topic.
+
+    A sender thread sends the waiting telemetry when the backlog of the
+    connector (see :attr:`~stacking_middleware.base_connector.BaseConnector.backlog`)
+    is below ``max_backlog``. Connectors that can not tell their backlog
+    send the telemetry as fast as the send returns, the messages that
+    arrive while a send blocks are still coalesced.
+    """
+
+    def __init__(self, connector, max_backlog: int = MAX_BACKLOG) -> ...:
+        """
+        Initialize the outbox and start the sender thread.
+
+        Parameters
+        ----------
+        connector : BaseConnector
+            The connector to send the messages with.
+        max_backlog : int
+            The unread bytes on the connector above which the telemetry is held back.
+        """
+        self.connector = connector
+        self._max_backlog = max_backlog
+        self._latest = {}  # The waiting message per topic
+        self._condition = tr.Condition()
+        self._closed = False
+        self.replaced = 0  # Amount of telemetry messages replaced by a newer one before they were sent
+        self._sender = tr.Thread(target=self._send_loop, daemon=True)
+        self._sender.start()
+
+    @property
+    def waiting(self) -> int:
+        """The amount of telemetry messages waiting to be sent."""
+        return len(self._latest)
+
+    def send(self, message) -> ...:
+        """
+        Send a message, telemetry replaces the waiting message of its topic.
+
+        Parameters
+        ----------
+        message : Message
+            The message to send.
+        """
+        topic = topic_of(message)
+        if topic not in COALESCED_TOPICS:
+            self.connector.send(message)
+            return
+        self._condition.acquire()
+        try:
+            if topic in self._latest:
+                self.replaced += 1
+            self._latest[topic] = message
+            self._condition.notify()
+        finally:
+            self._condition.release()
+
+    def _has_room(self) -> bool:
+        """Check if the connector has room for the telemetry."""
+        backlog = self.connector.backlog
+        return backlog is None or backlog <= self._max_backlog
+
+    def _send_loop(self) -> ...:
+        """Send the waiting telemetry (runs in the sender thread)."""
+        while True:
+            self._condition.acquire()
+            try:
+                while not self._closed and not (self._latest and self._has_room()):
+                    # Wait for telemetry, or poll the backlog while the telemetry is held back
+                    self._condition.wait(BACKLOG_POLL if self._latest else None)
+                if self._closed:
+                    return
+                messages = list(self._latest.values())
+                self._latest.clear()
+            finally:
+                self._condition.release()
+
+            if self.connector.is_connected:
+                self.connector.send(messages)
+
+    def close(self, timeout: Union[float, None] = None) -> ...:
+        """
+        Stop the sender thread, the waiting telemetry is dropped.
+
+        Parameters
+        ----------
+        timeout : float, None
+            The time to wait for a send in progress, None to wait until it is done.
+        """
+        self._condition.acquire()
+        self._closed = True
+        self._condition.notify()
+        self._condition.release()
+        if self._sender is not tr.current_thread():
+            self._sender.join(timeout)
@@ -1,13 +1,40 @@
 import multiprocessing as mp
-from .base_connector import BaseConnector, SENTINEL, EOM_CHAR
+from .base_connector import BaseConnector, SENTINEL
+from .message_codec import MessageCodec
 import errno
 import os
+import struct
 from time import sleep
 from queue import Empty, Full
 import threading as tr
+from typing import Union
+
+try:
+    import array
+    import fcntl
+    import termios
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+
+FRAME_VERSION = 2
+_FRAME_HEADER = struct.Struct("<BI")  # Frame version, amount of items
+_DEFAULT_CODEC = MessageCodec()  # Used when the writer does not give its own codec
 
 
 class PipeCom:
+    """
+    Framed transport over a multiprocessing pipe.
+
+    Every write is one frame holding a batch of items: a small header
+    (frame version and item count) followed by the items encoded with
+    the :class:`~stacking_middleware.message_codec.MessageCodec`.
+    The frame is sent with one :meth:`send_bytes`, which is length
+    prefixed by the pipe itself, so a frame is always received whole and
+    frames of different writers can not interleave. The reader drains
+    all the waiting frames in one pass.
+    """
+
     @staticmethod
     def close_pipe(conn):
         """
@@ -25,6 +52,76 @@ class PipeCom:
         """
         conn.close()
 
+    @staticmethod
+    def join_frame(encoded_items: list) -> bytes:
+        """
+        Pack a batch of items that are already encoded into one frame.
+
+        Parameters
+        ----------
+        encoded_items : list
+            The items encoded with :meth:`MessageCodec.encode_item`.
+
+        Returns
+        -------
+        frame : bytes
+            The frame.
+        """
+        return _FRAME_HEADER.pack(FRAME_VERSION, len(encoded_items)) + b"".join(encoded_items)
+
+    @staticmethod
+    def encode_frame(items: list, codec: MessageCodec = None) -> bytes:
+        """
+        Pack a batch of items into one frame.
+
+        Parameters
+        ----------
+        items : list
+            The items to send, messages, strings or picklable objects.
+        codec : MessageCodec, None
+            The codec of the connection, numbers the messages.
+
+        Returns
+        -------
+        frame : bytes
+            The frame.
+        """
+        codec = _DEFAULT_CODEC if codec is None else codec
+        return PipeCom.join_frame([codec.encode_item(item) for item in items])
+
+    @staticmethod
+    def decode_frame(frame: bytes, trusted: bool = True) -> list:
+        """
+        Unpack a frame into the batch of items.
+
+        Parameters
+        ----------
+        frame : bytes
+            The received frame.
+        trusted : bool
+            If the sender is trusted, pickled items are refused otherwise.
+
+        Raises
+        ------
+        ValueError
+            If the frame has another version, is incomplete or holds
+            pickled data of a sender that is not trusted.
+
+        Returns
+        -------
+        items : list
+            The items in the frame.
+        """
+        version, count = _FRAME_HEADER.unpack_from(frame)
+        if version != FRAME_VERSION:
+            raise ValueError("Unsupported frame version {}.".format(version))
+        items, used = MessageCodec.decode_items(frame, _FRAME_HEADER.size, trusted)
+        if len(items) != count or used != len(frame):
+            raise ValueError(
+                "Incomplete frame, expected {} items got {}.".format(count, len(items))
+            )
+        return items
+
     @classmethod
     def read_pipe(cls, child_conn, feedback=False):
         """
@@ -43,18 +140,19 @@ class PipeCom:
         Returns
         -------
         result : list
-            The received data. I a sentinel command was received, it will be the
-            last element in the list.
+            The received data of all the waiting frames. I a sentinel command
+            was received, it will be the last element in the list.
 
         """
         result = []
         try:
-            # Check if there is a message ready
-            if child_conn.poll():
-                for msg in iter(child_conn.recv, EOM_CHAR):
-                    result.append(msg)
-            else:
-                pass
+            # Drain all the frames that are ready
+            while child_conn.poll():
+                result.extend(cls.decode_frame(child_conn.recv_bytes()))
+        except EOFError:
+            # The other side closed the pipe
+            cls.close_pipe(child_conn)
+            return result
         except IOError as e:
             # Catch the error if the other side closes unexpected
             if e.errno == errno.EPIPE:
@@ -75,34 +173,29 @@ class PipeCom:
             result.append(result.pop(result.index(SENTINEL)))
         return result
 
-    @staticmethod
-    def write_pipe(conn, data):
+    @classmethod
+    def write_pipe(cls, conn, data, codec=None):
         """
-        Write the data to the pipe.
+        Write the data to the pipe as one frame.
 
         Parameters
         ----------
         conn : multiprocessing.connection.Connection
             The connection to write to.
-        data : list, str or bytes
-            The data to write to the pipe.
+        data : list or any picklable object
+            The data to write to the pipe, the items of a list are sent
+            as one batch.
+        codec : MessageCodec, None
+            The codec of the connection.
 
         Returns
         -------
         None.
 
         """
+        items = data if isinstance(data, list) else [data]
         try:
-            if isinstance(data, str) and isinstance(data, bytes):
-                raise TypeError(
-                    "The data to write to the pipe must be a list, str or bytes."
-                )
-            elif isinstance(data, list):
-                for item in data:
-                    conn.send(item)
-            else:
-                conn.send(data)
-            conn.send(EOM_CHAR)
+            conn.send_bytes(cls.encode_frame(items, codec))
         except (OSError, BrokenPipeError):
             print("Pipe closed unexpectedly.")
             conn.close()
@@ -152,6 +245,31 @@ class PipeCom:
             cls.close_pipe(conn)
             return False
 
+    @staticmethod
+    def unsent_bytes(conn):
+        """
+        Get the amount of bytes written to the pipe that the other side did not read yet.
+
+        Parameters
+        ----------
+        conn : multiprocessing.connection.Connection
+            The connection to check.
+
+        Returns
+        -------
+        int, None
+            The bytes (including the overhead of the OS) waiting in the pipe,
+            None if the OS can not tell.
+        """
+        if fcntl is None:
+            return None
+        count = array.array("i", [0])
+        try:
+            fcntl.ioctl(conn.fileno(), termios.TIOCOUTQ, count)
+        except (OSError, ValueError, AttributeError):
+            return None
+        return count[0]
+
 
 class PipelineConnection(BaseConnector):
     """
@@ -163,7 +281,7 @@ class PipelineConnection(BaseConnector):
 
     _connection_method = "PIPELINE"
 
-    def __init__(self, connection, role, settings=None):
+    def __init__(self, connection, role, settings=None, telemetry=None):
         """
         Initialize the connection.
 
@@ -175,9 +293,15 @@ class PipelineConnection(BaseConnector):
             The role of the connection. Either "FRONDEND" or "BACKEND".
         settings : ConfigParser
             Not used in this connection method but added for compatibility.
+        telemetry : TelemetryBlock, None
+            The shared telemetry block, give the same block to both sides
+            to publish the position and temperature reports in the block
+            instead of sending them over the pipe.
         """
         self._connection = connection
         self._role = role
+        self._telemetry = telemetry
+        self._codec = MessageCodec()
         if role == "FRONTEND":
             self.__init_lock__()
         else:
@@ -196,6 +320,11 @@ class PipelineConnection(BaseConnector):
         self._lock.release()
         return state
 
+    @property
+    def backlog(self) -> Union[int, None]:
+        """Return the bytes that were sent but not read by the other side yet."""
+        return PipeCom.unsent_bytes(self._connection)
+
     def connect(self) -> ...:
         # The pipe is connected on init and cannot reconnect
         pass
@@ -209,8 +338,12 @@ class PipelineConnection(BaseConnector):
 
     def disconnect(self) -> ...:
         """Close the connection."""
+        self.stop_heartbeat()
         self._lock.acquire()
         PipeCom.close_pipe(self._connection)
+        if self._telemetry is not None:
+            self._telemetry.close()
+            self._telemetry = None
         self._lock.release()
 
     def send(self, data) -> ...:
@@ -222,8 +355,11 @@ class PipelineConnection(BaseConnector):
         data : list, str or bytes
             The data to send.
         """
+        items = self._select(data)
+        if not items:
+            return
         self._lock.acquire()
-        PipeCom.write_pipe(self._connection, data)
+        PipeCom.write_pipe(self._connection, items, self._codec)
         self._lock.release()
 
     def message_waiting(self) -> bool:
@@ -254,7 +390,8 @@ class PipelineConnection(BaseConnector):
         # Check if a message is waiting
         self._lock.acquire()
         if not self._connection.poll():
+            self._lock.release()
             return None
         state = PipeCom.read_pipe(self._connection)
         self._lock.release()
-        return state
+        return self._take_subscriptions(state)
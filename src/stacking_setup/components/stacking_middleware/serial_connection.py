@@ -1,17 +1,172 @@
 import serial
+import zlib
+import queue
+import struct
+import threading as tr
 from typing import Union
-from typeguard import typechecked
-import time
 
 try:
-    from .base_connector import BaseConnector, HandshakeError
+    from .base_connector import BaseConnector, SENTINEL
+    from .message_codec import MessageCodec
+    from .pipeline_connection import PipeCom
     from ..stacking_backend.configs.settings import Settings
 except ImportError:
-    from base_connector import BaseConnector, HandshakeError
+    from base_connector import BaseConnector, SENTINEL
+    from message_codec import MessageCodec
+    from pipeline_connection import PipeCom
     from ..stacking_backend.configs.settings import Settings
 
 
+_CRC = struct.Struct("<I")  # CRC32 of the frame, sent after the frame
+_DELIMITER = b"\x00"  # End of a frame, never part of a COBS encoded frame
+
+MAX_FRAME = 1 << 20  # Bytes without a delimiter before the receive buffer is dropped
+READ_TIMEOUT = 0.05  # Seconds the reader waits for data before checking if it should stop
+
+
+def cobs_encode(data: bytes) -> bytes:
+    """
+    Encode data with Consistent Overhead Byte Stuffing.
+
+    The encoded data does not contain any zero bytes, so a zero byte can
+    be used to mark the end of a frame.
+
+    Parameters
+    ----------
+    data : bytes
+        The data to encode.
+
+    Returns
+    -------
+    encoded : bytes
+        The encoded data, at most one byte per 254 bytes longer.
+    """
+    encoded = bytearray()
+    for block in data.split(b"\x00"):
+        while len(block) >= 0xFE:
+            # A full block without a zero after it
+            encoded.append(0xFF)
+            encoded += block[:0xFE]
+            block = block[0xFE:]
+        encoded.append(len(block) + 1)
+        encoded += block
+    return bytes(encoded)
+
+
+def cobs_decode(encoded: bytes) -> bytes:
+    """
+    Decode data encoded with :func:`cobs_encode`.
+
+    Parameters
+    ----------
+    encoded : bytes
+        The encoded data, without the delimiter.
+
+    Raises
+    ------
+    ValueError
+        If the data is not valid COBS.
+
+    Returns
+    -------
+    data : bytes
+        The decoded data.
+    """
+    data = bytearray()
+    i = 0
+    while i < len(encoded):
+        code = encoded[i]
+        end = i + code
+        if code == 0 or end > len(encoded):
+            raise ValueError("Invalid COBS block at byte {}".format(i))
+        data += encoded[i + 1:end]
+        i = end
+        if code < 0xFF and i < len(encoded):
+            data.append(0)
+    return bytes(data)
+
+
+def wrap_frame(frame: bytes) -> bytes:
+    """
+    Add the CRC to a frame, encode it and add the delimiter.
+
+    Parameters
+    ----------
+    frame : bytes
+        The frame to send, see :meth:`~stacking_middleware.pipeline_connection.PipeCom.encode_frame`.
+
+    Returns
+    -------
+    data : bytes
+        The bytes to write to the serial port.
+    """
+    return cobs_encode(frame + _CRC.pack(zlib.crc32(frame))) + _DELIMITER
+
+
+class FrameDecoder:
+    """
+    Extract the frames written with :func:`wrap_frame` from a byte stream.
+
+    A frame with a wrong CRC or an invalid encoding is dropped and counted
+    in :attr:`errors`. Decoding continues after the next delimiter, so the
+    stream recovers from noise on the line and from starting to read in
+    the middle of a frame.
+    """
+
+    def __init__(self) -> ...:
+        """Initialize the decoder."""
+        self._buffer = b""
+        self.errors = 0
+
+    def feed(self, data: bytes) -> list:
+        """
+        Add received data and get the complete frames.
+
+        Parameters
+        ----------
+        data : bytes
+            The received data.
+
+        Returns
+        -------
+        frames : list
+            The valid frames that were completed by the data.
+        """
+        *chunks, self._buffer = (self._buffer + data).split(_DELIMITER)
+        if len(self._buffer) > MAX_FRAME:
+            self._buffer = b""
+            self.errors += 1
+
+        frames = []
+        for chunk in chunks:
+            if not chunk:
+                continue  # Delimiters after each other
+            try:
+                payload = cobs_decode(chunk)
+            except ValueError:
+                self.errors += 1
+                continue
+            frame = payload[:-_CRC.size]
+            if len(payload) < _CRC.size or _CRC.unpack(payload[-_CRC.size:])[0] != zlib.crc32(frame):
+                self.errors += 1
+                continue
+            frames.append(frame)
+        return frames
+
+
 class SerialConnection(BaseConnector):
+    """
+    Connection method using a serial port, for a frontend on another machine.
+
+    The items are framed like the
+    :class:`~stacking_middleware.pipeline_connection.PipelineConnection`,
+    every frame gets a CRC32 and is COBS encoded with a zero byte as
+    delimiter. A reader thread does bulk reads of everything waiting on
+    the port, extracts the frames and queues the decoded items, so the
+    items are ready when :meth:`receive` is called. Every send is written
+    as one frame with one write.
+    """
+
     _connection_method = "SERIAL"
 
     def __init__(self, settings: Settings, role: str) -> ...:
@@ -23,10 +178,19 @@ class SerialConnection(BaseConnector):
         settings : Settings
             The settings to use.
         role : str
-            The role of the connection. Either "frontend" or "backend".
+            The role of the connection. Either "FRONTEND" or "BACKEND".
         """
         self._role = role
         self._settings = settings
+        self._codec = MessageCodec()
+        self._decoder = FrameDecoder()
+        self._lock = None
+
+        # The reader and queue cannot be pickled so they are created with the lock
+        self._inbox = None
+        self._inbox_ready = None
+        self._reader = None
+        self._stop_reader = None
 
         # Load some settings
         port = self._settings.get("serial", "port")
@@ -37,22 +201,77 @@ class SerialConnection(BaseConnector):
         self._ser = serial.Serial(port, baudrate, timeout=timeout)
         self.connect()
 
-    def connect(self) -> ...:
-        """Connect to the serial port."""
-        if not self._serial.is_open:
-            self._serial.open()
+        if role == "FRONTEND":
+            self.__init_lock__()
 
-    def disconnect(self) -> ...:
-        """Disconnect from the serial port."""
-        if self._serial.is_open:
-            self._serial.close()
+    def __init_lock__(self) -> tr.Lock:
+        """Initialize the lock and start the reader."""
+        self._lock = tr.Lock()
+        if self._reader is None or not self._reader.is_alive():
+            self._inbox = queue.Queue()
+            self._inbox_ready = tr.Event()
+            self._stop_reader = tr.Event()
+            self._ser.timeout = READ_TIMEOUT  # Only the reader reads, it has to check if it should stop
+            self._reader = tr.Thread(target=self._read_loop, daemon=True)
+            self._reader.start()
 
+    @property
     def is_connected(self) -> bool:
         """Check if the serial port is connected."""
-        return self._serial.is_open
+        return self._ser.is_open
+
+    @property
+    def backlog(self) -> Union[int, None]:
+        """Return the bytes that were sent but not written to the line yet."""
+        try:
+            return self._ser.out_waiting
+        except (serial.SerialException, OSError, AttributeError, NotImplementedError):
+            return None
+
+    @property
+    def frame_errors(self) -> int:
+        """The amount of received frames that were dropped because they were damaged."""
+        return self._decoder.errors
+
+    def _read_loop(self) -> ...:
+        """Read the port and queue the items of the received frames (runs in the reader thread)."""
+        while not self._stop_reader.is_set():
+            try:
+                # Wait for the first byte, then take everything that is waiting
+                data = self._ser.read(max(1, self._ser.in_waiting))
+            except (serial.SerialException, OSError, TypeError, AttributeError):
+                break  # The port was closed
+            if not data:
+                continue
+            items = []
+            for frame in self._decoder.feed(data):
+                try:
+                    items.extend(PipeCom.decode_frame(frame))
+                except ValueError:
+                    self._decoder.errors += 1
+            if items:
+                self._inbox.put(items)
+                self._inbox_ready.set()
+
+    def connect(self) -> ...:
+        """Connect to the serial port."""
+        if not self._ser.is_open:
+            self._ser.open()
+
+    def disconnect(self) -> ...:
+        """Stop the reader and disconnect from the serial port."""
+        self.stop_heartbeat()
+        if self._reader is not None:
+            self._stop_reader.set()
+            if self._reader is not tr.current_thread():
+                self._reader.join()
+            self._reader = None
+        if self._ser.is_open:
+            self._ser.close()
 
     def send_sentinel(self) -> ...:
         """Send the sentinel command to the other side."""
+        print("Sending sentinel")
         self.send(self.SENTINEL)
 
     def send(self, command) -> ...:
@@ -61,101 +280,67 @@ class SerialConnection(BaseConnector):
 
         Parameters
         ----------
-        command : str
-            The command to send.
+        command : list, Message, str or any picklable object
+            The command to send, the items of a list are sent as one frame.
         """
-        # Check if the command is a string otherwise convert to str
-        if not isinstance(command, str):
-            command = str(command)
-        self._serial.write(command.encode())
+        items = self._select(command)
+        if not items or not self.is_connected:
+            return
+        data = wrap_frame(PipeCom.encode_frame(items, self._codec))
+        self._lock.acquire()
+        try:
+            self._ser.write(data)
+        except serial.SerialException:
+            print("Serial port closed unexpectedly.")
+            self.disconnect()
+        finally:
+            self._lock.release()
 
     def message_waiting(self) -> bool:
-        """Check if a message is waiting."""
-        return True if self._serial.in_waiting > 0 else False
-
-    def receive(self) -> Union[str, None]:
-        """Receive a message from the serial port."""
-        return self._serial.read().decode()
-
-    def handshake(self):
-        """Perform the handshake."""
-        # Depending on the role of the connector decide
-        # what to send and what to receive
-        if self._role == "FRONDEND":
-            if not self._frondend_handshake():
-                raise HandshakeError("Frondend handshake failed")
-            else:
-                self._handshake_complete = True
-
-        elif self._role == "BACKEND":
-            if not self._backend_handshake():
-                raise HandshakeError("Backend handshake failed")
-            else:
-                self._handshake_complete = True
-
-        else:
-            raise HandshakeError("Unknown role {}".format(self._role))
-
-    def _frondend_handshake(self) -> bool:
-        """Perform the frontend handshake."""
-        if not self.is_connected:
-            return False
-
-        # Send the hello message
-        self.send("Hello there.")
-
-        # Wait for the response
-        attempts = 0
-        max_attempts = 5
-        while attempts < max_attempts:
-            res = self.receive()
-            if len(res) == 0:
-                attempts += 1
-                time.sleep(0.1)
-            elif res[0] == "Hello there general Kenobi.":
-                return True
-
-    def _backend_handshake(self):
-        """Perform the backend handshake."""
-        # Wait for the hello message
-        attempts = 0
-        max_attempts = 5
-        while attempts < max_attempts:
-            res = self.receive()
-            if len(res) == 0:
-                attempts += 1
-                time.sleep(0.1)
-            elif res[0] == "Hello there.":
-                break
-
-        # If the handshake failed keep waiting for the hello message
-        # and send 'Im still here' every 5 seconds
-        if attempts == max_attempts:
-            while True:
-                res = self.receive()
-                if len(res) == 0:
-                    time.sleep(5)
-                    self.send("Im still here")
-                elif res[0] == "Hello there.":
-                    # Break out of the loop
-                    break
-
-        # Send the response
-        self.send("Hello there general Kenobi.")
-        return True
-
-
-if __name__ == "__main__":
-
-    def test_frondend():
-        serial_connection = SerialConnection("FRONDEND")
-        serial_connection.handshake()
-        print(serial_connection._handshake_complete)
-
-    def test_backend():
-        serial_connection = SerialConnection("BACKEND")
-        serial_connection.handshake()
-        print(serial_connection._handshake_complete)
-
-    test_frondend()
-    # test_backend()
+        """
+        Check if a message is waiting.
+
+        Returns:
+        --------
+        bool
+            True if a message is waiting, False otherwise.
+        """
+        return not self._inbox.empty()
+
+    def wait_for_message(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Wait until a message is waiting.
+
+        Parameters
+        ----------
+        timeout : float, None
+            The maximum time to wait in seconds, None to wait forever.
+
+        Returns
+        -------
+        bool
+            True if a message is waiting, False otherwise.
+        """
+        return self._inbox_ready.wait(timeout) and self.message_waiting()
+
+    def receive(self) -> Union[list, None]:
+        """
+        Receive all the waiting data.
+
+        Returns:
+        --------
+        data : list, None
+            The received data, None if nothing was waiting. If a sentinel
+            command was received, it will be the last element in the list.
+        """
+        if not self.message_waiting():
+            return None
+        result = []
+        self._inbox_ready.clear()
+        while not self._inbox.empty():
+            result.extend(self._inbox.get_nowait())
+
+        if SENTINEL in result:
+            # Put the SENTINEL command at the end
+            result.append(result.pop(result.index(SENTINEL)))
+        return self._take_subscriptions(result)
@@ -0,0 +1,388 @@
+import time
+import struct
+import threading as tr
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Union
+
+from .base_connector import BaseConnector, SENTINEL
+from .message_codec import MessageCodec
+from .pipeline_connection import PipeCom
+
+
+DEFAULT_CAPACITY = 1 << 20  # Bytes per direction
+
+_INDEX = struct.Struct("<Q")
+_LENGTH = struct.Struct("<I")
+
+# Offsets in the ring header, the head and tail are on their own cache line
+_HEAD = 0
+_TAIL = 64
+_CLOSED = 128
+_DATA = 192
+
+
+class RingBuffer:
+    """
+    Single producer single consumer ring buffer in shared memory.
+
+    The records (length prefixed frames) are written after each other in
+    the data area and wrap around at the end. The head is the total
+    amount of bytes written and only changed by the writer, the tail the
+    total amount of bytes read and only changed by the reader. The writer
+    copies the record before moving the head, so the reader never sees a
+    partial record, and the reader copies the records before moving the
+    tail, so the writer never overwrites unread data. Neither side takes
+    a lock.
+
+    The reader is woken with a semaphore that is released when a record
+    is written into an empty ring.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, capacity: int, ready) -> ...:
+        """
+        Initialize the ring, use :meth:`create`.
+
+        Parameters
+        ----------
+        memory : multiprocessing.shared_memory.SharedMemory
+            The shared memory of the ring.
+        capacity : int
+            The size of the data area in bytes.
+        ready : multiprocessing.Semaphore
+            Released when data is written into an empty ring.
+        """
+        self._memory = memory
+        self._capacity = capacity
+        self._ready = ready
+
+    @classmethod
+    def create(cls, capacity: int = DEFAULT_CAPACITY) -> "RingBuffer":
+        """
+        Create a new (empty) ring.
+
+        Parameters
+        ----------
+        capacity : int
+            The size of the data area in bytes.
+
+        Returns
+        -------
+        ring : RingBuffer
+            The ring.
+        """
+        memory = shared_memory.SharedMemory(create=True, size=_DATA + capacity)
+        memory.buf[:_DATA] = bytes(_DATA)
+        return cls(memory, capacity, mp.Semaphore(0))
+
+    @property
+    def closed(self) -> bool:
+        """If one of the sides closed the ring (or the ring was released)."""
+        buf = self._memory.buf
+        return buf is None or buf[_CLOSED] != 0
+
+    def close(self) -> ...:
+        """Mark the ring as closed, the other side stops waiting on it."""
+        if self._memory.buf is not None:
+            self._memory.buf[_CLOSED] = 1
+        self._ready.release()
+
+    def in_waiting(self) -> bool:
+        """Check if there is data to read."""
+        buf = self._memory.buf
+        if buf is None:
+            return False
+        return _INDEX.unpack_from(buf, _HEAD)[0] != _INDEX.unpack_from(buf, _TAIL)[0]
+
+    def pending(self) -> int:
+        """The amount of bytes written but not read yet."""
+        buf = self._memory.buf
+        if buf is None:
+            return 0
+        return _INDEX.unpack_from(buf, _HEAD)[0] - _INDEX.unpack_from(buf, _TAIL)[0]
+
+    def _copy_in(self, position: int, data: bytes) -> ...:
+        """Copy the data into the ring at the (unwrapped) position."""
+        buf = self._memory.buf
+        start = position % self._capacity
+        first = min(len(data), self._capacity - start)
+        buf[_DATA + start:_DATA + start + first] = data[:first]
+        if first < len(data):
+            buf[_DATA:_DATA + len(data) - first] = data[first:]
+
+    def _copy_out(self, position: int, size: int) -> bytes:
+        """Copy data out of the ring at the (unwrapped) position."""
+        buf = self._memory.buf
+        start = position % self._capacity
+        first = min(size, self._capacity - start)
+        data = bytes(buf[_DATA + start:_DATA + start + first])
+        if first < size:
+            data += bytes(buf[_DATA:_DATA + size - first])
+        return data
+
+    def write(self, data: bytes, timeout: Union[float, None] = None) -> bool:
+        """
+        Write a record, waits while the ring is full.
+
+        Parameters
+        ----------
+        data : bytes
+            The record to write.
+        timeout : float, None
+            The time to wait for space in seconds, None to wait until the
+            reader made space or the ring is closed.
+
+        Raises
+        ------
+        ValueError
+            If the record is larger than the ring.
+
+        Returns
+        -------
+        written : bool
+            False if the ring was closed or full for the whole timeout.
+        """
+        size = _LENGTH.size + len(data)
+        if size > self._capacity:
+            raise ValueError(
+                "Record of {} bytes does not fit in the ring of {} bytes.".format(size, self._capacity)
+            )
+        buf = self._memory.buf
+        head = _INDEX.unpack_from(buf, _HEAD)[0]
+        etime = None if timeout is None else time.monotonic() + timeout
+        while self._capacity - (head - _INDEX.unpack_from(buf, _TAIL)[0]) < size:
+            if self.closed or (etime is not None and time.monotonic() > etime):
+                return False
+            time.sleep(0.0005)
+
+        self._copy_in(head, _LENGTH.pack(len(data)))
+        self._copy_in(head + _LENGTH.size, data)
+        _INDEX.pack_into(buf, _HEAD, head + size)
+        if _INDEX.unpack_from(buf, _TAIL)[0] == head:
+            # The ring was empty, the reader might be waiting
+            self._ready.release()
+        return True
+
+    def read_all(self) -> list:
+        """
+        Read all the waiting records.
+
+        Returns
+        -------
+        records : list
+            The records in the order they were written.
+        """
+        buf = self._memory.buf
+        tail = _INDEX.unpack_from(buf, _TAIL)[0]
+        head = _INDEX.unpack_from(buf, _HEAD)[0]
+        records = []
+        while tail < head:
+            (size,) = _LENGTH.unpack(self._copy_out(tail, _LENGTH.size))
+            records.append(self._copy_out(tail + _LENGTH.size, size))
+            tail += _LENGTH.size + size
+        _INDEX.pack_into(buf, _TAIL, tail)
+
+        # Forget the wakeups of the read records, so the count of the
+        # semaphore can not grow when the reader polls instead of waits
+        while self._ready.acquire(False):
+            pass
+        return records
+
+    def wait(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Wait until there is data to read.
+
+        Parameters
+        ----------
+        timeout : float, None
+            The maximum time to wait in seconds, None to wait forever.
+
+        Returns
+        -------
+        waiting : bool
+            True if there is data to read.
+        """
+        if self.in_waiting():
+            return True
+        self._ready.acquire(timeout=timeout)
+        return self.in_waiting()
+
+    def release(self, unlink: bool = False) -> ...:
+        """
+        Release the shared memory of this process.
+
+        Parameters
+        ----------
+        unlink : bool
+            Also remove the shared memory, only done by the side that created it.
+        """
+        if self._memory.buf is not None:  # Not yet released by the other side in this process
+            self._memory.close()
+        if unlink:
+            self._memory.unlink()
+
+
+class SharedMemoryChannel:
+    """
+    The two rings between a frontend and backend.
+
+    Create the channel before starting the backend and give it to the
+    :class:`SharedMemoryConnection` of both sides.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> ...:
+        """
+        Create the rings.
+
+        Parameters
+        ----------
+        capacity : int
+            The size of each ring in bytes.
+        """
+        self.to_backend = RingBuffer.create(capacity)
+        self.to_frontend = RingBuffer.create(capacity)
+
+
+class SharedMemoryConnection(BaseConnector):
+    """
+    Connection method using a shared memory ring buffer in each direction.
+
+    This connection method is only possible when the frond and backend are
+    running on the same machine. The data is framed like the
+    :class:`~stacking_middleware.pipeline_connection.PipelineConnection`
+    but copied straight into shared memory instead of going through an
+    OS pipe. Only the sending side takes a lock (the backend sends from
+    several threads), receiving is lock free.
+    """
+
+    _connection_method = "SHARED_MEMORY"
+
+    def __init__(self, channel: SharedMemoryChannel, role: str, settings=None, telemetry=None) -> ...:
+        """
+        Initialize the connection.
+
+        Parameters
+        ----------
+        channel : SharedMemoryChannel
+            The rings to use, the same channel is given to both sides.
+        role : str
+            The role of the connection. Either "FRONTEND" or "BACKEND".
+        settings : ConfigParser
+            Not used in this connection method but added for compatibility.
+        telemetry : TelemetryBlock, None
+            The shared telemetry block, see :class:`~stacking_middleware.pipeline_connection.PipelineConnection`.
+        """
+        self._role = role
+        self._telemetry = telemetry
+        self._codec = MessageCodec()
+        if role == "FRONTEND":
+            self._tx, self._rx = channel.to_backend, channel.to_frontend
+            self.__init_lock__()
+        else:
+            self._tx, self._rx = channel.to_frontend, channel.to_backend
+            # The lock cannot be pickled, so it is created on the backend
+            self._lock = None
+        self._owner = role == "FRONTEND"  # The frontend removes the rings
+        self._open = True
+
+    def __init_lock__(self) -> tr.Lock:
+        """Initialize the lock."""
+        self._lock = tr.Lock()
+
+    @property
+    def is_connected(self) -> bool:
+        """Check if the connection is open."""
+        return self._open and not (self._tx.closed or self._rx.closed)
+
+    @property
+    def backlog(self) -> Union[int, None]:
+        """Return the bytes that were sent but not read by the other side yet."""
+        return self._tx.pending() if self._open else 0
+
+    def connect(self) -> ...:
+        # The rings are connected on init and cannot reconnect
+        pass
+
+    def send_sentinel(self) -> ...:
+        """Send the sentinel command to the other side."""
+        print("Sending sentinel")
+        self.send(self.SENTINEL)
+
+    def disconnect(self) -> ...:
+        """Close the connection."""
+        self.stop_heartbeat()
+        if not self._open:
+            return
+        self._open = False
+        self._tx.close()
+        self._tx.release(self._owner)
+        self._rx.release(self._owner)
+        if self._telemetry is not None:
+            self._telemetry.close()
+            self._telemetry = None
+
+    def send(self, data) -> ...:
+        """
+        Send the data to the other side.
+
+        Parameters
+        ----------
+        data : list, str or Message
+            The data to send, the items of a list are sent as one batch.
+        """
+        items = self._select(data)
+        if not self._open or not items:
+            return
+        self._lock.acquire()
+        try:
+            self._tx.write(PipeCom.encode_frame(items, self._codec))
+        finally:
+            self._lock.release()
+
+    def message_waiting(self) -> bool:
+        """
+        Check if a message is waiting.
+
+        Returns:
+        --------
+        bool
+            True if a message is waiting, False otherwise.
+        """
+        return self._open and self._rx.in_waiting()
+
+    def wait_for_message(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Wait until a message is waiting.
+
+        Parameters
+        ----------
+        timeout : float, None
+            The maximum time to wait in seconds, None to wait forever.
+
+        Returns
+        -------
+        bool
+            True if a message is waiting, False otherwise.
+        """
+        return self._open and self._rx.wait(timeout)
+
+    def receive(self) -> Union[list, None]:
+        """
+        Receive all the waiting data.
+
+        Returns:
+        --------
+        data : list, None
+            The received data, None if nothing was waiting. If a sentinel
+            command was received, it will be the last element in the list.
+        """
+        if not self.message_waiting():
+            return None
+        result = []
+        for frame in self._rx.read_all():
+            result.extend(PipeCom.decode_frame(frame))
+
+        if SENTINEL in result:
+            # Put the SENTINEL command at the end
+            result.append(result.pop(result.index(SENTINEL)))
+        return self._take_subscriptions(result)
@@ -0,0 +1,568 @@
+import os
+import time
+import queue
+import select
+import socket
+import struct
+import asyncio
+import ipaddress
+import threading as tr
+from typing import Union
+
+from .base_connector import BaseConnector, HandshakeError, SENTINEL
+from .message_codec import MessageCodec
+from .pipeline_connection import PipeCom
+from .topics import Subscription, topic_of
+from .heartbeat import Heartbeat, Beat, INTERVAL, MISSED_BEATS
+from . import handshake as hs
+
+
+_LENGTH = struct.Struct("<I")  # Length of the frame that follows
+
+MAX_CLIENT_BUFFER = 4 << 20  # Bytes waiting for a client before it is dropped
+MAX_FRAME_SIZE = 1 << 20  # Largest frame the backend accepts from a client
+SOCKET_MODE = 0o600  # Permissions of the Unix socket, only the user of the backend can connect
+
+
+def _is_loopback(host: str) -> bool:
+    """Check if a host name or ip address is the loopback interface."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # A host name
+
+
+def parse_address(address: str, allow_remote: bool = False) -> tuple:
+    """
+    Parse the address of the backend.
+
+    The commands of a client move the hardware, so by default a TCP socket
+    only listens on (and connects to) the loopback interface.
+
+    Parameters
+    ----------
+    address : str
+        '<host>:<port>' for a TCP socket, otherwise the path of a Unix socket.
+        Without a host the loopback interface is used.
+    allow_remote : bool
+        Accept a host that is not the loopback interface.
+
+    Raises
+    ------
+    ValueError
+        If the host is not the loopback interface and remote hosts are not allowed.
+
+    Returns
+    -------
+    family : int
+        socket.AF_INET, socket.AF_INET6 or socket.AF_UNIX.
+    address : tuple, str
+        (host, port) or the path.
+    """
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        host = host.strip("[]") or "127.0.0.1"
+        if not allow_remote and not _is_loopback(host):
+            raise ValueError(
+                "The host {} is not the loopback interface, remote clients are not allowed.".format(host)
+            )
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        return family, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+class _ClientLink:
+    """The connector of a :class:`Heartbeat` that beats with one client of the server."""
+
+    def __init__(self, connection: "SocketConnection", writer: asyncio.StreamWriter) -> ...:
+        """
+        Initialize the link.
+
+        Parameters
+        ----------
+        connection : SocketConnection
+            The backend side of the connection.
+        writer : asyncio.StreamWriter
+            The writer of the client.
+        """
+        self._connection = connection
+        self._writer = writer
+
+    @property
+    def is_connected(self) -> bool:
+        """Check if the client is still connected."""
+        return self._connection.is_connected and self._writer in self._connection._clients
+
+    def send(self, beat: Beat) -> ...:
+        """Send a beat to the client only."""
+        data = self._connection._encode([beat])
+        self._connection._loop.call_soon_threadsafe(self._connection._write_client, self._writer, data)
+
+
+class SocketConnection(BaseConnector):
+    """
+    Connection method using a Unix or TCP socket.
+
+    The backend runs an asyncio server in a thread, several frontends (the
+    GUI, a monitoring client and a scripting client) can be connected at
+    the same time. The commands of all the clients end up in one queue
+    that the backend reads in order of arrival, so the backend loop is
+    the only place that decides on the commands. Everything the backend
+    sends is encoded once and the same bytes are written to every client
+    that subscribed to the topic of the message, the messages of topics
+    without any subscribed client are not encoded at all.
+
+    Every client does its own handshake with the server, the backend
+    handshake gives the capabilities for the answers and returns when the
+    first client is connected (a client that greets before that is
+    answered without capabilities). When a client sends the sentinel only
+    that client is disconnected, the backend gets the sentinel (and stops)
+    when the last client leaves with a sentinel.
+
+    The backend beats with every client on its own (see
+    :meth:`start_heartbeat`), a client that stops beating is dropped even
+    when the other clients keep beating.
+
+    The clients are not trusted: their frames are limited to
+    :data:`MAX_FRAME_SIZE` and decoded without pickle. By default the
+    backend only listens on the loopback interface, a Unix socket can only
+    be reached by the user of the backend (:data:`SOCKET_MODE`).
+    """
+
+    _connection_method = "SOCKET"
+
+    def __init__(
+        self, address: str, role: str, settings=None, connect_timeout: float = 30, allow_remote: bool = False
+    ) -> ...:
+        """
+        Initialize the connection.
+
+        Parameters
+        ----------
+        address : str
+            The address of the backend, see :func:`parse_address`.
+        role : str
+            The role of the connection. Either "FRONTEND" or "BACKEND".
+        settings : ConfigParser
+            Not used in this connection method but added for compatibility.
+        connect_timeout : float
+            The time in seconds a frontend keeps trying to reach the backend.
+        allow_remote : bool
+            Listen on (or connect to) a host that is not the loopback
+            interface, see :func:`parse_address`.
+        """
+        self._address = address
+        self._allow_remote = allow_remote
+        parse_address(address, allow_remote)  # Refuse a remote host straight away
+        self._role = role
+        self._connect_timeout = connect_timeout
+        self._codec = MessageCodec()
+        self._lock = None
+
+        # Backend, the queue and events cannot be pickled so they are created on the backend
+        self._loop = None
+        self._loop_thread = None
+        self._server = None
+        self._clients = {}  # The subscribed topics by the writers of the clients that did the handshake
+        self._inbox = None  # The commands of all the clients
+        self._inbox_ready = None
+        self._client_connected = None
+        self._heartbeats = {}  # The heartbeats by the writers of the clients
+        self._heartbeat_args = None  # (interval, missed, on_lost) of the client heartbeats
+
+        # Frontend
+        self._sock = None
+        self._rx_buffer = b""
+
+        if role == "FRONTEND":
+            self.__init_lock__()
+
+    def __init_lock__(self) -> tr.Lock:
+        """Initialize the lock and (on the backend) start the server."""
+        self._lock = tr.Lock()
+        if self._role == "BACKEND":
+            self._inbox = queue.Queue()
+            self._inbox_ready = tr.Event()
+            self._client_connected = tr.Event()
+            self._subscriptions = frozenset()  # No clients yet
+            self.connect()
+
+    @property
+    def is_connected(self) -> bool:
+        """Check if the connection is open."""
+        if self._role == "BACKEND":
+            return self._loop_thread is not None and self._loop_thread.is_alive()
+        return self._sock is not None
+
+    @property
+    def backlog(self) -> Union[int, None]:
+        """Return the bytes waiting for the slowest client (backend) or on the socket (frontend)."""
+        if self._role == "BACKEND":
+            return max((w.transport.get_write_buffer_size() for w in list(self._clients)), default=0)
+        return PipeCom.unsent_bytes(self._sock) if self._sock is not None else 0
+
+    # BACKEND
+    def _run_loop(self, started: tr.Event) -> ...:
+        """Run the event loop of the server (runs in the server thread)."""
+        asyncio.set_event_loop(self._loop)
+        family, address = parse_address(self._address, self._allow_remote)
+        if family == socket.AF_UNIX:
+            if os.path.exists(address):
+                os.remove(address)  # Left by a backend that did not stop
+            start = asyncio.start_unix_server(self._serve_client, path=address)
+        else:
+            start = asyncio.start_server(self._serve_client, host=address[0], port=address[1])
+        self._server = self._loop.run_until_complete(start)
+        if family == socket.AF_UNIX:
+            os.chmod(address, SOCKET_MODE)
+        started.set()
+        self._loop.run_forever()
+
+        # Stopped, close the clients and the server
+        for writer in list(self._clients):
+            writer.close()
+        self._server.close()
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.close()
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.remove(address)
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> ...:
+        """Read the frames of one client until it leaves."""
+        try:
+            while True:
+                (size,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+                if size > MAX_FRAME_SIZE:
+                    print("Dropped a client of {} that sent a frame of {} bytes.".format(self._address, size))
+                    break
+                items = PipeCom.decode_frame(await reader.readexactly(size), trusted=False)
+                commands = []
+                for item in items:
+                    if hs.is_greeting(item):
+                        # Handshake of this client, only answer this client and only
+                        # once, a greeting that was sent again is not a command
+                        if writer not in self._clients:
+                            # Register the client before it gets the answer
+                            reply = hs.answer(item, self._capabilities)
+                            if hs.accepted(reply):
+                                self._clients[writer] = None  # All the topics until it subscribes
+                                self._update_subscriptions()
+                                self._watch_client(writer)
+                                self._client_connected.set()
+                            writer.write(self._encode([reply]))
+                    elif writer not in self._clients:
+                        continue  # Only accept commands after the handshake
+                    elif isinstance(item, Beat):
+                        if writer in self._heartbeats:
+                            self._heartbeats[writer].receive(item)
+                    elif isinstance(item, Subscription):
+                        self._clients[writer] = item.topics
+                        self._update_subscriptions()
+                    elif item == SENTINEL:
+                        self._drop_client(writer)
+                        if not self._clients:
+                            commands.append(SENTINEL)  # The last client left
+                        break
+                    else:
+                        commands.append(item)
+                if commands:
+                    self._inbox.put(commands)
+                    self._inbox_ready.set()
+                if SENTINEL in items:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, struct.error):
+            pass  # The client left or sent garbage (or pickled data)
+        finally:
+            self._drop_client(writer)
+
+    def _drop_client(self, writer: asyncio.StreamWriter) -> ...:
+        """Forget a client and close its connection (runs in the server thread)."""
+        heartbeat = self._heartbeats.pop(writer, None)
+        if heartbeat is not None:
+            # Stop before the client is forgotten, otherwise it looks lost. Do not block
+            # the server, the heartbeat thread stops within an interval.
+            heartbeat.stop(wait=False)
+        if self._clients.pop(writer, False) is not False:
+            self._update_subscriptions()
+        writer.close()
+
+    def _write_client(self, writer: asyncio.StreamWriter, data: bytes) -> ...:
+        """Write an encoded frame to one client (runs in the server thread)."""
+        if writer in self._clients:
+            writer.write(data)
+
+    def _watch_client(self, writer: asyncio.StreamWriter) -> ...:
+        """Start the heartbeat of a client if the backend beats (runs in the server thread)."""
+        if self._heartbeat_args is None or writer in self._heartbeats or writer not in self._clients:
+            return
+        interval, missed, on_lost = self._heartbeat_args
+        heartbeat = Heartbeat(
+            _ClientLink(self, writer), interval, missed, on_lost=lambda: self._client_lost(writer, on_lost)
+        )
+        self._heartbeats[writer] = heartbeat
+        heartbeat.start()
+
+    def _client_lost(self, writer: asyncio.StreamWriter, on_lost: Union[callable, None]) -> ...:
+        """Drop a client that stopped beating (runs in the heartbeat thread of the client)."""
+        if self.is_connected:
+            self._loop.call_soon_threadsafe(self._drop_client, writer)
+        if on_lost is not None:
+            on_lost()
+
+    def _update_subscriptions(self) -> ...:
+        """Combine the topics of all the clients (runs in the server thread)."""
+        topics = set()
+        for client_topics in self._clients.values():
+            if client_topics is None:
+                self._subscriptions = None
+                return
+            topics.update(client_topics)
+        self._subscriptions = frozenset(topics)
+
+    def _broadcast(self, encoded: list) -> ...:
+        """Write the encoded items to the clients of their topic (runs in the server thread)."""
+        for writer, topics in list(self._clients.items()):
+            if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                print("Dropped a client of {} that stopped reading.".format(self._address))
+                self._drop_client(writer)
+                continue
+            parts = [data for topic, data in encoded if topic is None or topics is None or topic in topics]
+            if parts:
+                frame = PipeCom.join_frame(parts)
+                writer.write(_LENGTH.pack(len(frame)) + frame)
+
+    # FRONTEND
+    def _open_socket(self) -> ...:
+        """Connect to the backend, retry until the connect timeout."""
+        family, address = parse_address(self._address, self._allow_remote)
+        etime = time.monotonic() + self._connect_timeout
+        while True:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                sock.connect(address)
+                break
+            except OSError:
+                sock.close()
+                if time.monotonic() > etime:
+                    raise HandshakeError("Could not reach the backend at {}".format(self._address))
+                time.sleep(0.1)
+        if family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+
+    def _read_socket(self, timeout: float = 0) -> ...:
+        """Move the data waiting on the socket into the receive buffer."""
+        if self._sock is None:
+            return
+        readable, _, _ = select.select([self._sock], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = self._sock.recv(1 << 16)
+        except OSError:
+            data = b""
+        if not data:
+            # The backend closed the connection
+            self._sock.close()
+            self._sock = None
+            return
+        self._rx_buffer += data
+
+    def _frame_waiting(self) -> bool:
+        """Check if a complete frame is in the receive buffer."""
+        if len(self._rx_buffer) < _LENGTH.size:
+            return False
+        (size,) = _LENGTH.unpack_from(self._rx_buffer)
+        return len(self._rx_buffer) >= _LENGTH.size + size
+
+    # BOTH
+    def _encode(self, items: list) -> bytes:
+        """Encode the items as one length prefixed frame."""
+        frame = PipeCom.encode_frame(items, self._codec)
+        return _LENGTH.pack(len(frame)) + frame
+
+    def connect(self) -> ...:
+        """Start the server (backend) or connect to it (frontend)."""
+        if self.is_connected:
+            return
+        if self._role == "BACKEND":
+            self._loop = asyncio.new_event_loop()
+            started = tr.Event()
+            self._loop_thread = tr.Thread(target=self._run_loop, args=(started,), daemon=True)
+            self._loop_thread.start()
+            started.wait()
+        else:
+            self._open_socket()
+
+    def handshake(self, capabilities: Union[hs.Capabilities, None] = None) -> ...:
+        """
+        Perform the handshake.
+
+        The frontend greets the server, the backend waits until the first
+        client greeted it (the server answers every client itself).
+
+        Parameters
+        ----------
+        capabilities : Capabilities, None
+            What the backend can handle, only used by the backend.
+        """
+        self.connect()
+        if self._role == "BACKEND":
+            self._capabilities = capabilities
+            self._protocol_version = hs.PROTOCOL_VERSION
+            self._client_connected.wait()
+            self._handshake_complete = True
+        else:
+            super().handshake()
+
+    def start_heartbeat(
+        self,
+        interval: float = INTERVAL,
+        missed: int = MISSED_BEATS,
+        on_lost: Union[callable, None] = None,
+    ) -> Union[Heartbeat, None]:
+        """
+        Start sending heartbeats, see :meth:`BaseConnector.start_heartbeat`.
+
+        The backend beats with every client on its own, the beats of one
+        client do not keep another client alive. A client that stops
+        beating is dropped and ``on_lost`` is called.
+
+        Returns
+        -------
+        heartbeat : Heartbeat, None
+            The started heartbeat of the frontend, None on the backend
+            (every client has its own heartbeat).
+        """
+        if self._role != "BACKEND":
+            return super().start_heartbeat(interval, missed, on_lost)
+        self.stop_heartbeat()
+        self._heartbeat_args = (interval, missed, on_lost)
+        if self.is_connected:
+            for writer in list(self._clients):
+                self._loop.call_soon_threadsafe(self._watch_client, writer)
+        return None
+
+    def stop_heartbeat(self) -> ...:
+        """Stop sending heartbeats, called by :meth:`disconnect`."""
+        if self._role != "BACKEND":
+            return super().stop_heartbeat()
+        self._heartbeat_args = None
+        for writer in list(self._heartbeats):
+            heartbeat = self._heartbeats.pop(writer, None)
+            if heartbeat is not None:
+                heartbeat.stop()
+
+    def disconnect(self) -> ...:
+        """Close the connection, the backend stops the server."""
+        self.stop_heartbeat()
+        if self._role == "BACKEND":
+            if self._loop_thread is not None and self._loop_thread.is_alive():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop_thread.join()
+        elif self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def send_sentinel(self) -> ...:
+        """Send the sentinel command to the other side."""
+        print("Sending sentinel")
+        self.send(self.SENTINEL)
+
+    def send(self, data) -> ...:
+        """
+        Send the data, the backend sends it to all the clients.
+
+        Parameters
+        ----------
+        data : list, str or Message
+            The data to send, the items of a list are sent as one batch.
+        """
+        items = self._select(data)
+        if not items:
+            return
+        self._lock.acquire()
+        try:
+            if self._role == "BACKEND":
+                if self.is_connected:
+                    encoded = [(topic_of(i), self._codec.encode_item(i)) for i in items]
+                    self._loop.call_soon_threadsafe(self._broadcast, encoded)
+            elif self._sock is not None:
+                self._sock.sendall(self._encode(items))
+        except OSError:
+            print("Socket closed unexpectedly.")
+            self.disconnect()
+        finally:
+            self._lock.release()
+
+    def message_waiting(self) -> bool:
+        """
+        Check if a message is waiting.
+
+        Returns:
+        --------
+        bool
+            True if a message is waiting, False otherwise.
+        """
+        if self._role == "BACKEND":
+            return not self._inbox.empty()
+        if not self._frame_waiting():
+            self._read_socket()
+        return self._frame_waiting()
+
+    def wait_for_message(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Wait until a message is waiting.
+
+        Parameters
+        ----------
+        timeout : float, None
+            The maximum time to wait in seconds, None to wait forever.
+
+        Returns
+        -------
+        bool
+            True if a message is waiting, False otherwise.
+        """
+        if self._role == "BACKEND":
+            return self._inbox_ready.wait(timeout) and self.message_waiting()
+        etime = None if timeout is None else time.monotonic() + timeout
+        while not self.message_waiting():
+            remaining = None if etime is None else etime - time.monotonic()
+            if remaining is not None and remaining <= 0 or not self.is_connected:
+                return False
+            self._read_socket(remaining)
+        return True
+
+    def receive(self) -> Union[list, None]:
+        """
+        Receive all the waiting data.
+
+        Returns:
+        --------
+        data : list, None
+            The received data, None if nothing was waiting. If a sentinel
+            command was received, it will be the last element in the list.
+        """
+        if not self.message_waiting():
+            return None
+        result = []
+        if self._role == "BACKEND":
+            self._inbox_ready.clear()
+            while not self._inbox.empty():
+                result.extend(self._inbox.get_nowait())
+        else:
+            while self._frame_waiting():
+                (size,) = _LENGTH.unpack_from(self._rx_buffer)
+                end = _LENGTH.size + size
+                result.extend(PipeCom.decode_frame(self._rx_buffer[_LENGTH.size:end]))
+                self._rx_buffer = self._rx_buffer[end:]
+                if not self._frame_waiting():
+                    self._read_socket()
+
+        if SENTINEL in result:
+            # Put the SENTINEL command at the end
+            result.append(result.pop(result.index(SENTINEL)))
+        return self._take_subscriptions(result)
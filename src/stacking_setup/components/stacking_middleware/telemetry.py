@@ -0,0 +1,255 @@
+"""
+Shared memory block with the latest telemetry of the backend.
+
+The backend publishes the latest position, moving flag, temperature and
+temperature setpoint of every axis in a :class:`TelemetryBlock`, the
+frontend reads it at its own rate. The telemetry does not go over the
+command pipe so it can not delay the command responses, and a slow
+reader only ever sees the latest values instead of a backlog.
+
+The block is protected by a seqlock. The writer makes the sequence
+number odd, writes the values and makes it even again. A reader copies
+the values and retries if the sequence number was odd or changed while
+it was copying, so it always gets a consistent snapshot without ever
+blocking the writer.
+
+Layout of the block::
+
+    sequence nr (Q) | amount of axes (I) | updated in epoch s (d) |
+    MAX_AXES * [axis id (16s) | position (d) | temperature (d) |
+                setpoint (d) | flags (B)]
+"""
+import os
+import math
+import time
+import struct
+import threading as tr
+from multiprocessing import shared_memory
+from typing import Union
+
+
+MAX_AXES = 32
+
+# Flags per axis
+HAS_POSITION = 0x01
+MOVING = 0x02
+HAS_TEMPERATURE = 0x04
+
+_SEQUENCE = struct.Struct("<Q")
+_HEADER = struct.Struct("<QId4x")
+_SLOT = struct.Struct("<16sdddB7x")
+_BODY = struct.Struct("<" + "16sdddB7x" * MAX_AXES)
+SIZE = _HEADER.size + _BODY.size
+
+_RETRIES = 1000  # Amount of tries to get a consistent snapshot
+
+
+class TelemetryBlock:
+    """
+    The shared memory block with the latest telemetry.
+
+    Create the block with :meth:`create` before starting the backend and
+    give it to both the frontend and backend connector. The block can be
+    pickled, it is attached again by name in the other process.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool = False) -> ...:
+        """
+        Initialize the block, use :meth:`create` or :meth:`attach`.
+
+        Parameters
+        ----------
+        memory : multiprocessing.shared_memory.SharedMemory
+            The shared memory of the block.
+        owner : bool
+            If the block was created in this process, only the owner
+            removes the block when it is closed.
+        """
+        self._memory = memory
+        self._buffer = memory.buf
+        self._owner_pid = os.getpid() if owner else None
+        self._slots = {}  # Slot per axis id of the writer
+        self._moving = {}  # Last published position per axis id of the writer
+        self._lock = tr.Lock()  # The position and temperature reports are published by different threads
+
+    @classmethod
+    def create(cls, name: Union[str, None] = None) -> "TelemetryBlock":
+        """
+        Create a new block.
+
+        Parameters
+        ----------
+        name : str, None
+            The name of the shared memory, by default a unique name.
+
+        Returns
+        -------
+        block : TelemetryBlock
+            The new (empty) block.
+        """
+        memory = shared_memory.SharedMemory(name=name, create=True, size=SIZE)
+        memory.buf[:SIZE] = bytes(SIZE)
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "TelemetryBlock":
+        """
+        Attach to an existing block.
+
+        Parameters
+        ----------
+        name : str
+            The name of the block.
+
+        Returns
+        -------
+        block : TelemetryBlock
+            The block.
+        """
+        return cls(shared_memory.SharedMemory(name=name))
+
+    def __reduce__(self) -> tuple:
+        """Attach to the block by name when unpickled."""
+        return (self.attach, (self.name,))
+
+    @property
+    def name(self) -> str:
+        """The name of the shared memory."""
+        return self._memory.name
+
+    @property
+    def sequence(self) -> int:
+        """The sequence number, changes every time new values are published."""
+        return _SEQUENCE.unpack_from(self._buffer)[0]
+
+    def close(self) -> ...:
+        """Close the block, the process that created the block also removes it."""
+        self._buffer = None
+        self._memory.close()
+        if self._owner_pid == os.getpid():
+            self._memory.unlink()
+
+    # WRITER
+    def _slot(self, axis_id: str) -> Union[int, None]:
+        """Get the slot of an axis, a new axis gets the next free slot."""
+        slot = self._slots.get(axis_id)
+        if slot is None and len(self._slots) < MAX_AXES:
+            slot = len(self._slots)
+            self._slots[axis_id] = slot
+        return slot
+
+    def _update(self, values: dict, update: callable) -> ...:
+        """Update the slots of the given axes within one write of the seqlock."""
+        self._lock.acquire()
+        buffer = self._buffer
+        sequence = _SEQUENCE.unpack_from(buffer)[0]
+        _SEQUENCE.pack_into(buffer, 0, sequence + 1)  # Odd, writing
+        try:
+            for axis_id, value in values.items():
+                slot = self._slot(axis_id)
+                if slot is None:
+                    continue  # More axes than the block can hold
+                offset = _HEADER.size + slot * _SLOT.size
+                name, position, temperature, setpoint, flags = _SLOT.unpack_from(buffer, offset)
+                _SLOT.pack_into(buffer, offset, axis_id.encode()[:16],
+                                *update(axis_id, value, position, temperature, setpoint, flags))
+            _HEADER.pack_into(buffer, 0, sequence + 1, len(self._slots), time.time())
+        finally:
+            _SEQUENCE.pack_into(buffer, 0, sequence + 2)  # Even, done
+            self._lock.release()
+
+    def _update_position(self, axis_id: str, value, position, temperature, setpoint, flags) -> tuple:
+        """Get the new slot values for a position."""
+        if value is None:
+            self._moving.pop(axis_id, None)
+            return math.nan, temperature, setpoint, flags & ~(HAS_POSITION | MOVING)
+        value = float(value)
+        previous = self._moving.get(axis_id)
+        self._moving[axis_id] = value
+        flags |= HAS_POSITION
+        if previous is not None and previous != value:
+            flags |= MOVING
+        else:
+            flags &= ~MOVING
+        return value, temperature, setpoint, flags
+
+    @staticmethod
+    def _update_temperature(axis_id: str, value, position, temperature, setpoint, flags) -> tuple:
+        """Get the new slot values for a temperature."""
+        current, target = value.get("current"), value.get("target")
+        return (position,
+                math.nan if current is None else float(current),
+                math.nan if target is None else float(target),
+                flags | HAS_TEMPERATURE)
+
+    def publish_positions(self, positions: dict) -> ...:
+        """
+        Publish the positions of the axes.
+
+        An axis is flagged as moving when its position changed since the
+        previous published position.
+
+        Parameters
+        ----------
+        positions : dict
+            The positions in the format of M114, {<axis_id> : <position>, ...}
+        """
+        self._update(positions, self._update_position)
+
+    def publish_temperatures(self, temperatures: dict) -> ...:
+        """
+        Publish the temperatures of the axes.
+
+        Parameters
+        ----------
+        temperatures : dict
+            The temperatures in the format of M105,
+            {<axis_id> : {'current' : <temperature>, 'target' : <setpoint>}, ...}
+        """
+        self._update(temperatures, self._update_temperature)
+
+    # READER
+    def read(self) -> Union[dict, None]:
+        """
+        Read a consistent snapshot of the telemetry.
+
+        Returns
+        -------
+        snapshot : dict, None
+            The snapshot in the format
+            {'sequence' : <nr>, 'updated' : <epoch s>,
+            'positions' : {<axis_id> : <position>, ...},
+            'moving' : {<axis_id> : <bool>, ...},
+            'temperatures' : {<axis_id> : {'current' : <temperature>, 'target' : <setpoint>}, ...}},
+            None if the writer kept changing the block while reading.
+        """
+        buffer = self._buffer
+        for _ in range(_RETRIES):
+            sequence, count, updated = _HEADER.unpack_from(buffer)
+            if sequence & 1:
+                continue  # The writer is busy
+            values = _BODY.unpack_from(buffer, _HEADER.size)
+            if _SEQUENCE.unpack_from(buffer)[0] == sequence:
+                break
+        else:
+            return None
+
+        positions, moving, temperatures = {}, {}, {}
+        for i in range(0, count * 5, 5):
+            name, position, temperature, setpoint, flags = values[i:i + 5]
+            axis_id = name.rstrip(b"\x00").decode()
+            if flags & HAS_POSITION:
+                positions[axis_id] = position
+                moving[axis_id] = bool(flags & MOVING)
+            if flags & HAS_TEMPERATURE:
+                temperatures[axis_id] = {
+                    "current": None if math.isnan(temperature) else temperature,
+                    "target": None if math.isnan(setpoint) else setpoint,
+                }
+        return {
+            "sequence": sequence,
+            "updated": updated,
+            "positions": positions,
+            "moving": moving,
+            "temperatures": temperatures,
+        }
@@ -0,0 +1,97 @@
+"""
+Topics of the messages sent by the backend.
+
+A frontend subscribes to the topics it needs with
+:meth:`~stacking_middleware.base_connector.BaseConnector.subscribe`, the
+backend side of the connector drops the messages of the other topics
+before they are encoded. Items that are not messages (the handshake and
+the sentinel) do not have a topic and are always sent.
+"""
+from typing import Union
+
+try:
+    from .message import Message
+    from .message_codec import ITEM_SUBSCRIPTION, register_item
+except ImportError:
+    from message import Message
+    from message_codec import ITEM_SUBSCRIPTION, register_item
+
+
+TOPIC_RESPONSES = "responses"  # The responses to the commands
+TOPIC_POSITIONS = "positions"  # The position auto report (M154)
+TOPIC_TEMPERATURES = "temperatures"  # The temperature auto report (M155)
+TOPIC_SYSTEM = "system"  # The keep alive messages (M113)
+TOPIC_ESTOP = "estop"  # The emergency stop (M112)
+
+TOPICS = (TOPIC_RESPONSES, TOPIC_POSITIONS, TOPIC_TEMPERATURES, TOPIC_SYSTEM, TOPIC_ESTOP)
+
+# The topic of the messages by command id, all the other messages are responses
+_COMMAND_TOPICS = {
+    "M154": TOPIC_POSITIONS,
+    "M155": TOPIC_TEMPERATURES,
+    "M113": TOPIC_SYSTEM,
+    "M112": TOPIC_ESTOP,
+}
+
+
+def topic_of(item) -> Union[str, None]:
+    """
+    Get the topic of an item.
+
+    Parameters
+    ----------
+    item : Message or any other item
+        The item to send.
+
+    Returns
+    -------
+    topic : str, None
+        The topic of a message, None for the other items.
+    """
+    if isinstance(item, Message):
+        return _COMMAND_TOPICS.get(item.command_id, TOPIC_RESPONSES)
+    return None
+
+
+class Subscription:
+    """The topics a frontend wants to receive, sent to the backend by the connector."""
+
+    __slots__ = ("topics",)
+
+    def __init__(self, topics: Union[tuple, None]) -> ...:
+        """
+        Initialize the subscription.
+
+        Parameters
+        ----------
+        topics : tuple, None
+            The topics to receive, None for all the topics.
+
+        Raises
+        ------
+        ValueError
+            If one of the topics is unknown.
+        """
+        if topics is not None:
+            topics = frozenset(topics)
+            unknown = topics.difference(TOPICS)
+            if unknown:
+                raise ValueError("Unknown topics {}.".format(sorted(unknown)))
+        self.topics = topics
+
+    def pack(self) -> bytes:
+        """Pack the subscription for the wire, a '*' subscribes to all the topics."""
+        if self.topics is None:
+            return b"*"
+        return ",".join(sorted(self.topics)).encode()
+
+    @classmethod
+    def unpack(cls, data: Union[bytes, memoryview]) -> "Subscription":
+        """Unpack a subscription packed with :meth:`pack`."""
+        data = bytes(data).decode()
+        if data == "*":
+            return cls(None)
+        return cls(tuple(data.split(",")) if data else ())
+
+
+register_item(ITEM_SUBSCRIPTION, Subscription)
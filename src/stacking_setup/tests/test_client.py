@@ -0,0 +1,147 @@
+import unittest
+from unittest.mock import patch
+import multiprocessing as mp
+import threading as tr
+import asyncio
+import time
+
+#Following lines are for assigning parent directory dynamically.
+import sys, os
+dir_path = os.path.dirname(os.path.realpath(__file__))
+parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
+sys.path.insert(0, parent_dir_path)
+
+# The code to be tested
+from components.stacking_backend.gcode_parser import GcodeParser
+from components.stacking_middleware.pipeline_connection import PipelineConnection
+from components.stacking_middleware.message import Message
+from components.stacking_middleware.handshake import Capabilities
+from client import StackingClient, AsyncStackingClient, CommandError
+
+
+class FakeBackend:
+    """
+    Backend that answers every numbered line with the request id of the line.
+
+    'G28' fails, 'M114' answers with positions and the other commands
+    answer with an empty message.
+    """
+
+    def __init__(self, connection: PipelineConnection) -> ...:
+        """Start answering on the connection."""
+        self._con = connection
+        self._con.__init_lock__()
+        self.lines = []
+        self._thread = tr.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> ...:
+        """Answer the lines until the sentinel is received."""
+        self._con.handshake(Capabilities(axes=('X', 'Y'), opcodes=('G0', 'G28', 'M114')))
+        while True:
+            if not self._con.wait_for_message(0.1):
+                continue
+            for line in self._con.receive():
+                if line == self._con.SENTINEL:
+                    return
+                self.lines.append(line)
+                request_id, line = GcodeParser.split_line_number(line)
+                command_id = line.split()[0]
+                if command_id == 'G28':
+                    response = Message(exit_code=1, msg='Homing failed', command_id=command_id)
+                elif command_id == 'M114':
+                    response = Message(exit_code=0, msg={'X': 1.5, 'Y': 2.0}, command_id=command_id)
+                else:
+                    response = Message(exit_code=0, msg='', command_id=command_id)
+                response.request_id = request_id
+                self._con.send(response)
+
+    def report(self, positions: dict) -> ...:
+        """Send a position auto report."""
+        self._con.send(Message.report(0, 'M154', positions, 'M114'))
+
+    def join(self) -> ...:
+        """Wait until the backend stopped."""
+        self._thread.join(5)
+
+
+class TestStackingClient(unittest.TestCase):
+    """Test the scripting client."""
+
+    def setUp(self):
+        to_proc, from_proc = mp.Pipe()
+        self.backend = FakeBackend(PipelineConnection(to_proc, 'BACKEND'))
+        self.client = StackingClient(PipelineConnection(from_proc, 'FRONTEND'), timeout=5)
+        self.client.connect()
+
+    def tearDown(self):
+        self.client.close(stop_backend=True)
+        self.backend.join()
+
+    def test_split_line_number(self):
+        self.assertEqual(GcodeParser.split_line_number('N12 G0 X10'), (12, 'G0 X10'))
+        self.assertEqual(GcodeParser.split_line_number('G0 N10'), (None, 'G0 N10'))
+        self.assertEqual(GcodeParser.split_line_number('NX G0'), (None, 'NX G0'))
+
+    def test_commands(self):
+        self.assertEqual(self.client.move({'X': 10, 'Y': -5}).command_id, 'G0')
+        self.assertEqual(self.client.positions(), {'X': 1.5, 'Y': 2.0})
+        with self.assertRaises(CommandError):
+            self.client.home()
+        self.assertEqual(self.backend.lines[0].split()[1:], ['G0', 'X10', 'Y-5'])
+        self.assertEqual(self.client.outstanding, 0)
+
+    def test_capabilities(self):
+        with self.assertRaises(ValueError):
+            self.client.submit('M140 S60')
+        with self.assertRaises(ValueError):
+            self.client.move({'K': 10})
+        self.assertEqual(self.backend.lines, [])
+
+    def test_batch(self):
+        with patch.object(self.client.connector, 'send', wraps=self.client.connector.send) as send:
+            with self.client.batch():
+                futures = [self.client.move({'X': i}, wait=False) for i in range(50)]
+                with self.assertRaises(RuntimeError):
+                    self.client.move({'X': 1})
+            send.assert_called_once()
+
+        # Every future gets the response to its own line, the waited line is still sent
+        responses = [future.result(5) for future in futures]
+        self.assertEqual(len({response.request_id for response in responses}), 50)
+        self.client.positions()
+        self.assertEqual(len(self.backend.lines), 52)
+
+    def test_telemetry(self):
+        received = []
+
+        def read():
+            for topic, values in self.client.telemetry(timeout=2):
+                received.append((topic, values))
+                if len(received) == 3:
+                    return
+
+        reader = tr.Thread(target=read)
+        reader.start()
+        time.sleep(0.1)  # Let the iterator register
+        for i in range(3):
+            self.backend.report({'X': float(i)})
+        reader.join(5)
+        self.assertEqual(received, [('positions', {'X': float(i)}) for i in range(3)])
+
+    def test_async(self):
+        client = AsyncStackingClient(self.client.connector, timeout=5)
+        client.client = self.client  # Share the connected client
+
+        async def run():
+            moves = await asyncio.gather(*[client.move({'X': i}) for i in range(5)])
+            positions = await client.positions()
+            return moves, positions
+
+        moves, positions = asyncio.run(run())
+        self.assertEqual([m.command_id for m in moves], ['G0'] * 5)
+        self.assertEqual(positions, {'X': 1.5, 'Y': 2.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,42 @@
 import unittest
 from unittest.mock import MagicMock, patch
 import multiprocessing as mp
+import threading as tr
 import configparser
 #Following lines are for assigning parent directory dynamically.
 import sys, os
 dir_path = os.path.dirname(os.path.realpath(__file__))
 parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
 sys.path.insert(0, parent_dir_path)
-from components.stacking_middleware.pipeline_connection import PipelineConnection
+from components.stacking_middleware.pipeline_connection import PipelineConnection, PipeCom
+from components.stacking_middleware.serial_connection import (
+    SerialConnection, FrameDecoder, cobs_encode, cobs_decode, wrap_frame
+)
+from components.stacking_middleware.message_codec import (
+    MessageCodec, OPCODES, KIND_FLOATS, KIND_TEMPERATURES, KIND_PICKLE, _HEADER
+)
+from components.stacking_middleware.message import Message
+from components.stacking_middleware.telemetry import TelemetryBlock
+from components.stacking_middleware.shared_memory_connection import SharedMemoryConnection, SharedMemoryChannel
+from components.stacking_middleware.base_connector import SENTINEL, HandshakeError
+from components.stacking_middleware import handshake as hs
+from components.stacking_middleware.handshake import Capabilities, Hello, Welcome
+from components.stacking_middleware.heartbeat import Beat
+from components.stacking_middleware.socket_connection import SocketConnection, parse_address
+from components.stacking_middleware.outbox import TelemetryOutbox
+from components.stacking_middleware.command_coalescer import CommandCoalescer, split_command, join_command
+from components.stacking_middleware.topics import (
+    Subscription, topic_of, TOPIC_RESPONSES, TOPIC_POSITIONS, TOPIC_SYSTEM
+)
+import pickle
+import struct
+import serial
+import select
+import socket
+import shutil
+import tempfile
+import time
+import datetime
 
 
 class TestPipeLineConnection(unittest.TestCase):
@@ -75,5 +104,798 @@ class TestPipeLineConnection(unittest.TestCase):
         self.assertFalse(parent_pipe.is_connected)
         self.assertFalse(child_pipe.is_connected)
 
+    # Send a batch as one frame
+    @patch.object(PipelineConnection, 'handshake', return_value=True)
+    def test_batch_is_one_frame(self, connector_mock):
+        parent_pipe = PipelineConnection(self.to_proc, 'FRONTEND', self.settings)
+        child_pipe = PipelineConnection(self.from_proc, 'BACKEND', self.settings)
+        child_pipe.__init_lock__()
+
+        parent_pipe.send(['G0 X1', 'M114', {'S': 1}])
+        frame = self.from_proc.recv_bytes()
+        self.assertEqual(PipeCom.decode_frame(frame), ['G0 X1', 'M114', {'S': 1}])
+        self.assertFalse(child_pipe.message_waiting())
+
+    # Drain all the waiting frames at once
+    @patch.object(PipelineConnection, 'handshake', return_value=True)
+    def test_receive_drains_all_frames(self, connector_mock):
+        parent_pipe = PipelineConnection(self.to_proc, 'FRONTEND', self.settings)
+        child_pipe = PipelineConnection(self.from_proc, 'BACKEND', self.settings)
+        child_pipe.__init_lock__()
+
+        parent_pipe.send(['M105', 'M114'])
+        parent_pipe.send('M0')
+        self.assertEqual(child_pipe.receive(), ['M105', 'M114', 'M0'])
+        self.assertIsNone(child_pipe.receive())
+
+    # Refuse a frame of another version
+    def test_unknown_frame_version(self):
+        frame = bytearray(PipeCom.encode_frame(['M114']))
+        frame[0] = 99
+        with self.assertRaises(ValueError):
+            PipeCom.decode_frame(bytes(frame))
+
+
+class TestMessage(unittest.TestCase):
+    """Test the status message."""
+
+    def test_fields(self):
+        message = Message(exit_code=0, msg='Done', command_id='G28', command='G28')
+        self.assertFalse(hasattr(message, '__dict__'))
+        self.assertEqual(list(message.keys()), ['exit_code', 'command', 'command_id', 'msg', 'timestamp'])
+        self.assertEqual(dict(message.items())['msg'], 'Done')
+        self.assertEqual(message.values()[0], 0)
+
+    def test_timestamp(self):
+        message = Message.report(0, 'M154', {'X': 1.0}, 'M114', created=0.0)
+        self.assertEqual(message.timestamp, str(datetime.datetime.fromtimestamp(0.0)))
+
+    def test_typechecks(self):
+        with self.assertRaises(Exception):
+            Message(exit_code='0', msg='', command_id='M0')
+
+    def test_pickle(self):
+        message = pickle.loads(pickle.dumps(Message(exit_code=1, msg={'X': 2.0}, command_id='M114')))
+        self.assertEqual((message.exit_code, message.msg, message.command_id), (1, {'X': 2.0}, 'M114'))
+        self.assertIsNone(message.sequence)
+
+
+class TestMessageCodec(unittest.TestCase):
+    """Test the binary wire format of the messages."""
+
+    def setUp(self):
+        self.codec = MessageCodec()
+
+    def _roundtrip(self, message):
+        return MessageCodec.decode(self.codec.encode(message))
+
+    def test_position_report(self):
+        positions = {'X': 1.5, 'Y': -20.25, 'Z': 0.0, 'H': 1000.125}
+        message = Message(exit_code=0, msg=positions, command_id='M154', command='M114')
+        decoded = self._roundtrip(message)
+
+        self.assertEqual(decoded.msg, positions)
+        self.assertEqual(decoded.command_id, 'M154')
+        self.assertEqual(decoded.command, 'M114')
+        self.assertEqual(decoded.exit_code, 0)
+        self.assertEqual(decoded.timestamp, message.timestamp)
+
+    def test_other_payloads(self):
+        command = {'G0': {'X': 1.0}}
+        decoded = self._roundtrip(Message(exit_code=1, msg='Failed', command_id='Custom', command=command))
+        self.assertEqual((decoded.msg, decoded.command_id, decoded.command), ('Failed', 'Custom', command))
+
+        decoded = self._roundtrip(Message(exit_code=0, msg={'X': None, 'Y': 'error'}, command_id='M114'))
+        self.assertEqual(decoded.msg, {'X': None, 'Y': 'error'})
+        self.assertIsNone(decoded.command)
+
+    def test_sequence_numbers(self):
+        message = Message(exit_code=0, msg='', command_id='M0')
+        first = MessageCodec.decode(self.codec.encode(message))
+        second = MessageCodec.decode(self.codec.encode(message))
+        self.assertEqual(second.sequence, first.sequence + 1)
+        self.assertGreater(second.sent_ns, 0)
+
+    def test_request_id(self):
+        message = Message(exit_code=0, msg='', command_id='G0')
+        self.assertIsNone(self._roundtrip(message).request_id)
+        message.request_id = 0xFFFFFFFF
+        self.assertEqual(self._roundtrip(message).request_id, 0xFFFFFFFF)
+
+    def test_report_kinds(self):
+        # The payloads as the backend builds them (see M105 and M114)
+        temperatures = {'L': {'current': 21.5, 'target': None}, 'K': {'current': 40, 'target': 60.0}}
+        positions = {'X': 120, 'Y': -3, 'L': 12.5, 'H': None}
+        for msg, command, kind in [(temperatures, 'M105', KIND_TEMPERATURES), (positions, 'M114', KIND_FLOATS)]:
+            for command_id in (command, 'M154' if command == 'M114' else 'M155'):
+                data = self.codec.encode(Message(exit_code=0, msg=msg, command_id=command_id, command=command))
+                self.assertEqual(_HEADER.unpack_from(data)[7], kind)
+                self.assertEqual(MessageCodec.decode(data).msg, msg)
+        decoded = self._roundtrip(Message(exit_code=0, msg=positions, command_id='M114'))
+        self.assertIs(type(decoded.msg['X']), float)
+
+        # Other nested dicts are still pickled
+        data = self.codec.encode(Message(exit_code=0, msg={'L': {'current': 1.0}}, command_id='M105'))
+        self.assertEqual(_HEADER.unpack_from(data)[7], KIND_PICKLE)
+
+    def test_report_smaller_than_pickle(self):
+        positions = {axis: float(i) for i, axis in enumerate('XYZHJKL')}
+        message = Message(exit_code=0, msg=positions, command_id='M154', command='M114')
+        self.assertLess(len(self.codec.encode(message)), len(pickle.dumps(message)) / 2)
+
+    def test_known_opcodes_are_unique(self):
+        self.assertEqual(len(set(OPCODES)), len(OPCODES))
+
+    def test_untrusted_items(self):
+        items = [Hello(), Subscription(None), Subscription(('positions',)), Beat(1, 2), 'M114']
+        data = b''.join(self.codec.encode_item(item) for item in items)
+        decoded, used = MessageCodec.decode_items(data, trusted=False)
+        self.assertEqual(used, len(data))
+        self.assertEqual(decoded[0].version, hs.PROTOCOL_VERSION)
+        self.assertEqual([decoded[1].topics, decoded[2].topics], [None, frozenset(['positions'])])
+
+        # Pickled items and payloads are only decoded for a trusted peer
+        for item in [{'G0': {'X': 1.0}}, Message(exit_code=0, msg='', command_id='G0', command={'G0': {}})]:
+            data = self.codec.encode_item(item)
+            self.assertEqual(len(MessageCodec.decode_items(data)[0]), 1)
+            with self.assertRaises(ValueError):
+                MessageCodec.decode_items(data, trusted=False)
+
+
+def _serial_settings(port):
+    """Settings of a serial connection on the given port."""
+    settings = MagicMock()
+    settings.get.side_effect = lambda section, key: {'port': port, 'baudrate': 115200, 'timeout': 0}[key]
+    return settings
+
+
+def _bridge_ptys(first, second, stop):
+    """Copy the data between the master ends of two ptys (runs in a thread)."""
+    peers = {first: second, second: first}
+    while not stop.is_set():
+        readable, _, _ = select.select(list(peers), [], [], 0.05)
+        for fd in readable:
+            os.write(peers[fd], os.read(fd, 4096))
+
+
+class TestSerialConnection(unittest.TestCase):
+    """Test the serial connection over a loopback port and pty pairs."""
+
+    def setUp(self):
+        with patch('serial.Serial', side_effect=lambda port, baudrate, timeout: serial.serial_for_url(port, timeout=timeout)):
+            self.connection = SerialConnection(_serial_settings('loop://'), 'FRONTEND')
+
+    def tearDown(self):
+        self.connection.disconnect()
+
+    def open_pty(self):
+        """Open a pty pair, returns the master fd and the path of the slave."""
+        master, slave = os.openpty()
+        self.addCleanup(os.close, master)
+        self.addCleanup(os.close, slave)
+        return master, os.ttyname(slave)
+
+    def test_cobs(self):
+        for data in [b'', b'\x00', b'\x00\x00', b'abc', b'a' * 254, b'a' * 254 + b'\x00b', bytes(range(256)) * 3]:
+            encoded = cobs_encode(data)
+            self.assertNotIn(b'\x00', encoded)
+            self.assertEqual(cobs_decode(encoded), data)
+        self.assertRaises(ValueError, cobs_decode, b'\x05ab')
+
+    def test_send_and_receive(self):
+        message = Message(exit_code=0, msg={'L': 21.5}, command_id='M155', command='M105')
+        self.connection.send([message, 'M114'])
+
+        self.assertTrue(self.connection.wait_for_message(2))
+        received = self.connection.receive()
+        self.assertEqual(received[0].msg, {'L': 21.5})
+        self.assertEqual(received[1], 'M114')
+
+    def test_partial_frame(self):
+        data = wrap_frame(PipeCom.encode_frame(['G0 X10']))
+        self.connection._ser.write(data[:4])
+        self.assertFalse(self.connection.wait_for_message(0.2))
+        self.connection._ser.write(data[4:])
+        self.assertTrue(self.connection.wait_for_message(2))
+        self.assertEqual(self.connection.receive(), ['G0 X10'])
+
+    def test_pty_frames(self):
+        master, port = self.open_pty()
+        connection = SerialConnection(_serial_settings(port), 'FRONTEND')
+        self.addCleanup(connection.disconnect)
+
+        # Noise, a damaged frame and a valid frame, only the valid frame is received
+        damaged = bytearray(wrap_frame(PipeCom.encode_frame(['G0 X99'])))
+        damaged[5] = damaged[5] % 254 + 1  # Another byte that is not a delimiter
+        message = Message(exit_code=0, msg={'X': 1.5}, command_id='M154', command='M114')
+        os.write(master, b'noise\x00' + bytes(damaged) + wrap_frame(PipeCom.encode_frame([message, 'M105'])))
+        self.assertTrue(connection.wait_for_message(2))
+        received = connection.receive()
+        self.assertEqual(received[0].msg, {'X': 1.5})
+        self.assertEqual(received[1:], ['M105'])
+        self.assertEqual(connection.frame_errors, 2)
+
+        # The frames written by the connection
+        connection.send(['M114', 'M105'])
+        decoder, frames = FrameDecoder(), []
+        etime = time.monotonic() + 2
+        while not frames and time.monotonic() < etime:
+            frames = decoder.feed(os.read(master, 4096))
+        self.assertEqual(PipeCom.decode_frame(frames[0]), ['M114', 'M105'])
+
+    def test_pty_handshake(self):
+        frontend_master, frontend_port = self.open_pty()
+        backend_master, backend_port = self.open_pty()
+        stop = tr.Event()
+        bridge = tr.Thread(target=_bridge_ptys, args=(frontend_master, backend_master, stop), daemon=True)
+        bridge.start()
+        self.addCleanup(bridge.join)
+        self.addCleanup(stop.set)
+
+        frontend = SerialConnection(_serial_settings(frontend_port), 'FRONTEND')
+        self.addCleanup(frontend.disconnect)
+        backend = SerialConnection(_serial_settings(backend_port), 'BACKEND')
+        backend.__init_lock__()
+        self.addCleanup(backend.disconnect)
+
+        handshake = tr.Thread(target=backend.handshake)
+        handshake.start()
+        frontend.handshake()
+        handshake.join(5)
+        self.assertTrue(frontend.handshake_complete)
+        self.assertTrue(backend.handshake_complete)
+
+        # Telemetry rate, many small frames arrive complete and in order
+        for i in range(200):
+            backend.send(Message(exit_code=0, msg={'X': float(i)}, command_id='M154', command='M114'))
+        received = []
+        while len(received) < 200 and frontend.wait_for_message(2):
+            received.extend(frontend.receive())
+        self.assertEqual([m.msg['X'] for m in received], [float(i) for i in range(200)])
+
+
+def _publish_equal_positions(block, count):
+    """Publish positions where all the axes have the same value (runs in the writer process)."""
+    for i in range(count):
+        block.publish_positions({axis: float(i) for axis in 'XYZHJKL'})
+    block.close()
+
+
+class TestTelemetryBlock(unittest.TestCase):
+    """Test the shared memory telemetry block."""
+
+    def setUp(self):
+        self.block = TelemetryBlock.create()
+
+    def tearDown(self):
+        self.block.close()
+
+    def test_publish_and_read(self):
+        self.assertEqual(self.block.read()['positions'], {})
+        self.block.publish_positions({'X': 1.5, 'Y': None})
+        self.block.publish_temperatures({'L': {'current': 21.5, 'target': 60}})
+
+        snapshot = self.block.read()
+        self.assertEqual(snapshot['sequence'], 4)
+        self.assertEqual(snapshot['positions'], {'X': 1.5})
+        self.assertEqual(snapshot['temperatures'], {'L': {'current': 21.5, 'target': 60.0}})
+
+    def test_moving_flag(self):
+        self.block.publish_positions({'X': 1.0, 'Y': 2.0})
+        self.block.publish_positions({'X': 1.5, 'Y': 2.0})
+        self.assertEqual(self.block.read()['moving'], {'X': True, 'Y': False})
+        self.block.publish_positions({'X': 1.5})
+        self.assertFalse(self.block.read()['moving']['X'])
+
+    def test_snapshots_are_consistent(self):
+        writer = mp.Process(target=_publish_equal_positions, args=(pickle.loads(pickle.dumps(self.block)), 20000))
+        writer.start()
+        snapshots = 0
+        while writer.is_alive():
+            snapshot = self.block.read()
+            if snapshot is not None and snapshot['positions']:
+                self.assertEqual(len(set(snapshot['positions'].values())), 1)
+                snapshots += 1
+        writer.join()
+        self.assertGreater(snapshots, 0)
+        self.assertEqual(self.block.read()['positions']['X'], 19999.0)
+
+    def test_connection_closes_block(self):
+        to_proc, from_proc = mp.Pipe()
+        connection = PipelineConnection(from_proc, 'FRONTEND', telemetry=TelemetryBlock.attach(self.block.name))
+        self.assertIsNotNone(connection.telemetry)
+        connection.disconnect()
+        self.assertIsNone(connection.telemetry)
+        to_proc.close()
+
+
+def _echo_backend(connection):
+    """Handshake and echo the received items until the sentinel (runs in the backend process)."""
+    connection.__init_lock__()
+    connection.handshake()
+    while True:
+        if not connection.wait_for_message(1):
+            continue
+        items = connection.receive()
+        if SENTINEL in items:
+            break
+        connection.send(items)
+    connection.disconnect()
+
+
+class TestSharedMemoryConnection(unittest.TestCase):
+    """Test the shared memory ring buffer connection."""
+
+    def setUp(self):
+        self.channel = SharedMemoryChannel(capacity=4096)
+        self.frontend = SharedMemoryConnection(self.channel, 'FRONTEND')
+        self.backend = SharedMemoryConnection(self.channel, 'BACKEND')
+        self.backend.__init_lock__()
+
+    def tearDown(self):
+        self.backend.disconnect()
+        self.frontend.disconnect()
+
+    def test_send_and_receive(self):
+        self.assertFalse(self.frontend.message_waiting())
+        self.assertIsNone(self.frontend.receive())
+        message = Message(exit_code=0, msg={'X': 1.5}, command_id='M154', command='M114')
+        self.backend.send([message, 'ok'])
+        self.backend.send(self.backend.SENTINEL)
+        self.backend.send('last')
+
+        self.assertTrue(self.frontend.message_waiting())
+        received = self.frontend.receive()
+        self.assertEqual(received[0].msg, {'X': 1.5})
+        self.assertEqual(received[1:], ['ok', 'last', SENTINEL])
+
+    def test_ring_wraps_around(self):
+        for i in range(500):
+            self.frontend.send('G0 X{}'.format(i))
+            self.assertEqual(self.backend.receive(), ['G0 X{}'.format(i)])
+
+    def test_full_ring(self):
+        ring = self.channel.to_backend
+        self.assertTrue(ring.write(bytes(3000), timeout=0))
+        self.assertFalse(ring.write(bytes(2000), timeout=0.01))
+        ring.read_all()
+        self.assertTrue(ring.write(bytes(2000), timeout=0))
+        with self.assertRaises(ValueError):
+            ring.write(bytes(5000))
+
+    def test_wakeup(self):
+        timer = tr.Timer(0.05, self.backend.send, args=('woken',))
+        timer.start()
+        self.assertTrue(self.frontend.wait_for_message(5))
+        self.assertEqual(self.frontend.receive(), ['woken'])
+        self.assertFalse(self.frontend.wait_for_message(0.01))
+
+    def test_handshake_with_backend_process(self):
+        backend = mp.Process(target=_echo_backend, args=(self.backend,))
+        backend.start()
+        self.frontend.handshake()
+        self.frontend.send(['M114', 'G28'])
+        self.assertTrue(self.frontend.wait_for_message(5))
+        self.assertEqual(self.frontend.receive(), ['M114', 'G28'])
+        self.frontend.send_sentinel()
+        backend.join(5)
+        self.assertEqual(backend.exitcode, 0)
+        self.assertFalse(self.frontend.is_connected)
+
+
+class TestSocketConnection(unittest.TestCase):
+    """Test the socket connection with several clients."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.address = os.path.join(self.tmp, 'backend.sock')
+        self.backend = SocketConnection(self.address, 'BACKEND')
+        self.backend.__init_lock__()
+        self.clients = [SocketConnection(self.address, 'FRONTEND', connect_timeout=5) for _ in range(2)]
+        for client in self.clients:
+            client.handshake()
+        self.backend.handshake()
+
+    def tearDown(self):
+        for client in self.clients:
+            client.disconnect()
+        self.backend.disconnect()
+        shutil.rmtree(self.tmp)
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('localhost:8765'), (socket.AF_INET, ('localhost', 8765)))
+        self.assertEqual(parse_address(':8765'), (socket.AF_INET, ('127.0.0.1', 8765)))
+        self.assertEqual(parse_address('/tmp/backend.sock'), (socket.AF_UNIX, '/tmp/backend.sock'))
+        self.assertEqual(parse_address('[::1]:8765'), (socket.AF_INET6, ('::1', 8765)))
+        with self.assertRaises(ValueError):
+            parse_address('0.0.0.0:8765')
+        self.assertEqual(parse_address('0.0.0.0:8765', allow_remote=True), (socket.AF_INET, ('0.0.0.0', 8765)))
+
+    def test_untrusted_clients(self):
+        self.assertEqual(os.stat(self.address).st_mode & 0o777, 0o600)
+        frames = [
+            PipeCom.encode_frame([Hello(), ['G28']]),  # Pickled item
+            PipeCom.encode_frame([Hello(), Message(exit_code=0, msg='', command_id='G0', command={'G0': {}})]),  # Pickled payload
+        ]
+        for frame in frames:
+            with socket.socket(socket.AF_UNIX) as sock:
+                sock.connect(self.address)
+                sock.settimeout(5)
+                sock.sendall(struct.pack('<I', len(frame)) + frame)
+                self.assertEqual(sock.recv(1024), b'')  # Dropped before the handshake is answered
+        with socket.socket(socket.AF_UNIX) as sock:
+            sock.connect(self.address)
+            sock.settimeout(5)
+            sock.sendall(struct.pack('<I', 1 << 31))
+            self.assertEqual(sock.recv(1024), b'')
+        self.assertFalse(self.backend.message_waiting())
+
+    def test_commands_of_all_clients(self):
+        self.clients[0].send('M114')
+        self.assertTrue(self.backend.wait_for_message(5))
+        self.clients[1].send(['G28', 'M105'])
+        etime = time.monotonic() + 5
+        received = []
+        while len(received) < 3 and time.monotonic() < etime:
+            if self.backend.wait_for_message(0.1):
+                received.extend(self.backend.receive())
+        self.assertEqual(received, ['M114', 'G28', 'M105'])
+
+    def test_broadcast(self):
+        self.backend.send(Message(exit_code=0, msg={'X': 2.5}, command_id='M154', command='M114'))
+        for client in self.clients:
+            self.assertTrue(client.wait_for_message(5))
+            self.assertEqual(client.receive()[0].msg, {'X': 2.5})
+
+    def test_sentinel_of_last_client(self):
+        self.clients[0].send_sentinel()
+        self.clients[1].send('M114')
+        self.assertTrue(self.backend.wait_for_message(5))
+        self.assertEqual(self.backend.receive(), ['M114'])
+
+        self.clients[1].send_sentinel()
+        self.assertTrue(self.backend.wait_for_message(5))
+        self.assertEqual(self.backend.receive(), [SENTINEL])
+
+    def test_heartbeat_per_client(self):
+        lost = tr.Event()
+        for client in self.clients:
+            client.start_heartbeat(0.02)
+        self.assertIsNone(self.backend.start_heartbeat(0.02, missed=3, on_lost=lost.set))
+        etime = time.monotonic() + 0.2
+        while time.monotonic() < etime:
+            for client in self.clients:
+                client.receive()
+            time.sleep(0.005)
+        self.assertFalse(lost.is_set())
+
+        # The first client stops beating while the second keeps beating
+        self.clients[0].stop_heartbeat()
+        etime = time.monotonic() + 2
+        while not lost.is_set() and time.monotonic() < etime:
+            self.clients[1].receive()
+            time.sleep(0.005)
+        self.assertTrue(lost.is_set())
+
+        # The backend dropped the silent client
+        etime = time.monotonic() + 2
+        while self.clients[0].is_connected and time.monotonic() < etime:
+            self.clients[0].wait_for_message(0.05)
+            self.clients[0].receive()
+        self.assertFalse(self.clients[0].is_connected)
+
+        self.clients[1].send('M114')
+        self.assertTrue(self.backend.wait_for_message(5))
+        self.assertEqual(self.backend.receive(), ['M114'])
+        self.assertFalse(self.clients[1].heartbeat.lost)
+
+    def test_tcp(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        backend = SocketConnection('127.0.0.1:{}'.format(port), 'BACKEND')
+        backend.__init_lock__()
+        client = SocketConnection('127.0.0.1:{}'.format(port), 'FRONTEND', connect_timeout=5)
+        client.handshake()
+        backend.send('ok')
+        self.assertTrue(client.wait_for_message(5))
+        self.assertEqual(client.receive(), ['ok'])
+        client.disconnect()
+        backend.disconnect()
+
+
+class TestHandshake(unittest.TestCase):
+    """Test the versioned handshake with the capabilities of the backend."""
+
+    def setUp(self):
+        to_proc, from_proc = mp.Pipe()
+        self.frontend = PipelineConnection(from_proc, 'FRONTEND')
+        self.backend = PipelineConnection(to_proc, 'BACKEND')
+        self.backend.__init_lock__()
+        self.capabilities = Capabilities(axes=('X', 'Y'), opcodes=('G0', 'M114'), topics=('responses',))
+
+    def tearDown(self):
+        self.frontend.disconnect()
+        self.backend.disconnect()
+
+    def _backend_handshake(self, delay: float = 0) -> tr.Thread:
+        def run():
+            time.sleep(delay)
+            self.backend.handshake(self.capabilities)
+        thread = tr.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def test_capabilities(self):
+        backend = self._backend_handshake()
+        self.frontend.handshake()
+        backend.join(5)
+        self.assertEqual(self.frontend.protocol_version, hs.PROTOCOL_VERSION)
+        self.assertEqual(self.frontend.capabilities.axes, ('X', 'Y'))
+        self.assertTrue(self.frontend.supports('G0'))
+        self.assertFalse(self.frontend.supports('G28'))
+        with self.assertRaises(ValueError):
+            self.frontend.subscribe(['positions'])
+
+    def test_backoff(self):
+        backend = self._backend_handshake(delay=0.3)
+        with patch.object(self.frontend, 'send', wraps=self.frontend.send) as send:
+            self.frontend.handshake()
+        backend.join(5)
+        # Greeted again after 0.02, 0.06, 0.14, 0.3 and 0.62 seconds at most
+        self.assertLessEqual(send.call_count, 6)
+
+        # The repeated greetings are not passed on as commands
+        self.frontend.send('M114')
+        received = []
+        while self.backend.wait_for_message(0.1):
+            received.extend(self.backend.receive())
+        self.assertEqual(received, ['M114'])
+
+    def test_version_mismatch(self):
+        self.assertIsNotNone(hs.answer(Hello(version=1), self.capabilities).error)
+        with patch.object(hs, 'PROTOCOL_VERSION', hs.PROTOCOL_VERSION + 1):
+            self._backend_handshake()
+            with self.assertRaises(HandshakeError):
+                self.frontend.handshake()
+        self.assertFalse(self.backend.handshake_complete)
+
+    def test_legacy_greeting(self):
+        backend = self._backend_handshake()
+        self.frontend.send(hs.LEGACY_HELLO)
+        self.assertTrue(self.frontend.wait_for_message(5))
+        self.assertEqual(self.frontend.receive(), [hs.LEGACY_REPLY])
+        backend.join(5)
+        self.assertEqual(self.backend.protocol_version, 1)
+
+
+class TestHeartbeat(unittest.TestCase):
+    """Test the heartbeats of a connection."""
+
+    def setUp(self):
+        to_proc, from_proc = mp.Pipe()
+        self.frontend = PipelineConnection(from_proc, 'FRONTEND')
+        self.backend = PipelineConnection(to_proc, 'BACKEND')
+        self.backend.__init_lock__()
+        self.lost = tr.Event()
+
+    def tearDown(self):
+        self.frontend.disconnect()
+        self.backend.disconnect()
+
+    def _receive(self, duration, connectors):
+        """Keep receiving on the connectors, the beats are taken on receive."""
+        received = []
+        etime = time.monotonic() + duration
+        while time.monotonic() < etime:
+            for connector in connectors:
+                received.extend(connector.receive() or [])
+            time.sleep(0.002)
+        return received
+
+    def test_beat_codec(self):
+        data = MessageCodec().encode_item(Beat(7, 10, 5, 2))
+        self.assertLess(len(data), 40)
+        beat, = MessageCodec.decode_items(data)[0]
+        self.assertEqual((beat.sequence, beat.sent_ns, beat.echo_ns, beat.hold_ns), (7, 10, 5, 2))
+
+    def test_round_trip_time(self):
+        self.frontend.start_heartbeat(0.02)
+        self.backend.start_heartbeat(0.02)
+        # The beats are not passed on as received items
+        self.assertEqual(self._receive(0.3, [self.frontend, self.backend]), [])
+        for connector in (self.frontend, self.backend):
+            self.assertGreater(connector.heartbeat.received, 5)
+            self.assertGreater(connector.heartbeat.rtt, 0)
+            self.assertLess(connector.heartbeat.rtt, 0.1)
+            self.assertFalse(connector.heartbeat.lost)
+
+    def test_lost(self):
+        self.frontend.start_heartbeat(0.02)
+        heartbeat = self.backend.start_heartbeat(0.02, missed=3, on_lost=self.lost.set)
+        self._receive(0.1, [self.frontend, self.backend])
+
+        # The frontend stops beating, the backend notices within the missed beats
+        self.frontend.stop_heartbeat()
+        start = time.monotonic()
+        while not self.lost.is_set() and time.monotonic() - start < 2:
+            self.backend.receive()
+            time.sleep(0.002)
+        self.assertTrue(heartbeat.lost)
+        self.assertLess(time.monotonic() - start, heartbeat.timeout + 2 * heartbeat.interval + 0.05)
+
+        # Beating again restores the connection
+        self.frontend.start_heartbeat(0.02)
+        self._receive(0.1, [self.backend])
+        self.assertFalse(heartbeat.lost)
+
+    def test_silent_peer(self):
+        heartbeat = self.backend.start_heartbeat(0.01, missed=2, on_lost=self.lost.set)
+        self._receive(0.1, [self.frontend, self.backend])
+        self.assertFalse(heartbeat.lost)
+        self.assertFalse(self.lost.is_set())
+        self.assertIsNone(heartbeat.rtt)
+
+
+class TestTopics(unittest.TestCase):
+    """Test the topic subscriptions."""
+
+    def setUp(self):
+        to_proc, from_proc = mp.Pipe()
+        self.frontend = PipelineConnection(from_proc, 'FRONTEND')
+        self.backend = PipelineConnection(to_proc, 'BACKEND')
+        self.backend.__init_lock__()
+        self.position = Message(exit_code=0, msg={'X': 1.0}, command_id='M154', command='M114')
+        self.response = Message(exit_code=0, msg='', command_id='G28')
+
+    def tearDown(self):
+        self.frontend.disconnect()
+        self.backend.disconnect()
+
+    def test_topic_of(self):
+        self.assertEqual(topic_of(self.position), TOPIC_POSITIONS)
+        self.assertEqual(topic_of(self.response), TOPIC_RESPONSES)
+        self.assertEqual(topic_of(Message(exit_code=0, msg='', command_id='M113')), TOPIC_SYSTEM)
+        self.assertIsNone(topic_of('Hello there.'))
+        with self.assertRaises(ValueError):
+            Subscription(['positions', 'unknown'])
+
+    def test_subscribe(self):
+        self.assertTrue(self.backend.has_subscribers(TOPIC_POSITIONS))
+        self.frontend.subscribe([TOPIC_RESPONSES])
+        self.frontend.send('M114')
+        self.assertEqual(self.backend.receive(), ['M114'])
+        self.assertFalse(self.backend.has_subscribers(TOPIC_POSITIONS))
+
+        with patch.object(self.backend._codec, 'encode', wraps=self.backend._codec.encode) as encode:
+            self.backend.send([self.position, self.response, 'ok'])
+            self.assertEqual(encode.call_count, 1)
+        self.assertEqual([getattr(i, 'command_id', i) for i in self.frontend.receive()], ['G28', 'ok'])
+
+        # Nothing is sent when no item is subscribed
+        self.backend.send(self.position)
+        self.assertFalse(self.frontend.message_waiting())
+
+        self.frontend.subscribe(None)
+        self.backend.receive()
+        self.assertTrue(self.backend.has_subscribers(TOPIC_POSITIONS))
+
+    def test_socket_clients(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        address = os.path.join(tmp, 'backend.sock')
+        backend = SocketConnection(address, 'BACKEND')
+        backend.__init_lock__()
+        self.addCleanup(backend.disconnect)
+        self.assertFalse(backend.has_subscribers(TOPIC_RESPONSES))
+        clients = [SocketConnection(address, 'FRONTEND', connect_timeout=5) for _ in range(2)]
+        for client, topics in zip(clients, ([TOPIC_POSITIONS], [TOPIC_RESPONSES])):
+            self.addCleanup(client.disconnect)
+            client.handshake()
+            client.subscribe(topics)
+
+        etime = time.monotonic() + 5
+        while backend.has_subscribers(TOPIC_SYSTEM) and time.monotonic() < etime:
+            time.sleep(0.01)
+        self.assertFalse(backend.has_subscribers(TOPIC_SYSTEM))
+        self.assertTrue(backend.has_subscribers(TOPIC_POSITIONS))
+
+        backend.send([self.position, self.response])
+        for client, command_id in zip(clients, ('M154', 'G28')):
+            self.assertTrue(client.wait_for_message(5))
+            self.assertEqual([i.command_id for i in client.receive()], [command_id])
+
+
+class TestCommandCoalescer(unittest.TestCase):
+    """Test the coalescing of the velocity updates."""
+
+    def setUp(self):
+        self.now = 0.0
+        self.coalescer = CommandCoalescer(min_interval=0.1, monotonic=lambda: self.now)
+
+    def test_split_and_join(self):
+        self.assertEqual(split_command('M812 X10 Y2.5'), ('M812', {'X': 10.0, 'Y': 2.5}))
+        self.assertEqual(join_command('M812', {'X': 10.0, 'Y': 2.5}), 'M812 X10.0 Y2.5')
+        for line in ['G0 X10', 'M812 Xfast', '', Subscription(None)]:
+            self.assertIsNone(split_command(line))
+
+    def test_merge_per_axis(self):
+        self.assertFalse(self.coalescer.holds('M812'))
+        for value in range(10):
+            self.assertTrue(self.coalescer.add_line('M812 X{0} Y{0}'.format(value)))
+        self.assertTrue(self.coalescer.add_line('M812 K3'))
+        self.assertFalse(self.coalescer.add_line('G0 X1'))
+        self.assertEqual(self.coalescer.merged, 18)
+        self.assertTrue(self.coalescer.holds('M812'))
+        self.assertEqual(self.coalescer.release_lines(), ['M812 X9.0 Y9.0 K3.0'])
+        self.assertFalse(self.coalescer.waiting)
+
+    def test_rate(self):
+        self.coalescer.add_line('M812 X1')
+        self.assertTrue(self.coalescer.due())  # The first update is not delayed
+        self.assertEqual(len(self.coalescer.release(force=False)), 1)
+
+        self.coalescer.add_line('M812 X2')
+        self.assertFalse(self.coalescer.due())
+        self.assertEqual(self.coalescer.release(force=False), [])
+        self.now += 0.1
+        self.assertTrue(self.coalescer.due())
+        self.assertEqual(self.coalescer.release(force=False), [('M812', {'X': 2.0})])
+
+
+class TestTelemetryOutbox(unittest.TestCase):
+    """Test the latest wins outbox of the telemetry."""
+
+    def test_latest_wins(self):
+        connector = MagicMock(backlog=1 << 20, is_connected=True)
+        outbox = TelemetryOutbox(connector, max_backlog=0)
+        self.addCleanup(outbox.close)
+        for i in range(10):
+            outbox.send(Message.report(0, 'M154', {'X': float(i)}, 'M114'))
+        outbox.send(Message.report(0, 'M155', {'L': {'current': 21.5, 'target': None}}, 'M105'))
+        outbox.send(Message.report(1, 'G28', 'Homing failed'))
+
+        # The response is sent straight away, the telemetry waits for the backlog
+        time.sleep(0.05)
+        connector.send.assert_called_once()
+        self.assertEqual(connector.send.call_args[0][0].command_id, 'G28')
+        self.assertEqual(outbox.waiting, 2)
+        self.assertEqual(outbox.replaced, 9)
+
+        connector.backlog = 0
+        etime = time.monotonic() + 2
+        while connector.send.call_count < 2 and time.monotonic() < etime:
+            time.sleep(0.01)
+        sent = connector.send.call_args[0][0]
+        self.assertEqual([m.command_id for m in sent], ['M154', 'M155'])
+        self.assertEqual(sent[0].msg, {'X': 9.0})
+
+    def test_slow_frontend(self):
+        to_proc, from_proc = mp.Pipe()
+        frontend = PipelineConnection(from_proc, 'FRONTEND')
+        backend = PipelineConnection(to_proc, 'BACKEND')
+        backend.__init_lock__()
+        self.addCleanup(backend.disconnect)
+        self.addCleanup(frontend.disconnect)
+        if backend.backlog is None:
+            self.skipTest('The backlog of a pipe is not known on this platform')
+
+        # The frontend does not read while the backend reports, the pipe only holds a few reports
+        outbox = TelemetryOutbox(backend)
+        self.addCleanup(outbox.close)
+        for i in range(2000):
+            outbox.send(Message.report(0, 'M154', {'X': float(i)}, 'M114'))
+        time.sleep(0.1)
+        self.assertLessEqual(backend.backlog, 2 * 8192)
+
+        received = []
+        etime = time.monotonic() + 2
+        while time.monotonic() < etime and (not received or received[-1].msg['X'] != 1999.0):
+            if frontend.wait_for_message(0.1):
+                received.extend(frontend.receive())
+        self.assertEqual(received[-1].msg, {'X': 1999.0})
+        self.assertLess(len(received), 100)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
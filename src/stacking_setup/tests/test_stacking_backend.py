@@ -2,6 +2,10 @@ import unittest
 from unittest.mock import MagicMock, patch, PropertyMock, Mock
 import multiprocessing as mp
 import configparser
+import threading as tr
+import time
+import tempfile
+import shutil
 from typing import List
 
 #Following lines are for assigning parent directory dynamically.
@@ -13,9 +17,49 @@ sys.path.insert(0, parent_dir_path)
 # The code to be tested
 from components.stacking_backend.stacking_setup import StackingSetupBackend
 from components.stacking_backend.components.base import Base
+from components.stacking_backend.components.base_stepper import BaseStepper
+from components.stacking_backend.components.PIA13 import PIA13
 from components.stacking_backend.configs.settings import Settings
 from components.stacking_backend.exceptions import NotSupportedError
 from components.stacking_backend.configs.accepted_commands import ACCEPTED_COMMANDS, ACCEPTED_LINEAR_AXES, ACCEPTED_ROTATIONAL_AXES
+from components.stacking_backend import clock
+from components.stacking_backend.controllers.main_xy_controller import MainXYController
+from components.stacking_backend.simulation import SimulatedSerial, SimulatedMainXYSerial
+from components.stacking_backend import serial_trace
+from components.stacking_backend.bring_up import BringUpGraph
+from components.stacking_backend.exceptions import AxisNotReadyError, HardwareNotConnectedError
+from components.stacking_backend import machine_state
+from components.stacking_backend.parameter_cache import ParameterCache
+from components.stacking_middleware.telemetry import TelemetryBlock
+
+
+class PipeEnd:
+    """
+    End of a multiprocessing pipe with the connection state of a middleware connector.
+
+    The backend checks ``is_connected`` before sending the periodic
+    reports, a raw pipe end does not have that attribute.
+    """
+
+    telemetry = None
+    backlog = None
+
+    def __init__(self, connection) -> ...:
+        """Wrap the pipe end."""
+        self._connection = connection
+
+    def has_subscribers(self, topic: str) -> bool:
+        """A raw pipe end sends all the topics."""
+        return True
+
+    @property
+    def is_connected(self) -> bool:
+        """Check if the pipe end is still open."""
+        return not self._connection.closed
+
+    def __getattr__(self, name: str):
+        """Pass the other attributes on to the pipe end."""
+        return getattr(self._connection, name)
 
 
 def mock_pia13(id) -> MagicMock:
@@ -205,14 +249,34 @@ class TestControlBackend(unittest.TestCase):
             Because patching is used to prevent the backend from connecting
             to the hardware the backend is not started in the setUp.
         """
-        self.to_main, self.to_proc = mp.Pipe()
+        to_main, self.to_proc = mp.Pipe()
+        self.to_main = PipeEnd(to_main)
         
     def tearDown(self) -> ...:
         """Clean up after the test."""
+        # Let the command threads finish sending first, otherwise a late message
+        # can end up in the pipe of the next test (the handle nr is reused)
+        for thread in tr.enumerate():
+            if thread.name.endswith('(_threaded_excecution)'):
+                thread.join(timeout=1)
+
         # Close the pipes
         self.to_main.close()
         self.to_proc.close()
         
+    @patch.object(StackingSetupBackend, '_init_all_hardware', return_value=_get_hardware_mocks())
+    def test_component_connect_timeout(self, _init_all_hardware_mock) -> ...:
+        """Test that a part that connects slower than its connect_timeout setting fails the bring up."""
+        settings = Settings()
+        settings._config['PIA13.X']['connect_timeout'] = '0.05'
+        _init_all_hardware_mock.return_value[0].connect.side_effect = lambda: time.sleep(0.5)
+        stack = StackingSetupBackend(self.to_main, settings)
+
+        with self.assertRaises(HardwareNotConnectedError):
+            stack.setup_backend(settings)
+        self.assertEqual(stack._startup_report['steps']['X']['status'], BringUpGraph.TIMEOUT)
+        self.assertEqual(stack._startup_report['steps']['Y']['status'], BringUpGraph.OK)
+
     @patch.object(StackingSetupBackend, '_init_all_hardware', return_value=_get_hardware_mocks())
     def test_connect_hardware(self, _init_all_hardware_mock) -> ...:
         """
@@ -384,6 +448,73 @@ class TestControlBackend(unittest.TestCase):
         self.assertEqual(pipe_msg.msg, '')
         self.assertEqual(pipe_msg.exit_code, 0)
 
+    # Test the coalescing of the velocity updates
+    @patch.object(StackingSetupBackend, 'G0', return_value=(0, None))
+    @patch.object(StackingSetupBackend, 'M812', return_value=(0, None))
+    @patch.object(StackingSetupBackend, '_init_all_hardware', return_value=_get_hardware_mocks())
+    def test_coalesce_M812(self, _init_all_hardware_mock, M812_mock, G0_mock) -> ...:
+        """A burst of velocity updates is applied once with the latest value per axis, before the next command."""
+        stack = StackingSetupBackend(self.to_main)
+        stack.setup_backend(Settings())
+
+        for i in range(20):
+            stack._execute_or_coalesce({'M812': {'X': float(i), 'L': 2.0 * i}})
+        stack._execute_or_coalesce({'M812': {'Y': 5.0}})
+        M812_mock.assert_not_called()
+
+        # Every merged command is acknowledged
+        acknowledgements = [self.to_proc.recv() for _ in range(20)]
+        self.assertEqual({(m.command_id, m.exit_code) for m in acknowledgements}, {('M812', 0)})
+        self.assertFalse(self.to_proc.poll())
+
+        stack._execute_or_coalesce({'G0': {'X': 1}})
+        for thread in tr.enumerate():
+            if thread.name.endswith('(_threaded_excecution)'):
+                thread.join(timeout=1)
+        M812_mock.assert_called_once_with({'X': 19.0, 'L': 38.0, 'Y': 5.0})
+        G0_mock.assert_called_once()
+
+        # The next update waits for the rate limit
+        stack._execute_or_coalesce({'M812': {'X': 1.0}})
+        self.assertFalse(stack._coalescer.due())
+        self.assertTrue(stack._coalescer.waiting)
+
+    def test_capabilities(self) -> ...:
+        """The handshake announces the enabled axes and the implemented commands."""
+        settings = Settings()
+        capabilities = StackingSetupBackend(self.to_main)._capabilities(settings)
+        self.assertTrue({'G0', 'G28', 'M114', 'M154', 'M812'}.issubset(capabilities.opcodes))
+        self.assertFalse(capabilities.supports('setup_backend'))
+        self.assertFalse(capabilities.supports('M92'))  # A method without a dispatch
+        for command_id in capabilities.opcodes:
+            self.assertTrue(callable(getattr(StackingSetupBackend, command_id)))
+        self.assertEqual('K' in capabilities.axes, bool(settings.get('TANGODESKTOP.K', 'enabled')))
+
+    @patch.object(StackingSetupBackend, 'M0', return_value=(0, 'Machine stopped.'))
+    @patch.object(StackingSetupBackend, '_init_all_hardware', return_value=_get_hardware_mocks())
+    def test_stop_for_lost_frontend(self, _init_all_hardware_mock, M0_mock) -> ...:
+        """All movement stops when the frontend stopped sending heartbeats."""
+        stack = StackingSetupBackend(self.to_main)
+        stack.setup_backend(Settings())
+        stack._stop_for_lost_frontend()
+        M0_mock.assert_called_once()
+
+    # Test that the response carries the request id of the command
+    @patch.object(StackingSetupBackend, 'G0', return_value=(0, None))
+    @patch.object(StackingSetupBackend, '_init_all_hardware', return_value=_get_hardware_mocks())
+    def test_request_id(self, _init_all_hardware_mock, G0_mock) -> ...:
+        """A numbered command is answered with its line number, an unnumbered one without."""
+        stack = StackingSetupBackend(self.to_main)
+        stack.setup_backend(Settings())
+
+        stack._execute_or_coalesce({'G0': {'X': 1}}, request_id=7)
+        stack._check_command_output()
+        self.assertEqual(self.to_proc.recv().request_id, 7)
+
+        stack._execute_or_coalesce({'G0': {'X': 1}})
+        stack._check_command_output()
+        self.assertIsNone(self.to_proc.recv().request_id)
+
 
 class TestMovementCommands(unittest.TestCase):
     """
@@ -394,7 +525,8 @@ class TestMovementCommands(unittest.TestCase):
 
     def setUp(self) -> ...:
         """Create the backend for testing."""
-        self.to_main, self.to_proc = mp.Pipe()
+        to_main, self.to_proc = mp.Pipe()
+        self.to_main = PipeEnd(to_main)
         
     def tearDown(self) -> ...:
         """Clean up after testing."""
@@ -566,7 +698,8 @@ class TestMachineCommands(unittest.TestCase):
 
     def setUp(self) -> ...:
         """Set up the stacking backend."""
-        self.to_main, self.to_proc = mp.Pipe()
+        to_main, self.to_proc = mp.Pipe()
+        self.to_main = PipeEnd(to_main)
         self.settings = configparser.ConfigParser()
         
     def tearDown(self) -> ...:
@@ -681,6 +814,29 @@ class TestMachineCommands(unittest.TestCase):
         self.assertEqual(exit_code, 0)
         self.assertEqual(msg, 1)
 
+    @patch.object(StackingSetupBackend, '_init_all_hardware', return_value=_get_hardware_mocks())
+    def test_M154_telemetry_block(self, _init_all_hardware_mock) -> ...:
+        """Test that the auto reports are published in the telemetry block instead of the pipe."""
+        block = TelemetryBlock.create()
+        self.addCleanup(block.close)
+        self.to_main.telemetry = block
+        stack = StackingSetupBackend(self.to_main)
+        stack.setup_backend(Settings())
+
+        stack.M154({'S': 0.01})
+        stack.M155({'S': 0.01})
+        etime = time.monotonic() + 5
+        while not block.read()['temperatures'] and time.monotonic() < etime:
+            time.sleep(0.01)
+        stack.M154({'S': 0})
+        stack.M155({'S': 0})
+
+        snapshot = block.read()
+        self.assertEqual(snapshot['positions'], {'X': 0, 'Y': 0, 'Z': 0, 'L': 0, 'H': 0, 'J': 0})
+        self.assertEqual(snapshot['temperatures'], {'K': {'current': 0, 'target': 10}})
+        while self.to_proc.poll():
+            self.assertNotIn(getattr(self.to_proc.recv(), 'command_id', None), ('M154', 'M155'))
+
     @patch.object(StackingSetupBackend, '_init_all_hardware', return_value=_get_hardware_mocks())
     def test_M155(self, _init_all_hardware_mock) -> ...:
         """Test the M155 command."""
@@ -752,6 +908,35 @@ class TestSettings(unittest.TestCase):
         with self.assertRaises(KeyError):
             self.settings.set('PIA13.DEFAULT', key='L', value=10)
 
+    def test_section_snapshot(self) -> ...:
+        """Test that a section is compiled once with the default values resolved."""
+        section = self.settings.section('PIA13.X')
+        self.assertIs(self.settings.section('PIA13.X'), section)
+        self.assertEqual(section['max_vel'], 40)
+        self.assertTrue(section['enabled'])
+        with self.assertRaises(TypeError):
+            section['max_vel'] = 10
+        with self.assertRaises(KeyError):
+            section['test']
+
+    def test_section_recompiled_after_change(self) -> ...:
+        """Test that a changed setting is used after the next compile."""
+        section = self.settings.section('PIA13.X')
+        self.settings._config['PIA13.X']['max_vel'] = '20'
+
+        self.assertEqual(section['max_vel'], 40)  # The old snapshot does not change
+        self.assertEqual(self.settings.section('PIA13.X')['max_vel'], 20)
+        self.assertEqual(self.settings.get('PIA13.X', 'max_vel'), 20)
+
+    def test_schema_validation(self) -> ...:
+        """Test that a value of the wrong type is refused when loading the file."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'wrong.ini')
+            with open(path, 'w') as f:
+                f.write("[PIA13.DEFAULT]\nmax_vel = 'fast'\n")
+            with self.assertRaises(TypeError):
+                Settings(path)
+
     def test_save(self) -> ...:
         """Test saving the settings."""
         self.settings.set('PIA13.Z', key='l', value=1)
@@ -769,6 +954,617 @@ class TestSettings(unittest.TestCase):
         self.assertEqual(new_settings.get('PIA13.Z', 'l'), 1)
 
 
+class TestSettingsReload(unittest.TestCase):
+    """Test reloading the settings while the backend is running (M501)."""
+
+    def setUp(self) -> ...:
+        """Copy the simulation settings and create a backend with two base steppers."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'settings.ini')
+        configs = os.path.dirname(sys.modules[Settings.__module__].__file__)
+        shutil.copy(os.path.join(configs, 'simulation_config.ini'), self.path)
+
+        self.settings = Settings(self.path)
+        self.backend = StackingSetupBackend(MagicMock(), settings=self.settings)
+        self.backend._controllers = {}
+        self.backend._snapshot_interval = 10
+        self.steppers = [BaseStepper(self.settings, MagicMock(), id, mp.Event()) for id in ('H', 'J')]
+        self.backend._hardware = self.steppers
+
+    def tearDown(self) -> ...:
+        """Remove the copied settings."""
+        self.tmp_dir.cleanup()
+
+    def _change(self, section: str, **keys) -> ...:
+        """Change keys in the settings file."""
+        config = configparser.ConfigParser()
+        config.read(self.path)
+        for key, value in keys.items():
+            config[section][key] = value
+        with open(self.path, 'w') as f:
+            config.write(f)
+
+    def test_apply_live_settings(self) -> ...:
+        """Test that the safe settings are applied and the others reported."""
+        self._change('BASESTEPPER.DEFAULT', max_vel='100', steps_per_um='10')
+        self._change('BASESTEPPER.J', max_vel='50')
+        self._change('SNAPSHOT.DEFAULT', interval='5')
+
+        exit_code, msg = self.backend.M501()
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(msg['applied'], {
+            'BASESTEPPER.DEFAULT': ['max_vel'], 'BASESTEPPER.J': ['max_vel'], 'SNAPSHOT.DEFAULT': ['interval']
+        })
+        self.assertEqual(msg['reconnect'], {'BASESTEPPER.DEFAULT': ['steps_per_um']})
+        self.assertEqual([i._max_speed for i in self.steppers], [100, 50])
+        self.assertEqual(self.steppers[0]._steps_per_um, 78.125)
+        self.assertEqual(self.backend._snapshot_interval, 5)
+
+    def test_invalid_file_keeps_settings(self) -> ...:
+        """Test that a file with a wrong value is refused and the running settings are kept."""
+        self._change('BASESTEPPER.DEFAULT', max_vel="'fast'")
+
+        exit_code, msg = self.backend.M501()
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(self.settings.get('BASESTEPPER.H', 'max_vel'), 400)
+        self.assertEqual(self.steppers[0]._max_speed, 400)
+
+
+class TestClock(unittest.TestCase):
+    """Test the real and virtual clock."""
+
+    def tearDown(self) -> ...:
+        """Restore the real clock and power cycle the simulated hardware."""
+        clock.set_clock(None)
+        SimulatedSerial.reset_devices()
+
+    def test_real_clock_is_default(self) -> ...:
+        """Test that the real clock is used by default."""
+        self.assertIsInstance(clock.get_clock(), clock.RealClock)
+        start = clock.monotonic()
+        clock.sleep(0.01)
+        self.assertGreaterEqual(clock.monotonic() - start, 0.01)
+
+    def test_virtual_sleep(self) -> ...:
+        """Test that a virtual sleep returns immediately and advances the time."""
+        clock.set_clock(clock.VirtualClock())
+        start = time.perf_counter()
+        clock.sleep(3600)
+        self.assertEqual(clock.monotonic(), 3600)
+        self.assertLess(time.perf_counter() - start, 1)
+
+    def test_virtual_wake_up_order(self) -> ...:
+        """Test that sleeping threads wake up in order of their wake up time."""
+        virtual = clock.VirtualClock()
+        woken = []
+
+        def sleeper(seconds):
+            virtual.sleep(seconds)
+            woken.append((seconds, virtual.monotonic()))
+
+        threads = [tr.Thread(target=sleeper, args=(i,)) for i in (30, 10, 20)]
+        for thread in threads:
+            virtual.register(thread)
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        self.assertEqual(woken, [(10, 10), (20, 20), (30, 30)])
+
+    def test_simulated_zeroing_in_virtual_time(self) -> ...:
+        """Test that the simulated base stage zeroes without waiting for it."""
+        clock.set_clock(clock.VirtualClock())
+        controller = MainXYController(Settings('simulation_config.ini'), mp.Event())
+
+        start = time.perf_counter()
+        controller.connect()
+        controller.zero()
+        self.assertTrue(controller.is_homed)
+        self.assertGreater(clock.monotonic(), 5)
+        self.assertLess(time.perf_counter() - start, 5)
+
+
+class TestBackgroundZeroing(unittest.TestCase):
+    """Test zeroing the base stage in the background."""
+
+    def setUp(self) -> ...:
+        """Use the virtual clock so zeroing does not take real time."""
+        clock.set_clock(clock.VirtualClock())
+
+    def tearDown(self) -> ...:
+        """Restore the real clock and power cycle the simulated hardware."""
+        clock.set_clock(None)
+        SimulatedSerial.reset_devices()
+
+    def _controller(self, policy: str) -> MainXYController:
+        """Create a simulated base controller with the given not ready policy."""
+        settings = Settings('simulation_config.ini')
+        settings._config['MAINXYCONTROLLER.DEFAULT']['not_ready_policy'] = repr(policy)
+        return MainXYController(settings, mp.Event())
+
+    def test_usable_while_zeroing(self) -> ...:
+        """Test that connect returns directly and the heater can be used while zeroing."""
+        controller = self._controller('reject')
+        controller.connect()
+
+        self.assertEqual(controller.axis_states, {'x': 'zeroing', 'y': 'zeroing'})
+        self.assertIsInstance(controller.temperature, float)
+        with self.assertRaises(AxisNotReadyError):
+            controller.move_by('H', 100)
+
+        controller.wait_until_zeroed()
+        self.assertTrue(controller.is_ready('H'))
+        self.assertTrue(controller.is_ready('J'))
+        self.assertTrue(controller.is_zeroed)
+
+    def test_queue_until_ready(self) -> ...:
+        """Test that a move to an axis that is zeroing waits until it is ready."""
+        controller = self._controller('queue')
+        controller.connect()
+        controller.move_to('J', 100)
+
+        self.assertTrue(controller.is_ready('J'))
+        self.assertTrue(controller.wait_for_motion('J', 5))
+        self.assertEqual(int(controller.get_position('J')), 100)
+
+    def test_invalid_policy(self) -> ...:
+        """Test that an unknown not ready policy is refused."""
+        with self.assertRaises(ValueError):
+            self._controller('wait')
+
+    def test_split_endpos_line(self) -> ...:
+        """Test that an ENDPOS line split between two reads is still handled."""
+        class ChunkedSerial:
+            """Serial port that returns the answer to a write in the given chunks."""
+            def __init__(self, chunks: list) -> ...:
+                self.chunks = chunks
+                self.received = []
+
+            @property
+            def in_waiting(self) -> int:
+                return len(self.received[0]) if self.received else 0
+
+            def read(self, size: int = 1) -> bytes:
+                if not self.received:
+                    clock.sleep(0.001)
+                    return b""
+                return self.received.pop(0)
+
+            def write(self, data: bytes) -> ...:
+                self.received += self.chunks
+
+        controller = self._controller('reject')
+        controller._axis_state['x'] = controller.ZEROING
+        controller._ser = ChunkedSerial([b"ENDPOS", b" X\r\nO", b"K\r\n"])
+        lines = []
+        controller.subscribe(lines.append)
+        controller._send_and_receive('ssx100', expect_confirmation=True)
+        controller._stop_reader()
+
+        self.assertEqual(lines, [b"ENDPOS X"])
+        self.assertEqual(controller.axis_states['x'], controller.READY)
+
+    def test_responses_in_order(self) -> ...:
+        """Test that the reader gives every command its own answer and releases the port on errors."""
+        controller = self._controller('reject')
+        controller.connect()
+
+        self.assertEqual(len(controller._send_and_receive('gb', expect_response=True)), 48)
+        with self.assertRaises(ValueError):
+            controller._send_and_receive('qq')
+        self.assertEqual(len(controller._send_and_receive('l', expect_response=True)), 6)
+        controller.wait_until_zeroed()
+        controller.disconnect()
+        self.assertIsNone(controller._reader)
+
+    def test_pipelined_commands(self) -> ...:
+        """Test that pipelined commands stay in the window and report the refused ones."""
+        controller = self._controller('reject')
+        controller.connect()
+        in_flight = []
+        write = controller._ser.write
+
+        def counting_write(data: bytes) -> int:
+            in_flight.append(len(controller._requests))
+            return write(data)
+
+        controller._ser.write = counting_write
+        with self.assertRaises(ValueError) as cm:
+            controller._send_pipelined(['su1', 'qq', 'st4000', 'fp0', 'su1', 'fp0'])
+        self.assertIn('qq', str(cm.exception))
+        self.assertLessEqual(max(in_flight), controller._pipeline_window)
+        self.assertTrue(controller._ser.device.vacuum)  # The commands after the error are sent
+        self.assertEqual(controller._ser.device.target_temperature, 40)
+
+        responses = controller._send_pipelined(['gt', 'gk', 'l'], expect_response=True)
+        self.assertEqual([len(i) for i in responses], [1, 1, 6])
+        controller.wait_until_zeroed()
+
+    def test_jog_trailing_lines(self) -> ...:
+        """Test that extra lines after a jog answer do not shift the answers of the next commands."""
+        controller = self._controller('reject')
+        controller.connect()
+        controller.wait_until_zeroed()
+        device = controller._ser.device
+        handle = device.handle
+
+        def jog_with_extra_line(line: bytes) -> list:
+            lines = handle(line)
+            if line.startswith(b"sv"):
+                lines.append(b"JOG 1000\r\n")
+            return lines
+
+        with patch.object(device, 'handle', side_effect=jog_with_extra_line):
+            # Pipelined, so the next commands wait while the extra line arrives
+            responses = controller._send_pipelined(['svx1000', 'gb', 'svx0', 'gt', 'l'], expect_response=True)
+        self.assertEqual([len(i) for i in responses], [0, 48, 0, 1, 6])
+        with self.assertRaises(ValueError):
+            controller._send_and_receive('qq')  # A real error is still reported
+        controller.disconnect()
+
+
+class TestMotionCompletion(unittest.TestCase):
+    """Test finding out when the moves of the base stage are finished."""
+
+    def setUp(self) -> ...:
+        """Connect a zeroed simulated base controller on the virtual clock."""
+        clock.set_clock(clock.VirtualClock())
+        self.controller = MainXYController(Settings('simulation_config.ini'), mp.Event())
+        self.controller.connect()
+        self.controller.wait_until_zeroed()
+
+    def tearDown(self) -> ...:
+        """Restore the real clock and power cycle the simulated hardware."""
+        clock.set_clock(None)
+        SimulatedSerial.reset_devices()
+
+    def test_move_completion(self) -> ...:
+        """Test that a move is done when the axis stopped, with few status polls."""
+        with patch.object(self.controller._ser, 'write', wraps=self.controller._ser.write) as write:
+            start = clock.monotonic()
+            done = self.controller.move_to('H', 51200)  # 2 s at the zero speed
+            self.assertFalse(done.is_set())
+            self.assertTrue(self.controller.wait_for_motion('H', 10))
+            polls = [i for i in write.call_args_list if i.args[0] == b"gb\r\n"]
+
+        self.assertGreaterEqual(clock.monotonic() - start, 2)
+        self.assertLess(clock.monotonic() - start, 2.1)
+        self.assertLessEqual(len(polls), 2)
+        self.assertEqual(int(self.controller.get_position('H')), 51200)
+
+        # Chained moves start when the axis is idle
+        self.assertFalse(self.controller.move_by('H', -25600).is_set())
+        self.assertTrue(self.controller.wait_for_motion(timeout=10))
+        self.assertEqual(int(self.controller.get_position('H')), 25600)
+
+    def test_jog(self) -> ...:
+        """Test that a jog is tracked until it is stopped."""
+        self.controller.start_jog('J', 1000)
+        self.assertFalse(self.controller.wait_for_motion('J', 1))
+        self.controller.stop_jog('J')
+        self.assertTrue(self.controller.wait_for_motion('J', 1))
+
+    def test_notification(self) -> ...:
+        """Test that an end position line of the controller finishes the move."""
+        self.controller.start_jog('H', 1000)
+        self.controller._route(b"ENDPOS X")
+        self.assertTrue(self.controller.motion_event('H').is_set())
+        self.controller.stop_jog()
+
+
+class TestParameterCache(unittest.TestCase):
+    """Test caching the slow changing device parameters."""
+
+    def tearDown(self) -> ...:
+        """Restore the real clock and power cycle the simulated hardware."""
+        clock.set_clock(None)
+        SimulatedSerial.reset_devices()
+
+    def test_hits_and_misses(self) -> ...:
+        """Test that one read fills all its parameters and invalidating reads again."""
+        cache = ParameterCache()
+        read = Mock(return_value={'vel': 10, 'acc': 20})
+        self.assertEqual(cache.get('vel', read), 10)
+        self.assertEqual(cache.get('acc', read), 20)
+        cache.set('vel', 15)
+        self.assertEqual(cache.get('vel', read), 15)
+        self.assertEqual(read.call_count, 1)
+        self.assertEqual(cache.stats, {'hits': 2, 'misses': 1, 'size': 2})
+
+        cache.invalidate()
+        self.assertEqual(cache.get('vel', read), 10)
+        self.assertEqual(read.call_count, 2)
+
+    def test_invalidated_while_reading(self) -> ...:
+        """Test that a value read before an invalidation is not cached."""
+        cache = ParameterCache()
+
+        def read() -> dict:
+            cache.invalidate()  # For example an emergency stop during the read
+            return {'vel': 10}
+
+        self.assertEqual(cache.get('vel', read), 10)
+        self.assertEqual(cache.stats['size'], 0)
+
+    def test_main_xy_write_through(self) -> ...:
+        """Test that the base controller reads 'l' once and keeps the values it sets."""
+        clock.set_clock(clock.VirtualClock())
+        controller = MainXYController(Settings('simulation_config.ini'), mp.Event())
+        controller.connect()
+        controller.wait_until_zeroed()
+        controller.parameter_cache.invalidate()
+
+        with patch.object(controller._ser, 'write', wraps=controller._ser.write) as write:
+            self.assertEqual(controller.speed, 25600)
+            self.assertEqual(controller.acceleration, 200)
+            controller.target_temperature = 40
+            self.assertEqual(controller.target_temperature, 40)
+            self.assertEqual([i.args[0] for i in write.call_args_list], [b"l\r\n", b"st4000\r\n"])
+        self.assertEqual(controller.parameter_cache.stats['misses'], 1)
+
+        controller.emergency_stop()
+        self.assertEqual(controller.parameter_cache.stats['size'], 0)
+        self.assertEqual(controller.target_temperature, 40)  # Read again
+
+    def test_component_cache(self) -> ...:
+        """Test that the speed and acceleration of a piezo share one drive read."""
+        hardware = MagicMock()
+        hardware.get_drive_parameters.return_value = {'vel': 100, 'acc': 1000}
+        piezo = PIA13('X', 1, hardware, mp.Event(), Settings('simulation_config.ini'))
+
+        self.assertEqual(piezo.speed, 100)
+        self.assertEqual(piezo.acceleration, 1000)
+        hardware.get_drive_parameters.assert_called_once()
+
+        piezo.emergency_stop()
+        self.assertEqual(piezo.speed, 100)
+        self.assertEqual(hardware.get_drive_parameters.call_count, 2)
+
+
+class TestMachineState(unittest.TestCase):
+    """Test the machine state snapshot used for warm restarts."""
+
+    def setUp(self) -> ...:
+        """Set up the test."""
+        clock.set_clock(clock.VirtualClock())
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'machine_state.json')
+
+    def tearDown(self) -> ...:
+        """Restore the real clock and power cycle the simulated hardware."""
+        clock.set_clock(None)
+        SimulatedSerial.reset_devices()
+        self.tmp_dir.cleanup()
+
+    def test_save_and_load(self) -> ...:
+        """Test that a saved snapshot is loaded and no temporary files are left."""
+        state = {'positioning': 'ABS', 'axes': {'H': {'position': 10.5}}}
+        machine_state.save_snapshot(self.path, state)
+        machine_state.save_snapshot(self.path, state)
+
+        self.assertEqual(machine_state.load_snapshot(self.path), state)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['machine_state.json'])
+
+    def test_unusable_snapshot(self) -> ...:
+        """Test that missing, corrupt and old snapshots are ignored."""
+        self.assertIsNone(machine_state.load_snapshot(self.path))
+        with open(self.path, 'w') as f:
+            f.write('{"version": 1, "ti')
+        self.assertIsNone(machine_state.load_snapshot(self.path))
+
+        machine_state.save_snapshot(self.path, {'positioning': 'REL'})
+        with patch.object(machine_state.time, 'time', return_value=time.time() + 120):
+            self.assertIsNone(machine_state.load_snapshot(self.path, max_age=60))
+
+    def _controller(self, session_token: bool = True) -> MainXYController:
+        """Create a simulated base controller, with or without the session commands."""
+        settings = Settings('simulation_config.ini')
+        settings._config['MAINXYCONTROLLER.DEFAULT']['session_token'] = repr(session_token)
+        return MainXYController(settings, mp.Event())
+
+    def test_warm_restart_skips_zeroing(self) -> ...:
+        """Test that a controller that kept its reference is not zeroed and gets its speeds back."""
+        controller = self._controller()
+        controller.connect()
+        controller.wait_until_zeroed()
+        controller.move_to('H', 1000)
+        state = controller.state
+        state['speeds']['x'] = 12800
+
+        # A new backend process finds the controller where it was left
+        restarted = self._controller()
+        restarted.restore_state(state)
+        restarted.connect()
+        self.assertEqual(restarted.axis_states, {'x': 'ready', 'y': 'ready'})
+        self.assertEqual(int(restarted.get_position('H')), 1000)
+        self.assertEqual(restarted._ser.device.axes['x'].speed, 12800)
+
+    def test_state_from_cache(self) -> ...:
+        """Test that taking a checkpoint does not use the serial connection."""
+        controller = self._controller()
+        controller.connect()
+        controller.wait_until_zeroed()
+        controller.move_to('J', 500)
+
+        with patch.object(controller, '_send_and_receive', side_effect=AssertionError):
+            state = controller.state
+        self.assertEqual(state['positions'], {'x': 0, 'y': 500})
+        self.assertEqual(state['speeds'], {'x': 25600, 'y': 25600})
+        self.assertNotEqual(state['session'], 0)
+
+    def test_restart_at_zero_position(self) -> ...:
+        """Test that a matching position without the session token is not trusted."""
+        controller = self._controller()
+        controller.connect()
+        controller.wait_until_zeroed()
+        state = controller.state
+        self.assertEqual(state['positions'], {'x': 0, 'y': 0})
+
+        # The power cycled controller starts counting at 0 as well
+        SimulatedSerial.reset_devices()
+        device = SimulatedMainXYSerial('SIM_BASE').device
+        for axis in device.axes.values():
+            axis.position = 0
+
+        restarted = self._controller()
+        restarted.restore_state(state)
+        restarted.connect()
+        self.assertEqual(restarted.axis_states, {'x': 'zeroing', 'y': 'zeroing'})
+        restarted.wait_until_zeroed()
+
+    def test_without_session_commands(self) -> ...:
+        """Test that the session commands are only sent when the firmware has them."""
+        controller = self._controller(session_token=False)
+        with patch.object(SimulatedMainXYSerial, 'write', autospec=True, side_effect=SimulatedMainXYSerial.write) as write:
+            controller.connect()
+            controller.wait_until_zeroed()
+            state = controller.state
+
+            restarted = self._controller(session_token=False)
+            restarted.restore_state(state)
+            restarted.connect()
+            self.assertEqual(restarted.axis_states, {'x': 'zeroing', 'y': 'zeroing'})
+            restarted.wait_until_zeroed()
+        commands = [i.args[1] for i in write.call_args_list]
+        self.assertEqual(commands.count(b"z\r\n"), 2)  # Zeroed at both starts
+        self.assertFalse([i for i in commands if i[:2] in (b"sk", b"gk")])
+
+    def test_cold_restart_zeroes(self) -> ...:
+        """Test that a controller that lost its position (power cycle) is zeroed again."""
+        controller = self._controller()
+        controller.connect()
+        controller.wait_until_zeroed()
+        state = controller.state
+
+        SimulatedSerial.reset_devices()
+        restarted = self._controller()
+        restarted.restore_state(state)
+        restarted.connect()
+        self.assertEqual(restarted.axis_states, {'x': 'zeroing', 'y': 'zeroing'})
+        restarted.wait_until_zeroed()
+
+
+class TestSerialTrace(unittest.TestCase):
+    """Test the capture and replay of the serial traffic."""
+
+    def setUp(self) -> ...:
+        """Set up the test."""
+        clock.set_clock(clock.VirtualClock())
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.trace = os.path.join(self.tmp_dir.name, 'main_xy.trace')
+
+        # The session token is random, use the same one while recording and replaying
+        random = Mock()
+        random.randint.return_value = 12345
+        session = patch('components.stacking_backend.controllers.main_xy_controller.random', random)
+        session.start()
+        self.addCleanup(session.stop)
+
+    def tearDown(self) -> ...:
+        """Close the traces and restore the real clock."""
+        serial_trace.close_traces()
+        SimulatedSerial.reset_devices()
+        clock.set_clock(None)
+        self.tmp_dir.cleanup()
+
+    def _controller(self, **keys) -> MainXYController:
+        """Create a simulated base controller with the given settings changed."""
+        settings = Settings('simulation_config.ini')
+        for key, value in keys.items():
+            settings._config['MAINXYCONTROLLER.DEFAULT'][key] = repr(value)
+        return MainXYController(settings, mp.Event())
+
+    def _record_session(self) -> tuple:
+        """Record connecting the controller and reading the position."""
+        controller = self._controller(capture_file=self.trace)
+        controller.connect()
+        controller.wait_until_zeroed()
+        position = controller.get_position('H')
+        serial_trace.close_traces()
+        return position
+
+    def test_capture(self) -> ...:
+        """Test that the writes and reads end up in the trace in order."""
+        self._record_session()
+        records = serial_trace.read_trace(self.trace)
+
+        self.assertEqual(records[0][:1], (serial_trace.OPEN,))
+        self.assertEqual(records[1][0], serial_trace.WRITE)
+        self.assertEqual(records[1][2], b'gid\r\n')
+        self.assertEqual(records[2][0], serial_trace.READ)
+        self.assertEqual(records[2][2], b'Base Stage Controller10\r\n')
+        times = [r[1] for r in records]
+        self.assertEqual(times, sorted(times))
+
+    def test_replay(self) -> ...:
+        """Test that a recorded session can be replayed without the hardware."""
+        position = self._record_session()
+        SimulatedSerial.reset_devices()
+
+        controller = self._controller(replay_file=self.trace, replay_speed=4)
+        controller.connect()
+        controller.wait_until_zeroed()
+        self.assertEqual(controller.get_position('H'), position)
+        self.assertEqual(controller._ser.mismatches, [])
+        self.assertTrue(controller._ser.finished)
+
+    def test_invalid_trace(self) -> ...:
+        """Test that a file that is not a trace is refused."""
+        with open(self.trace, 'wb') as f:
+            f.write(b'not a trace file')
+        with self.assertRaises(ValueError):
+            serial_trace.read_trace(self.trace)
+
+
+class TestBringUpGraph(unittest.TestCase):
+    """Test connecting the hardware as a dependency graph."""
+
+    def test_parallel_controllers(self) -> ...:
+        """Test that independent steps run in parallel and components wait for their controller."""
+        graph = BringUpGraph()
+        graph.add('A', lambda: time.sleep(0.2))
+        graph.add('B', lambda: time.sleep(0.2))
+        graph.add('C', lambda: None, depends=('A', 'B'))
+        report = graph.run()
+
+        self.assertLess(report['total'], 0.35)
+        self.assertEqual({s['status'] for s in report['steps'].values()}, {BringUpGraph.OK})
+        self.assertGreaterEqual(report['steps']['C']['start'], report['steps']['A']['end'])
+
+    def test_failed_dependency(self) -> ...:
+        """Test that the steps depending on a failed step are skipped."""
+        def fail():
+            raise ConnectionError('not connected')
+
+        graph = BringUpGraph()
+        graph.add('A', fail)
+        graph.add('B', lambda: None, depends=('A',))
+        graph.add('C', lambda: None)
+        report = graph.run()
+
+        self.assertEqual(report['steps']['A']['status'], BringUpGraph.FAILED)
+        self.assertIn('not connected', report['steps']['A']['error'])
+        self.assertEqual(report['steps']['B']['status'], BringUpGraph.SKIPPED)
+        self.assertEqual(report['steps']['C']['status'], BringUpGraph.OK)
+
+    def test_timeout(self) -> ...:
+        """Test that a step that takes too long times out."""
+        graph = BringUpGraph()
+        graph.add('A', lambda: time.sleep(1), timeout=0.05)
+        report = graph.run()
+
+        self.assertEqual(report['steps']['A']['status'], BringUpGraph.TIMEOUT)
+        self.assertLess(report['total'], 0.5)
+
+    def test_unknown_dependency(self) -> ...:
+        """Test that depending on an unknown step raises an error."""
+        graph = BringUpGraph()
+        graph.add('A', lambda: None, depends=('B',))
+        with self.assertRaises(ValueError):
+            graph.run()
+
+
 if __name__ == '__main__':
     # Run all the tests in this file
     unittest.main()